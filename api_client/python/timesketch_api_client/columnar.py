@@ -0,0 +1,203 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reader for the columnar transfer format of search results.
+
+The server sends a sequence of frames, every frame starts with a one byte
+frame type and the length of the payload as a four byte big endian integer.
+A frame either contains the metadata of the response as JSON ("M"), a batch
+of events as JSON columns ("J") or a batch of events as an Arrow IPC stream
+("A"). Arrow batches are only requested if pyarrow is installed.
+"""
+from __future__ import unicode_literals
+
+import itertools
+import json
+import struct
+
+import pandas
+
+try:
+    import pyarrow
+    from pyarrow import ipc as pyarrow_ipc
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+MIMETYPE = "application/vnd.timesketch.columnar"
+
+FORMAT_ARROW = "arrow"
+FORMAT_COLUMNS = "columns"
+
+FRAME_HEADER = struct.Struct(">cI")
+FRAME_META = b"M"
+FRAME_COLUMNS = b"J"
+FRAME_ARROW = b"A"
+
+
+def get_request_format():
+    """Returns the columnar format to request from the server."""
+    if PYARROW_AVAILABLE:
+        return FORMAT_ARROW
+    return FORMAT_COLUMNS
+
+
+def is_columnar_response(response):
+    """Returns whether a response is in the columnar format.
+
+    Servers that do not support the format ignore the request for it and
+    return JSON instead.
+
+    Args:
+        response (requests.Response): a response object from a HTTP request.
+
+    Returns:
+        bool: True if the response is in the columnar format.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    return content_type.split(";")[0].strip() == MIMETYPE
+
+
+def _read_exactly(stream, size):
+    """Returns exactly size bytes from a stream, or less at the end of it."""
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+
+def iter_frames(stream):
+    """Yields the frames of a columnar response.
+
+    Args:
+        stream (file): file like object with the response body.
+
+    Yields:
+        tuple: the frame type and the payload of the frame.
+
+    Raises:
+        ValueError: if the response ends in the middle of a frame.
+    """
+    while True:
+        header = _read_exactly(stream, FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise ValueError("Columnar response ended in a frame header.")
+
+        frame_type, size = FRAME_HEADER.unpack(header)
+        payload = _read_exactly(stream, size)
+        if len(payload) < size:
+            raise ValueError("Columnar response ended in a frame.")
+        yield frame_type, payload
+
+
+def _arrow_to_data_frame(payload):
+    """Returns a DataFrame from an Arrow IPC stream."""
+    table = pyarrow_ipc.open_stream(pyarrow.py_buffer(payload)).read_all()
+    metadata = table.schema.metadata or {}
+    json_columns = json.loads(metadata.get(b"json_columns", b"[]"))
+    data_frame = table.to_pandas()
+    for column in json_columns:
+        data_frame[column] = data_frame[column].map(
+            lambda value: json.loads(value) if isinstance(value, str) else value
+        )
+    return data_frame
+
+
+def _frames_to_data_frames(frames, meta=None):
+    """Yields a DataFrame per batch of events in a sequence of frames."""
+    for frame_type, payload in frames:
+        if frame_type == FRAME_META:
+            if meta is not None:
+                meta.update(json.loads(payload.decode("utf-8")))
+        elif frame_type == FRAME_COLUMNS:
+            columns = json.loads(payload.decode("utf-8")).get("columns", {})
+            yield pandas.DataFrame(columns)
+        elif frame_type == FRAME_ARROW:
+            if not PYARROW_AVAILABLE:
+                raise ValueError("Unable to read Arrow data, pyarrow is not installed.")
+            yield _arrow_to_data_frame(payload)
+        else:
+            raise ValueError(f"Unknown frame type in columnar response: {frame_type}")
+
+
+def iter_data_frames(stream, meta=None):
+    """Yields a DataFrame per batch of events in a columnar response.
+
+    Args:
+        stream (file): file like object with the response body.
+        meta (dict): optional dict that is updated with the metadata of the
+            response.
+
+    Yields:
+        pandas.DataFrame: a batch of events.
+
+    Raises:
+        ValueError: if the response can not be decoded.
+    """
+    yield from _frames_to_data_frames(iter_frames(stream), meta=meta)
+
+
+def response_to_data_frames(response, meta=None):
+    """Yields a DataFrame per batch of events in a streamed HTTP response.
+
+    Args:
+        response (requests.Response): a streamed response in the columnar
+            format.
+        meta (dict): optional dict that is updated with the metadata of the
+            response.
+
+    Yields:
+        pandas.DataFrame: a batch of events.
+    """
+    response.raw.decode_content = True
+    yield from iter_data_frames(response.raw, meta=meta)
+
+
+def read_response(response):
+    """Returns the metadata and the batches of events of a streamed response.
+
+    The metadata is sent in the first frame of the response and is read
+    right away. The batches of events are only read and decoded while the
+    returned iterator is consumed.
+
+    Args:
+        response (requests.Response): a streamed response in the columnar
+            format.
+
+    Returns:
+        tuple: a dict with the metadata of the response and an iterator of
+            pandas.DataFrame, one per batch of events.
+
+    Raises:
+        ValueError: if the first frame of the response can not be decoded.
+    """
+    response.raw.decode_content = True
+    frames = iter_frames(response.raw)
+    meta = {}
+    first_frame = next(frames, None)
+    if first_frame is None:
+        return meta, iter(())
+
+    frame_type, payload = first_frame
+    if frame_type == FRAME_META:
+        meta.update(json.loads(payload.decode("utf-8")))
+    else:
+        frames = itertools.chain([first_frame], frames)
+    return meta, _frames_to_data_frames(frames, meta=meta)
@@ -0,0 +1,93 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the columnar transfer format reader."""
+from __future__ import unicode_literals
+
+import io
+import json
+import unittest
+
+import mock
+
+from . import columnar
+
+
+def _frame(frame_type, data):
+    """Returns an encoded frame with a JSON payload."""
+    payload = json.dumps(data).encode("utf-8")
+    return columnar.FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+class ColumnarTest(unittest.TestCase):
+    """Test the columnar transfer format reader."""
+
+    def test_iter_data_frames(self):
+        """Test reading the metadata and batches of a response."""
+        stream = io.BytesIO(
+            _frame(columnar.FRAME_META, {"scroll_id": "foo"})
+            + _frame(
+                columnar.FRAME_COLUMNS,
+                {"columns": {"message": ["a", "b"], "tag": [["x"], None]}},
+            )
+            + _frame(columnar.FRAME_COLUMNS, {"columns": {"message": ["c"]}})
+        )
+        meta = {}
+        data_frames = list(columnar.iter_data_frames(stream, meta=meta))
+
+        self.assertEqual(meta, {"scroll_id": "foo"})
+        self.assertEqual(len(data_frames), 2)
+        self.assertEqual(list(data_frames[0]["message"]), ["a", "b"])
+        self.assertEqual(data_frames[0]["tag"][0], ["x"])
+        self.assertEqual(list(data_frames[1]["message"]), ["c"])
+
+    def test_truncated_response(self):
+        """Test that a truncated response raises an error."""
+        stream = io.BytesIO(_frame(columnar.FRAME_META, {"scroll_id": "foo"})[:-2])
+        with self.assertRaises(ValueError):
+            list(columnar.iter_data_frames(stream))
+
+    def test_read_exactly(self):
+        """Test reading a frame that arrives in small chunks."""
+        stream = mock.Mock()
+        stream.read.side_effect = [b"ab", b"c", b"d", b"e", b""]
+        # pylint: disable=protected-access
+        self.assertEqual(columnar._read_exactly(stream, 4), b"abcd")
+        self.assertEqual(columnar._read_exactly(stream, 4), b"e")
+
+    def test_read_response(self):
+        """Test the batches of a response are read while they are consumed."""
+        stream = io.BytesIO(
+            _frame(columnar.FRAME_META, {"scroll_id": "foo"})
+            + _frame(columnar.FRAME_COLUMNS, {"columns": {"message": ["a", "b"]}})
+            + _frame(columnar.FRAME_COLUMNS, {"columns": {"message": ["c"]}})
+        )
+        response = mock.Mock(raw=stream)
+        meta, data_frames = columnar.read_response(response)
+
+        self.assertEqual(meta, {"scroll_id": "foo"})
+        meta_size = len(_frame(columnar.FRAME_META, {"scroll_id": "foo"}))
+        self.assertEqual(stream.tell(), meta_size)
+
+        self.assertEqual(list(next(data_frames)["message"]), ["a", "b"])
+        self.assertLess(stream.tell(), len(stream.getvalue()))
+        self.assertEqual([list(df["message"]) for df in data_frames], [["c"]])
+
+    def test_read_response_without_meta(self):
+        """Test reading a response that starts with a batch of events."""
+        stream = io.BytesIO(
+            _frame(columnar.FRAME_COLUMNS, {"columns": {"message": ["a"]}})
+        )
+        meta, data_frames = columnar.read_response(mock.Mock(raw=stream))
+        self.assertEqual(meta, {})
+        self.assertEqual([list(df["message"]) for df in data_frames], [["a"]])
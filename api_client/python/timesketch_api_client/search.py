@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Timesketch API search object."""
+from concurrent import futures
 import datetime
 import json
 import logging
@@ -19,6 +20,7 @@ import re
 
 import pandas
 
+from . import columnar
 from . import error
 from . import resource
 from . import searchtemplate
@@ -431,6 +433,8 @@ class Search(resource.SketchResource):
     """Search object."""
 
     DEFAULT_SIZE_LIMIT = 10000
+    # Size of the chunks read from the response when saving results to a file.
+    FILE_CHUNK_SIZE = 1024 * 1024
 
     def __init__(self, sketch):
         resource_uri = f"sketches/{sketch.id}/explore/"
@@ -489,23 +493,20 @@ class Search(resource.SketchResource):
 
             self.add_chip(chip)
 
-    def _execute_query(self, file_name="", count=False):
-        """Execute a search request and store the results.
+    def _get_form_data(self, file_name="", count=False):
+        """Returns the form data of a search request.
 
         Args:
             file_name (str): Optional file path to a filename that
-                all the results will be saved to. If not provided
-                the results will be stored in the search object.
+                all the results will be saved to.
             count (bool): Optional boolean that determines whether
-                we want to execute the query or only count the
-                number of events that the query would produce. If
-                set to True, the results will be stored in the
-                search object, and the number of events will be
-                returned.
+                we only want to count the number of events.
 
         Returns:
-            A dict with the search results or the total number of events
-            (if count=True) or None if saved to file.
+            A dict with the form data.
+
+        Raises:
+            ValueError: if the query filter is not a dict.
         """
         query_filter = self.query_filter
         if not isinstance(query_filter, dict):
@@ -517,7 +518,7 @@ class Search(resource.SketchResource):
         if self.scrolling is not None:
             scrolling = self.scrolling
 
-        form_data = {
+        return {
             "query": self.query_string,
             "filter": query_filter,
             "dsl": self.query_dsl,
@@ -527,8 +528,32 @@ class Search(resource.SketchResource):
             "file_name": file_name,
         }
 
+    def _execute_query(self, file_name="", count=False):
+        """Execute a search request and store the results.
+
+        Args:
+            file_name (str): Optional file path to a filename that
+                all the results will be saved to. If not provided
+                the results will be stored in the search object.
+            count (bool): Optional boolean that determines whether
+                we want to execute the query or only count the
+                number of events that the query would produce. If
+                set to True, the results will be stored in the
+                search object, and the number of events will be
+                returned.
+
+        Returns:
+            A dict with the search results or the total number of events
+            (if count=True) or None if saved to file.
+        """
+        form_data = self._get_form_data(file_name=file_name, count=count)
+
+        # File exports are streamed by the server, write them to disk as
+        # they arrive instead of holding the whole archive in memory.
         response = self.api.session.post(
-            f"{self.api.api_root}/{self.resource_uri}", json=form_data
+            f"{self.api.api_root}/{self.resource_uri}",
+            json=form_data,
+            stream=bool(file_name),
         )
         if not error.check_return_status(response, logger):
             error.error_message(
@@ -537,7 +562,8 @@ class Search(resource.SketchResource):
 
         if file_name:
             with open(file_name, "wb") as fw:
-                fw.write(response.content)
+                for chunk in response.iter_content(chunk_size=self.FILE_CHUNK_SIZE):
+                    fw.write(chunk)
             return None
 
         response_json = error.get_response_json(response, logger)
@@ -547,39 +573,123 @@ class Search(resource.SketchResource):
             self._total_elastic_size = meta.get("total_count", 0)
             return meta.get("total_count", 0)
 
-        scroll_id = response_json.get("meta", {}).get("scroll_id", "")
-        form_data["scroll_id"] = scroll_id
+        response_json.setdefault("objects", [])
+        response_json.setdefault("meta", {}).setdefault("es_time", 0)
+        for page in self._iter_pages(form_data, first_page=response_json):
+            if page is response_json:
+                continue
+            response_json["objects"].extend(page.get("objects", []))
+            response_json["meta"]["es_time"] += page["meta"].get("es_time", 0)
 
-        count = len(response_json.get("objects", []))
-        total_count = count
-        while count > 0:
-            if self.max_entries and total_count >= self.max_entries:
-                break
+        self._raw_response = response_json
+        return response_json
 
-            if not scroll_id:
-                logger.debug("No scroll ID, will stop.")
-                break
+    def _fetch_page(self, form_data):
+        """Fetch a single page of search results.
 
-            more_response = self.api.session.post(
-                f"{self.api.api_root}/{self.resource_uri}", json=form_data
-            )
-            if not error.check_return_status(more_response, logger):
-                error.error_message(
-                    more_response,
-                    message="Unable to query results while scrolling",
-                    error=ValueError,
-                )
-            more_response_json = error.get_response_json(more_response, logger)
-            count = len(more_response_json.get("objects", []))
-            total_count += count
-            response_json["objects"].extend(more_response_json.get("objects", []))
-            more_meta = more_response_json.get("meta", {})
-            added_time = more_meta.get("es_time", 0)
-            response_json["meta"]["es_time"] += added_time
-
-        self._total_elastic_size = response_json.get("meta", {}).get(
-            "es_total_count", 0
+        Args:
+            form_data (dict): the form data of the search request.
+
+        Returns:
+            A dict with the "meta" of the response and either the "objects"
+            of a JSON response or the "data_frames" of a columnar response.
+            The data frames are an iterator, the batches of events are read
+            from the response while it is consumed.
+        """
+        response = self.api.session.post(
+            f"{self.api.api_root}/{self.resource_uri}",
+            json=form_data,
+            stream="format" in form_data,
         )
+        if not error.check_return_status(response, logger):
+            error.error_message(
+                response, message="Unable to query results", error=ValueError
+            )
+
+        if columnar.is_columnar_response(response):
+            meta, data_frames = columnar.read_response(response)
+            return {"meta": meta, "data_frames": data_frames}
+
+        response_json = error.get_response_json(response, logger)
+        response_json.setdefault("meta", {})
+        response_json.setdefault("objects", [])
+        return response_json
+
+    @staticmethod
+    def _count_data_frames(data_frames, page_size):
+        """Yields the data frames of a page and counts their events.
+
+        Args:
+            data_frames (iterator): the data frames of a columnar page.
+            page_size (dict): dict with the number of events in "count",
+                updated while the data frames are yielded.
+
+        Yields:
+            pandas.DataFrame: a batch of events.
+        """
+        for data_frame in data_frames:
+            page_size["count"] += len(data_frame)
+            yield data_frame
+
+    def _iter_pages(self, form_data, first_page=None):
+        """Yields the pages of search results, prefetching the next page.
+
+        While the caller processes a page, the next page is requested in a
+        background thread. Only the page that is being processed and the page
+        that is being fetched are held in memory. The events of a columnar
+        page are only counted once the caller has consumed the page, so the
+        next page is requested before it is known whether the page was the
+        last one.
+
+        Args:
+            form_data (dict): the form data of the search request.
+            first_page (dict): optional first page, if it was already fetched.
+
+        Yields:
+            dict: a page as returned by _fetch_page.
+        """
+        form_data = dict(form_data)
+        total_count = 0
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            if first_page is None:
+                page = executor.submit(self._fetch_page, dict(form_data)).result()
+            else:
+                page = first_page
+            self._total_elastic_size = page["meta"].get("es_total_count", 0)
+
+            while page is not None:
+                page_size = None
+                if "data_frames" in page:
+                    page_size = {"count": 0}
+                    page["data_frames"] = self._count_data_frames(
+                        page["data_frames"], page_size
+                    )
+                    count = None
+                else:
+                    count = len(page.get("objects", []))
+                    total_count += count
+                scroll_id = page["meta"].get("scroll_id", "")
+
+                next_page = None
+                if count != 0 and not (
+                    self.max_entries and total_count >= self.max_entries
+                ):
+                    if scroll_id:
+                        form_data["scroll_id"] = scroll_id
+                        next_page = executor.submit(self._fetch_page, dict(form_data))
+                    else:
+                        logger.debug("No scroll ID, will stop.")
+
+                yield page
+
+                if page_size is not None:
+                    total_count += page_size["count"]
+                    if not page_size["count"] or (
+                        self.max_entries and total_count >= self.max_entries
+                    ):
+                        next_page = None
+                page = next_page.result() if next_page else None
+
         if self._total_elastic_size != total_count:
             logger.info(
                 "%d results were returned, but %d records matched the search query",
@@ -587,8 +697,67 @@ class Search(resource.SketchResource):
                 self._total_elastic_size,
             )
 
-        self._raw_response = response_json
-        return response_json
+    def iter_events(self):
+        """Yields the events of the query, one at a time.
+
+        Pages of results are fetched in the background and released once all
+        their events have been yielded, so the memory use does not depend on
+        the number of results. At most max_entries events are returned.
+
+        Yields:
+            dict: an event as returned by the search API, with the "_id",
+                "_index" and "_source" of the event.
+        """
+        if self._raw_response is not None:
+            yield from self._raw_response.get("objects", [])
+            return
+
+        returned = 0
+        for page in self._iter_pages(self._get_form_data()):
+            objects = page.get("objects", [])
+            if self.max_entries:
+                objects = objects[: self.max_entries - returned]
+            returned += len(objects)
+            yield from objects
+
+    def iter_dataframes(self):
+        """Yields the results of the query as pandas DataFrames.
+
+        The results are requested in the columnar format and a DataFrame is
+        yielded per batch of events. Pages of results are fetched in the
+        background and released once they have been yielded. At most
+        max_entries events are returned.
+
+        Yields:
+            pandas.DataFrame: a batch of events.
+        """
+        # The timelines are listed before the first page is fetched, the
+        # session is not used by two threads at the same time.
+        timelines = {t.id: t.name for t in self._sketch.list_timelines()}
+        if self._raw_response is not None:
+            pages = [self._raw_response]
+        else:
+            form_data = self._get_form_data()
+            form_data["format"] = columnar.get_request_format()
+            pages = self._iter_pages(form_data)
+
+        returned = 0
+        for page in pages:
+            if "data_frames" in page:
+                data_frames = [
+                    self._format_columnar_data_frame(data_frame, timelines)
+                    for data_frame in page["data_frames"]
+                ]
+            else:
+                data_frames = [self._objects_to_data_frame(page["objects"], timelines)]
+
+            for data_frame in data_frames:
+                if self.max_entries:
+                    if returned >= self.max_entries:
+                        return
+                    data_frame = data_frame.iloc[: self.max_entries - returned]
+                returned += len(data_frame)
+                yield self._convert_datetime(data_frame)
 
     def add_chip(self, chip):
         """Add a chip to the ..."""
@@ -1108,26 +1277,55 @@ class Search(resource.SketchResource):
         self._scrolling = old_scrolling
         return True
 
-    def to_pandas(self):
-        """Returns a pandas DataFrame with the response of the query."""
-        if self._raw_response is None:
-            self._raw_response = self._execute_query()
-            if self._raw_response is None:
-                raise ValueError("No results to return.")
+    def _get_return_field_list(self):
+        """Returns a list of the fields that the search returns."""
+        return_fields = self.return_fields
+        if not return_fields:
+            return []
+        if return_fields.startswith("'"):
+            return_fields = return_fields[1:]
+        if return_fields.endswith("'"):
+            return_fields = return_fields[:-1]
+        return return_fields.split(",")
 
-        return_list = []
-        timelines = {t.id: t.name for t in self._sketch.list_timelines()}
+    def _format_columnar_data_frame(self, data_frame, timelines):
+        """Returns a batch of columnar results with the requested fields.
+
+        Args:
+            data_frame (pandas.DataFrame): a batch of events.
+            timelines (dict): timeline names by timeline ID.
+
+        Returns:
+            A pandas DataFrame.
+        """
+        return_field_list = self._get_return_field_list()
+        for field in ("_id", "_index"):
+            if return_field_list and field not in return_field_list:
+                if field in data_frame:
+                    del data_frame[field]
+
+        add_source = not return_field_list or any(
+            field in return_field_list for field in ("_source", "__ts_timeline_id")
+        )
+        if add_source and "__ts_timeline_id" in data_frame:
+            data_frame["_source"] = data_frame["__ts_timeline_id"].map(timelines)
+        return data_frame
 
-        return_field_list = []
+    def _objects_to_data_frame(self, objects, timelines):
+        """Returns a DataFrame from the events of a JSON response.
+
+        Args:
+            objects (list): the events of the response.
+            timelines (dict): timeline names by timeline ID.
+
+        Returns:
+            A pandas DataFrame.
+        """
+        return_list = []
         return_fields = self.return_fields
-        if return_fields:
-            if return_fields.startswith("'"):
-                return_fields = return_fields[1:]
-            if return_fields.endswith("'"):
-                return_fields = return_fields[:-1]
-            return_field_list = return_fields.split(",")
-
-        for result in self._raw_response.get("objects", []):
+        return_field_list = self._get_return_field_list()
+
+        for result in objects:
             source = result.get("_source", {})
             if not return_fields or "_id" in return_field_list:
                 source["_id"] = result.get("_id")
@@ -1142,7 +1340,11 @@ class Search(resource.SketchResource):
 
             return_list.append(source)
 
-        data_frame = pandas.DataFrame(return_list)
+        return pandas.DataFrame(return_list)
+
+    @staticmethod
+    def _convert_datetime(data_frame):
+        """Converts the datetime or timestamp of events to datetime objects."""
         if "datetime" in data_frame:
             try:
                 data_frame["datetime"] = pandas.to_datetime(
@@ -1157,9 +1359,21 @@ class Search(resource.SketchResource):
                 )
             except pandas.errors.OutOfBoundsDatetime:
                 pass
-
         return data_frame
 
+    def to_pandas(self):
+        """Returns a pandas DataFrame with the response of the query.
+
+        Unless the results of the query are already stored in the search
+        object, the DataFrame is built batch by batch from iter_dataframes.
+        """
+        data_frames = list(self.iter_dataframes())
+        if not data_frames:
+            return pandas.DataFrame()
+        if len(data_frames) == 1:
+            return data_frames[0]
+        return pandas.concat(data_frames, ignore_index=True, sort=False)
+
     @property
     def updated_at(self):
         """Property that returns back the updated time of a search."""
@@ -279,3 +279,42 @@ class SearchTest(unittest.TestCase):
         self.assertEqual(chip.after, 1)
         self.assertEqual(chip.unit, "m")
         self.assertEqual(chip.chip, expected_chip)
+
+    def test_iter_events(self):
+        """Test iterating over scrolled pages of events."""
+        pages = [
+            {
+                "meta": {"scroll_id": "foo", "es_total_count": 5, "es_time": 2},
+                "objects": [{"_id": "1"}, {"_id": "2"}],
+            },
+            {"meta": {"scroll_id": "foo", "es_time": 3}, "objects": [{"_id": "3"}]},
+            {"meta": {"scroll_id": "foo", "es_time": 4}, "objects": []},
+        ]
+        responses = []
+        for page in pages:
+            response = mock.Mock(status_code=200, headers={})
+            response.json.return_value = page
+            responses.append(response)
+
+        search_obj = search.Search(sketch=self.sketch)
+        search_obj.query_string = "*"
+        with mock.patch.object(
+            self.api_client.session, "post", side_effect=list(responses)
+        ):
+            event_ids = [event["_id"] for event in search_obj.iter_events()]
+        self.assertEqual(event_ids, ["1", "2", "3"])
+        self.assertEqual(search_obj.expected_size, 5)
+
+        search_obj.max_entries = 2
+        with mock.patch.object(
+            self.api_client.session, "post", side_effect=list(responses)
+        ) as mock_post:
+            event_ids = [event["_id"] for event in search_obj.iter_events()]
+        self.assertEqual(event_ids, ["1", "2"])
+        self.assertEqual(mock_post.call_count, 1)
+
+        with mock.patch.object(
+            self.api_client.session, "post", side_effect=list(responses)
+        ):
+            search_dict = search_obj.to_dict()
+        self.assertEqual(search_dict["meta"]["es_time"], 2)
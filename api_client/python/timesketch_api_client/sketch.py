@@ -19,7 +19,7 @@ import os
 import json
 import time
 import logging
-from typing import Dict, Generator, List, Optional
+from typing import Dict, Generator, List, Optional, Union
 
 import pandas
 
@@ -28,6 +28,7 @@ from requests.exceptions import RequestException
 
 from . import analyzer
 from . import aggregation
+from . import columnar
 from . import definitions
 from . import error
 from . import graph
@@ -57,6 +58,9 @@ class Sketch(resource.BaseResource):
     # Add in necessary fields in data ingested via a different mechanism.
     _NECESSARY_DATA_FIELDS = frozenset(["timestamp", "datetime", "message"])
 
+    # Number of events per DataFrame when exporting JSON lines as data frames.
+    DEFAULT_EXPORT_BATCH_SIZE = 10000
+
     def __init__(self, sketch_id, api, sketch_name=None):
         """Initializes the Sketch object.
 
@@ -1572,7 +1576,9 @@ class Sketch(resource.BaseResource):
             RuntimeError: if the sketch is archived.
 
         Returns:
-            A dict with the results from the tagging operation.
+            A dict with the results from the tagging operation. Large
+            requests are tagged in the background by the server, the dict
+            then contains the ID of the task in "task_id".
         """
         if self.is_archived():
             raise RuntimeError("Unable to tag events in an archived sketch.")
@@ -1984,7 +1990,8 @@ class Sketch(resource.BaseResource):
         query_dsl: Optional[str] = None,
         query_filter: Optional[Dict] = None,
         return_fields: Optional[List[str]] = None,
-    ) -> Generator[Dict, None, None]:
+        as_pandas: bool = False,
+    ) -> Generator[Union[Dict, pandas.DataFrame], None, None]:
         """Exports all events from the sketch matching the query.
 
         This uses the high-performance sliced export API endpoint.
@@ -1994,9 +2001,13 @@ class Sketch(resource.BaseResource):
             query_dsl (str): OpenSearch query DSL as JSON string.
             query_filter (dict): Filter for the query as a dict.
             return_fields (list): List of strings with fields to return.
+            as_pandas (bool): If True the events are transferred in the
+                columnar format and a DataFrame is yielded per batch of
+                events instead of a dict per event.
 
         Yields:
-            dict: A dictionary representing an event.
+            dict: A dictionary representing an event, or a pandas DataFrame
+                with a batch of events if as_pandas is True.
         """
         if return_fields is None:
             return_fields = ["datetime", "message", "timestamp_desc"]
@@ -2015,6 +2026,8 @@ class Sketch(resource.BaseResource):
             "dsl": query_dsl,
             "fields": return_fields,
         }
+        if as_pandas:
+            form_data["format"] = columnar.get_request_format()
 
         response = self.api.session.post(resource_url, json=form_data, stream=True)
 
@@ -2023,13 +2036,30 @@ class Sketch(resource.BaseResource):
                 response, message="Unable to export events", error=RuntimeError
             )
 
+        if as_pandas and columnar.is_columnar_response(response):
+            yield from columnar.response_to_data_frames(response)
+            return
+
+        events = []
         for line in response.iter_lines():
             if line:
                 try:
-                    yield json.loads(line.decode("utf-8"))
+                    event = json.loads(line.decode("utf-8"))
                 except json.JSONDecodeError:
                     logger.warning("Received invalid JSON line during export")
                     continue
+                if not as_pandas:
+                    yield event
+                    continue
+                # Servers without support for the columnar format send JSON
+                # lines, those are batched up into data frames here.
+                events.append(event)
+                if len(events) >= self.DEFAULT_EXPORT_BATCH_SIZE:
+                    yield pandas.DataFrame(events)
+                    events = []
+
+        if events:
+            yield pandas.DataFrame(events)
 
     def create_timeline(self, searchindex_id: int, timeline_name: str):
         """Creates a Timeline in this Sketch
@@ -86,11 +86,15 @@ def mock_response(*args, **kwargs):
             self.json_data = json_data
             self.text = text_data
             self.status_code = status_code
+            self.headers = {"Content-Type": "application/json"}
 
         def json(self):
             """Mock JSON response."""
             return self.json_data
 
+        def close(self):
+            """Mock closing the response."""
+
     archive_data = {
         "is_archived": False,
         "sketch_id": 1,
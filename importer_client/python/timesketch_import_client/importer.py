@@ -15,16 +15,20 @@
 from __future__ import unicode_literals
 
 import codecs
+from concurrent import futures
+import hashlib
 import io
 import json
 import logging
 import math
 import os
+import threading
 import time
 import uuid
 
 import numpy
 import pandas
+from requests import exceptions as requests_exceptions
 
 from timesketch_api_client import timeline
 from timesketch_api_client import definitions
@@ -81,6 +85,9 @@ class ImportStreamer(object):
     # Define the maximum amount of retries for a file/chunk upload.
     DEFAULT_RETRY_LIMIT = 3
 
+    # Number of file chunks that are uploaded in parallel.
+    DEFAULT_CHUNK_CONCURRENCY = 4
+
     def __init__(self):
         """Initialize the upload streamer."""
         self._celery_task_id = ""
@@ -97,12 +104,14 @@ class ImportStreamer(object):
         self._last_response = None
         self._provider = "Importer library"
         self._resource_url = ""
+        self._resume_upload = True
         self._sketch = None
         self._timeline_id = None
         self._timeline_name = None
         self._upload_context = ""
 
         self._chunk = 1
+        self._chunk_concurrency = self.DEFAULT_CHUNK_CONCURRENCY
 
         self._text_encoding = self.DEFAULT_TEXT_ENCODING
         self._timestamp_desc = self.DEFAULT_TIMESTAMP_DESC
@@ -319,12 +328,6 @@ class ImportStreamer(object):
             data["context"] = self._upload_context
 
         response = self._sketch.api.session.post(self._resource_url, data=data)
-
-        # TODO: Investigate why the sleep is needed, fix the underlying issue
-        # and get rid of it here.
-        # To prevent unexpected errors with connection refusal adding a quick
-        # sleep.
-        time.sleep(2)
         if response.status_code not in definitions.HTTP_STATUS_CODE_20X:
             if retry_count >= self.DEFAULT_RETRY_LIMIT:
                 raise RuntimeError(
@@ -344,6 +347,8 @@ class ImportStreamer(object):
                 )
             )
 
+            # Back off before retrying, instead of pausing after every buffer.
+            time.sleep(2 ** (retry_count + 1))
             return self._upload_data_buffer(
                 end_stream=end_stream, retry_count=retry_count + 1
             )
@@ -422,6 +427,288 @@ class ImportStreamer(object):
         self._last_response = response_dict
         return None
 
+    def _get_upload_id(self, file_path, file_size):
+        """Returns an identifier for the chunked upload of a file.
+
+        The identifier only depends on the file and the upload target so that
+        an interrupted upload is resumed when the same file is imported again.
+        If resuming uploads is disabled, a new random identifier is returned.
+
+        Args:
+            file_path (str): a full path to the file that is about to be uploaded.
+            file_size (int): the size of the file in bytes.
+
+        Returns:
+            A string with 32 hexadecimal characters.
+        """
+        if not self._resume_upload:
+            return uuid.uuid4().hex
+
+        upload_key = "\n".join(
+            [
+                os.path.abspath(file_path),
+                str(file_size),
+                str(os.path.getmtime(file_path)),
+                str(self._sketch.id),
+                self._timeline_name or "",
+                self._index or "",
+                str(self._threshold_filesize),
+            ]
+        )
+        return hashlib.sha256(upload_key.encode("utf-8")).hexdigest()[:32]
+
+    def _get_upload_state(self, upload_id, chunks):
+        """Returns the state of a chunked upload on the server.
+
+        Args:
+            upload_id (str): the identifier of the chunked upload.
+            chunks (int): the total number of chunks.
+
+        Returns:
+            The response of the server, or None if the server is unable to
+            report the state of the upload.
+        """
+        params = {
+            "sketch_id": self._sketch.id,
+            "chunk_index_name": upload_id,
+            "chunk_total_chunks": chunks,
+        }
+        try:
+            response = self._sketch.api.session.get(self._resource_url, params=params)
+        except requests_exceptions.RequestException as e:
+            logger.warning("Unable to get the state of the upload: %s", e)
+            return None
+
+        if response.status_code not in definitions.HTTP_STATUS_CODE_20X:
+            return None
+        try:
+            response.json()
+        except ValueError:
+            return None
+        return response
+
+    @staticmethod
+    def _is_upload_indexed(state):
+        """Returns whether an upload was indexed into a timeline.
+
+        Args:
+            state (requests.Response): the state of the upload, see
+                _get_upload_state.
+
+        Returns:
+            True if the upload was completed and the server returned the
+            timeline of the upload.
+        """
+        if state is None:
+            return False
+        response_dict = state.json()
+        if not response_dict.get("meta", {}).get("upload_complete"):
+            return False
+        return bool(response_dict.get("objects"))
+
+    @staticmethod
+    def _is_upload_stale(state):
+        """Returns whether the timeline of a completed upload is gone.
+
+        Args:
+            state (requests.Response): the state of the upload, see
+                _get_upload_state.
+
+        Returns:
+            True if the upload was completed and indexed into a timeline, but
+            the server no longer returns that timeline.
+        """
+        if state is None:
+            return False
+        response_dict = state.json()
+        meta_dict = response_dict.get("meta", {})
+        if not meta_dict.get("upload_complete"):
+            return False
+        return bool(meta_dict.get("timeline_id")) and not response_dict.get("objects")
+
+    @staticmethod
+    def _get_missing_chunks(state, chunks):
+        """Returns the chunks of an upload that the server has not received.
+
+        Args:
+            state (requests.Response): the state of the upload, see
+                _get_upload_state.
+            chunks (int): the total number of chunks.
+
+        Returns:
+            A sorted list of chunk indices. If the server is unable to report
+            the state of the upload all chunks are returned. If the upload was
+            already completed no chunks are returned.
+        """
+        all_chunks = list(range(chunks))
+        if state is None:
+            return all_chunks
+
+        meta_dict = state.json().get("meta", {})
+        if meta_dict.get("upload_complete"):
+            return []
+        missing_chunks = meta_dict.get("missing_chunks")
+        if missing_chunks is None:
+            return all_chunks
+        missing_chunks = sorted(int(index) for index in missing_chunks)
+        # The upload is only completed by a request that uploads a chunk.
+        return missing_chunks or [chunks - 1]
+
+    def _upload_chunk(self, fh, fh_lock, file_path, data, index, chunks):
+        """Upload a single chunk of a file.
+
+        Args:
+            fh (file): the file object of the file, shared between uploads.
+            fh_lock (threading.Lock): lock that protects the file object.
+            file_path (str): a full path to the file that is uploaded.
+            data (dict): the form data of the upload.
+            index (int): the index of the chunk.
+            chunks (int): the total number of chunks.
+
+        Returns:
+            The response of the last upload attempt.
+        """
+        start = self._threshold_filesize * index
+        with fh_lock:
+            fh.seek(start)
+            binary_data = fh.read(self._threshold_filesize)
+
+        chunk_data = dict(data)
+        chunk_data["chunk_index"] = index
+        chunk_data["chunk_byte_offset"] = start
+
+        response = None
+        for retry_count in range(self.DEFAULT_RETRY_LIMIT):
+            if retry_count:
+                logger.warning(
+                    "Error uploading data chunk {0:d}/{1:d}, retry "
+                    "attempt {2:d}/{3:d}".format(
+                        index,
+                        chunks,
+                        retry_count,
+                        self.DEFAULT_RETRY_LIMIT,
+                    )
+                )
+                time.sleep(2**retry_count)
+
+            file_stream = io.BytesIO(binary_data)
+            file_stream.name = file_path
+            try:
+                response = self._sketch.api.session.post(
+                    self._resource_url,
+                    files={"file": file_stream},
+                    data=chunk_data,
+                )
+            except requests_exceptions.RequestException as e:
+                logger.warning("Unable to upload data chunk %d: %s", index, e)
+                continue
+
+            if response.status_code in definitions.HTTP_STATUS_CODE_20X:
+                break
+
+        return response
+
+    def _upload_chunks(self, file_path, file_size, data):
+        """Upload a file in chunks, in parallel and resuming earlier uploads.
+
+        The chunks that the server is missing are uploaded with up to
+        chunk_concurrency parallel requests. After every round the server is
+        asked which chunks are still missing, which are then uploaded again.
+
+        Args:
+            file_path (str): a full path to the file that is about to be uploaded.
+            file_size (int): the size of the file in bytes.
+            data (dict): the form data of the upload.
+
+        Returns:
+            The response of the request that completed the upload. If the
+            upload was completed before, the state of the upload with the
+            timeline it was indexed into.
+
+        Raises:
+            RuntimeError: If not all chunks could be uploaded.
+        """
+        chunks = int(math.ceil(float(file_size) / self._threshold_filesize))
+        upload_id = self._get_upload_id(file_path, file_size)
+        data["chunk_total_chunks"] = chunks
+        data["chunk_index_name"] = upload_id
+
+        state = self._get_upload_state(upload_id, chunks)
+        if self._is_upload_indexed(state):
+            logger.info(
+                "File %s was already uploaded, reusing its timeline.", file_path
+            )
+            return state
+
+        if self._is_upload_stale(state):
+            logger.info(
+                "The timeline of the earlier upload of %s no longer exists, "
+                "uploading the file again.",
+                file_path,
+            )
+            upload_id = uuid.uuid4().hex
+            data["chunk_index_name"] = upload_id
+            state = None
+
+        missing_chunks = self._get_missing_chunks(state, chunks)
+        if len(missing_chunks) < chunks:
+            logger.info(
+                "Resuming upload of %s, %d/%d chunks already uploaded.",
+                file_path,
+                chunks - len(missing_chunks),
+                chunks,
+            )
+
+        fh_lock = threading.Lock()
+        last_response = None
+        with open(file_path, "rb") as fh:
+            for retry_count in range(self.DEFAULT_RETRY_LIMIT):
+                # The upload is completed by another request, wait for the
+                # timeline to be created.
+                if not missing_chunks:
+                    time.sleep(2**retry_count)
+                with futures.ThreadPoolExecutor(
+                    max_workers=self._chunk_concurrency
+                ) as executor:
+                    responses = list(
+                        executor.map(
+                            lambda index: self._upload_chunk(
+                                fh, fh_lock, file_path, data, index, chunks
+                            ),
+                            missing_chunks,
+                        )
+                    )
+
+                for response in responses:
+                    if response is None:
+                        continue
+                    last_response = response
+                    if response.status_code not in definitions.HTTP_STATUS_CODE_20X:
+                        continue
+                    meta_dict = response.json().get("meta", {})
+                    if meta_dict.get("upload_complete"):
+                        return response
+
+                state = self._get_upload_state(upload_id, chunks)
+                if self._is_upload_indexed(state):
+                    return state
+                missing_chunks = self._get_missing_chunks(state, chunks)
+
+        if last_response is None:
+            raise RuntimeError(
+                "Error uploading data chunks of file: {0:s}".format(file_path)
+            )
+        raise RuntimeError(
+            "Error uploading data chunks: {0:d}/{1:d} missing. Status "
+            "code: {2:d} - {3!s} {4!s}".format(
+                len(missing_chunks),
+                chunks,
+                last_response.status_code,
+                last_response.reason,
+                last_response.text,
+            )
+        )
+
     def _upload_binary_file(self, file_path):
         """Upload binary data to Timesketch, potentially chunking it up.
 
@@ -457,52 +744,7 @@ class ImportStreamer(object):
                     self._resource_url, files=file_dict, data=data
                 )
         else:
-            chunks = int(math.ceil(float(file_size) / self._threshold_filesize))
-            data["chunk_total_chunks"] = chunks
-            data["chunk_index_name"] = uuid.uuid4().hex
-
-            for index in range(0, chunks):
-                data["chunk_index"] = index
-                start = self._threshold_filesize * index
-                data["chunk_byte_offset"] = start
-                with open(file_path, "rb") as fh:
-                    fh.seek(start)
-                    binary_data = fh.read(self._threshold_filesize)
-                    file_stream = io.BytesIO(binary_data)
-                    file_stream.name = file_path
-                    file_dict = {"file": file_stream}
-
-                retry_count = 0
-                while True:
-                    if retry_count >= self.DEFAULT_RETRY_LIMIT:
-                        raise RuntimeError(
-                            "Error uploading data chunk: {0:d}/{1:d}. Status "
-                            "code: {2:d} - {3!s} {4!s}".format(
-                                index,
-                                chunks,
-                                response.status_code,
-                                response.reason,
-                                response.text,
-                            )
-                        )
-
-                    response = self._sketch.api.session.post(
-                        self._resource_url, files=file_dict, data=data
-                    )
-
-                    if response.status_code in definitions.HTTP_STATUS_CODE_20X:
-                        break
-
-                    retry_count += 1
-                    logger.warning(
-                        "Error uploading data chunk {0:d}/{1:d}, retry "
-                        "attempt {2:d}/{3:d}".format(
-                            index,
-                            chunks,
-                            retry_count,
-                            self.DEFAULT_RETRY_LIMIT,
-                        )
-                    )
+            response = self._upload_chunks(file_path, file_size, data)
 
         if response.status_code not in definitions.HTTP_STATUS_CODE_20X:
             raise RuntimeError(
@@ -841,6 +1083,18 @@ class ImportStreamer(object):
         """Set the threshold for file size per chunk."""
         self._threshold_filesize = threshold
 
+    def set_chunk_concurrency(self, concurrency):
+        """Set the number of file chunks that are uploaded in parallel."""
+        self._chunk_concurrency = max(1, int(concurrency))
+
+    def set_resume_upload(self, resume):
+        """Set whether interrupted uploads of a file are resumed.
+
+        If set to False every upload of a file starts over, even if the
+        server has chunks of an earlier upload of the same file.
+        """
+        self._resume_upload = bool(resume)
+
     def set_config_helper(self, helper):
         """Set the config helper object."""
         self._config_helper = helper
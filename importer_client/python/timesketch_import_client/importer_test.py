@@ -15,6 +15,7 @@
 from __future__ import unicode_literals
 
 import json
+import tempfile
 import unittest
 import mock
 import pandas
@@ -347,3 +348,132 @@ class RunAnalyzersTest(unittest.TestCase):
             "['test_analyzer']",
             "Analyzer failed.",
         )
+
+    def test_upload_binary_file_chunks(self):
+        """Test that only the missing chunks of a file are uploaded."""
+        sketch = MockSketch()
+        status_response = mock.Mock(status_code=200)
+        status_response.json.return_value = {"meta": {"missing_chunks": [1, 3]}}
+        sketch.api.session.get.return_value = status_response
+
+        def _post(url, files, data):
+            del url
+            upload_complete = data["chunk_index"] == 3
+            response = mock.Mock(status_code=201)
+            response.json.return_value = {
+                "meta": {"upload_complete": upload_complete},
+                "objects": (
+                    [{"id": 2, "searchindex": {"index_name": "foo"}}]
+                    if upload_complete
+                    else []
+                ),
+            }
+            self.assertEqual(
+                files["file"].read(), b"0123456789abcd"[data["chunk_byte_offset"] :][:4]
+            )
+            return response
+
+        sketch.api.session.post.side_effect = _post
+
+        streamer = importer.ImportStreamer()
+        streamer.set_sketch(sketch)
+        streamer.set_filesize_threshold(4)
+        streamer.set_chunk_concurrency(2)
+        with tempfile.NamedTemporaryFile(suffix=".plaso") as fh:
+            fh.write(b"0123456789abcd")
+            fh.flush()
+            # pylint: disable=protected-access
+            streamer._upload_binary_file(fh.name)
+
+        uploaded = sorted(
+            call.kwargs["data"]["chunk_index"]
+            for call in sketch.api.session.post.call_args_list
+        )
+        self.assertEqual(uploaded, [1, 3])
+        # pylint: disable=protected-access
+        self.assertEqual(streamer._timeline_id, 2)
+        self.assertEqual(streamer._index, "foo")
+
+    def test_upload_binary_file_already_indexed(self):
+        """Test that a completed upload reuses its timeline."""
+        sketch = MockSketch()
+        status_response = mock.Mock(status_code=200)
+        status_response.json.return_value = {
+            "meta": {"upload_complete": True, "timeline_id": 2, "missing_chunks": []},
+            "objects": [{"id": 2, "searchindex": {"index_name": "foo"}}],
+        }
+        sketch.api.session.get.return_value = status_response
+
+        streamer = importer.ImportStreamer()
+        streamer.set_sketch(sketch)
+        streamer.set_filesize_threshold(4)
+        with tempfile.NamedTemporaryFile(suffix=".plaso") as fh:
+            fh.write(b"0123456789abcd")
+            fh.flush()
+            # pylint: disable=protected-access
+            streamer._upload_binary_file(fh.name)
+
+        sketch.api.session.post.assert_not_called()
+        # pylint: disable=protected-access
+        self.assertEqual(streamer._timeline_id, 2)
+        self.assertEqual(streamer._index, "foo")
+
+    def test_upload_binary_file_timeline_deleted(self):
+        """Test a re-import after the timeline of the upload was deleted."""
+        sketch = MockSketch()
+        status_response = mock.Mock(status_code=200)
+        status_response.json.return_value = {
+            "meta": {"upload_complete": True, "timeline_id": 2, "missing_chunks": []},
+            "objects": [],
+        }
+        sketch.api.session.get.return_value = status_response
+
+        def _post(url, files, data):
+            del url, files
+            upload_complete = data["chunk_index"] == 3
+            response = mock.Mock(status_code=201)
+            response.json.return_value = {
+                "meta": {"upload_complete": upload_complete},
+                "objects": (
+                    [{"id": 3, "searchindex": {"index_name": "foo"}}]
+                    if upload_complete
+                    else []
+                ),
+            }
+            return response
+
+        sketch.api.session.post.side_effect = _post
+
+        streamer = importer.ImportStreamer()
+        streamer.set_sketch(sketch)
+        streamer.set_filesize_threshold(4)
+        with tempfile.NamedTemporaryFile(suffix=".plaso") as fh:
+            fh.write(b"0123456789abcd")
+            fh.flush()
+            # pylint: disable=protected-access
+            upload_id = streamer._get_upload_id(fh.name, 14)
+            streamer._upload_binary_file(fh.name)
+
+        posted = sketch.api.session.post.call_args_list
+        self.assertEqual(
+            sorted(call.kwargs["data"]["chunk_index"] for call in posted), [0, 1, 2, 3]
+        )
+        upload_ids = {call.kwargs["data"]["chunk_index_name"] for call in posted}
+        self.assertEqual(len(upload_ids), 1)
+        self.assertNotIn(upload_id, upload_ids)
+        # pylint: disable=protected-access
+        self.assertEqual(streamer._timeline_id, 3)
+
+    def test_get_upload_id_without_resume(self):
+        """Test that a new upload identifier is used if resuming is disabled."""
+        streamer = importer.ImportStreamer()
+        streamer.set_sketch(MockSketch())
+        with tempfile.NamedTemporaryFile() as fh:
+            # pylint: disable=protected-access
+            self.assertEqual(
+                streamer._get_upload_id(fh.name, 0), streamer._get_upload_id(fh.name, 0)
+            )
+            streamer.set_resume_upload(False)
+            self.assertNotEqual(
+                streamer._get_upload_id(fh.name, 0), streamer._get_upload_id(fh.name, 0)
+            )
@@ -128,6 +128,13 @@ def upload_file(
         if size_threshold:
             streamer.set_filesize_threshold(size_threshold)
 
+        chunk_concurrency = config_dict.get("chunk_concurrency")
+        if chunk_concurrency:
+            streamer.set_chunk_concurrency(chunk_concurrency)
+
+        if not config_dict.get("resume_upload", True):
+            streamer.set_resume_upload(False)
+
         data_label = config_dict.get("data_label")
         if data_label:
             streamer.set_data_label(data_label)
@@ -428,6 +435,31 @@ def main(args=None):
         ),
     )
 
+    config_group.add_argument(
+        "--chunk_concurrency",
+        "--chunk-concurrency",
+        action="store",
+        type=int,
+        default=0,
+        dest="chunk_concurrency",
+        help=(
+            "For binary file transfer, how many chunks should be transferred "
+            "in parallel."
+        ),
+    )
+
+    config_group.add_argument(
+        "--no_resume",
+        "--no-resume",
+        action="store_false",
+        default=True,
+        dest="resume_upload",
+        help=(
+            "For binary file transfer, do not resume an earlier upload of the "
+            "same file, always upload the whole file again."
+        ),
+    )
+
     config_group.add_argument(
         "--sketch_id",
         "--sketch-id",
@@ -645,6 +677,8 @@ def main(args=None):
         "timestamp_description": options.time_desc,
         "entry_threshold": options.entry_threshold,
         "size_threshold": options.size_threshold,
+        "chunk_concurrency": options.chunk_concurrency,
+        "resume_upload": options.resume_upload,
         "log_config_file": options.log_config_file,
         "data_label": options.data_label,
         "context": context,
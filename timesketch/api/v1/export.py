@@ -14,18 +14,59 @@
 """This module holds methods and classes to export events."""
 
 
+import csv
 import io
 import json
 import logging
+import zipfile
 
 import pandas as pd
 
 from timesketch.api.v1 import utils
+from timesketch.lib.aggregators import result_cache as aggregation_result_cache
 from timesketch.lib.stories import api_fetcher as story_api_fetcher
 
 
 logger = logging.getLogger("timesketch.api_exporter")
 
+# Number of CSV rows written to the ZIP stream before the produced bytes are
+# handed back to the caller.
+STREAM_FLUSH_ROWS = 1000
+
+# Columns that are added to every exported event, after the mapped fields.
+EXPORT_EXTRA_COLUMNS = ("_id", "_index", "label")
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only, non-seekable buffer used to stream a ZIP file.
+
+    ZipFile falls back to writing data descriptors when the underlying file
+    object cannot seek, which allows the archive to be produced front to back
+    and sent to the client while it is being written.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):  # pylint: disable=arguments-renamed
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        """Returns and clears the bytes written since the last call."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
 
 def export_aggregation(aggregation, sketch, zip_file):
     """Export an aggregation from a sketch and write it to a ZIP file.
@@ -38,12 +79,17 @@ def export_aggregation(aggregation, sketch, zip_file):
             content to.
     """
     name = f"{aggregation.id:04d}_{aggregation.name:s}"
-    parameters = json.loads(aggregation.parameters)
-    result_obj, meta = utils.run_aggregator(
-        sketch.id,
-        aggregator_name=aggregation.agg_type,
-        aggregator_parameters=parameters,
-    )
+    if aggregation.sketch_id != sketch.id:
+        logger.error(
+            "Aggregation %d does not belong to sketch %d", aggregation.id, sketch.id
+        )
+        return
+
+    # The result is read from the aggregation result cache, if enabled.
+    result_obj, meta = aggregation_result_cache.get_result(aggregation)
+    if result_obj is None:
+        logger.error("Unable to export aggregation %d", aggregation.id)
+        return
 
     zip_file.writestr(f"aggregations/{name:s}.meta", data=json.dumps(meta))
 
@@ -111,6 +157,169 @@ def export_story(story, sketch, story_exporter, zip_file):
         )
 
 
+def get_export_columns(datastore, indices, return_fields=None):
+    """Returns a stable, ordered list of CSV columns for an export.
+
+    The columns are taken from the field mappings of the indices, so that
+    every export of the same indices produces the same header regardless
+    of which fields the first events happen to contain.
+
+    Args:
+        datastore (opensearch.OpenSearchDataStore): the datastore object.
+        indices (list): List of index names that are exported.
+        return_fields (list): Optional list of fields to limit the columns to.
+
+    Returns:
+        list: the column names, mapped fields sorted by name followed by
+            the document ID, index name and sketch labels.
+    """
+    try:
+        mappings = datastore.client.indices.get_mapping(index=indices)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning("Unable to get mappings for export: %s", str(e))
+        mappings = {}
+
+    fields = set()
+    for value in mappings.values():
+        properties = value.get("mappings", {}).get("properties")
+        if properties is None:
+            # Mapping types were removed in version 7, older versions nest
+            # the properties under the document type.
+            properties = next(iter(value.get("mappings", {}).values()), {}).get(
+                "properties", {}
+            )
+        fields.update(properties.keys())
+
+    fields.discard("timesketch_label")
+    if return_fields:
+        wanted_fields = set(return_fields)
+        fields = {field for field in fields if field in wanted_fields}
+        if not fields:
+            fields = wanted_fields
+
+    columns = sorted(field for field in fields if field not in EXPORT_EXTRA_COLUMNS)
+    columns.extend(EXPORT_EXTRA_COLUMNS)
+    return columns
+
+
+def _event_to_row(event, sketch_id, columns):
+    """Returns a CSV row from an exported event dict.
+
+    Args:
+        event (dict): an event as yielded by export_events_with_slicing.
+        sketch_id (int): the sketch ID, used to select the event labels.
+        columns (list): the column names of the export.
+
+    Returns:
+        list: the CSV values in the order of the columns.
+    """
+    labels = [
+        label.get("name")
+        for label in event.get("timesketch_label", [])
+        if label.get("sketch_id") == sketch_id
+    ]
+    row = []
+    for column in columns:
+        if column == "label":
+            value = labels
+        else:
+            value = event.get(column)
+
+        if value is None:
+            row.append("")
+        elif column == "tag" and isinstance(value, (list, tuple)):
+            row.append(",".join(value))
+        else:
+            row.append(value)
+    return row
+
+
+def query_to_zip_stream(
+    metadata,
+    query_string="",
+    query_dsl="",
+    query_filter=None,
+    sketch=None,
+    datastore=None,
+    indices=None,
+    timeline_ids=None,
+    return_fields=None,
+):
+    """Query the datastore and stream the results as a ZIP file.
+
+    The events are fetched with the sliced Point-In-Time export of the
+    datastore and written to the CSV as they arrive, so memory usage does
+    not grow with the number of exported events.
+
+    Args:
+        metadata (dict): content of the METADATA file in the archive.
+        query_string (str): OpenSearch query string.
+        query_dsl (str): OpenSearch query DSL as JSON string.
+        query_filter (dict): Filter for the query as a dict.
+        sketch (timesketch.models.sketch.Sketch): a sketch object.
+        datastore (opensearch.OpenSearchDataStore): the datastore object.
+        indices (list): List of indices to query
+        timeline_ids (list): Optional list of IDs of Timeline objects that
+            should be queried as part of the search.
+        return_fields (list): List of fields to return
+
+    Yields:
+        bytes: consecutive parts of a ZIP file containing a METADATA file and
+            a query_results.csv file.
+    """
+    if query_filter is None:
+        query_filter = {}
+
+    full_query_dsl = datastore.build_query(
+        sketch_id=sketch.id,
+        query_string=query_string,
+        query_filter=query_filter,
+        query_dsl=query_dsl,
+        timeline_ids=timeline_ids,
+    )
+    base_query_body = {"query": full_query_dsl.get("query", {})}
+    post_filter = full_query_dsl.get("post_filter")
+    if post_filter:
+        base_query_body["post_filter"] = post_filter
+
+    columns = get_export_columns(datastore, indices, return_fields)
+    if return_fields:
+        source_fields = [
+            column for column in columns if column not in EXPORT_EXTRA_COLUMNS
+        ]
+        source_fields.append("timesketch_label")
+        base_query_body["_source"] = source_fields
+
+    stream = _ZipStreamBuffer()
+    with zipfile.ZipFile(
+        stream, mode="w", compression=zipfile.ZIP_DEFLATED
+    ) as zip_file:
+        zip_file.writestr("METADATA", data=json.dumps(metadata))
+        yield stream.drain()
+
+        with zip_file.open("query_results.csv", mode="w", force_zip64=True) as fw:
+            text_fh = io.TextIOWrapper(fw, encoding="utf-8", newline="")
+            csv_writer = csv.writer(text_fh)
+            csv_writer.writerow(columns)
+
+            row_count = 0
+            for event in datastore.export_events_with_slicing(
+                indices_for_pit=list(indices),
+                base_query_body=base_query_body,
+            ):
+                csv_writer.writerow(_event_to_row(event, sketch.id, columns))
+                row_count += 1
+                if row_count % STREAM_FLUSH_ROWS == 0:
+                    text_fh.flush()
+                    yield stream.drain()
+
+            text_fh.flush()
+            text_fh.detach()
+
+    logger.info("Streamed %d events to a ZIP export.", row_count)
+    yield stream.drain()
+
+
 def query_to_filehandle(
     query_string="",
     query_dsl="",
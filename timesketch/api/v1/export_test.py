@@ -0,0 +1,114 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the API export functions."""
+import csv
+import io
+import json
+import zipfile
+
+from unittest import mock
+
+from timesketch.api.v1 import export
+from timesketch.lib.testlib import BaseTest
+
+
+class TestQueryToZipStream(BaseTest):
+    """Tests for streaming query results into a ZIP file."""
+
+    MAPPING = {
+        "index_1": {
+            "mappings": {
+                "properties": {
+                    "message": {"type": "text"},
+                    "datetime": {"type": "date"},
+                    "tag": {"type": "keyword"},
+                    "timesketch_label": {"type": "nested"},
+                }
+            }
+        }
+    }
+
+    def _get_datastore(self, events):
+        """Returns a mocked datastore that exports the given events."""
+        datastore = mock.MagicMock()
+        datastore.client.indices.get_mapping.return_value = self.MAPPING
+        datastore.build_query.return_value = {
+            "query": {"match_all": {}},
+            "size": 10000,
+        }
+        datastore.export_events_with_slicing.return_value = iter(events)
+        return datastore
+
+    def test_get_export_columns(self):
+        """Test that the columns come from the mapping in a stable order."""
+        datastore = self._get_datastore([])
+        columns = export.get_export_columns(datastore, ["index_1"])
+        self.assertEqual(
+            columns, ["datetime", "message", "tag", "_id", "_index", "label"]
+        )
+
+        columns = export.get_export_columns(
+            datastore, ["index_1"], return_fields=["message", "foobar"]
+        )
+        self.assertEqual(columns, ["message", "_id", "_index", "label"])
+
+    def test_query_to_zip_stream(self):
+        """Test that events are written as CSV rows into the ZIP stream."""
+        events = [
+            {
+                "_id": str(event_id),
+                "_index": "index_1",
+                "message": f"event {event_id}",
+                "tag": ["foo", "bar"],
+                "timesketch_label": [
+                    {"name": "__ts_star", "sketch_id": 1},
+                    {"name": "other", "sketch_id": 2},
+                ],
+            }
+            for event_id in range(export.STREAM_FLUSH_ROWS + 1)
+        ]
+        datastore = self._get_datastore(events)
+        sketch = mock.Mock(id=1)
+
+        parts = list(
+            export.query_to_zip_stream(
+                {"query": "*"},
+                query_string="*",
+                query_filter={"size": 10000},
+                sketch=sketch,
+                datastore=datastore,
+                indices=["index_1"],
+            )
+        )
+        # METADATA, one flushed batch of rows and the remainder.
+        self.assertGreaterEqual(len(parts), 3)
+
+        base_query_body = datastore.export_events_with_slicing.call_args[1][
+            "base_query_body"
+        ]
+        self.assertEqual(base_query_body, {"query": {"match_all": {}}})
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(parts))) as zip_file:
+            self.assertEqual(zip_file.namelist(), ["METADATA", "query_results.csv"])
+            self.assertEqual(json.loads(zip_file.read("METADATA")), {"query": "*"})
+            csv_data = zip_file.read("query_results.csv").decode("utf-8")
+
+        rows = list(csv.reader(io.StringIO(csv_data)))
+        self.assertEqual(len(rows), len(events) + 1)
+        self.assertEqual(
+            rows[0], ["datetime", "message", "tag", "_id", "_index", "label"]
+        )
+        self.assertEqual(
+            rows[1], ["", "event 0", "foo,bar", "0", "index_1", "['__ts_star']"]
+        )
@@ -384,6 +384,9 @@ class ResourceMixin:
     def datastore(self):
         """Property to get an instance of the datastore backend.
 
+        The datastore is cheap to create, all instances in the process share
+        the same pooled OpenSearch client.
+
         Returns:
             Instance of lib.datastores.opensearch.OpenSearchDatastore
         """
@@ -23,6 +23,7 @@ from flask import current_app
 from flask import jsonify
 from flask import request
 from flask import abort
+from flask_restful import inputs
 from flask_restful import marshal
 from flask_restful import Resource
 from flask_login import login_required
@@ -39,6 +40,7 @@ from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
 from timesketch.lib.definitions import HTTP_STATUS_CODE_FORBIDDEN
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.lib.aggregators import manager as aggregator_manager
+from timesketch.lib.aggregators import result_cache as aggregation_result_cache
 from timesketch.models import db_session
 from timesketch.models.sketch import Aggregation
 from timesketch.models.sketch import AggregationGroup
@@ -57,6 +59,9 @@ class AggregationResource(resources.ResourceMixin, Resource):
 
         Handler for /api/v1/sketches/:sketch_id/aggregation/:aggregation_id
 
+        Add ?include_result=true to get the result and the Vega spec of the
+        aggregation in the meta of the response.
+
         Args:
             sketch_id: Integer primary key for a sketch database model.
             aggregation_id: Integer primary key for an aggregation database
@@ -100,7 +105,19 @@ class AggregationResource(resources.ResourceMixin, Resource):
         # Update the last activity of a sketch.
         utils.update_sketch_last_activity(sketch)
 
-        return self.to_json(aggregation)
+        meta = {}
+        if request.args.get("include_result", default=False, type=inputs.boolean):
+            # The result is read from the aggregation result cache, if enabled.
+            result_obj, meta = aggregation_result_cache.get_result(aggregation)
+            if result_obj is None:
+                abort(
+                    HTTP_STATUS_CODE_BAD_REQUEST,
+                    f"Unable to run aggregation, no aggregator named "
+                    f"{aggregation.agg_type:s}",
+                )
+            meta = dict(meta, result=result_obj.to_dict(encoding=True))
+
+        return self.to_json(aggregation, meta=meta)
 
     @login_required
     # pylint: disable=unused-argument
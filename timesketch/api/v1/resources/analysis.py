@@ -21,6 +21,7 @@ import prometheus_client
 from flask import jsonify
 from flask import request
 from flask import abort
+from flask import current_app
 from flask_restful import Resource
 from flask_restful import reqparse
 from flask_login import login_required
@@ -296,6 +297,24 @@ class AnalyzerRunResource(resources.ResourceMixin, Resource):
         # pylint: disable=import-outside-toplevel
         from timesketch.lib import tasks
 
+        # Users can lower the number of analyzers that run at the same time,
+        # the configured value is the upper limit.
+        max_concurrency = current_app.config.get(
+            "ANALYZERS_MAX_CONCURRENCY", tasks.DEFAULT_ANALYZERS_MAX_CONCURRENCY
+        )
+        requested_concurrency = form.get("max_concurrency")
+        if requested_concurrency is not None:
+            if (
+                isinstance(requested_concurrency, bool)
+                or not isinstance(requested_concurrency, int)
+                or requested_concurrency < 1
+            ):
+                return abort(
+                    HTTP_STATUS_CODE_BAD_REQUEST,
+                    "Max concurrency needs to be a positive integer.",
+                )
+            max_concurrency = min(requested_concurrency, max_concurrency)
+
         # TODO: Change to run on Timeline instead of Index
         sessions = []
         for timeline_id in timeline_ids:
@@ -317,6 +336,7 @@ class AnalyzerRunResource(resources.ResourceMixin, Resource):
                     timeline_id=timeline_id,
                     analyzer_force_run=analyzer_force_run,
                     include_dfiq=include_dfiq,
+                    max_concurrency=max_concurrency,
                 )
             except KeyError as e:
                 logger.warning(
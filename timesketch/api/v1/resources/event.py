@@ -18,15 +18,12 @@ import datetime
 import hashlib
 import json
 import logging
-import math
 import time
 from typing import Optional
 import six
 
 import dateutil
 from opensearchpy.exceptions import RequestError
-import numpy as np
-import pandas as pd
 
 from flask import current_app
 from flask import jsonify
@@ -36,9 +33,11 @@ from flask_restful import Resource, inputs
 from flask_restful import reqparse
 from flask_login import login_required
 from flask_login import current_user
+from sqlalchemy.orm import selectinload
 
 from timesketch.api.v1 import resources
 from timesketch.lib import forms
+from timesketch.lib.datastores import query_cache
 from timesketch.lib.definitions import HTTP_STATUS_CODE_OK
 from timesketch.lib.definitions import HTTP_STATUS_CODE_CREATED
 from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
@@ -57,47 +56,6 @@ from timesketch.models.sketch import SearchHistory
 logger = logging.getLogger("timesketch.event_api")
 
 
-def _tag_event(row, tag_dict, tags_to_add, datastore, flush_interval):
-    """Tag each event from a dataframe with tags.
-
-    Args:
-        row (np.Series): a single row of data with existing tags and
-            information about the event in order to be able to add
-            tags to it.
-        tag_dict (dict): a dict that contains information to be returned
-            by the API call to the user.
-        tags_to_add (list[str]): a list of strings of tags to add to each
-            event.
-        datastore (opensearch.OpenSearchDataStore): the datastore object.
-        flush_interval (int): the number of events to import before a bulk
-            update is done with the datastore.
-    """
-    tag_dict["events_processed_by_api"] += 1
-    existing_tags = set()
-
-    if "tag" in row:
-        tag = row["tag"]
-        if isinstance(tag, (list, tuple)):
-            existing_tags = set(tag)
-
-        new_tags = list(set().union(existing_tags, set(tags_to_add)))
-    else:
-        new_tags = tags_to_add
-
-    if set(existing_tags) == set(new_tags):
-        return
-
-    datastore.import_event(
-        index_name=row["_index"],
-        event_id=row["_id"],
-        event={"tag": new_tags},
-        flush_interval=flush_interval,
-    )
-
-    tag_dict["tags_applied"] += len(new_tags)
-    tag_dict["number_of_events_with_added_tags"] += 1
-
-
 class EventCreateResource(resources.ResourceMixin, Resource):
     """Resource to create an annotation for an event."""
 
@@ -549,19 +507,19 @@ class EventAddAttributeResource(resources.ResourceMixin, Resource):
 class EventTaggingResource(resources.ResourceMixin, Resource):
     """Resource to fetch and set tags to an event."""
 
-    # The number of events to bulk together for each query.
-    EVENT_CHUNK_SIZE = 1000
-
-    # The maximum number of events to tag in a single request.
+    # The maximum number of events to tag in a single request, larger
+    # requests are tagged asynchronously by a Celery task.
     MAX_EVENTS_TO_TAG = 100000
 
-    # The size of the buffer before a bulk update in ES takes place.
-    BUFFER_SIZE_FOR_ES_BULK_UPDATES = 10000
-
     @login_required
     def post(self, sketch_id: int):
         """Handles POST request to the resource.
 
+        The tags are added server side with a painless script, events are not
+        read before they are updated. Requests with more than
+        MAX_EVENTS_TO_TAG events, or with "async" set, are handed over to a
+        Celery task and the task ID is returned.
+
         Args:
             sketch_id: (int) Integer primary key for a sketch database model
 
@@ -586,7 +544,8 @@ class EventTaggingResource(resources.ResourceMixin, Resource):
         tag_dict = {
             "events_processed_by_api": 0,
             "number_of_events_with_added_tags": 0,
-            "tags_applied": 0,
+            "number_of_version_conflicts": 0,
+            "number_of_failures": 0,
         }
         datastore = self.datastore
 
@@ -608,136 +567,87 @@ class EventTaggingResource(resources.ResourceMixin, Resource):
             )
 
         events = form.get("events", [])
-        event_df = pd.DataFrame(events)
-
-        for field in ["_id", "_index"]:
-            if field not in event_df:
-                abort(
-                    HTTP_STATUS_CODE_BAD_REQUEST,
-                    f"Events need to have a [{field:s}] field associated to it.",
-                )
-            if any(event_df[field].isna()):
-                abort(
-                    HTTP_STATUS_CODE_BAD_REQUEST,
-                    f"All events need to have a [{field:s}] field set, it cannot"
-                    "have a non-value.",
-                )
-
-        # Remove any potential extra fields from the events.
-        if "_type" in event_df:
-            event_df = event_df[["_id", "_type", "_index"]]
-        else:
-            event_df = event_df[["_id", "_index"]]
-
-        tag_df = pd.DataFrame()
-
-        event_size = event_df.shape[0]
-        if event_size > self.MAX_EVENTS_TO_TAG:
-            abort(
-                HTTP_STATUS_CODE_BAD_REQUEST,
-                f"Cannot tag more than {self.MAX_EVENTS_TO_TAG:d} events in a "
-                "single request",
-            )
-
-        tag_dict["number_of_events_passed_to_api"] = event_size
-
-        errors = []
-
-        verbose = form.get("verbose", False)
-        if verbose:
-            tag_dict["number_of_indices"] = len(event_df["_index"].unique())
-            time_tag_gathering_start = time.time()
-
-        for _index in event_df["_index"].unique():
-            index_slice = event_df[event_df["_index"] == _index]
-            index_size = index_slice.shape[0]
-
-            if verbose:
-                tag_dict.setdefault("index_count", {})
-                tag_dict["index_count"][_index] = index_size
-
-            if index_size <= self.EVENT_CHUNK_SIZE:
-                chunks = 1
-            else:
-                chunks = math.ceil(index_size / self.EVENT_CHUNK_SIZE)
-
-            tags = []
-            for index_chunk in np.array_split(index_slice["_id"].unique(), chunks):
-                should_list = [{"match": {"_id": x}} for x in index_chunk]
-                query_body = {"query": {"bool": {"should": should_list}}}
-
-                # Adding a small buffer to make sure all results are captured.
-                size = len(should_list) + 100
-                query_body["size"] = size
-                query_body["terminate_after"] = size
-
-                try:
-                    # pylint: disable=unexpected-keyword-arg
-                    if datastore.version.startswith("6"):
-                        search = datastore.client.search(
-                            body=json.dumps(query_body),
-                            index=[_index],
-                            _source_include=["tag"],
-                            search_type="query_then_fetch",
-                        )
-                    else:
-                        search = datastore.client.search(
-                            body=json.dumps(query_body),
-                            index=[_index],
-                            _source_includes=["tag"],
-                            search_type="query_then_fetch",
-                        )
+        if not isinstance(events, list):
+            abort(HTTP_STATUS_CODE_BAD_REQUEST, "Events need to be a list")
 
-                except RequestError as e:
-                    logger.error("Unable to query for events", exc_info=True)
-                    errors.append(f"Unable to query for events, {e!s}")
+        event_ids_per_index = {}
+        for event in events:
+            for field in ["_id", "_index"]:
+                if field not in event:
                     abort(
                         HTTP_STATUS_CODE_BAD_REQUEST,
-                        f"Unable to query events, {e!s}",
+                        f"Events need to have a [{field:s}] field associated to it.",
                     )
+                if not event[field]:
+                    abort(
+                        HTTP_STATUS_CODE_BAD_REQUEST,
+                        f"All events need to have a [{field:s}] field set, it cannot"
+                        "have a non-value.",
+                    )
+            event_ids_per_index.setdefault(event["_index"], set()).add(event["_id"])
 
-                for result in search["hits"]["hits"]:
-                    tag = result.get("_source", {}).get("tag", [])
-                    if not tag:
-                        continue
-                    tags.append({"_id": result.get("_id"), "tag": tag})
+        sketch_indices = {t.searchindex.index_name for t in sketch.timelines}
+        if not set(event_ids_per_index).issubset(sketch_indices):
+            abort(
+                HTTP_STATUS_CODE_FORBIDDEN,
+                "Events need to be part of a timeline in this sketch.",
+            )
 
-            if not tags:
-                continue
-            tag_df = pd.concat([tag_df, pd.DataFrame(tags)])
+        event_ids_per_index = {
+            index_name: sorted(event_ids)
+            for index_name, event_ids in event_ids_per_index.items()
+        }
 
-        if tag_df.shape[0]:
-            event_df = event_df.merge(tag_df, on="_id", how="left")
+        event_size = len(events)
+        tag_dict["number_of_events_passed_to_api"] = event_size
 
+        verbose = form.get("verbose", False)
         if verbose:
-            tag_dict["time_to_gather_tags"] = time.time() - time_tag_gathering_start
-            tag_dict["number_of_events"] = len(events)
+            tag_dict["number_of_indices"] = len(event_ids_per_index)
+            tag_dict["index_count"] = {
+                index_name: len(event_ids)
+                for index_name, event_ids in event_ids_per_index.items()
+            }
+            tag_dict["tags_to_add"] = tags_to_add
+            time_tag_start = time.time()
 
-            if tag_df.shape[0]:
-                tag_dict["number_of_events_in_tag_frame"] = tag_df.shape[0]
+        if form.get("async", False) or event_size > self.MAX_EVENTS_TO_TAG:
+            # Import here to avoid circular imports.
+            # pylint: disable=import-outside-toplevel
+            from timesketch.lib import tasks
 
-            if "tag" in event_df:
-                current_tag_events = event_df[~event_df["tag"].isna()].shape[0]
-                tag_dict["number_of_events_with_tags"] = current_tag_events
-            else:
-                tag_dict["number_of_events_with_tags"] = 0
+            task = tasks.run_tag_events.apply_async(
+                args=(event_ids_per_index, tags_to_add)
+            )
+            tag_dict["task_id"] = task.id
+            schema = {"meta": tag_dict, "objects": []}
+            response = jsonify(schema)
+            response.status_code = HTTP_STATUS_CODE_OK
+            return response
 
-            tag_dict["tags_to_add"] = tags_to_add
-            time_tag_start = time.time()
+        errors = []
+        for index_name, event_ids in event_ids_per_index.items():
+            try:
+                result = datastore.add_tags_to_events(
+                    index_name, event_ids, tags_to_add
+                )
+            except RequestError as e:
+                logger.error("Unable to tag events", exc_info=True)
+                abort(
+                    HTTP_STATUS_CODE_BAD_REQUEST,
+                    f"Unable to tag events, {e!s}",
+                )
 
-        if event_size > datastore.DEFAULT_FLUSH_INTERVAL:
-            flush_interval = self.BUFFER_SIZE_FOR_ES_BULK_UPDATES
-        else:
-            flush_interval = datastore.DEFAULT_FLUSH_INTERVAL
-        _ = event_df.apply(
-            _tag_event,
-            axis=1,
-            tag_dict=tag_dict,
-            tags_to_add=tags_to_add,
-            datastore=datastore,
-            flush_interval=flush_interval,
-        )
-        datastore.flush_queued_events()
+            tag_dict["events_processed_by_api"] += result["total"]
+            tag_dict["number_of_events_with_added_tags"] += result["updated"]
+            tag_dict["number_of_version_conflicts"] += result["version_conflicts"]
+            tag_dict["number_of_failures"] += len(result["failures"])
+            errors.extend(str(failure) for failure in result["failures"])
+            if result["version_conflicts"]:
+                errors.append(
+                    f"Unable to tag {result['version_conflicts']:d} events in "
+                    f"{index_name:s}, they were changed by another update."
+                )
 
         if verbose:
             tag_dict["time_to_tag"] = time.time() - time_tag_start
@@ -762,6 +672,12 @@ class EventAnnotationResource(resources.ResourceMixin, Resource):
         currentSearchNode_id: The search node id as string
     """
 
+    # Maximum number of events that are looked up with a single query.
+    EVENT_LOOKUP_CHUNK_SIZE = 500
+
+    # Number of label updates that are sent in a single bulk request.
+    DATASTORE_FLUSH_INTERVAL = 1000
+
     def __init__(self):
         super().__init__()
         self.parser = reqparse.RequestParser()
@@ -882,104 +798,183 @@ class EventAnnotationResource(resources.ResourceMixin, Resource):
 
         return None
 
-    def _get_search_index_for_event(
+    def _get_search_indices_for_events(
         self,
         sketch: Sketch,
-        event_id: str,
-    ) -> str:
-        """Gets the search index name associated with the event.
+        event_ids: list,
+    ) -> dict:
+        """Gets the search index names associated with a list of events.
 
-        This function queries the datastore to find the specific search index
-        that an event belongs to within the context of a given sketch. It's
-        used when the event's index is not explicitly provided in an API request.
+        This is the batched form of looking up the index of an event when it
+        is not explicitly provided in an API request. The events are looked up
+        with one IDs query per chunk of event IDs.
 
         Args:
             sketch: The Sketch object to query.
-            event_id: The document_id to query.
+            event_ids: List of document_ids to query.
 
         Returns:
-            str: The search index name.
+            dict: The search index name per document_id.
 
         Raises:
             HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR: If a datastore error occurs
                 during the search.
-            HTTP_STATUS_CODE_NOT_FOUND: If the event is not found in any of the
+            HTTP_STATUS_CODE_NOT_FOUND: If an event is not found in any of the
                 sketch's active timelines.
             HTTP_STATUS_CODE_BAD_REQUEST: If multiple events are found with the
                 same ID across different indices (ambiguity).
         """
-
         indices_to_search = [t.searchindex.index_name for t in sketch.active_timelines]
-        event_id_query = f"_id:{event_id}"
-        try:
-            result = self.datastore.search(
-                sketch_id=sketch.id,
-                indices=indices_to_search,
-                query_string=event_id_query,
-            )
-        except ValueError as e:
-            logger.error(
-                "Datastore search failed for event_id [%s] in sketch [%s]: %s",
-                event_id,
-                sketch.id,
-                e,
-                exc_info=True,
-            )
-            abort(
-                HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR,
-                f"Error while searching for event [{event_id}] to determine its index.",
-            )
-        if isinstance(result, dict):
-            hits = result.get("hits", {}).get("hits", [])
+        event_ids = list(dict.fromkeys(event_ids))
+        index_names = {}
+        chunk_size = self.EVENT_LOOKUP_CHUNK_SIZE
+        for chunk_start in range(0, len(event_ids), chunk_size):
+            chunk = event_ids[chunk_start : chunk_start + chunk_size]
+            try:
+                result = self.datastore.search(
+                    sketch_id=sketch.id,
+                    indices=indices_to_search,
+                    query_dsl={"query": {"ids": {"values": chunk}}},
+                    # Allow for the same _id to be found in more than one index.
+                    query_filter={"size": len(chunk) * 2},
+                    return_fields=["_id"],
+                )
+            except ValueError as e:
+                logger.error(
+                    "Datastore search failed for [%d] events in sketch [%s]: %s",
+                    len(chunk),
+                    sketch.id,
+                    e,
+                    exc_info=True,
+                )
+                abort(
+                    HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR,
+                    "Error while searching for events to determine their index.",
+                )
 
-        if not hits:
-            logger.error(
-                "Event with ID [%s] not found in indices [%s] for sketch [%s].",
-                event_id,
-                ",".join(indices_to_search),
-                sketch.id,
-            )
-            abort(
-                HTTP_STATUS_CODE_NOT_FOUND,
-                f"Event with ID [{event_id}] not found in the specified sketch "
-                "context.",
-            )
-        if len(hits) > 1:
-            # _id is only unique per index, so there is a slight chance of the
-            # same _id in two indices. If this happens, log a warning and abort!
-            logger.warning(
-                "Found multiple events with the same _ID [%s] in different "
-                "indices [%s] for sketch [%s].",
-                event_id,
-                ",".join(indices_to_search),
-                sketch.id,
-            )
-            abort(
-                HTTP_STATUS_CODE_BAD_REQUEST,
-                f"Multiple events found with ID [{event_id}]. This ID exists in "
-                "more than one search index. Please specify the '_index' "
-                "(search index name) for this event in your request to disambiguate.",
-            )
+            hits = []
+            if isinstance(result, dict):
+                hits = result.get("hits", {}).get("hits", [])
+
+            for hit in hits:
+                event_id = hit.get("_id")
+                if event_id in index_names:
+                    # _id is only unique per index, so there is a slight chance
+                    # of the same _id in two indices. If this happens, log a
+                    # warning and abort!
+                    logger.warning(
+                        "Found multiple events with the same _ID [%s] in "
+                        "different indices [%s] for sketch [%s].",
+                        event_id,
+                        ",".join(indices_to_search),
+                        sketch.id,
+                    )
+                    abort(
+                        HTTP_STATUS_CODE_BAD_REQUEST,
+                        f"Multiple events found with ID [{event_id}]. This ID "
+                        "exists in more than one search index. Please specify "
+                        "the '_index' (search index name) for this event in "
+                        "your request to disambiguate.",
+                    )
+                index_names[event_id] = hit.get("_index")
 
-        # We expect only one hit for a unique event ID.
-        event_index_name = hits[0].get("_index")
+        for event_id in event_ids:
+            if event_id not in index_names:
+                logger.error(
+                    "Event with ID [%s] not found in indices [%s] for sketch [%s].",
+                    event_id,
+                    ",".join(indices_to_search),
+                    sketch.id,
+                )
+                abort(
+                    HTTP_STATUS_CODE_NOT_FOUND,
+                    f"Event with ID [{event_id}] not found in the specified sketch "
+                    "context.",
+                )
+            if not index_names[event_id]:
+                logger.error(
+                    "Event with ID [%s] found, but it is missing the _index field.",
+                    event_id,
+                )
+                abort(
+                    HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR,
+                    f"Found event [{event_id}] but it is missing index information.",
+                )
 
-        if not event_index_name:
-            logger.error(
-                "Event with ID [%s] found, but it is missing the _index field.",
-                event_id,
+        return index_names
+
+    def _get_or_create_events(
+        self,
+        sketch: Sketch,
+        searchindices: dict,
+        event_keys: list,
+        annotation_type: str,
+    ) -> dict:
+        """Gets or creates the SQL Event objects for a list of events.
+
+        Existing events are fetched with one IN query per chunk of document
+        IDs, with the annotations of the given type loaded eagerly. Missing
+        events are created and added to the session, but not committed.
+
+        Args:
+            sketch: The Sketch object the events belong to.
+            searchindices: Dict with the SearchIndex object per index name.
+            event_keys: List of (index name, document_id) tuples.
+            annotation_type: The annotation type (comment, label) as string.
+
+        Returns:
+            dict: The Event object per (index name, document_id) tuple.
+        """
+        index_names_by_id = {
+            searchindex.id: index_name
+            for index_name, searchindex in searchindices.items()
+        }
+        event_keys = list(dict.fromkeys(event_keys))
+        document_ids = list({document_id for _, document_id in event_keys})
+
+        eager_load = None
+        if "comment" in annotation_type:
+            eager_load = selectinload(Event.comments)
+        elif "label" in annotation_type:
+            eager_load = selectinload(Event.labels)
+
+        events = {}
+        chunk_size = self.EVENT_LOOKUP_CHUNK_SIZE
+        for chunk_start in range(0, len(document_ids), chunk_size):
+            chunk = document_ids[chunk_start : chunk_start + chunk_size]
+            query = Event.query.filter(
+                Event.sketch_id == sketch.id,
+                Event.searchindex_id.in_(list(index_names_by_id)),
+                Event.document_id.in_(chunk),
             )
-            abort(
-                HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR,
-                f"Found event [{event_id}] but it is missing index information.",
+            if eager_load is not None:
+                query = query.options(eager_load)
+            for event in query.all():
+                event_key = (index_names_by_id[event.searchindex_id], event.document_id)
+                events.setdefault(event_key, event)
+
+        for index_name, document_id in event_keys:
+            if (index_name, document_id) in events:
+                continue
+            event = Event(
+                sketch=sketch,
+                searchindex=searchindices.get(index_name),
+                document_id=document_id,
             )
+            db_session.add(event)
+            events[(index_name, document_id)] = event
 
-        return event_index_name
+        return events
 
     @login_required
     def post(self, sketch_id: int):
         """Handles POST request to the resource.
 
+        All events in the request are annotated in a batch: the events are
+        resolved with bulk queries, the label scripts are sent to the
+        datastore with the bulk API and the database changes are committed
+        in a single transaction.
+
         Args:
             sketch_id: (int) Integer primary key for a sketch database model
 
@@ -1010,27 +1005,147 @@ class EventAnnotationResource(resources.ResourceMixin, Resource):
         annotation_type = form.annotation_type.data
         events = form.events.raw_data
 
-        for _event in events:
-            if not _event.get("_index"):
-                searchindex_id = self._get_search_index_for_event(sketch, _event["_id"])
-                _event["_index"] = searchindex_id
-            else:
-                searchindex_id = _event["_index"]
-            searchindex = SearchIndex.query.filter_by(index_name=searchindex_id).first()
-            event_id = _event["_id"]
+        if "comment" not in annotation_type and "label" not in annotation_type:
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Annotation type needs to be either label or comment, "
+                f"not {annotation_type!s}",
+            )
 
-            if searchindex_id not in indices:
+        missing_index_ids = [
+            _event["_id"] for _event in events if not _event.get("_index")
+        ]
+        if missing_index_ids:
+            index_names = self._get_search_indices_for_events(sketch, missing_index_ids)
+            for _event in events:
+                if not _event.get("_index"):
+                    _event["_index"] = index_names[_event["_id"]]
+
+        for _event in events:
+            if _event["_index"] not in indices:
                 abort(
                     HTTP_STATUS_CODE_BAD_REQUEST,
-                    f"Search index ID ({searchindex_id!s}) does not belong to the"
+                    f"Search index ID ({_event['_index']!s}) does not belong to the"
                     " list of indices",
                 )
 
-            # Get or create an event in the SQL database to have something
-            # to attach the annotation to.
-            event = Event.get_or_create(
-                sketch=sketch, searchindex=searchindex, document_id=event_id
+        searchindices = {
+            searchindex.index_name: searchindex
+            for searchindex in SearchIndex.query.filter(
+                SearchIndex.index_name.in_({_event["_index"] for _event in events})
+            ).all()
+        }
+
+        # Get or create the events in the SQL database to have something
+        # to attach the annotation to.
+        sql_events = self._get_or_create_events(
+            sketch,
+            searchindices,
+            [(_event["_index"], _event["_id"]) for _event in events],
+            annotation_type,
+        )
+
+        label_name = None
+        toggle = False
+        conclusion = None
+        search_node_label = None
+        if "comment" in annotation_type:
+            label_name = "__ts_comment"
+            search_node_label = "__ts_comment"
+        else:
+            # TODO(#3434): Fix the label logic.
+            conclusion_id = request.json.get("conclusion_id", None)
+
+            # Construct the specific fact label if a conclusion_id is present
+            label_name = form.annotation.data
+            if "__ts_fact" in label_name and conclusion_id:
+                label_name = f"__ts_fact_{conclusion_id}"
+
+            annotation = Event.Label.get_or_create(label=label_name, user=current_user)
+
+            if "__ts_star" in label_name:
+                toggle = True
+            if "__ts_hidden" in label_name:
+                toggle = True
+            if "__ts_fact" in label_name:
+                toggle = True
+            if form.remove.data:
+                toggle = True
+
+            if current_search_node:
+                if "__ts_star" in label_name:
+                    search_node_label = "__ts_star"
+                elif "__ts_fact" in label_name:
+                    search_node_label = "__ts_fact"
+                    conclusion = self._get_current_search_node_conclusion(
+                        current_search_node
+                    )
+                else:
+                    search_node_label = "__ts_label"
+
+            if "__ts_fact" in label_name:
+                if not conclusion and conclusion_id:
+                    conclusion = InvestigativeQuestionConclusion.get_by_id(
+                        conclusion_id
+                    )
+
+                if not conclusion:
+                    abort(
+                        HTTP_STATUS_CODE_BAD_REQUEST,
+                        "Conclusion ID is required to add a fact.",
+                    )
+
+        # The label scripts are sent with the bulk API, they are applied in
+        # the order of the request so toggles behave the same as when the
+        # events are updated one by one.
+        datastore = self.datastore
+        for _event in events:
+            label_script = datastore.set_label(
+                _event["_index"],
+                _event["_id"],
+                sketch.id,
+                current_user.id,
+                label_name,
+                toggle=toggle,
+                single_update=False,
+            )
+            if label_script:
+                datastore.import_event(
+                    _event["_index"],
+                    event=label_script,
+                    event_id=_event["_id"],
+                    flush_interval=self.DATASTORE_FLUSH_INTERVAL,
+                )
+
+        upload_results = datastore.flush_queued_events() or {}
+
+        failed_events = set()
+        if upload_results.get("errors_in_upload"):
+            logger.error(
+                "Unable to annotate all events in sketch [%s]: %s",
+                sketch.id,
+                upload_results.get("error_container"),
             )
+            for index_name, index_errors in upload_results.get(
+                "error_container", {}
+            ).items():
+                for document_id in index_errors.get("document_ids", []):
+                    failed_events.add((index_name, document_id))
+            if not failed_events:
+                # The failed events are unknown, none of them is saved.
+                failed_events = set(sql_events)
+
+        for _event in events:
+            searchindex_id = _event["_index"]
+            event_id = _event["_id"]
+            event = sql_events[(searchindex_id, event_id)]
+
+            # Events that were not updated in the datastore are not saved to
+            # the database, so that both keep the same annotations.
+            if (searchindex_id, event_id) in failed_events:
+                if event in db_session.new:
+                    db_session.expunge(event)
+                continue
 
             if current_search_node:
                 current_search_node.events.append(event)
@@ -1041,94 +1156,33 @@ class EventAnnotationResource(resources.ResourceMixin, Resource):
                     comment=form.annotation.data, user=current_user
                 )
                 event.comments.append(annotation)
-                self.datastore.set_label(
-                    searchindex_id,
-                    event_id,
-                    sketch.id,
-                    current_user.id,
-                    "__ts_comment",
-                    toggle=False,
-                )
-                if current_search_node:
-                    current_search_node.add_label("__ts_comment")
-
-            elif "label" in annotation_type:
-                # TODO(#3434): Fix the label logic.
-                conclusion = None
-                conclusion_id = request.json.get("conclusion_id", None)
-
-                # Construct the specific fact label if a conclusion_id is present
-                label_name = form.annotation.data
-                if "__ts_fact" in label_name and conclusion_id:
-                    label_name = f"__ts_fact_{conclusion_id}"
-
-                annotation = Event.Label.get_or_create(
-                    label=label_name, user=current_user
-                )
-
+            else:
                 if annotation not in event.labels:
                     event.labels.append(annotation)
 
-                toggle = False
-                if "__ts_star" in label_name:
-                    toggle = True
-                if "__ts_hidden" in label_name:
-                    toggle = True
-                if "__ts_fact" in label_name:
-                    toggle = True
-                if form.remove.data:
-                    toggle = True
-
-                self.datastore.set_label(
-                    searchindex_id,
-                    event_id,
-                    sketch.id,
-                    current_user.id,
-                    label_name,
-                    toggle=toggle,
-                )
-
-                if current_search_node:
-                    if "__ts_star" in label_name:
-                        search_node_label = "__ts_star"
-                    elif "__ts_fact" in label_name:
-                        search_node_label = "__ts_fact"
-                        conclusion = self._get_current_search_node_conclusion(
-                            current_search_node
-                        )
-                    else:
-                        search_node_label = "__ts_label"
-                    current_search_node.add_label(search_node_label)
-
                 if "__ts_fact" in label_name:
-                    if not conclusion and conclusion_id:
-                        conclusion = InvestigativeQuestionConclusion.get_by_id(
-                            conclusion_id
-                        )
-
-                    if not conclusion:
-                        abort(
-                            HTTP_STATUS_CODE_BAD_REQUEST,
-                            "Conclusion ID is required to add a fact.",
-                        )
                     # Adding facts to conclusions
                     if not form.remove.data:
                         event.conclusions.append(conclusion)
                     # Remove facts from conclusions
                     if form.remove.data:
                         event.conclusions.remove(conclusion)
+            annotations.append(annotation)
 
-            else:
-                abort(
-                    HTTP_STATUS_CODE_BAD_REQUEST,
-                    "Annotation type needs to be either label or comment, "
-                    f"not {annotation_type!s}",
-                )
+        if current_search_node and search_node_label and annotations:
+            current_search_node.add_label(search_node_label)
 
-            annotations.append(annotation)
-            # Save the event to the database
-            db_session.add(event)
-            db_session.commit()
+        # Save the events that were updated in the datastore in a single
+        # transaction.
+        db_session.commit()
+
+        if failed_events:
+            abort(
+                HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR,
+                "Unable to store the annotation of these events in the "
+                "datastore: "
+                + ", ".join(sorted(event_id for _, event_id in failed_events)),
+            )
 
         return self.to_json(annotations, status_code=HTTP_STATUS_CODE_CREATED)
 
@@ -1452,6 +1506,8 @@ class MarkEventsWithTimelineIdentifier(resources.ResourceMixin, Resource):
             conflicts="proceed",
             wait_for_completion=False,
         )
+        # Results cached before the update are stale.
+        query_cache.bump_index_generation([searchindex.index_name])
 
         # Update mappings - to make sure that we can label events.
         mapping_update = {
@@ -14,10 +14,8 @@
 """Explore resources for version 1 of the Timesketch API."""
 
 import datetime
-import io
 import json
 import logging
-import zipfile
 
 import prometheus_client
 
@@ -25,7 +23,8 @@ from flask import abort
 from flask import jsonify
 from flask import current_app
 from flask import request
-from flask import send_file
+from flask import Response
+from flask import stream_with_context
 from flask_restful import Resource
 from flask_restful import reqparse
 from flask_login import login_required
@@ -33,6 +32,8 @@ from flask_login import current_user
 
 from timesketch.api.v1 import export
 from timesketch.api.v1 import resources
+from timesketch.api.v1.resources import exportstream
+from timesketch.lib import columnar
 from timesketch.lib import forms
 from timesketch.lib import utils
 from timesketch.lib.utils import get_validated_indices
@@ -41,6 +42,8 @@ from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
 from timesketch.lib.definitions import HTTP_STATUS_CODE_FORBIDDEN
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.lib.definitions import METRICS_NAMESPACE
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.datastores.opensearch import OpenSearchDataStore
 from timesketch.models import db_session
 from timesketch.models.sketch import Event
 from timesketch.models.sketch import Sketch
@@ -75,7 +78,9 @@ class ExploreResource(resources.ResourceMixin, Resource):
             sketch_id: Integer primary key for a sketch database model
 
         Returns:
-            JSON with list of matched events
+            JSON with list of matched events, or the events in the columnar
+            format of timesketch.lib.columnar if the request has a "format"
+            of "arrow" or "columns".
         """
         sketch = Sketch.get_with_acl(sketch_id)
         if not sketch:
@@ -228,8 +233,20 @@ class ExploreResource(resources.ResourceMixin, Resource):
             if "terminate_after" in query_filter:
                 _ = query_filter.pop("terminate_after")
 
+            cache = query_cache.QueryCache()
+            cache_key = cache.build_key(
+                indices,
+                sketch_id=sketch_id,
+                query_string=form.query.data,
+                query_filter=query_filter,
+                query_dsl=query_dsl,
+                timeline_ids=timeline_ids,
+                count=True,
+            )
             try:
-                result = self.datastore.search(
+                result = cache.get_or_search(
+                    cache_key,
+                    self.datastore.search,
                     sketch_id=sketch_id,
                     query_string=form.query.data,
                     query_filter=query_filter,
@@ -246,8 +263,6 @@ class ExploreResource(resources.ResourceMixin, Resource):
             return jsonify(schema)
 
         if file_name:
-            file_object = io.BytesIO()
-
             form_data = {
                 "created_at": datetime.datetime.utcnow().isoformat(),
                 "created_by": current_user.username,
@@ -257,29 +272,49 @@ class ExploreResource(resources.ResourceMixin, Resource):
                 "query_filter": query_filter,
                 "return_fields": return_fields,
             }
-            with zipfile.ZipFile(file_object, mode="w") as zip_file:
-                zip_file.writestr("METADATA", data=json.dumps(form_data))
-                fh = export.query_to_filehandle(
-                    query_string=form.query.data,
-                    query_dsl=query_dsl,
-                    query_filter=query_filter,
-                    indices=indices,
-                    sketch=sketch,
-                    datastore=self.datastore,
-                    return_fields=return_fields,
-                    timeline_ids=timeline_ids,
-                )
-                fh.seek(0)
-                zip_file.writestr("query_results.csv", fh.read())
-            file_object.seek(0)
-            return send_file(file_object, mimetype="zip", download_name=file_name)
+            pool_maxsize = current_app.config.get(
+                "OPENSEARCH_SLICED_EXPORT_POOL_MAXSIZE",
+                exportstream.DEFAULT_POOL_MAXSIZE,
+            )
+            zip_stream = export.query_to_zip_stream(
+                form_data,
+                query_string=form.query.data,
+                query_dsl=query_dsl,
+                query_filter=query_filter,
+                indices=indices,
+                sketch=sketch,
+                datastore=OpenSearchDataStore(pool_maxsize=pool_maxsize),
+                return_fields=return_fields,
+                timeline_ids=timeline_ids,
+            )
+            return Response(
+                stream_with_context(zip_stream),
+                mimetype="application/zip",
+                headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+            )
 
         if scroll_id:
             # pylint: disable=unexpected-keyword-arg
             result = self.datastore.client.scroll(scroll_id=scroll_id, scroll="1m")
         else:
+            # Scrolling results can't be reused, the scroll ID expires.
+            cache = query_cache.QueryCache()
+            cache_key = None
+            if not enable_scroll:
+                cache_key = cache.build_key(
+                    indices,
+                    sketch_id=sketch_id,
+                    query_string=form.query.data,
+                    query_filter=query_filter,
+                    query_dsl=query_dsl,
+                    aggregations=index_stats_agg,
+                    return_fields=return_fields,
+                    timeline_ids=timeline_ids,
+                )
             try:
-                result = self.datastore.search(
+                result = cache.get_or_search(
+                    cache_key,
+                    self.datastore.search,
                     sketch_id=sketch_id,
                     query_string=form.query.data,
                     query_filter=query_filter,
@@ -482,6 +517,14 @@ class ExploreResource(resources.ResourceMixin, Resource):
         if isinstance(meta["es_total_count"], dict):
             meta["es_total_count"] = meta["es_total_count"].get("value", 0)
 
+        response_format = columnar.get_response_format(request.json.get("format"))
+        if response_format:
+            rows = [columnar.hit_to_row(hit) for hit in result["hits"]["hits"]]
+            return Response(
+                columnar.stream_frames(rows, response_format, meta=meta),
+                mimetype=columnar.MIMETYPE,
+            )
+
         schema = {"meta": meta, "objects": result["hits"]["hits"]}
         return jsonify(schema)
 
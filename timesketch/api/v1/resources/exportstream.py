@@ -26,6 +26,7 @@ from flask_login import login_required
 from flask_login import current_user
 
 from timesketch.api.v1 import resources
+from timesketch.lib import columnar
 from timesketch.lib import utils
 from timesketch.lib import forms
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
@@ -78,7 +79,9 @@ class ExportStreamListResource(resources.ResourceMixin, Resource):
             sketch_id (int): Integer primary key for a sketch database model.
 
         Returns:
-            Streamed response of events in JSONL format.
+            Streamed response of events in JSONL format, or in the columnar
+            format of timesketch.lib.columnar if the request has a "format"
+            of "arrow" or "columns".
 
         Raises:
             HTTPException:
@@ -171,6 +174,8 @@ class ExportStreamListResource(resources.ResourceMixin, Resource):
         if post_filter:
             base_query_body["post_filter"] = post_filter
 
+        response_format = columnar.get_response_format(request.json.get("format"))
+
         def generate():
             try:
                 event_generator = self.datastore.export_events_with_slicing(
@@ -178,6 +183,10 @@ class ExportStreamListResource(resources.ResourceMixin, Resource):
                     base_query_body=base_query_body,
                 )
 
+                if response_format:
+                    yield from columnar.stream_frames(event_generator, response_format)
+                    return
+
                 for event in event_generator:
                     yield json.dumps(event) + "\n"
             except Exception as e:
@@ -190,6 +199,5 @@ class ExportStreamListResource(resources.ResourceMixin, Resource):
                 )
                 raise
 
-        return Response(
-            stream_with_context(generate()), mimetype="application/x-json-stream"
-        )
+        mimetype = columnar.MIMETYPE if response_format else "application/x-json-stream"
+        return Response(stream_with_context(generate()), mimetype=mimetype)
@@ -21,16 +21,19 @@ from flask_login import login_required
 from flask_login import current_user
 
 from flask import abort
+from flask import current_app
 from flask import jsonify
 from flask import request
 
 from timesketch.lib.graphs import manager
+from timesketch.lib.graphs.interface import merge_partial_graphs
 from timesketch.api.v1 import resources
 from timesketch.api.v1 import utils
 from timesketch.models import db_session
 from timesketch.models.sketch import Sketch
 from timesketch.models.sketch import Graph
 from timesketch.models.sketch import GraphCache
+from timesketch.models.sketch import GraphCacheTimeline
 
 from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
 from timesketch.lib.definitions import HTTP_STATUS_CODE_CREATED
@@ -40,6 +43,9 @@ from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 
 logger = logging.getLogger("timesketch.graph_api")
 
+# Seconds after which a pending or processing partial graph is generated again.
+DEFAULT_GRAPH_GENERATION_TIMEOUT = 3600
+
 
 class GraphListResource(resources.ResourceMixin, Resource):
     """Resource to get all saved graphs for a sketch."""
@@ -319,42 +325,84 @@ class GraphCacheResource(resources.ResourceMixin, Resource):
                 "Timeline IDs needs to be a list of integers.",
             )
 
-        sketch_indices = [
-            timeline.searchindex.index_name for timeline in sketch.active_timelines
-        ]
+        try:
+            graph_class = manager.GraphManager.get_graph(plugin_name)
+        except KeyError:
+            abort(HTTP_STATUS_CODE_NOT_FOUND, "No graph plugin found with this name.")
+
+        timelines = sketch.active_timelines
+        if timeline_ids:
+            timelines = [t for t in timelines if t.id in timeline_ids]
 
         cache = GraphCache.get_or_create(sketch=sketch, graph_plugin=plugin_name)
 
         if graph_config:
-            cache_config = graph_config
-        else:
-            cache_config = cache.graph_config
-
-        if isinstance(cache_config, str):
-            cache_config = json.loads(cache_config)
-
-        # Refresh cache if timelines have been added/removed from the sketch.
-        if cache_config:
-            cache_graph_filter = cache_config.get("filter", {})
-            cache_filter_indices = cache_graph_filter.get("indices", [])
-            if set(sketch_indices) ^ set(cache_filter_indices):
-                refresh = True
-
-        if cache.graph_elements and not refresh:
-            return self.to_json(cache)
-
-        graph_class = manager.GraphManager.get_graph(plugin_name)
-        graph = graph_class(sketch=sketch, timeline_ids=timeline_ids)
-        cytoscape_json = graph.generate().to_cytoscape()
-
-        if cytoscape_json:
-            cache.graph_elements = json.dumps(cytoscape_json)
             cache.graph_config = json.dumps(graph_config)
+
+        # Every timeline has its own partial graph, only timelines without
+        # a partial graph (or all of them when refreshing) are scanned.
+        partial_graphs = {
+            partial_graph.timeline_id: partial_graph
+            for partial_graph in cache.partial_graphs
+        }
+        # Partial graphs that are pending or processing for longer than the
+        # timeout were left behind by a stopped worker and are regenerated.
+        timeout = current_app.config.get(
+            "GRAPH_GENERATION_TIMEOUT", DEFAULT_GRAPH_GENERATION_TIMEOUT
+        )
+        schedule_generation = False
+        for timeline in timelines:
+            partial_graph = partial_graphs.get(timeline.id)
+            if not partial_graph:
+                partial_graph = GraphCacheTimeline(timeline_id=timeline.id)
+                cache.partial_graphs.append(partial_graph)
+                partial_graphs[timeline.id] = partial_graph
+            elif partial_graph.is_generating(timeout):
+                continue
+            elif not refresh and partial_graph.get_status.status not in (
+                "pending",
+                "processing",
+            ):
+                continue
+            partial_graph.graph_elements = None
+            partial_graph.set_status("pending")
+            schedule_generation = True
+
+        if schedule_generation:
+            # Import here to avoid circular imports.
+            # pylint: disable=import-outside-toplevel
+            from timesketch.lib import tasks
+
+            tasks.run_graph_generation.apply_async(args=(cache.id,))
+
+        progress = {"total": len(timelines), "ready": 0, "failed": 0, "pending": 0}
+        partials = []
+        for timeline in timelines:
+            partial_graph = partial_graphs[timeline.id]
+            status = partial_graph.get_status.status
+            if status == "ready":
+                progress["ready"] += 1
+                partials.append(json.loads(partial_graph.graph_elements))
+            elif status == "fail":
+                progress["failed"] += 1
+            else:
+                progress["pending"] += 1
+
+        graph = merge_partial_graphs(graph_class.GRAPH_TYPE, partials)
+        graph_elements = json.dumps(graph.to_cytoscape())
+        if graph_elements != cache.graph_elements:
+            cache.graph_elements = graph_elements
+            cache.num_nodes = graph.nx_instance.number_of_nodes()
+            cache.num_edges = graph.nx_instance.number_of_edges()
             cache.update_modification_time()
-            db_session.add(cache)
-            db_session.commit()
+        db_session.add(cache)
+        db_session.commit()
 
         # Update the last activity of a sketch.
         utils.update_sketch_last_activity(sketch)
 
-        return self.to_json(cache)
+        meta = {
+            "status": "pending" if progress["pending"] else "done",
+            "progress": progress,
+        }
+        return self.to_json(cache, meta=meta)
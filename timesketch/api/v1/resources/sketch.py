@@ -15,7 +15,6 @@
 
 import logging
 
-import opensearchpy
 from opensearchpy.exceptions import NotFoundError
 
 
@@ -41,6 +40,7 @@ from timesketch.lib.definitions import HTTP_STATUS_CODE_FORBIDDEN
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.lib.definitions import HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR
 from timesketch.lib.aggregators import manager as aggregator_manager
+from timesketch.lib.datastores import sketch_snapshot
 from timesketch.lib.emojis import get_emojis_as_dict
 from timesketch.models import db_session
 from timesketch.models.sketch import Sketch
@@ -360,101 +360,18 @@ class SketchResource(resources.ResourceMixin, Resource):
                 "description": cls.DESCRIPTION,
             }
 
-        # Get mappings for all indices in the sketch. This is used to set
-        # columns shown in the event list.
-        sketch_indices = [
-            t.searchindex.index_name
-            for t in sketch.active_timelines
-            if t.searchindex.get_status.status == "ready"
-        ]
-
-        # Make sure the list of index names is uniq
-        sketch_indices = list(set(sketch_indices))
-
-        # Get event count and size on disk for each index in the sketch.
-        indices_metadata = {}
-        stats_per_timeline = {}
-        for timeline in sketch.active_timelines:
-            indices_metadata[timeline.searchindex.index_name] = {}
-            stats_per_timeline[timeline.id] = {"count": 0}
-
-        if not sketch_indices:
-            mappings_settings = {}
-        else:
-            try:
-                mappings_settings = self.datastore.client.indices.get_mapping(
-                    index=sketch_indices
-                )
-            except opensearchpy.NotFoundError:
-                logger.error(
-                    "Unable to get indices mapping in datastore, for indices: [%s]",
-                    ",".join(sketch_indices),
-                )
-                mappings_settings = {}
-
-        mappings = []
-
-        for index_name, value in mappings_settings.items():
-            # The structure is different in ES version 6.x and lower. This check
-            # makes sure we support both old and new versions.
-            properties = value["mappings"].get("properties")
-            if not properties:
-                properties = next(iter(value["mappings"].values())).get("properties")
-
-            # Determine if index is from the time before multiple timelines per
-            # index. This is used in the UI to support both modes.
-            is_legacy = bool("__ts_timeline_id" not in properties)
-            indices_metadata[index_name]["is_legacy"] = is_legacy
-
-            for field, value_dict in properties.items():
-                mapping_dict = {}
-                # Exclude internal fields
-                if field.startswith("__"):
-                    continue
-                if field == "timesketch_label":
-                    continue
-                mapping_dict["field"] = field
-                mapping_dict["type"] = value_dict.get("type", "n/a")
-                mappings.append(mapping_dict)
-
-        # Get number of events per timeline
-        if sketch_indices:
-            # Support legacy indices.
-            for timeline in sketch.active_timelines:
-                index_name = timeline.searchindex.index_name
-                if indices_metadata[index_name].get("is_legacy", False):
-                    doc_count, _ = self.datastore.count(indices=index_name)
-                    stats_per_timeline[timeline.id] = {"count": doc_count}
-
-            count_agg_spec = {
-                "size": 0,
-                "aggs": {
-                    "per_timeline": {
-                        "terms": {
-                            "field": "__ts_timeline_id",
-                            "size": len(sketch.timelines),
-                        }
-                    }
-                },
-            }
-            count_agg = self.datastore.search(
-                sketch_id=sketch.id,
-                indices=sketch_indices,
-                query_dsl=count_agg_spec,
-            )
-
-            count_per_timeline = (
-                count_agg.get("aggregations", {})
-                .get("per_timeline", {})
-                .get("buckets", [])
-            )
-            for count_stat in count_per_timeline:
-                stats_per_timeline[count_stat["key"]] = {
-                    "count": count_stat["doc_count"]
-                }
-
-        # Make the list of dicts unique
-        mappings = {v["field"]: v for v in mappings}.values()
+        # Get mappings, event counts and labels for all indices in the sketch.
+        # The mappings are used to set columns shown in the event list. The
+        # metadata is served from the sketch snapshot unless fresh is set.
+        fresh = request.args.get("fresh", default=False, type=inputs.boolean)
+        # Only connect to the datastore if there is metadata to read.
+        datastore = None
+        if any(
+            t.searchindex.get_status.status == "ready" for t in sketch.active_timelines
+        ):
+            datastore = self.datastore
+        snapshot = sketch_snapshot.SketchSnapshot(datastore, sketch.id)
+        sketch_metadata = snapshot.get(sketch.active_timelines, fresh=fresh)
 
         views = []
         for view in sketch.get_named_views:
@@ -495,8 +412,10 @@ class SketchResource(resources.ResourceMixin, Resource):
             "views": views,
             "stories": stories,
             "searchtemplates": [
-                {"name": searchtemplate.name, "id": searchtemplate.id}
-                for searchtemplate in SearchTemplate.query.all()
+                {"name": name, "id": searchtemplate_id}
+                for searchtemplate_id, name in db_session.query(
+                    SearchTemplate.id, SearchTemplate.name
+                )
             ],
             "emojis": get_emojis_as_dict(),
             "permissions": {
@@ -510,16 +429,12 @@ class SketchResource(resources.ResourceMixin, Resource):
                 "groups": [group.name for group in sketch.groups],
             },
             "attributes": utils.get_sketch_attributes(sketch),
-            "mappings": list(mappings),
-            "indices_metadata": indices_metadata,
-            "stats_per_timeline": stats_per_timeline,
+            "mappings": sketch_metadata["mappings"],
+            "indices_metadata": sketch_metadata["indices_metadata"],
+            "stats_per_timeline": sketch_metadata["stats_per_timeline"],
             "last_activity": utils.get_sketch_last_activity(sketch),
             "sketch_labels": [label.label for label in sketch.labels],
-            "filter_labels": (
-                self.datastore.get_filter_labels(sketch.id, sketch_indices)
-                if sketch_indices
-                else []
-            ),
+            "filter_labels": sketch_metadata["filter_labels"],
         }
         return self.to_json(sketch, meta=meta)
 
@@ -16,6 +16,7 @@
 import codecs
 import logging
 import os
+import shutil
 import uuid
 import json
 from typing import Optional, Dict, List
@@ -32,6 +33,7 @@ from timesketch.api.v1 import resources
 from timesketch.api.v1 import utils
 from timesketch.lib.definitions import HTTP_STATUS_CODE_CREATED
 from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
+from timesketch.lib.definitions import HTTP_STATUS_CODE_CONFLICT
 from timesketch.lib.definitions import HTTP_STATUS_CODE_FORBIDDEN
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.models import db_session
@@ -136,6 +138,7 @@ class UploadFileResource(resources.ResourceMixin, Resource):
         meta: Optional[Dict] = None,
         headers_mapping: Optional[List] = None,
         delimiter: str = ",",
+        upload_state_path: str = "",
     ):
         """Creates a full pipeline for an uploaded file and returns the results.
 
@@ -160,6 +163,10 @@ class UploadFileResource(resources.ResourceMixin, Resource):
                              (iii) def. value if we add a new column [key=default_value]
 
             delimiter: delimiter to read the CSV file
+            upload_state_path: optional path of the state files of a chunked
+                upload. The completion marker of the upload is written before
+                indexing starts and the state files are removed once indexing
+                is done.
 
         Returns:
             A timeline if created otherwise a search index in JSON (instance
@@ -217,6 +224,7 @@ class UploadFileResource(resources.ResourceMixin, Resource):
                 meta=meta,
                 headers_mapping=headers_mapping,
                 delimiter=delimiter,
+                upload_state_path=upload_state_path,
             )
 
         if not timeline:
@@ -281,7 +289,10 @@ class UploadFileResource(resources.ResourceMixin, Resource):
             timeline_id=timeline.id,
             headers_mapping=headers_mapping,
             delimiter=delimiter,
+            upload_state_path=upload_state_path,
         )
+        if upload_state_path:
+            self._write_upload_marker(upload_state_path, timeline)
         task_id = uuid.uuid4().hex
         pipeline.apply_async(task_id=task_id)
 
@@ -319,6 +330,168 @@ class UploadFileResource(resources.ResourceMixin, Resource):
             headers_mapping=headers_mapping,
         )
 
+    @staticmethod
+    def _get_upload_path(name: str) -> str:
+        """Returns the path of a file in the upload folder.
+
+        Args:
+            name: The name of the file, an index name or upload identifier.
+
+        Returns:
+            The path of the file in the upload folder.
+
+        Raises:
+            HTTP_STATUS_CODE_BAD_REQUEST: If the name is not valid.
+        """
+        upload_folder = current_app.config["UPLOAD_FOLDER"]
+        if not utils.is_valid_index_name(name):
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Unable to upload file. Index name is not valid",
+            )
+        return utils.format_upload_path(upload_folder, name)
+
+    @staticmethod
+    def _add_to_chunk_manifest(state_path: str, chunk_index: int):
+        """Record a received chunk in the manifest of an upload.
+
+        The manifest is only ever appended to, a single short write in append
+        mode is atomic so parallel requests do not overwrite each other.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+            chunk_index: The index of the received chunk.
+        """
+        with open(f"{state_path}.chunks", "a", encoding="utf-8") as fh:
+            fh.write(f"{chunk_index:d}\n")
+
+    @staticmethod
+    def _read_chunk_manifest(state_path: str) -> List[int]:
+        """Returns the indices of the chunks received for an upload.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+
+        Returns:
+            A sorted list of chunk indices.
+        """
+        try:
+            with open(f"{state_path}.chunks", "r", encoding="utf-8") as fh:
+                lines = fh.read().split()
+        except FileNotFoundError:
+            return []
+        return sorted({int(line) for line in lines if line.isdigit()})
+
+    @staticmethod
+    def _claim_upload(state_path: str) -> bool:
+        """Claim a completed upload so that it is only indexed once.
+
+        The claim creates the completion marker of the upload, only one of
+        the requests that see the upload as complete can create it.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+
+        Returns:
+            True if the upload should be indexed by this request.
+        """
+        try:
+            file_descriptor = os.open(
+                f"{state_path}.done", os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o640
+            )
+        except FileExistsError:
+            return False
+        os.close(file_descriptor)
+        return True
+
+    @staticmethod
+    def _release_upload(state_path: str):
+        """Remove the claim of an upload that could not be indexed.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+        """
+        try:
+            os.remove(f"{state_path}.done")
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _write_upload_marker(state_path: str, timeline: Timeline):
+        """Record the timeline that a completed upload was indexed into.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+            timeline: The timeline of the upload.
+        """
+        marker = {
+            "timeline_id": timeline.id,
+            "searchindex_id": timeline.searchindex_id,
+        }
+        # The marker is replaced at once, so it is never read half written.
+        temporary_path = f"{state_path}.done.{uuid.uuid4().hex}"
+        with open(temporary_path, "w", encoding="utf-8") as fh:
+            json.dump(marker, fh)
+        os.replace(temporary_path, f"{state_path}.done")
+
+    @staticmethod
+    def _read_upload_marker(state_path: str) -> Optional[Dict]:
+        """Returns the completion marker of an upload.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+
+        Returns:
+            None if the upload was not claimed yet, otherwise a dict with the
+            IDs of the timeline and search index. The dict is empty while the
+            upload is being indexed.
+        """
+        try:
+            with open(f"{state_path}.done", "r", encoding="utf-8") as fh:
+                content = fh.read()
+        except FileNotFoundError:
+            return None
+        try:
+            return json.loads(content) if content else {}
+        except ValueError:
+            return {}
+
+    def _get_upload_marker(self, state_path: str, sketch: Sketch) -> Optional[Dict]:
+        """Returns the completion marker of an upload that is still valid.
+
+        A marker is stale once the timeline of the upload was removed from
+        the sketch. The state of a stale upload is reset, so that the file
+        can be uploaded and indexed again.
+
+        Args:
+            state_path: The path that the state files of the upload use.
+            sketch: The sketch the upload belongs to.
+
+        Returns:
+            None if the upload was not claimed yet or the marker was stale,
+            otherwise the marker as returned by _read_upload_marker.
+        """
+        marker = self._read_upload_marker(state_path)
+        if not marker or not marker.get("timeline_id"):
+            return marker
+
+        timeline = Timeline.get_by_id(marker.get("timeline_id"))
+        if timeline and timeline.sketch_id == sketch.id:
+            return marker
+
+        logger.info(
+            "Timeline {0!s} of upload {1:s} is no longer part of sketch "
+            "{2:d}, resetting the upload.".format(
+                marker.get("timeline_id"), os.path.basename(state_path), sketch.id
+            )
+        )
+        for suffix in (".done", ".chunks"):
+            try:
+                os.remove(f"{state_path}{suffix}")
+            except FileNotFoundError:
+                pass
+        return None
+
     def _upload_file(
         self,
         file_storage: object,
@@ -382,7 +555,8 @@ class UploadFileResource(resources.ResourceMixin, Resource):
                 Created status code.
             - For intermediate chunks of a chunked upload:
               Returns a JSON response with metadata about the upload progress
-                and a 201 Created status code.
+                and a 201 Created status code. Chunks can be uploaded in any
+                order, the upload is complete once all chunks are received.
 
         Raises:
             HTTP_STATUS_CODE_BAD_REQUEST:
@@ -396,6 +570,9 @@ class UploadFileResource(resources.ResourceMixin, Resource):
             HTTP_STATUS_CODE_NOT_FOUND: If the sketch is not found.
             HTTP_STATUS_CODE_FORBIDDEN: If the user does not have
                 write access to the sketch.
+            Exception: Any error raised while indexing the completed upload
+                is raised again, after the upload was released so that it
+                can be completed again.
         """
         _filename, _extension = os.path.splitext(file_storage.filename)
         file_extension = _extension.lstrip(".")
@@ -457,39 +634,64 @@ class UploadFileResource(resources.ResourceMixin, Resource):
         # For file chunks we need the correct filepath, otherwise each chunk
         # will get their own UUID as a filename.
         if index_name:
-            if not utils.is_valid_index_name(index_name):
-                abort(
-                    HTTP_STATUS_CODE_BAD_REQUEST,
-                    "Unable to upload file. Index name is not valid",
-                )
-            file_path = utils.format_upload_path(upload_folder, index_name)
+            file_path = self._get_upload_path(index_name)
         elif chunk_index_name:
-            if not utils.is_valid_index_name(chunk_index_name):
-                abort(
-                    HTTP_STATUS_CODE_BAD_REQUEST,
-                    "Unable to upload file. Index name is not valid",
-                )
-            file_path = utils.format_upload_path(upload_folder, chunk_index_name)
+            file_path = self._get_upload_path(chunk_index_name)
         else:
             file_path = utils.format_upload_path(upload_folder, uuid.uuid4().hex)
 
+        # The state of the upload, the received chunks and whether it was
+        # indexed, is kept per upload identifier.
+        if chunk_index_name:
+            state_path = self._get_upload_path(chunk_index_name)
+        else:
+            state_path = file_path
+
+        if not isinstance(chunk_total_chunks, int) or not isinstance(chunk_index, int):
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Unable to upload file. Chunk index is not valid",
+            )
+        if chunk_index >= chunk_total_chunks:
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Unable to upload file. Chunk index is not valid",
+            )
+        if not isinstance(chunk_byte_offset, int):
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Unable to upload file. Chunk byte offset is not valid",
+            )
+
+        if self._get_upload_marker(state_path, sketch) is not None:
+            abort(
+                HTTP_STATUS_CODE_CONFLICT,
+                "Unable to upload file. The upload was already completed.",
+            )
+
+        # Chunks can arrive in any order and in parallel, so every chunk is
+        # written at its own offset and recorded in the manifest of the upload.
         try:
-            with open(file_path, "ab") as fh:
+            file_descriptor = os.open(file_path, os.O_WRONLY | os.O_CREAT, 0o640)
+            with os.fdopen(file_descriptor, "wb") as fh:
                 fh.seek(chunk_byte_offset)
-                fh.write(file_storage.read())
+                shutil.copyfileobj(file_storage.stream, fh)
+            self._add_to_chunk_manifest(state_path, chunk_index)
         except OSError as e:
             abort(
                 HTTP_STATUS_CODE_BAD_REQUEST,
                 f"Unable to write data with error: {e!s}.",
             )
 
-        if (chunk_index + 1) != chunk_total_chunks:
+        received_chunks = self._read_chunk_manifest(state_path)
+        if len(received_chunks) < chunk_total_chunks:
             schema = {
                 "meta": {
                     "file_upload": True,
                     "upload_complete": False,
                     "total_chunks": chunk_total_chunks,
                     "chunk_index": chunk_index,
+                    "received_chunks": len(received_chunks),
                     "file_size": file_size,
                 },
                 "objects": [],
@@ -498,6 +700,11 @@ class UploadFileResource(resources.ResourceMixin, Resource):
             response.status_code = HTTP_STATUS_CODE_CREATED
             return response
 
+        # A previous upload to the same path can have left data behind the
+        # end of the file.
+        if os.path.getsize(file_path) > file_size:
+            os.truncate(file_path, file_size)
+
         if os.path.getsize(file_path) != file_size:
             abort(
                 HTTP_STATUS_CODE_BAD_REQUEST,
@@ -507,6 +714,23 @@ class UploadFileResource(resources.ResourceMixin, Resource):
                 ),
             )
 
+        # Another request that received the last chunk indexes the upload.
+        if not self._claim_upload(state_path):
+            schema = {
+                "meta": {
+                    "file_upload": True,
+                    "upload_complete": False,
+                    "total_chunks": chunk_total_chunks,
+                    "chunk_index": chunk_index,
+                    "received_chunks": len(received_chunks),
+                    "file_size": file_size,
+                },
+                "objects": [],
+            }
+            response = jsonify(schema)
+            response.status_code = HTTP_STATUS_CODE_CREATED
+            return response
+
         meta = {
             "file_upload": True,
             "upload_complete": True,
@@ -514,20 +738,93 @@ class UploadFileResource(resources.ResourceMixin, Resource):
             "total_chunks": chunk_total_chunks,
         }
 
-        return self._upload_and_index(
-            file_path=file_path,
-            file_extension=file_extension,
-            original_filename=_filename,
-            timeline_name=timeline_name,
-            index_name=index_name,
-            sketch=sketch,
-            form=form,
-            data_label=data_label,
-            enable_stream=enable_stream,
-            meta=meta,
-            headers_mapping=headers_mapping,
-            delimiter=delimiter,
-        )
+        try:
+            response = self._upload_and_index(
+                file_path=file_path,
+                file_extension=file_extension,
+                original_filename=_filename,
+                timeline_name=timeline_name,
+                index_name=index_name,
+                sketch=sketch,
+                form=form,
+                data_label=data_label,
+                enable_stream=enable_stream,
+                meta=meta,
+                headers_mapping=headers_mapping,
+                delimiter=delimiter,
+                upload_state_path=state_path,
+            )
+        except Exception:
+            # The upload can be completed again by resending a chunk.
+            self._release_upload(state_path)
+            raise
+        return response
+
+    @login_required
+    def get(self):
+        """Handles GET request to the resource.
+
+        Returns the chunks of a chunked upload that were received so far, so
+        that an interrupted upload can be resumed with the missing chunks.
+        Once the upload was indexed, the timeline of the upload is returned
+        with the IDs of the timeline and search index in the meta data. If
+        that timeline was removed from the sketch, the upload is reset.
+
+        Returns:
+            A view in JSON (instance of flask.wrappers.Response)
+        """
+        upload_enabled = current_app.config["UPLOAD_ENABLED"]
+        if not upload_enabled:
+            abort(HTTP_STATUS_CODE_BAD_REQUEST, "Upload not enabled")
+
+        args = request.args
+        sketch_id = args.get("sketch_id", type=int)
+        if not sketch_id:
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Unable to check an upload without supplying a sketch.",
+            )
+
+        sketch = Sketch.get_with_acl(sketch_id)
+        if not sketch:
+            abort(HTTP_STATUS_CODE_NOT_FOUND, "No sketch found with this ID.")
+
+        if not sketch.has_permission(current_user, "write"):
+            abort(
+                HTTP_STATUS_CODE_FORBIDDEN,
+                "Unable to upload data to a sketch, user does not have "
+                "write access.",
+            )
+
+        chunk_index_name = args.get("chunk_index_name", "")
+        if not chunk_index_name:
+            abort(
+                HTTP_STATUS_CODE_BAD_REQUEST,
+                "Unable to check an upload without a chunk index name.",
+            )
+        state_path = self._get_upload_path(chunk_index_name)
+        marker = self._get_upload_marker(state_path, sketch)
+        received_chunks = self._read_chunk_manifest(state_path)
+
+        meta = {
+            "chunk_index_name": chunk_index_name,
+            "received_chunks": received_chunks,
+            "upload_complete": marker is not None,
+        }
+        chunk_total_chunks = args.get("chunk_total_chunks", type=int)
+        if chunk_total_chunks:
+            received = set(received_chunks)
+            meta["total_chunks"] = chunk_total_chunks
+            meta["missing_chunks"] = [
+                index for index in range(chunk_total_chunks) if index not in received
+            ]
+
+        if marker:
+            meta.update(marker)
+            timeline = Timeline.get_by_id(marker.get("timeline_id"))
+            if timeline and timeline.sketch_id == sketch.id:
+                return self.to_json(timeline, meta=meta)
+        return jsonify({"meta": meta, "objects": []})
 
     @login_required
     def post(self):
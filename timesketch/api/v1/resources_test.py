@@ -13,23 +13,35 @@
 # limitations under the License.
 """Tests for v1 of the Timesketch API."""
 
+import io
 import json
+import os
+import shutil
+import sys
+import tempfile
 from unittest import mock
 
+from timesketch import lib
+
 from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
+from timesketch.lib.definitions import HTTP_STATUS_CODE_CONFLICT
 from timesketch.lib.definitions import HTTP_STATUS_CODE_CREATED
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.lib.definitions import HTTP_STATUS_CODE_OK
 from timesketch.lib.definitions import HTTP_STATUS_CODE_FORBIDDEN
 from timesketch.lib.definitions import HTTP_STATUS_CODE_GATEWAY_TIMEOUT
+from timesketch.lib.definitions import HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR
 from timesketch.lib.testlib import BaseTest
 from timesketch.lib.testlib import MockDataStore
+from timesketch.models import db_session
 from timesketch.lib.dfiq import DFIQCatalog
 from timesketch.api.v1.resources import scenarios
+from timesketch.models.sketch import Event
 from timesketch.models.sketch import Scenario
 from timesketch.models.sketch import InvestigativeQuestion
 from timesketch.models.sketch import InvestigativeQuestionApproach
 from timesketch.models.sketch import Facet
+from timesketch.models.sketch import Timeline
 from timesketch.api.v1.resources import ResourceMixin
 
 
@@ -890,6 +902,91 @@ class EventAddAttributeResourceTest(BaseTest):
         )
 
 
+class EventTaggingResourceTest(BaseTest):
+    """Test EventTaggingResource."""
+
+    resource_url = "/api/v1/sketches/1/event/tagging/"
+
+    def _post_tags(self, events, **kwargs):
+        """Tag events with the tags foo and bar."""
+        data = {"tag_string": json.dumps(["foo", "bar"]), "events": events}
+        data.update(kwargs)
+        return self.client.post(
+            self.resource_url, data=json.dumps(data), content_type="application/json"
+        )
+
+    @mock.patch("timesketch.api.v1.resources.OpenSearchDataStore", MockDataStore)
+    def test_tag_events(self):
+        """Test that the counters of all indices are returned."""
+        self.login()
+        result = {
+            "total": 2,
+            "updated": 1,
+            "noops": 1,
+            "version_conflicts": 1,
+            "failures": ["failed"],
+        }
+        with mock.patch.object(
+            MockDataStore, "add_tags_to_events", create=True, return_value=result
+        ) as mock_add_tags:
+            response = self._post_tags(
+                [{"_id": "2", "_index": "test"}, {"_id": "1", "_index": "test"}]
+            )
+
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_OK)
+        mock_add_tags.assert_called_once_with("test", ["1", "2"], ["foo", "bar"])
+        meta = response.json["meta"]
+        self.assertEqual(meta["number_of_events_passed_to_api"], 2)
+        self.assertEqual(meta["events_processed_by_api"], 2)
+        self.assertEqual(meta["number_of_events_with_added_tags"], 1)
+        self.assertEqual(meta["number_of_version_conflicts"], 1)
+        self.assertEqual(meta["number_of_failures"], 1)
+        self.assertEqual(len(meta["errors"]), 2)
+        self.assertEqual(meta["errors"][0], "failed")
+        self.assertIn("Unable to tag 1 events in test", meta["errors"][1])
+
+    @mock.patch("timesketch.api.v1.resources.OpenSearchDataStore", MockDataStore)
+    def test_tag_events_outside_sketch(self):
+        """Test that events of an index outside the sketch are not tagged."""
+        self.login()
+        with mock.patch.object(
+            MockDataStore, "add_tags_to_events", create=True
+        ) as mock_add_tags:
+            response = self._post_tags(
+                [{"_id": "1", "_index": "test"}, {"_id": "2", "_index": "test2"}]
+            )
+
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_FORBIDDEN)
+        mock_add_tags.assert_not_called()
+
+    @mock.patch("timesketch.api.v1.resources.OpenSearchDataStore", MockDataStore)
+    def test_tag_events_async(self):
+        """Test that large and async requests are tagged by a Celery task."""
+        self.login()
+        tasks = mock.Mock()
+        tasks.run_tag_events.apply_async.return_value.id = "task"
+        events = [{"_id": "1", "_index": "test"}, {"_id": "2", "_index": "test"}]
+        with mock.patch.dict(
+            sys.modules, {"timesketch.lib.tasks": tasks}
+        ), mock.patch.object(lib, "tasks", tasks, create=True):
+            response = self._post_tags(events, **{"async": True})
+            self.assertEqual(response.json["meta"]["task_id"], "task")
+
+            with mock.patch(
+                "timesketch.api.v1.resources.event.EventTaggingResource."
+                "MAX_EVENTS_TO_TAG",
+                1,
+            ):
+                response = self._post_tags(events)
+            self.assertEqual(response.json["meta"]["task_id"], "task")
+
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_OK)
+        self.assertEqual(tasks.run_tag_events.apply_async.call_count, 2)
+        tasks.run_tag_events.apply_async.assert_called_with(
+            args=({"test": ["1", "2"]}, ["foo", "bar"])
+        )
+
+
 class EventAnnotationResourceTest(BaseTest):
     """Test EventAnnotationResource."""
 
@@ -914,6 +1011,85 @@ class EventAnnotationResourceTest(BaseTest):
             self.assertIsInstance(response.json, dict)
             self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
 
+    @mock.patch("timesketch.api.v1.resources.OpenSearchDataStore", MockDataStore)
+    def test_post_annotate_multiple_events(self):
+        """Authenticated request to label multiple events in one batch."""
+        self.login()
+        events = [
+            {"_type": "test_event", "_index": "test", "_id": "batch_1"},
+            {"_type": "test_event", "_index": "test", "_id": "batch_2"},
+        ]
+        data = {
+            "annotation": "__ts_star",
+            "annotation_type": "label",
+            "events": events,
+        }
+        response = self.client.post(
+            self.resource_url,
+            data=json.dumps(data),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        self.assertEqual(len(response.json["objects"][0]), 2)
+
+        for document_id in ("batch_1", "batch_2"):
+            event = Event.query.filter_by(document_id=document_id).first()
+            self.assertIsNotNone(event)
+
+    @mock.patch("timesketch.api.v1.resources.OpenSearchDataStore", MockDataStore)
+    def test_post_annotate_datastore_error(self):
+        """Test that no annotation is saved if the datastore update fails."""
+        self.login()
+        data = {
+            "annotation": "not saved",
+            "annotation_type": "comment",
+            "events": [{"_type": "test_event", "_index": "test", "_id": "failed"}],
+        }
+        with mock.patch.object(
+            MockDataStore,
+            "flush_queued_events",
+            return_value={"errors_in_upload": True, "error_container": {}},
+        ):
+            response = self.client.post(
+                self.resource_url,
+                data=json.dumps(data),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR)
+        self.assertIsNone(Event.query.filter_by(document_id="failed").first())
+
+    @mock.patch("timesketch.api.v1.resources.OpenSearchDataStore", MockDataStore)
+    def test_post_annotate_partial_datastore_error(self):
+        """Test that only events updated in the datastore are saved."""
+        self.login()
+        data = {
+            "annotation": "__ts_star",
+            "annotation_type": "label",
+            "events": [
+                {"_type": "test_event", "_index": "test", "_id": "updated"},
+                {"_type": "test_event", "_index": "test", "_id": "failed"},
+            ],
+        }
+        with mock.patch.object(
+            MockDataStore,
+            "flush_queued_events",
+            return_value={
+                "errors_in_upload": True,
+                "error_container": {"test": {"document_ids": ["failed"]}},
+            },
+        ):
+            response = self.client.post(
+                self.resource_url,
+                data=json.dumps(data),
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_INTERNAL_SERVER_ERROR)
+        self.assertIn("failed", response.json["message"])
+        self.assertNotIn("updated", response.json["message"])
+        self.assertIsNone(Event.query.filter_by(document_id="failed").first())
+        event = Event.query.filter_by(document_id="updated").first()
+        self.assertEqual([label.label for label in event.labels], ["__ts_star"])
+
     def test_post_annotate_invalid_index_resource(self):
         """
         Authenticated request to create an annotation, but in the wrong index.
@@ -1963,3 +2139,107 @@ class ExportStreamListResourceTest(BaseTest):
         self.assertEqual(response.status_code, HTTP_STATUS_CODE_BAD_REQUEST)
         # Verify we hit the specific abort for empty indices_for_pit
         self.assertIn("No valid search indices", response.json["message"])
+
+
+class UploadFileResourceTest(BaseTest):
+    """Test UploadFileResource."""
+
+    resource_url = "/api/v1/upload/"
+    upload_id = "0123456789abcdef0123456789abcdef"
+
+    def setUp(self):
+        super().setUp()
+        self.upload_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_folder, ignore_errors=True)
+        self.app.config["UPLOAD_ENABLED"] = True
+        self.app.config["UPLOAD_FOLDER"] = self.upload_folder
+        self.addCleanup(self.app.config.update, UPLOAD_ENABLED=False)
+        # Importing the tasks module connects to the database.
+        tasks = mock.Mock()
+        for patcher in (
+            mock.patch.dict(sys.modules, {"timesketch.lib.tasks": tasks}),
+            mock.patch.object(lib, "tasks", tasks, create=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _post_chunk(self, index, data):
+        """Upload one chunk of four bytes of a CSV file."""
+        form = {
+            "sketch_id": 1,
+            "name": "uploaded",
+            "total_file_size": 8,
+            "chunk_index": index,
+            "chunk_byte_offset": index * 4,
+            "chunk_total_chunks": 2,
+            "chunk_index_name": self.upload_id,
+            "file": (io.BytesIO(data), "uploaded.csv"),
+        }
+        return self.client.post(
+            self.resource_url, data=form, content_type="multipart/form-data"
+        )
+
+    def _get_state(self):
+        """Returns the state of the upload."""
+        return self.client.get(
+            self.resource_url,
+            query_string={
+                "sketch_id": 1,
+                "chunk_index_name": self.upload_id,
+                "chunk_total_chunks": 2,
+            },
+        )
+
+    def test_chunked_upload(self):
+        """Test that a completed upload is reported and not uploaded again."""
+        self.login()
+        response = self._post_chunk(1, b"efgh")
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        self.assertFalse(response.json["meta"]["upload_complete"])
+        self.assertEqual(self._get_state().json["meta"]["missing_chunks"], [0])
+
+        response = self._post_chunk(0, b"abcd")
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        self.assertTrue(response.json["meta"]["upload_complete"])
+        timeline = response.json["objects"][0]
+        with open(os.path.join(self.upload_folder, self.upload_id), "rb") as fh:
+            self.assertEqual(fh.read(), b"abcdefgh")
+
+        response = self._get_state()
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_OK)
+        self.assertTrue(response.json["meta"]["upload_complete"])
+        self.assertEqual(response.json["meta"]["missing_chunks"], [])
+        self.assertEqual(response.json["meta"]["timeline_id"], timeline["id"])
+        self.assertEqual(
+            response.json["meta"]["searchindex_id"], timeline["searchindex"]["id"]
+        )
+        self.assertEqual(response.json["objects"][0]["id"], timeline["id"])
+
+        response = self._post_chunk(0, b"abcd")
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CONFLICT)
+
+    def test_chunked_upload_after_timeline_deleted(self):
+        """Test that an upload is reset once its timeline left the sketch."""
+        self.login()
+        self._post_chunk(0, b"abcd")
+        response = self._post_chunk(1, b"efgh")
+        self.assertTrue(response.json["meta"]["upload_complete"])
+
+        timeline = Timeline.get_by_id(response.json["objects"][0]["id"])
+        timeline.sketch.timelines.remove(timeline)
+        db_session.commit()
+
+        response = self._get_state()
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_OK)
+        self.assertFalse(response.json["meta"]["upload_complete"])
+        self.assertEqual(response.json["meta"]["missing_chunks"], [0, 1])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.upload_folder, f"{self.upload_id}.done"))
+        )
+
+        response = self._post_chunk(0, b"abcd")
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        response = self._post_chunk(1, b"efgh")
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        self.assertTrue(response.json["meta"]["upload_complete"])
+        self.assertNotEqual(response.json["objects"][0]["id"], timeline.id)
@@ -30,6 +30,7 @@ import altair as alt
 import pandas as pd
 
 from timesketch.lib import ontology
+from timesketch.lib.aggregators import interface as aggregator_interface
 from timesketch.lib.aggregators import manager as aggregator_manager
 from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
 from timesketch.models import db_session
@@ -180,6 +181,8 @@ def run_aggregator_group(group, sketch_id):
     orientation = group.orientation
     objects = []
     time_before = time.time()
+    runs = []
+    run_options = []
     for aggregator in group.aggregations:
         if aggregator.aggregationgroup_id != group.id:
             abort(
@@ -205,8 +208,15 @@ def run_aggregator_group(group, sketch_id):
         aggregator_obj = agg_class(sketch_id=sketch_id)
         chart_type = aggregator_parameters.pop("supported_charts", None)
         color = aggregator_parameters.pop("chart_color", "")
-        result_obj = aggregator_obj.run(**aggregator_parameters)
+        runs.append((aggregator_obj, aggregator_parameters))
+        run_options.append((aggregator.name, chart_type, color))
 
+    # The aggregations of all aggregators are sent in a single request.
+    result_objs = aggregator_interface.run_aggregators(runs)
+
+    for (aggregator_obj, _), (name, chart_type, color), result_obj in zip(
+        runs, run_options, result_objs
+    ):
         chart = result_obj.to_chart(
             chart_name=chart_type,
             chart_title=aggregator_obj.chart_title,
@@ -226,7 +236,7 @@ def run_aggregator_group(group, sketch_id):
 
         buckets = result_obj.to_dict()
         buckets["buckets"] = buckets.pop("values")
-        result = {"aggregation_result": {aggregator.name: buckets}}
+        result = {"aggregation_result": {name: buckets}}
         objects.append(result)
 
     parameters = {}
@@ -19,6 +19,7 @@ import pandas as pd
 
 from timesketch.lib.aggregators import interface
 from timesketch.lib.aggregators import manager
+from timesketch.lib.datastores import field_types
 
 
 class AggregationQuerySpec:
@@ -347,6 +348,25 @@ class ApexAggregation(interface.BaseAggregator):
         """Returns the aggregation specific DSL as a dictionary."""
         raise NotImplementedError
 
+    def _format_field(self, field):
+        """Returns the name of a field to aggregate on.
+
+        The type of the field is read from the cached index mappings, the type
+        sent with the field is only used for fields that are not mapped.
+
+        Args:
+            field (dict[str, str]): the field name and type.
+
+        Returns:
+            the field name, with .keyword appended for text fields.
+        """
+        field_type = field_types.get_field_type(
+            self.opensearch.client, self.indices, field["field"]
+        )
+        if (field_type or field.get("type")) == "text":
+            return f"{field['field']}.keyword"
+        return field["field"]
+
     def _get_vega_encoding(self):
         """Returns the Vega encoding for rendering the aggregation chart as a dict."""
         raise RuntimeError(f"{self.__name__} cannot be used for Vega encodings.")
@@ -421,13 +441,13 @@ class ApexAggregation(interface.BaseAggregator):
         )
         return aggregation_query.spec
 
-    def run(
-        self, *, fields, aggregator_options, chart_type, chart_options
-    ):  # pylint: disable=arguments-differ
-        """Runs the aggregator.
+    def _set_chart(self, fields, chart_type, chart_options):
+        """Sets the fields and the chart of a run.
 
-        Returns:
-            ApexChartResult object.
+        Args:
+            fields (list[dict[str, str]]): the event fields to aggregate.
+            chart_type (str): the Apex chart type.
+            chart_options (dict[str, Any]): the Apex chart options.
 
         Raises:
             ValueError when:
@@ -449,8 +469,61 @@ class ApexAggregation(interface.BaseAggregator):
         self.chart_type = chart_type
         self.chart_options = chart_options
 
-        aggregation_query_spec = self._build_aggregation_query_spec(aggregator_options)
-        response = self.opensearch_aggregation(aggregation_query_spec)
+    # pylint: disable=arguments-differ
+    def build_spec(
+        self, *, fields, aggregator_options, chart_type, chart_options, **_kwargs
+    ):
+        """Returns the aggregation spec of a run.
+
+        Args:
+            fields (list[dict[str, str]]): the event fields to aggregate.
+            aggregator_options (dict[str, Any]): a mapping of options for
+                filtering/searching aggregations.
+            chart_type (str): the Apex chart type.
+            chart_options (dict[str, Any]): the Apex chart options.
+            **_kwargs: Other parameters of the run, they are not used.
+
+        Returns:
+            an opensearch query DSL as a dict
+
+        Raises:
+            ValueError when:
+            * fields is empty or an invalid format.
+            * chart type is not a supported type.
+        """
+        self._set_chart(fields, chart_type, chart_options)
+        # The options are consumed while the spec is built, the parameters
+        # of the run are kept for format_response and a retry with run.
+        return self._build_aggregation_query_spec(dict(aggregator_options))
+
+    # pylint: disable=arguments-differ
+    def format_response(
+        self,
+        response,
+        *,
+        fields,
+        chart_type,
+        chart_options,
+        **_kwargs,
+    ):
+        """Returns the result of a run from the response to its aggregation.
+
+        Args:
+            response (dict[str, Any]): the OpenSearch aggregation response.
+            fields (list[dict[str, str]]): the event fields to aggregate.
+            chart_type (str): the Apex chart type.
+            chart_options (dict[str, Any]): the Apex chart options.
+            **_kwargs: Other parameters of the run, they are not used.
+
+        Returns:
+            ApexChartResult object.
+
+        Raises:
+            ValueError when:
+            * fields is empty or an invalid format.
+            * chart type is not a supported type.
+        """
+        self._set_chart(fields, chart_type, chart_options)
         values, labels = self._process_aggregation_response(response)
 
         return ApexAggregationResult(
@@ -463,6 +536,33 @@ class ApexAggregation(interface.BaseAggregator):
             spec=response,
         )
 
+    def run(
+        self, *, fields, aggregator_options, chart_type, chart_options
+    ):  # pylint: disable=arguments-differ
+        """Runs the aggregator.
+
+        Returns:
+            ApexChartResult object.
+
+        Raises:
+            ValueError when:
+            * fields is empty or an invalid format.
+            * chart type is not a supported type.
+        """
+        aggregation_query_spec = self.build_spec(
+            fields=fields,
+            aggregator_options=aggregator_options,
+            chart_type=chart_type,
+            chart_options=chart_options,
+        )
+        response = self.opensearch_aggregation(aggregation_query_spec)
+        return self.format_response(
+            response,
+            fields=fields,
+            chart_type=chart_type,
+            chart_options=chart_options,
+        )
+
 
 class CalendarDateHistogram(ApexAggregation):
     """Aggregates events using the Date Histogram (with calendar intervals)
@@ -505,10 +605,7 @@ class CalendarDateHistogram(ApexAggregation):
         }
 
         for field in self.fields:
-            if field["type"] == "text":
-                field = f"{field['field']}.keyword"
-            else:
-                field = field["field"]
+            field = self._format_field(field)
 
             dsl["aggs"][self.metric] = {self.metric: {"field": field}}
         return dsl
@@ -562,10 +659,7 @@ class AutoDateHistogram(ApexAggregation):
         }
 
         for field in self.fields:
-            if field["type"] == "text":
-                field = f"{field['field']}.keyword"
-            else:
-                field = field["field"]
+            field = self._format_field(field)
 
             dsl["aggs"][metric] = {metric: {"field": field}}
         return dsl
@@ -615,10 +709,7 @@ class TopTerms(ApexAggregation):
         """Returns the aggregation specific DSL as a dictionary."""
         max_items = aggregator_options.get("max_items", self.DEFAULT_MAX_ITEMS)
         field = self.fields[0]
-        if field["type"] == "text":
-            field = f"{field['field']}.keyword"
-        else:
-            field = field["field"]
+        field = self._format_field(field)
         dsl = {"terms": {"field": field, "size": max_items}}
         return dsl
 
@@ -658,10 +749,7 @@ class RareTerms(ApexAggregation):
         """Returns the aggregation specific DSL as a dictionary."""
         max_items = aggregator_options.get("max_items", self.DEFAULT_MAX_DOC_COUNT)
         field = self.fields[0]
-        if field["type"] == "text":
-            field = f"{field['field']}.keyword"
-        else:
-            field = field["field"]
+        field = self._format_field(field)
         dsl = {"rare_terms": {"field": field, "max_doc_count": max_items}}
         return dsl
 
@@ -705,10 +793,7 @@ class SingleMetric(ApexAggregation):
         """Returns the aggregation specific DSL as a dictionary."""
         self.metric = aggregator_options.get("metric", self.DEFAULT_METRIC)
         field = self.fields[0]
-        if field["type"] == "text":
-            field = f"{field['field']}.keyword"
-        else:
-            field = field["field"]
+        field = self._format_field(field)
         dsl = {
             self.metric: {
                 "field": field,
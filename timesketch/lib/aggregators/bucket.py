@@ -80,33 +80,64 @@ class TermsAggregation(interface.BaseAggregator):
         return "Top results for an unknown field"
 
     # pylint: disable=arguments-differ
-    def run(
+    def build_spec(
         self,
         field: str,
         limit: int = 10,
-        supported_charts: str = "table",
         start_time: str = "",
         end_time: str = "",
-        order_field: str = "count",
+        **_kwargs,
     ):
-        """Run the aggregation.
+        """Returns the aggregation spec of a run.
 
         Args:
             field: What field to aggregate on.
             limit: How many buckets to return.
-            supported_charts: Chart type to render. Defaults to table.
             start_time: Optional ISO formatted date string that limits the time
                 range for the aggregation.
             end_time: Optional ISO formatted date string that limits the time
                 range for the aggregation.
+            **_kwargs: Other parameters of the run, they are not used.
+
+        Returns:
+            Dict with OpenSearch aggregation spec.
+        """
+        self.field = field
+        formatted_field_name = self.format_field_by_type(field)
+
+        aggregation_spec = {
+            "aggs": {
+                "aggregation": {"terms": {"field": formatted_field_name, "size": limit}}
+            }
+        }
+
+        return self._add_query_to_aggregation_spec(
+            aggregation_spec, start_time, end_time
+        )
+
+    # pylint: disable=arguments-differ
+    def format_response(
+        self,
+        response,
+        field: str,
+        supported_charts: str = "table",
+        order_field: str = "count",
+        **_kwargs,
+    ):
+        """Returns the result of a run from the response to its aggregation.
+
+        Args:
+            response (dict): the OpenSearch response to the aggregation.
+            field: What field to aggregate on.
+            supported_charts: Chart type to render. Defaults to table.
             order_field: The name of the field that is used for the order
                 of items in the aggregation, defaults to "count".
+            **_kwargs: Other parameters of the run, they are not used.
 
         Returns:
             Instance of interface.AggregationResult with aggregation result.
         """
         self.field = field
-        formatted_field_name = self.format_field_by_type(field)
 
         # Encoding information for Vega-Lite.
         encoding = {
@@ -122,17 +153,6 @@ class TermsAggregation(interface.BaseAggregator):
             ],
         }
 
-        aggregation_spec = {
-            "aggs": {
-                "aggregation": {"terms": {"field": formatted_field_name, "size": limit}}
-            }
-        }
-
-        aggregation_spec = self._add_query_to_aggregation_spec(
-            aggregation_spec, start_time, end_time
-        )
-
-        response = self.opensearch_aggregation(aggregation_spec)
         aggregations = response.get("aggregations", {})
         aggregation = aggregations.get("aggregation", {})
 
@@ -150,5 +170,42 @@ class TermsAggregation(interface.BaseAggregator):
             field=field,
         )
 
+    # pylint: disable=arguments-differ
+    def run(
+        self,
+        field: str,
+        limit: int = 10,
+        supported_charts: str = "table",
+        start_time: str = "",
+        end_time: str = "",
+        order_field: str = "count",
+    ):
+        """Run the aggregation.
+
+        Args:
+            field: What field to aggregate on.
+            limit: How many buckets to return.
+            supported_charts: Chart type to render. Defaults to table.
+            start_time: Optional ISO formatted date string that limits the time
+                range for the aggregation.
+            end_time: Optional ISO formatted date string that limits the time
+                range for the aggregation.
+            order_field: The name of the field that is used for the order
+                of items in the aggregation, defaults to "count".
+
+        Returns:
+            Instance of interface.AggregationResult with aggregation result.
+        """
+        aggregation_spec = self.build_spec(
+            field, limit=limit, start_time=start_time, end_time=end_time
+        )
+        response = self.opensearch_aggregation(aggregation_spec)
+        return self.format_response(
+            response,
+            field,
+            supported_charts=supported_charts,
+            order_field=order_field,
+        )
+
 
 manager.AggregatorManager.register_aggregator(TermsAggregation)
@@ -211,29 +211,32 @@ class DateHistogramAggregation(interface.BaseAggregator):
         return aggregation_spec
 
     # pylint: disable=arguments-differ
-    def run(
+    def build_spec(
         self,
         field: str,
         field_query_string: str = "*",
         supported_intervals: str = "day",
-        supported_charts: str = "heatmap",
         start_time: str = "",
         end_time: str = "",
+        **_kwargs,
     ):
-        """Runs the date_histogram aggregator.
+        """Returns the aggregation spec of a run.
 
         Args:
             field: What field to aggregate on.
             field_query_string: The field value(s) to aggregate on.
             supported_intervals: The time interval to aggregate on.
-            supported_charts: The chart type to render.  Defaults to table.
             start_time: Optional ISO formatted date string that limits the time range
                 for the aggregation.
             end_time: Optional ISO formatted date string that limits the time range
                 for the aggregation.
+            **_kwargs: Other parameters of the run, they are not used.
 
         Returns:
-            interface.AggregationResult: the aggregation result.
+            Dict with OpenSearch aggregation spec.
+
+        Raises:
+            ValueError: if the field or field_query_string is missing.
         """
         if not field or not field_query_string:
             raise ValueError("Missing field and/or field_query_string.")
@@ -244,13 +247,36 @@ class DateHistogramAggregation(interface.BaseAggregator):
         self.interval = supported_intervals
         # pylint: enable=attribute-defined-outside-init
 
-        encoding = self._get_vega_encoding(supported_charts)
+        return self._get_histogram_aggregation_spec(start_time, end_time)
 
-        histogram_aggregation_spec = self._get_histogram_aggregation_spec(
-            start_time, end_time
-        )
+    # pylint: disable=arguments-differ
+    def format_response(
+        self,
+        response,
+        field: str,
+        supported_intervals: str = "day",
+        supported_charts: str = "heatmap",
+        **_kwargs,
+    ):
+        """Returns the result of a run from the response to its aggregation.
+
+        Args:
+            response (dict): the OpenSearch response to the aggregation.
+            field: What field to aggregate on.
+            supported_intervals: The time interval to aggregate on.
+            supported_charts: The chart type to render.  Defaults to table.
+            **_kwargs: Other parameters of the run, they are not used.
+
+        Returns:
+            interface.AggregationResult: the aggregation result.
+        """
+        self.field = field
+        # pylint: disable=attribute-defined-outside-init
+        self.interval = supported_intervals
+        # pylint: enable=attribute-defined-outside-init
+
+        encoding = self._get_vega_encoding(supported_charts)
 
-        response = self.opensearch_aggregation(histogram_aggregation_spec)
         aggregations = response.get("aggregations", {})
         aggregation = aggregations.get("aggregation", {})
         buckets = aggregation.get("buckets", [])
@@ -285,5 +311,45 @@ class DateHistogramAggregation(interface.BaseAggregator):
             field=field,
         )
 
+    # pylint: disable=arguments-differ
+    def run(
+        self,
+        field: str,
+        field_query_string: str = "*",
+        supported_intervals: str = "day",
+        supported_charts: str = "heatmap",
+        start_time: str = "",
+        end_time: str = "",
+    ):
+        """Runs the date_histogram aggregator.
+
+        Args:
+            field: What field to aggregate on.
+            field_query_string: The field value(s) to aggregate on.
+            supported_intervals: The time interval to aggregate on.
+            supported_charts: The chart type to render.  Defaults to table.
+            start_time: Optional ISO formatted date string that limits the time range
+                for the aggregation.
+            end_time: Optional ISO formatted date string that limits the time range
+                for the aggregation.
+
+        Returns:
+            interface.AggregationResult: the aggregation result.
+        """
+        histogram_aggregation_spec = self.build_spec(
+            field,
+            field_query_string=field_query_string,
+            supported_intervals=supported_intervals,
+            start_time=start_time,
+            end_time=end_time,
+        )
+        response = self.opensearch_aggregation(histogram_aggregation_spec)
+        return self.format_response(
+            response,
+            field,
+            supported_intervals=supported_intervals,
+            supported_charts=supported_charts,
+        )
+
 
 manager.AggregatorManager.register_aggregator(DateHistogramAggregation)
@@ -19,6 +19,7 @@ import opensearchpy
 import pandas
 
 from timesketch.lib.charts import manager as chart_manager
+from timesketch.lib.datastores import field_types
 from timesketch.lib.datastores.opensearch import OpenSearchDataStore
 from timesketch.models.sketch import Sketch as SQLSketch
 
@@ -78,6 +79,40 @@ class AggregationResult:
             aggregation_data["encoding"] = self.encoding
         return aggregation_data
 
+    def serialize(self):
+        """Encode the complete aggregation result as a JSON serializable dict.
+
+        Returns:
+            Dict that can be turned back into a result with deserialize().
+        """
+        return {
+            "chart_type": self.chart_type,
+            "encoding": self.encoding,
+            "values": self.values,
+            "sketch_url": self._sketch_url,
+            "field": self.field,
+            "extra_query_url": self._extra_query_url,
+        }
+
+    @classmethod
+    def deserialize(cls, data):
+        """Create an aggregation result from a dict made by serialize().
+
+        Args:
+            data: Dict with a serialized aggregation result.
+
+        Returns:
+            Aggregation result (instance of AggregationResult).
+        """
+        return cls(
+            encoding=data.get("encoding", {}),
+            values=data.get("values", []),
+            chart_type=data.get("chart_type", "table"),
+            sketch_url=data.get("sketch_url", ""),
+            field=data.get("field", ""),
+            extra_query_url=data.get("extra_query_url", ""),
+        )
+
     def to_pandas(self):
         """Encode aggregation result as a pandas dataframe.
 
@@ -159,6 +194,19 @@ class AggregationResult:
             return {}
 
 
+class _AggregationSpecCaptured(Exception):
+    """Raised to stop a run of an aggregator when its spec is captured."""
+
+    def __init__(self, aggregation_spec):
+        """Initialize the exception.
+
+        Args:
+            aggregation_spec: Dict with OpenSearch aggregation spec.
+        """
+        super().__init__()
+        self.aggregation_spec = aggregation_spec
+
+
 class BaseAggregator:
     """Base class for an aggregator."""
 
@@ -175,6 +223,12 @@ class BaseAggregator:
     # List of supported chart types.
     SUPPORTED_CHARTS = frozenset()
 
+    # Set while the aggregation spec of a run is captured.
+    _capture_spec = False
+
+    # Response that is used for the next aggregation instead of a search.
+    _prefetched_response = None
+
     def __init__(self, sketch_id=None, indices=None, timeline_ids=None):
         """Initialize the aggregator object.
 
@@ -335,59 +389,29 @@ class BaseAggregator:
         Returns:
             Field name as string formatted after mapping type.
         """
-        # Default field format is just the name unchanged.
-        field_format = field_name
-        field_type = None
-
-        indices = self.indices
-        if isinstance(indices, (list, tuple)):
-            indices = ",".join(indices)
-
-        # Get the mapping for the field.
-        try:
-            mapping = self.opensearch.client.indices.get_field_mapping(
-                index=indices, fields=field_name
-            )
-        except opensearchpy.NotFoundError:
-            mapping = {}
-
-        # The returned structure is nested so we need to unpack it.
-        # Example:
-        # {'<INDEX NAME>': {
-        #     'mappings': {
-        #         'inode': {
-        #             'full_name': 'inode',
-        #             'mapping': {
-        #                 'inode': {
-        #                     'type': 'long'
-        #                 }
-        #             }
-        #         }
-        #     }
-        # }}
-        for value in mapping.values():
-            mappings = value.get("mappings", {})
-            mapping = mappings.get(field_name, {}).get("mapping", {})
-            field_type = mapping.get(field_name, {}).get("type", None)
-            if field_type:
-                break
-
-        if field_type == "text":
-            field_format = f"{field_name}.keyword"
-
-        return field_format
+        # The field types are cached per index and shared by all aggregators.
+        return field_types.format_field_by_type(
+            self.opensearch.client, self.indices, field_name
+        )
 
     def opensearch_aggregation(self, aggregation_spec):
         """Helper method to execute aggregation in OpenSearch.
 
         Args:
-            aggregation_spec: Dict with OpenSearch aggregation spec.
+            aggregation_spec (dict): OpenSearch aggregation spec.
 
         Returns:
             OpenSearch aggregation result.
         """
-        # pylint: disable=unexpected-keyword-arg, no-value-for-parameter
+        if self._capture_spec:
+            raise _AggregationSpecCaptured(aggregation_spec)
+
+        if self._prefetched_response is not None:
+            aggregation = self._prefetched_response
+            self._prefetched_response = None
+            return aggregation
 
+        # pylint: disable=unexpected-keyword-arg, no-value-for-parameter
         try:
             aggregation = self.opensearch.client.search(
                 index=self.indices, body=aggregation_spec, size=0
@@ -397,6 +421,97 @@ class BaseAggregator:
             raise
         return aggregation
 
+    def build_spec(self, **kwargs):
+        """Returns the aggregation spec of a run without executing it.
+
+        Aggregators that send a single aggregation override build_spec and
+        format_response, so that their aggregation can be sent together with
+        others in a single msearch. By default the aggregator is run until it
+        sends its first aggregation to the datastore.
+
+        Args:
+            **kwargs: The parameters of the run.
+
+        Returns:
+            Dict with OpenSearch aggregation spec, or None if the run does
+            not send an aggregation to the datastore.
+        """
+        self._capture_spec = True
+        try:
+            self.run(**kwargs)
+        except _AggregationSpecCaptured as captured:
+            return captured.aggregation_spec
+        finally:
+            self._capture_spec = False
+        return None
+
+    def format_response(self, response, **kwargs):
+        """Returns the result of a run from the response to its aggregation.
+
+        By default the aggregator is run, and the response is used instead
+        of sending the aggregation to the datastore.
+
+        Args:
+            response (dict): The OpenSearch response to the aggregation spec
+                returned by build_spec.
+            **kwargs: The parameters of the run.
+
+        Returns:
+            The result of the run.
+        """
+        self._prefetched_response = response
+        try:
+            return self.run(**kwargs)
+        finally:
+            self._prefetched_response = None
+
     def run(self, *args, **kwargs):
         """Entry point for the aggregator."""
         raise NotImplementedError
+
+
+def run_aggregators(runs):
+    """Run aggregators, sending their aggregations in a single msearch.
+
+    Aggregators that do not send an aggregation, or whose aggregation failed
+    in the msearch, are run on their own.
+
+    Args:
+        runs (list): List of tuples with an aggregator (instance of
+            BaseAggregator) and a dict with the parameters of its run.
+
+    Returns:
+        List with the result of each run, in the order of the runs.
+    """
+    specs = []
+    for aggregator, parameters in runs:
+        spec = None
+        if aggregator.indices:
+            spec = aggregator.build_spec(**parameters)
+        specs.append(spec)
+
+    batched = [index for index, spec in enumerate(specs) if spec is not None]
+    responses = {}
+    if len(batched) > 1:
+        body = []
+        for index in batched:
+            aggregator = runs[index][0]
+            body.append({"index": ",".join(aggregator.indices)})
+            body.append(dict(specs[index], size=0))
+        client = runs[batched[0]][0].opensearch.client
+        try:
+            msearch_response = client.msearch(body=body)
+        except opensearchpy.OpenSearchException as e:
+            logger.warning("Unable to run aggregations with msearch: %s", str(e))
+            msearch_response = {}
+        for index, response in zip(batched, msearch_response.get("responses", [])):
+            if "error" not in response:
+                responses[index] = response
+
+    results = []
+    for index, (aggregator, parameters) in enumerate(runs):
+        if index in responses:
+            results.append(aggregator.format_response(responses[index], **parameters))
+        else:
+            results.append(aggregator.run(**parameters))
+    return results
@@ -0,0 +1,123 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the aggregator interface."""
+
+from unittest import mock
+
+from timesketch.lib.aggregators import interface
+from timesketch.lib.testlib import BaseTest
+
+
+class CountAggregator(interface.BaseAggregator):
+    """Aggregator that returns the number of events."""
+
+    NAME = "count"
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, client, indices):
+        self.opensearch = mock.Mock(client=client)
+        self.indices = indices
+
+    @property
+    def chart_title(self):
+        return "Count"
+
+    # pylint: disable=arguments-differ
+    def run(self, field):
+        response = self.opensearch_aggregation(
+            {"aggs": {"count": {"value_count": {"field": field}}}}
+        )
+        return response["aggregations"]["count"]["value"]
+
+
+class SplitCountAggregator(CountAggregator):
+    """Count aggregator that builds its spec and result separately."""
+
+    NAME = "split_count"
+
+    def __init__(self, client, indices):
+        super().__init__(client, indices)
+        self.built_specs = 0
+
+    # pylint: disable=arguments-differ
+    def build_spec(self, field):
+        self.built_specs += 1
+        return {"aggs": {"count": {"value_count": {"field": field}}}}
+
+    # pylint: disable=arguments-differ
+    def format_response(self, response, field):
+        return (field, response["aggregations"]["count"]["value"])
+
+    def run(self, field):
+        raise AssertionError("The aggregator should not be run.")
+
+
+def _response(value):
+    return {"aggregations": {"count": {"value": value}}}
+
+
+class TestRunAggregators(BaseTest):
+    """Tests for running aggregators in a single msearch."""
+
+    def test_build_spec_default(self):
+        """Test that the default build_spec does not run the aggregation."""
+        client = mock.Mock()
+        aggregator = CountAggregator(client, ["index_1"])
+        self.assertEqual(
+            aggregator.build_spec(field="domain"),
+            {"aggs": {"count": {"value_count": {"field": "domain"}}}},
+        )
+        client.search.assert_not_called()
+
+    def test_format_response_default(self):
+        """Test that the default format_response runs with the response."""
+        client = mock.Mock()
+        aggregator = CountAggregator(client, ["index_1"])
+        self.assertEqual(aggregator.format_response(_response(5), field="domain"), 5)
+        client.search.assert_not_called()
+
+    def test_run_aggregators(self):
+        """Test that the responses of the msearch are used by each run."""
+        client = mock.Mock()
+        client.msearch.return_value = {
+            "responses": [_response(1), {"error": {"reason": "failed"}}, _response(3)]
+        }
+        client.search.return_value = _response(2)
+        runs = [
+            (CountAggregator(client, ["index_1"]), {"field": "domain"}),
+            (CountAggregator(client, ["index_1", "index_2"]), {"field": "url"}),
+            (CountAggregator(client, ["index_2"]), {"field": "ip"}),
+        ]
+
+        self.assertEqual(interface.run_aggregators(runs), [1, 2, 3])
+
+        body = client.msearch.call_args[1]["body"]
+        self.assertEqual(body[2], {"index": "index_1,index_2"})
+        self.assertEqual(body[3]["size"], 0)
+        # Only the failed aggregation is run with its own search.
+        client.search.assert_called_once()
+
+    def test_run_aggregators_with_spec_split(self):
+        """Test that the spec of split aggregators is only built once."""
+        client = mock.Mock()
+        client.msearch.return_value = {"responses": [_response(1), _response(2)]}
+        aggregator = SplitCountAggregator(client, ["index_1"])
+        runs = [
+            (aggregator, {"field": "domain"}),
+            (CountAggregator(client, ["index_2"]), {"field": "url"}),
+        ]
+
+        self.assertEqual(interface.run_aggregators(runs), [("domain", 1), 2])
+        self.assertEqual(aggregator.built_specs, 1)
+        client.search.assert_not_called()
@@ -0,0 +1,379 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Persistent cache of the results of saved aggregations.
+
+The result of a saved aggregation, with its Vega spec, is stored in the
+database together with two fingerprints:
+
+ * The definition: the aggregator, its parameters and the indices and
+   timelines it runs on. A result with a different definition is never
+   served, the aggregation is run again.
+ * The stamp: the status and modification time of the timelines the
+   aggregation covered and the generation of their indices (see query_cache,
+   if index generations are kept). A result with a different stamp, or that
+   is older than AGGREGATION_RESULT_CACHE_TTL seconds, is served while a
+   Celery task computes the new result.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import prometheus_client
+import redis
+from flask import current_app
+
+from timesketch.lib.aggregators import interface
+from timesketch.lib.aggregators import manager
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.definitions import METRICS_NAMESPACE
+from timesketch.models import db_session
+from timesketch.models.sketch import AggregationResultCache
+
+
+logger = logging.getLogger("timesketch.aggregator_result_cache")
+
+METRICS = {
+    "aggregation_result_cache_lookups": prometheus_client.Counter(
+        "aggregation_result_cache_lookups",
+        "Number of saved aggregation results looked up in the cache per result "
+        "(hit, stale, miss)",
+        ["result"],
+        namespace=METRICS_NAMESPACE,
+    ),
+}
+
+# Default number of seconds a cached result is served without a refresh.
+DEFAULT_TTL = 3600
+
+# Number of seconds after which a refresh that did not finish is queued again.
+REFRESH_RETRY_INTERVAL = 600
+
+
+def is_enabled() -> bool:
+    """Returns whether the aggregation result cache is enabled."""
+    return bool(current_app.config.get("AGGREGATION_RESULT_CACHE_ENABLED", False))
+
+
+def _get_generations(index_names: List[str]) -> Dict[str, int]:
+    """Returns the generation of each index, if generations are kept."""
+    if not query_cache.generations_enabled():
+        return {}
+    try:
+        client = query_cache.get_redis_client()
+        if client is None:
+            return {}
+        generations = query_cache.get_index_generations(client, index_names)
+    except (ValueError, redis.exceptions.RedisError) as e:
+        logger.warning("Unable to read index generations: %s", str(e))
+        return {}
+    return dict(zip(index_names, generations))
+
+
+def _hash(value: Any) -> str:
+    """Returns the SHA-256 hex digest of a JSON serializable value."""
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def get_aggregator(aggregation) -> Optional[Tuple[Any, Dict, Dict]]:
+    """Returns the aggregator of a saved aggregation.
+
+    Args:
+        aggregation (timesketch.models.sketch.Aggregation): A saved
+            aggregation.
+
+    Returns:
+        A tuple with the aggregator object, a dict with the parameters of
+        its run and a dict with the "chart_type", "chart_color" and
+        "chart_title" of the aggregation, or None if the aggregator does not
+        exist.
+    """
+    try:
+        agg_class = manager.AggregatorManager.get_aggregator(aggregation.agg_type)
+    except KeyError:
+        return None
+    if not agg_class:
+        return None
+
+    if aggregation.parameters:
+        parameters = json.loads(aggregation.parameters)
+    else:
+        parameters = {}
+
+    # The index parameter is a list of index names and timeline IDs.
+    index_list = parameters.pop("index", None) or []
+    if isinstance(index_list, str):
+        index_list = index_list.split(",")
+    indices = [index for index in index_list if isinstance(index, str)]
+    timeline_ids = [index for index in index_list if isinstance(index, int)]
+
+    aggregator = agg_class(
+        sketch_id=aggregation.sketch_id, indices=indices, timeline_ids=timeline_ids
+    )
+    options = {
+        "chart_type": parameters.pop("supported_charts", None)
+        or aggregation.chart_type,
+        "chart_color": parameters.pop("chart_color", ""),
+        "chart_title": parameters.pop("chart_title", None),
+    }
+    return aggregator, parameters, options
+
+
+def get_fingerprints(aggregation, aggregator) -> Tuple[str, str]:
+    """Returns the definition and the stamp of a saved aggregation.
+
+    Args:
+        aggregation (timesketch.models.sketch.Aggregation): A saved
+            aggregation.
+        aggregator (BaseAggregator): The aggregator of the aggregation.
+
+    Returns:
+        A tuple with the hash of the definition of the aggregation and the
+        hash of the state of the data it covers.
+    """
+    index_names = sorted(set(aggregator.indices))
+    timelines = [
+        timeline
+        for timeline in aggregator.sketch.active_timelines
+        if timeline.searchindex.index_name in index_names
+        and (not aggregator.timeline_ids or timeline.id in aggregator.timeline_ids)
+    ]
+    timelines.sort(key=lambda timeline: timeline.id)
+
+    definition = {
+        "agg_type": aggregation.agg_type,
+        "parameters": aggregation.parameters,
+        "indices": index_names,
+        "timeline_ids": sorted(aggregator.timeline_ids or []),
+    }
+    stamp = {
+        "generations": _get_generations(index_names),
+        "timelines": [
+            [
+                timeline.id,
+                timeline.updated_at,
+                timeline.get_status.status,
+                timeline.searchindex.get_status.status,
+            ]
+            for timeline in timelines
+        ],
+    }
+    return _hash(definition), _hash(stamp)
+
+
+def _get_meta(aggregator, result, options: Dict, es_time: float) -> Dict:
+    """Returns the metadata of an aggregator run.
+
+    Args:
+        aggregator (BaseAggregator): The aggregator that was run.
+        result (AggregationResult): The result of the run.
+        options (dict): Dict with the chart options of the aggregation.
+        es_time (float): Number of seconds the run took.
+
+    Returns:
+        Dict with the metadata of the run, in the format of
+        timesketch.api.v1.utils.run_aggregator.
+    """
+    aggregator_description = aggregator.describe
+    chart_type = options.get("chart_type")
+    meta = {
+        "method": "aggregator_run",
+        "chart_type": chart_type,
+        "chart_color": options.get("chart_color"),
+        "name": aggregator_description.get("name"),
+        "description": aggregator_description.get("description"),
+        "es_time": es_time,
+    }
+    if chart_type:
+        chart_title = options.get("chart_title") or aggregator.chart_title
+        meta["vega_spec"] = result.to_chart(
+            chart_name=chart_type,
+            chart_title=chart_title,
+            color=options.get("chart_color"),
+        )
+        meta["vega_chart_title"] = chart_title
+    return meta
+
+
+def _store(aggregation, definition: str, stamp: str, result, meta: Dict):
+    """Store the result of a saved aggregation in the cache.
+
+    Args:
+        aggregation (timesketch.models.sketch.Aggregation): A saved
+            aggregation.
+        definition (str): Hash of the definition of the aggregation.
+        stamp (str): Hash of the state of the data the result covers.
+        result (AggregationResult): The result.
+        meta (dict): Dict with the metadata of the run.
+    """
+    cache = aggregation.result_cache
+    if cache is None:
+        cache = AggregationResultCache()
+        aggregation.result_cache = cache
+    cache.definition = definition
+    cache.stamp = stamp
+    cache.result = json.dumps(result.serialize())
+    cache.meta = json.dumps(meta)
+    cache.computed_at = datetime.datetime.utcnow()
+    cache.refresh_queued_at = None
+    db_session.add(cache)
+    db_session.commit()
+
+
+def _queue_refresh(cache):
+    """Queue a Celery task that refreshes a cached result.
+
+    The task is not queued again while an earlier refresh may still run.
+
+    Args:
+        cache (AggregationResultCache): The cached result.
+    """
+    now = datetime.datetime.utcnow()
+    retry_interval = datetime.timedelta(seconds=REFRESH_RETRY_INTERVAL)
+    if cache.refresh_queued_at and cache.refresh_queued_at > now - retry_interval:
+        return
+
+    cache.refresh_queued_at = now
+    db_session.add(cache)
+    db_session.commit()
+
+    # Import here to avoid circular imports.
+    # pylint: disable=import-outside-toplevel
+    from timesketch.lib import tasks
+
+    tasks.run_aggregation_result_refresh.apply_async(args=(cache.aggregation_id,))
+
+
+def get_results(aggregations: List[Any]) -> Dict[int, Tuple[Any, Dict]]:
+    """Returns the results of saved aggregations, from the cache if possible.
+
+    Aggregations without a usable cached result are run with a single
+    msearch (see interface.run_aggregators) and their results are cached.
+
+    Args:
+        aggregations (list): List of saved aggregations (instances of
+            timesketch.models.sketch.Aggregation).
+
+    Returns:
+        Dict with a tuple of the result (instance of AggregationResult) and a
+        dict with the metadata of the run per aggregation ID. Aggregations
+        whose aggregator does not exist are left out.
+    """
+    enabled = is_enabled()
+    ttl = datetime.timedelta(
+        seconds=current_app.config.get("AGGREGATION_RESULT_CACHE_TTL", DEFAULT_TTL)
+    )
+    expired_before = datetime.datetime.utcnow() - ttl
+
+    results = {}
+    runs = []
+    pending = []
+    for aggregation in aggregations:
+        if aggregation.id in results:
+            continue
+        aggregator = get_aggregator(aggregation)
+        if not aggregator:
+            continue
+        aggregator_obj, parameters, options = aggregator
+
+        definition = stamp = None
+        if enabled:
+            definition, stamp = get_fingerprints(aggregation, aggregator_obj)
+            cache = aggregation.result_cache
+            if cache and cache.result and cache.definition == definition:
+                result = interface.AggregationResult.deserialize(
+                    json.loads(cache.result)
+                )
+                results[aggregation.id] = (result, json.loads(cache.meta))
+                if (
+                    cache.stamp == stamp
+                    and cache.computed_at
+                    and cache.computed_at > expired_before
+                ):
+                    lookup_result = "hit"
+                else:
+                    lookup_result = "stale"
+                    _queue_refresh(cache)
+                METRICS["aggregation_result_cache_lookups"].labels(
+                    result=lookup_result
+                ).inc()
+                continue
+            METRICS["aggregation_result_cache_lookups"].labels(result="miss").inc()
+
+        results[aggregation.id] = None
+        runs.append((aggregator_obj, parameters))
+        pending.append((aggregation, options, definition, stamp))
+
+    if not runs:
+        return results
+
+    time_before = time.time()
+    # The aggregations of all aggregators are sent in a single request.
+    run_results = interface.run_aggregators(runs)
+    es_time = time.time() - time_before
+
+    for (aggregator_obj, _), (aggregation, options, definition, stamp), result in zip(
+        runs, pending, run_results
+    ):
+        meta = _get_meta(aggregator_obj, result, options, es_time)
+        results[aggregation.id] = (result, meta)
+        if enabled:
+            _store(aggregation, definition, stamp, result, meta)
+    return results
+
+
+def get_result(aggregation) -> Tuple[Any, Dict]:
+    """Returns the result of a saved aggregation, from the cache if possible.
+
+    Args:
+        aggregation (timesketch.models.sketch.Aggregation): A saved
+            aggregation.
+
+    Returns:
+        A tuple with the result (instance of AggregationResult) and a dict
+        with the metadata of the run, or None and an empty dict if the
+        aggregator does not exist.
+    """
+    return get_results([aggregation]).get(aggregation.id, (None, {}))
+
+
+def refresh(aggregation) -> bool:
+    """Run a saved aggregation and store its result in the cache.
+
+    Args:
+        aggregation (timesketch.models.sketch.Aggregation): A saved
+            aggregation.
+
+    Returns:
+        True if the result was refreshed, False if the aggregator does not
+        exist.
+    """
+    aggregator = get_aggregator(aggregation)
+    if not aggregator:
+        return False
+    aggregator_obj, parameters, options = aggregator
+
+    # The fingerprints are taken before the run, so that data written during
+    # the run makes the result stale.
+    definition, stamp = get_fingerprints(aggregation, aggregator_obj)
+    time_before = time.time()
+    result = aggregator_obj.run(**parameters)
+    meta = _get_meta(aggregator_obj, result, options, time.time() - time_before)
+    _store(aggregation, definition, stamp, result, meta)
+    return True
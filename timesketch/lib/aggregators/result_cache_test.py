@@ -0,0 +1,155 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the aggregation result cache."""
+
+import json
+import sys
+from unittest import mock
+
+from timesketch import lib
+from timesketch.lib.aggregators import interface
+from timesketch.lib.aggregators import result_cache
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.datastores.query_cache_test import FakeRedis
+from timesketch.lib.testlib import BaseTest
+from timesketch.models.sketch import Aggregation
+from timesketch.models.sketch import Sketch
+
+
+class CountAggregator(interface.BaseAggregator):
+    """Aggregator that returns the number of events with a field."""
+
+    NAME = "count"
+    DESCRIPTION = "Count events"
+
+    # Datastore mock, set by the tests.
+    opensearch = None
+
+    # pylint: disable=super-init-not-called
+    def __init__(self, sketch_id=None, indices=None, timeline_ids=None):
+        self.sketch = Sketch.get_by_id(sketch_id)
+        self.indices = indices or [
+            t.searchindex.index_name for t in self.sketch.active_timelines
+        ]
+        self.timeline_ids = timeline_ids or None
+
+    @property
+    def chart_title(self):
+        return "Count"
+
+    # pylint: disable=arguments-differ
+    def run(self, field):
+        response = self.opensearch_aggregation(
+            {"aggs": {"count": {"value_count": {"field": field}}}}
+        )
+        return interface.AggregationResult(
+            encoding={"x": {"field": "count"}},
+            values=[{"field": field, "count": response["aggregations"]["count"]}],
+        )
+
+
+class TestAggregationResultCache(BaseTest):
+    """Tests for the aggregation result cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.app.config["AGGREGATION_RESULT_CACHE_ENABLED"] = True
+        self.redis = FakeRedis()
+        self.search = mock.Mock(return_value={"aggregations": {"count": 10}})
+        # The tasks module connects to the database when it is imported.
+        self.tasks = mock.Mock()
+        CountAggregator.opensearch = mock.Mock()
+        CountAggregator.opensearch.client.search = self.search
+        for patcher in (
+            mock.patch.object(query_cache, "get_redis_client", return_value=self.redis),
+            mock.patch.object(
+                result_cache.manager.AggregatorManager,
+                "get_aggregator",
+                return_value=CountAggregator,
+            ),
+            mock.patch.dict(sys.modules, {"timesketch.lib.tasks": self.tasks}),
+            mock.patch.object(lib, "tasks", self.tasks, create=True),
+            # The chart registry is cleared by the chart manager tests.
+            mock.patch.object(
+                interface.AggregationResult,
+                "to_chart",
+                return_value={"mark": "table"},
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.aggregation = Aggregation(
+            name="Count",
+            description="Count",
+            agg_type="count",
+            parameters=json.dumps({"field": "domain", "chart_color": "red"}),
+            chart_type="table",
+            user_id=self.user1.id,
+            sketch_id=self.sketch1.id,
+        )
+        self._commit_to_database(self.aggregation)
+
+    def tearDown(self):
+        self.app.config["AGGREGATION_RESULT_CACHE_ENABLED"] = False
+        super().tearDown()
+
+    def test_result_is_cached(self):
+        """Test that a saved aggregation is run once."""
+        result, meta = result_cache.get_result(self.aggregation)
+        self.assertEqual(result.values, [{"field": "domain", "count": 10}])
+        self.assertEqual(meta["chart_color"], "red")
+        self.assertIn("vega_spec", meta)
+
+        cached_result, cached_meta = result_cache.get_result(self.aggregation)
+        self.assertEqual(cached_result.values, result.values)
+        self.assertEqual(cached_result.encoding, result.encoding)
+        self.assertEqual(cached_meta, json.loads(json.dumps(meta)))
+        self.search.assert_called_once()
+
+    def test_stale_result_is_refreshed_in_background(self):
+        """Test that a result is served and refreshed after data changed."""
+        result_cache.get_result(self.aggregation)
+        query_cache.bump_index_generation([self.timeline.searchindex.index_name])
+        self.search.return_value = {"aggregations": {"count": 12}}
+
+        for _ in range(2):
+            result, _ = result_cache.get_result(self.aggregation)
+            self.assertEqual(result.values[0]["count"], 10)
+        self.search.assert_called_once()
+        refresh_task = self.tasks.run_aggregation_result_refresh
+        refresh_task.apply_async.assert_called_once_with(args=(self.aggregation.id,))
+
+        self.assertTrue(result_cache.refresh(self.aggregation))
+        result, _ = result_cache.get_result(self.aggregation)
+        self.assertEqual(result.values[0]["count"], 12)
+        self.assertEqual(self.search.call_count, 2)
+
+    def test_changed_parameters(self):
+        """Test that a result is not served after the aggregation changed."""
+        result_cache.get_result(self.aggregation)
+        self.aggregation.parameters = json.dumps({"field": "url"})
+        self._commit_to_database(self.aggregation)
+
+        result, _ = result_cache.get_result(self.aggregation)
+        self.assertEqual(result.values[0]["field"], "url")
+        self.assertEqual(self.search.call_count, 2)
+
+    def test_disabled(self):
+        """Test that the aggregation is run every time when disabled."""
+        self.app.config["AGGREGATION_RESULT_CACHE_ENABLED"] = False
+        result_cache.get_result(self.aggregation)
+        result_cache.get_result(self.aggregation)
+        self.assertEqual(self.search.call_count, 2)
+        self.assertIsNone(self.aggregation.result_cache)
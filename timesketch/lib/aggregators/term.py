@@ -130,17 +130,17 @@ class FilteredTermsAggregation(interface.BaseAggregator):
         return "Top results for an unknown field after filtering"
 
     # pylint: disable=arguments-differ
-    def run(
+    def build_spec(
         self,
         field: str,
         query_string: str = "",
         query_dsl: str = "",
-        supported_charts: str = "table",
         start_time: str = "",
         end_time: str = "",
         limit: int = 10,
+        **_kwargs,
     ):
-        """Run the aggregation.
+        """Returns the aggregation spec of a run.
 
         Args:
             field (str): this denotes the event attribute that is used
@@ -150,15 +150,15 @@ class FilteredTermsAggregation(interface.BaseAggregator):
             query_dsl (str): the query DSL field to run on all documents prior
                 to aggregating the results. Either a query string or a query
                 DSL has to be present.
-            supported_charts: Chart type to render. Defaults to table.
             start_time: Optional ISO formatted date string that limits the time
                 range for the aggregation.
             end_time: Optional ISO formatted date string that limits the time
                 range for the aggregation.
             limit (int): How many buckets to return, defaults to 10.
+            **_kwargs: Other parameters of the run, they are not used.
 
         Returns:
-            Instance of interface.AggregationResult with aggregation result.
+            Dict with OpenSearch aggregation spec.
 
         Raises:
             ValueError: if neither query_string or query_dsl is provided.
@@ -176,10 +176,35 @@ class FilteredTermsAggregation(interface.BaseAggregator):
             query_dsl=query_dsl,
         )
 
-        aggregation_spec = self._add_query_to_aggregation_spec(
+        return self._add_query_to_aggregation_spec(
             aggregation_spec, start_time=start_time, end_time=end_time
         )
 
+    # pylint: disable=arguments-differ
+    def format_response(
+        self,
+        response,
+        field: str,
+        query_string: str = "",
+        supported_charts: str = "table",
+        **_kwargs,
+    ):
+        """Returns the result of a run from the response to its aggregation.
+
+        Args:
+            response (dict): the OpenSearch response to the aggregation.
+            field (str): this denotes the event attribute that is used
+                for aggregation.
+            query_string (str): the query field that was run on all documents
+                prior to aggregating the results.
+            supported_charts: Chart type to render. Defaults to table.
+            **_kwargs: Other parameters of the run, they are not used.
+
+        Returns:
+            Instance of interface.AggregationResult with aggregation result.
+        """
+        self.field = field
+
         # Encoding information for Vega-Lite.
         encoding = {
             "x": {
@@ -194,7 +219,6 @@ class FilteredTermsAggregation(interface.BaseAggregator):
             ],
         }
 
-        response = self.opensearch_aggregation(aggregation_spec)
         aggregations = response.get("aggregations", {})
         aggregation = aggregations.get("aggregation", {})
 
@@ -218,5 +242,55 @@ class FilteredTermsAggregation(interface.BaseAggregator):
             extra_query_url=extra_query_url,
         )
 
+    # pylint: disable=arguments-differ
+    def run(
+        self,
+        field: str,
+        query_string: str = "",
+        query_dsl: str = "",
+        supported_charts: str = "table",
+        start_time: str = "",
+        end_time: str = "",
+        limit: int = 10,
+    ):
+        """Run the aggregation.
+
+        Args:
+            field (str): this denotes the event attribute that is used
+                for aggregation.
+            query_string (str): the query field to run on all documents prior to
+                aggregating the results.
+            query_dsl (str): the query DSL field to run on all documents prior
+                to aggregating the results. Either a query string or a query
+                DSL has to be present.
+            supported_charts: Chart type to render. Defaults to table.
+            start_time: Optional ISO formatted date string that limits the time
+                range for the aggregation.
+            end_time: Optional ISO formatted date string that limits the time
+                range for the aggregation.
+            limit (int): How many buckets to return, defaults to 10.
+
+        Returns:
+            Instance of interface.AggregationResult with aggregation result.
+
+        Raises:
+            ValueError: if neither query_string or query_dsl is provided.
+        """
+        aggregation_spec = self.build_spec(
+            field,
+            query_string=query_string,
+            query_dsl=query_dsl,
+            start_time=start_time,
+            end_time=end_time,
+            limit=limit,
+        )
+        response = self.opensearch_aggregation(aggregation_spec)
+        return self.format_response(
+            response,
+            field,
+            query_string=query_string,
+            supported_charts=supported_charts,
+        )
+
 
 manager.AggregatorManager.register_aggregator(FilteredTermsAggregation)
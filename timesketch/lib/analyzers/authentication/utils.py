@@ -19,6 +19,7 @@ from typing import List, Tuple, Optional
 import copy
 import logging
 
+import numpy as np
 import pandas as pd
 
 from timesketch.lib.analyzers.interface import AnalyzerOutput
@@ -168,6 +169,48 @@ class AuthSummary:
         return output
 
 
+def first_at_or_after(
+    timestamps: Optional[np.ndarray], timestamp: int
+) -> Optional[int]:
+    """Returns the first timestamp at or after a timestamp.
+
+    Args:
+        timestamps (np.ndarray): Sorted array of timestamps.
+        timestamp (int): Timestamp to look up.
+
+    Returns:
+        int: The first timestamp that is not before the timestamp or None if there
+            is none.
+    """
+
+    if timestamps is None or timestamp is None:
+        return None
+
+    position = np.searchsorted(timestamps, timestamp, side="left")
+    if position >= len(timestamps):
+        return None
+    return timestamps[position]
+
+
+def count_in_windows(
+    timestamps: np.ndarray, window_starts: np.ndarray, window_ends: np.ndarray
+) -> np.ndarray:
+    """Counts the timestamps in time windows.
+
+    Args:
+        timestamps (np.ndarray): Sorted array of timestamps.
+        window_starts (np.ndarray): Start timestamp of each window, inclusive.
+        window_ends (np.ndarray): End timestamp of each window, inclusive.
+
+    Returns:
+        np.ndarray: The number of timestamps in each window.
+    """
+
+    return np.searchsorted(timestamps, window_ends, side="right") - np.searchsorted(
+        timestamps, window_starts, side="left"
+    )
+
+
 class BaseAuthenticationUtils:
     """Base authentication utils class.
 
@@ -191,6 +234,10 @@ class BaseAuthenticationUtils:
 
         self.df = pd.DataFrame()
 
+        # Group indexes of self.df, see get_index.
+        self._index = {}
+        self._indexed_df = None
+
     def set_dataframe(self, df: pd.DataFrame) -> None:
         """Set base class datafame.
 
@@ -223,8 +270,15 @@ class BaseAuthenticationUtils:
                 )
                 raise TypeError("Dataframe column type does not meet required type")
 
-        # Fill missing value
-        df.fillna("", inplace=True)
+        # Fill missing value. The columns with missing values are filled one
+        # by one as object columns, filling the whole frame makes pandas
+        # downcast its other object columns.
+        df = df.assign(
+            **{
+                column: df[column].astype("object").fillna("")
+                for column in df.columns[df.isna().any()]
+            }
+        )
 
         # Sort DataFrame by timestamp
         df.sort_values("timestamp", ascending=True, inplace=True)
@@ -250,6 +304,71 @@ class BaseAuthenticationUtils:
             return False
         return True
 
+    def get_index(self) -> dict:
+        """Returns the group indexes of the dataframe, building them if needed.
+
+        The indexes are built once per dataframe. They hold the positions of the
+        events in the dataframe per session ID, source IP and (username, domain),
+        and the sorted timestamps of the successful, failed and disconnection
+        events per session ID and source IP for searchsorted lookups. The
+        dataframe is sorted by timestamp in set_dataframe, so the positions and
+        timestamps of every group are sorted as well.
+
+        Returns:
+            dict: The group indexes of the dataframe.
+        """
+
+        if self._indexed_df is self.df:
+            return self._index
+
+        df = self.df
+        index = {}
+        if not df.empty:
+            timestamps = df["timestamp"].to_numpy()
+            success = (df["authentication_result"] == "success").to_numpy()
+            failure = (df["authentication_result"] == "failure").to_numpy()
+            if "event_type" in df.columns:
+                disconnection = (df["event_type"] == "disconnection").to_numpy()
+            else:
+                disconnection = np.zeros(len(df.index), dtype=bool)
+
+            index["session_id"] = df.groupby("session_id", sort=False).indices
+            index["source_ip"] = df.groupby("source_ip", sort=False).indices
+            index["useraccount"] = df.groupby(
+                ["username", "domain"], sort=False
+            ).indices
+
+            for group in ("session_id", "source_ip"):
+                for name, mask in (
+                    ("success", success),
+                    ("failure", failure),
+                    ("disconnection", disconnection),
+                ):
+                    index[f"{group}_{name}"] = {
+                        key: timestamps[positions[mask[positions]]]
+                        for key, positions in index[group].items()
+                    }
+
+        self._index = index
+        self._indexed_df = df
+        return index
+
+    def get_session_events(self, session_id: str) -> pd.DataFrame:
+        """Returns the events of a session.
+
+        Args:
+            session_id (str): Authentication session ID.
+
+        Returns:
+            pd.DataFrame: A dataframe with the events of the session, in the order
+                of the dataframe.
+        """
+
+        positions = self.get_index().get("session_id", {}).get(session_id)
+        if positions is None:
+            return self.df.iloc[0:0]
+        return self.df.iloc[positions]
+
     def calculate_session_duration(self, session_id: str, timestamp: int) -> int:
         """Calculates session duration for a session ID.
 
@@ -275,37 +394,26 @@ class BaseAuthenticationUtils:
         if self.df.empty:
             log.debug("[BaseAuthenticationUtils] Dataframe is empty")
             return -1
-        df = self.df
+        index = self.get_index()
 
-        session_start_timestamp = 0
-        try:
-            session_start_timestamp = df[
-                (df["session_id"] == session_id)
-                & (df["authentication_result"] == "success")
-                & (df["timestamp"] >= timestamp)
-            ].iloc[0]["timestamp"]
-        except (KeyError, ValueError, IndexError) as e:
+        session_start_timestamp = first_at_or_after(
+            index["session_id_success"].get(session_id), timestamp
+        )
+        if session_start_timestamp is None:
             log.debug(
-                "[BaseAuthenticationUtils] Error getting session start timestamp for"
-                " session ID %s. %s",
+                "[BaseAuthenticationUtils] No session start timestamp for session"
+                " ID %s",
                 session_id,
-                str(e),
             )
             return -1
 
-        session_end_timestamp = 0
-        try:
-            session_end_timestamp = df[
-                (df["session_id"] == session_id)
-                & (df["event_type"] == "disconnection")
-                & (df["timestamp"] >= timestamp)
-            ].iloc[0]["timestamp"]
-        except (KeyError, ValueError, IndexError) as e:
+        session_end_timestamp = first_at_or_after(
+            index["session_id_disconnection"].get(session_id), timestamp
+        )
+        if session_end_timestamp is None:
             log.debug(
-                "[BaseAuthenticationUtils] Error getting session end timestamp for"
-                " session ID %s. %s",
+                "[BaseAuthenticationUtils] No session end timestamp for session ID %s",
                 session_id,
-                str(e),
             )
             return -1
 
@@ -326,11 +434,11 @@ class BaseAuthenticationUtils:
             return None
 
         # Find all events for IP address
-        df = self.df
-        ip_df = df[df["source_ip"] == source_ip]
-        if ip_df.empty:
+        positions = self.get_index()["source_ip"].get(source_ip)
+        if positions is None:
             log.debug("[BaseAuthenticationUtils] No data for the IP %s", source_ip)
             return None
+        ip_df = self.df.iloc[positions]
 
         return self.get_authsummary(
             df=ip_df, summary_type="source_ip", summary_value=source_ip
@@ -359,12 +467,12 @@ class BaseAuthenticationUtils:
                 username,
             )
             return None
-        df = self.df
 
-        user_df = df[(df["username"] == username) & (df["domain"] == domain)]
-        if user_df.empty:
+        positions = self.get_index()["useraccount"].get((username, domain))
+        if positions is None:
             log.debug("[BaseAuthenticationUtils] No data for %s/%s", domain, username)
             return None
+        user_df = self.df.iloc[positions]
 
         user_df = user_df.sort_values(by="timestamp", ascending=True)
 
@@ -560,13 +668,11 @@ class BaseAuthenticationUtils:
             log.debug("[BaseAuthenticationUtils] Dataframe is empty")
             return None
 
-        df = self.df
-
-        ip_df = df[
-            (df["source_ip"] == source_ip)
-            & (df["session_id"] == session_id)
-            & (df["username"] == username)
-            & (df["domain"] == domain)
+        session_df = self.get_session_events(session_id)
+        ip_df = session_df[
+            (session_df["source_ip"] == source_ip)
+            & (session_df["username"] == username)
+            & (session_df["domain"] == domain)
         ]
         if ip_df.empty:
             log.debug(
@@ -751,13 +857,14 @@ class BruteForceUtils(BaseAuthenticationUtils):
         if self.df.empty:
             log.debug("[BruteForceUtils] Dataframe is empty")
             return None
-        df = self.df
+        index = self.get_index()
 
         # Get the dataframe for the given IP address
-        ip_df = df[df["source_ip"] == source_ip]
-        if ip_df.empty:
+        positions = index["source_ip"].get(source_ip)
+        if positions is None:
             log.debug("[BruteForceUtils] No records for %s in dataframe", source_ip)
             return None
+        ip_df = self.df.iloc[positions]
 
         # Get the successful events for the given IP address
         success_df = ip_df[ip_df["authentication_result"] == "success"]
@@ -768,73 +875,50 @@ class BruteForceUtils(BaseAuthenticationUtils):
             )
             return None
 
-        bruteforce_logins = []
-
-        for _, row in success_df.iterrows():
-            login_ts = int(row.get("timestamp", 0))
-            session_id = row.get("session_id", "")
-
-            if login_ts == 0:
-                log.warning(
-                    "[BruteForceUtils] Unable to get timestamp for session %s",
-                    session_id,
-                )
-                continue
-
-            # Get the brute force window start and end timestamp
-            bruteforce_window_start = login_ts - self.BRUTE_FORCE_WINDOW
-            bruteforce_window_end = login_ts
-
-            # Get the dataframe for the brute force window
-            bruteforce_window_df = ip_df[
-                (ip_df["timestamp"] >= bruteforce_window_start)
-                & (ip_df["timestamp"] <= bruteforce_window_end)
-                & (ip_df["source_ip"] == source_ip)
-            ]
+        # Count the failed and successful authentication events in the brute force
+        # window before every successful login.
+        login_timestamps = success_df["timestamp"].to_numpy(dtype="int64")
+        window_starts = login_timestamps - self.BRUTE_FORCE_WINDOW
+        failure_counts = count_in_windows(
+            index["source_ip_failure"][source_ip], window_starts, login_timestamps
+        )
+        success_counts = count_in_windows(
+            index["source_ip_success"][source_ip], window_starts, login_timestamps
+        )
+        is_bruteforce = (
+            (login_timestamps != 0)
+            & (success_counts > 0)
+            & (success_counts <= self.success_threshold)
+            & (failure_counts >= self.BRUTE_FORCE_MIN_FAILED_EVENT)
+        )
 
-            log.debug(
-                "[BruteForceUtils] %d records for %s between %s and %s",
-                len(bruteforce_window_df.index),
-                source_ip,
-                human_timestamp(bruteforce_window_start),
-                human_timestamp(bruteforce_window_end),
+        for position in np.flatnonzero(login_timestamps == 0):
+            log.warning(
+                "[BruteForceUtils] Unable to get timestamp for session %s",
+                success_df.iloc[position].get("session_id", ""),
             )
 
-            if bruteforce_window_df.empty:
-                continue
+        bruteforce_logins = []
 
-            # Get the number of failed and successful authentication events in the brute
-            # force window
-            failure_count = len(
-                bruteforce_window_df[
-                    bruteforce_window_df["authentication_result"] == "failure"
-                ].index
-            )
-            success_count = len(
-                bruteforce_window_df[
-                    bruteforce_window_df["authentication_result"] == "success"
-                ].index
-            )
+        for position in np.flatnonzero(is_bruteforce):
+            row = success_df.iloc[position]
             log.debug(
-                "[BruteForceUtils] success_count: %d, failure_count: %d for %s",
-                success_count,
-                failure_count,
+                "[BruteForceUtils] success_count: %d, failure_count: %d for %s at %s",
+                success_counts[position],
+                failure_counts[position],
                 source_ip,
+                human_timestamp(int(login_timestamps[position])),
             )
 
-            if (
-                0 < success_count <= self.success_threshold
-                and failure_count >= self.BRUTE_FORCE_MIN_FAILED_EVENT
-            ):
-                login = self.get_login_record(
-                    source_ip=source_ip,
-                    username=row.get("username", ""),
-                    domain=row.get("domain", ""),
-                    session_id=row.get("session_id", ""),
-                )
-                if login:
-                    login.source_hostname = row.get("source_hostname", "")
-                    bruteforce_logins.append(login)
+            login = self.get_login_record(
+                source_ip=source_ip,
+                username=row.get("username", ""),
+                domain=row.get("domain", ""),
+                session_id=row.get("session_id", ""),
+            )
+            if login:
+                login.source_hostname = row.get("source_hostname", "")
+                bruteforce_logins.append(login)
 
         if not bruteforce_logins:
             log.debug("[BruteForceUtils] No brute force activity from %s", source_ip)
@@ -308,6 +308,20 @@ class TestBaseAuthenticationAnalyzer(BaseTest):
         )
         self.assertEqual(1, session_duration)
 
+    def test_get_session_events(self) -> None:
+        """Tests get_session_events method."""
+
+        # Testing non-existent session ID
+        session_df = self.analyzer.get_session_events("abcdef01234567890")
+        self.assertTrue(session_df.empty)
+
+        # Testing valid session ID
+        session_id = "6d652a46d9ddf7ebc4cade9b36a2ff1a0819180ea353c63438b5e5d02a1991db"
+        session_df = self.analyzer.get_session_events(session_id)
+        expected_df = self.analyzer.df[self.analyzer.df["session_id"] == session_id]
+        self.assertFalse(session_df.empty)
+        pd.testing.assert_frame_equal(expected_df, session_df)
+
     def test_get_ip_summary(self) -> None:
         """Test get_ip_summary method."""
 
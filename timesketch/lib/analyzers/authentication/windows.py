@@ -18,6 +18,7 @@ from typing import List
 import logging
 import textwrap
 
+import numpy as np
 import pandas as pd
 
 from timesketch.lib.analyzers import manager
@@ -160,83 +161,20 @@ class WindowsLoginBruteForceAnalyzer(BaseAnalyzer):
             ValueError: If logon_type is not numeric value.
         """
 
-        # Store a list of WindowsLoginEventData
-        records = []
-
-        # Get the events from TimeSketch
-        events = self.event_stream(
-            query_string=self.SEARCH_QUERY, return_fields=self.EVENT_FIELDS
+        # Get the events from TimeSketch as a dataframe
+        events_df = self.event_pandas(
+            query_string=self.SEARCH_QUERY, return_fields=list(self.EVENT_FIELDS)
         )
-
-        # Iterate over the events
-        event_counter = 0
-        for event in events:
-            # Create a new WindowsLoginEventData object
-            event_data = WindowLoginEventData()
-
-            # Set the event data
-            event_data.event_id = event.event_id
-            event_data.timestamp = int(event.source.get("timestamp") / 1000000)
-            event_data.hostname = event.source.get("computer_name")
-            event_data.username = event.source.get("username")
-            event_data.domain = event.source.get("domain")
-            event_data.source_ip = event.source.get("ip_address")
-            event_data.source_port = event.source.get("port")
-            event_data.source_hostname = event.source.get("workstation_name")
-            event_data.session_id = event.source.get("logon_id")
-            event_data.eid = event.source.get("event_identifier")
-
-            # Handle events without logon_type
-            try:
-                event_data.logon_type = int(event.source.get("logon_type"))
-            except (ValueError, TypeError) as e:
-                log.debug("[%s] Unknown value for logon_type. %s", self.NAME, str(e))
-                event_data.logon_type = 0
-
-            event_data.logon_id = event.source.get("logon_id")
-            event_data.pid = event.source.get("process_id", 0)
-            event_data.process_name = event.source.get("process_name")
-
-            # Interpret the event data and extract required data
-            if event_data.eid == 4624:
-                if event_data.logon_type not in self.BRUTE_FORCE_LOGON_TYPE:
-                    continue
-                # NOTE: Windows does not capture the authentication method.
-                # Setting the authentication method as password
-                event_data.authentication_method = "password"
-                event_data.authentication_result = "success"
-                event_data.event_type = "authentication"
-            elif event_data.eid == 4625:
-                if event_data.logon_type not in self.BRUTE_FORCE_LOGON_TYPE:
-                    continue
-                # NOTE: Windows does not capture the authentication method.
-                # Setting the authentication method as password
-                event_data.authentication_method = "password"
-                event_data.authentication_result = "failure"
-                event_data.event_type = "authentication"
-            elif event_data.eid == 4634:
-                event_data.authentication_method = ""
-                event_data.authentication_result = ""
-                event_data.event_type = "disconnection"
-            else:
-                event_data.authentication_method = ""
-                event_data.authentication_result = ""
-                event_data.event_type = ""
-                continue
-
-            records.append(event_data.__dict__)
-            event_counter += 1
+        df = self.get_login_dataframe(events_df)
 
         # Log the number of Windows authentication events process
         log.debug(
             "[%s] %d of %d  Windows authentication events processed",
             self.NAME,
-            len(records),
-            event_counter,
+            len(df.index),
+            len(events_df.index),
         )
 
-        # Create a Pandas DataFrame from the list of records
-        df = pd.DataFrame(records)
         if df.empty:
             log.debug("[%s] No Windows authentication events", self.NAME)
             self.output.result_summary = "No Windows authentication events"
@@ -273,7 +211,7 @@ class WindowsLoginBruteForceAnalyzer(BaseAnalyzer):
         else:
             log.debug("[%s] No analyzer output", self.NAME)
             self.output.result_summary = (
-                f"No verdict for {len(records)} Windows authentication events"
+                f"No verdict for {len(df.index)} Windows authentication events"
             )
             self.output.result_priority = "NOTE"
             self.output.result_status = "SUCCESS"
@@ -295,6 +233,67 @@ class WindowsLoginBruteForceAnalyzer(BaseAnalyzer):
         self.output.result_attributes = {}
         return str(self.output)
 
+    def get_login_dataframe(self, events_df: pd.DataFrame) -> pd.DataFrame:
+        """Converts Windows authentication events to login event data.
+
+        Args:
+            events_df (pd.DataFrame): A dataframe of Windows authentication events
+                as returned by event_pandas.
+
+        Returns:
+            pd.DataFrame: A dataframe with a row per relevant authentication event
+                and the attributes of WindowLoginEventData as columns.
+        """
+
+        if events_df.empty:
+            return pd.DataFrame()
+
+        def _column(name, default=None):
+            if name in events_df.columns:
+                return events_df[name]
+            return pd.Series(default, index=events_df.index, dtype="object")
+
+        # Handle events without logon_type
+        logon_type = (
+            pd.to_numeric(_column("logon_type"), errors="coerce")
+            .fillna(0)
+            .astype("int64")
+        )
+        eid = _column("event_identifier")
+        is_login = eid.isin([4624, 4625]) & logon_type.isin(self.BRUTE_FORCE_LOGON_TYPE)
+        is_logoff = eid == 4634
+        # The same as fillna(0), without the deprecated downcasting of object
+        # columns by fillna.
+        pid = _column("process_id", 0)
+        pid = pd.Series(np.where(pid.isna(), 0, pid), index=pid.index).infer_objects()
+
+        # NOTE: Windows does not capture the authentication method.
+        # Setting the authentication method as password
+        df = pd.DataFrame(
+            {
+                "event_id": events_df["_id"],
+                "timestamp": (events_df["timestamp"] / 1000000).astype("int64"),
+                "hostname": _column("computer_name"),
+                "pid": pid,
+                "event_type": np.where(is_login, "authentication", "disconnection"),
+                "authentication_method": np.where(is_login, "password", ""),
+                "authentication_result": np.select(
+                    [eid == 4624, eid == 4625], ["success", "failure"], ""
+                ),
+                "source_ip": _column("ip_address"),
+                "source_port": _column("port"),
+                "username": _column("username"),
+                "domain": _column("domain"),
+                "session_id": _column("logon_id"),
+                "source_hostname": _column("workstation_name"),
+                "eid": eid,
+                "logon_type": logon_type,
+                "logon_id": _column("logon_id"),
+                "process_name": _column("process_name"),
+            }
+        )
+        return df[is_login | is_logoff].reset_index(drop=True)
+
     def annotate_events(self, events: List) -> None:
         """Annotates the matching events.
 
@@ -328,7 +327,7 @@ class WindowsLoginBruteForceAnalyzer(BaseAnalyzer):
             return
 
         # Generate the event IDs for tagging
-        event_ids = []
+        event_ids = set()
 
         for authsummary in self.output.result_attributes["bruteforce"]:
             log.debug(
@@ -344,9 +343,9 @@ class WindowsLoginBruteForceAnalyzer(BaseAnalyzer):
                 continue
 
             for login in authsummary.summary["bruteforce"]:
-                session_df = self.brute_force_analyzer.df[
-                    self.brute_force_analyzer.df["session_id"] == login.session_id
-                ]
+                session_df = self.brute_force_analyzer.get_session_events(
+                    login.session_id
+                )
                 if session_df.empty:
                     log.debug(
                         "[%s] No session ID %s in dataframe",
@@ -358,11 +357,10 @@ class WindowsLoginBruteForceAnalyzer(BaseAnalyzer):
                 # We only want to tag brute force login and logout events.
                 # We don't want to tag failed authentication events before the
                 # successful login event.
-                for _, row in session_df.iterrows():
-                    event_id = row.get("event_id", "")
-                    event_identifier = row.get("eid")
-                    if event_id and (event_identifier in [4624, 4634]):
-                        event_ids.append(event_id)
+                is_annotated = session_df["eid"].isin([4624, 4634]) & (
+                    session_df["event_id"] != ""
+                )
+                event_ids.update(session_df.loc[is_annotated, "event_id"])
 
         if not event_ids:
             log.debug("[%s] No events to annotate", self.NAME)
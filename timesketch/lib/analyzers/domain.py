@@ -4,7 +4,7 @@ import collections
 import logging
 import numpy
 
-from timesketch.lib.analyzers import interface
+from timesketch.lib.analyzers import enrichment
 from timesketch.lib.analyzers import manager
 from timesketch.lib.analyzers import utils
 
@@ -12,7 +12,7 @@ from timesketch.lib.analyzers import utils
 logger = logging.getLogger("timesketch.analyzers.domain")
 
 
-class DomainSketchPlugin(interface.BaseAnalyzer):
+class DomainSketchPlugin(enrichment.EnrichmentAnalyzer):
     """Analyzer for Domain."""
 
     NAME = "domain"
@@ -24,45 +24,94 @@ class DomainSketchPlugin(interface.BaseAnalyzer):
 
     DEPENDENCIES = frozenset()
 
-    def run(self):
-        """Entry point for the analyzer.
+    # Extracting the domain from a URL is cheap, there is no need to cache.
+    LOOKUP_CACHE_SIZE = 0
+
+    def __init__(self, index_name, sketch_id, timeline_id=None):
+        """Initialize The Sketch Analyzer.
+
+        Args:
+            index_name: OpenSearch index name
+            sketch_id: Sketch ID
+            timeline_id: Timeline ID
+        """
+        self._domain_updates = {}
+        super().__init__(index_name, sketch_id, timeline_id=timeline_id)
+
+    def get_query(self, field):
+        """Returns a query clause that limits the events enriched by a field.
+
+        Events with a domain attribute are enriched by their domain, only the
+        URLs of the remaining events are used.
+
+        Args:
+            field: Name of the field.
 
         Returns:
-            String with summary of the analyzer result
+            An OpenSearch query clause or None to enrich all events.
         """
-        query = (
-            '{"query": { "bool": { "should": [ '
-            '{ "exists" : { "field" : "url" }}, '
-            '{ "exists" : { "field" : "domain" }} ] } } }'
-        )
+        query = super().get_query(field)
+        if field != "url":
+            return query
 
-        return_fields = ["domain", "url"]
+        url_query = {"bool": {"must_not": [{"exists": {"field": "domain"}}]}}
+        if query:
+            url_query["bool"]["filter"] = [query]
+        return url_query
 
-        events = self.event_stream("", query_dsl=query, return_fields=return_fields)
+    def lookup_values(self, values):
+        """Extract the domain of a batch of URLs.
 
+        Args:
+            values: List of URLs.
+
+        Returns:
+            Dict with the domain per URL.
+        """
         domains = {}
-        domain_counter = collections.Counter()
-        tld_counter = collections.Counter()
-        cdn_counter = collections.Counter()
+        for url in values:
+            domain = utils.get_domain_from_url(url)
+            if domain:
+                domains[url] = domain
+        return domains
 
-        for event in events:
-            domain = event.source.get("domain")
+    def build_update(self, field, value, result):
+        """Returns the update of the events with a URL.
 
-            if not domain:
-                url = event.source.get("url")
-                if not url:
-                    continue
-                domain = utils.get_domain_from_url(url)
+        Args:
+            field: Name of the field.
+            value: The URL.
+            result: The domain of the URL.
 
-            if not domain:
-                continue
+        Returns:
+            Dict with the attributes and tags to add to the events.
+        """
+        return self._domain_updates.get(result)
+
+    def run(self):
+        """Entry point for the analyzer.
 
-            domain_counter[domain] += 1
-            domains.setdefault(domain, [])
-            domains[domain].append(event)
+        Returns:
+            String with summary of the analyzer result
+        """
+        domain_values = {
+            domain: count
+            for domain, count in self.get_distinct_values("domain")
+            if domain
+        }
+        url_values = dict(self.get_distinct_values("url"))
 
+        domain_counter = collections.Counter(domain_values)
+        tld_counter = collections.Counter()
+        cdn_counter = collections.Counter()
+
+        url_domains = self.resolve_values(list(url_values))
+        for url, domain in url_domains.items():
+            domain_counter[domain] += url_values[url]
+
+        for domain, count in domain_counter.items():
             tld = ".".join(domain.split(".")[-2:])
-            tld_counter[tld] += 1
+            tld_counter[tld] += count
 
         # Exit early if there are no domains in the data set to analyze.
         if not domain_counter:
@@ -113,12 +162,23 @@ class DomainSketchPlugin(interface.BaseAnalyzer):
             if cdn_provider:
                 new_attributes["cdn_provider"] = cdn_provider
 
-            for event in domains.get(domain, []):
-                event.add_tags(tags_to_add)
-                event.add_attributes(new_attributes)
+            self._domain_updates[domain] = {
+                "attributes": new_attributes,
+                "tags": tags_to_add,
+            }
 
-                # Commit the event to the datastore.
-                event.commit()
+        self.apply_updates(
+            "domain",
+            {domain: self._domain_updates[domain] for domain in domain_values},
+        )
+        # Events with a URL but no domain get the domain attribute as well.
+        self.apply_updates(
+            "url",
+            {
+                url: self.build_update("url", url, domain)
+                for url, domain in url_domains.items()
+            },
+        )
 
         # Create aggregation for all domains.
         domain_table_name = f"Domain Analyzer: ({self.timeline_name})"
@@ -153,7 +213,7 @@ class DomainSketchPlugin(interface.BaseAnalyzer):
         self.output.result_priority = "NOTE"
         self.output.result_summary = (
             "{:d} domains discovered ({:d} TLDs) and {:d} known " "CDN networks found."
-        ).format(len(domains), len(tld_counter), len(cdn_counter))
+        ).format(len(domain_counter), len(tld_counter), len(cdn_counter))
         return str(self.output)
 
 
@@ -0,0 +1,293 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Base class for analyzers that enrich events by the distinct values of fields.
+
+Lookup style analyzers (GeoIP, hash lookups, ...) only need to resolve every
+distinct value of a field once. Instead of streaming all events and keeping
+them in memory, an enrichment analyzer:
+
+1. collects the distinct values of a field with a composite aggregation,
+2. resolves the values in batches through a lookup that is cached per
+   analyzer class, and
+3. writes the results back server side with an update_by_query request per
+   chunk of values.
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from opensearchpy.exceptions import NotFoundError
+
+from timesketch.lib.analyzers import interface
+
+
+logger = logging.getLogger("timesketch.analyzers.enrichment")
+
+
+class LookupCache:
+    """A thread safe, size bounded cache of lookup results.
+
+    Values that could not be resolved are cached as None so that they are not
+    looked up again until their entry expires.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        """Initialize the cache.
+
+        Args:
+            max_size: Maximum number of values in the cache, 0 disables it.
+            ttl: Number of seconds a lookup result is kept.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, values: Iterable[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """Returns the cached results of a list of values.
+
+        Args:
+            values: The values to look up.
+
+        Returns:
+            A tuple with a dict of cached results per value and a list of the
+            values that are not in the cache.
+        """
+        cached = {}
+        missing = []
+        expired_before = time.monotonic() - self.ttl
+        with self._lock:
+            for value in values:
+                entry = self._entries.get(value)
+                if entry is None or entry[0] < expired_before:
+                    self._entries.pop(value, None)
+                    missing.append(value)
+                    continue
+                self._entries.move_to_end(value)
+                cached[value] = entry[1]
+        return cached, missing
+
+    def put_many(self, results: Dict[str, Any]):
+        """Add lookup results to the cache.
+
+        Args:
+            results: Dict with the lookup result per value.
+        """
+        if not self.max_size:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for value, result in results.items():
+                self._entries[value] = (now, result)
+                self._entries.move_to_end(value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class EnrichmentAnalyzer(interface.BaseAnalyzer):
+    """Base class for analyzers that enrich events by distinct field values.
+
+    Concrete analyzers implement lookup_values and build_update and call
+    enrich_field for every field that should be enriched.
+    """
+
+    # Number of values that are resolved by a single call to lookup_values.
+    LOOKUP_BATCH_SIZE = 1000
+
+    # Maximum number of lookup results that are cached per analyzer class.
+    LOOKUP_CACHE_SIZE = 100000
+
+    # Number of seconds a lookup result is cached.
+    LOOKUP_CACHE_TTL = 3600
+
+    _lookup_caches = {}
+    _lookup_caches_lock = threading.Lock()
+
+    @property
+    def lookup_cache(self) -> LookupCache:
+        """Returns the lookup cache shared by all instances of the class."""
+        cache_key = f"{self.__class__.__module__}.{self.__class__.__name__}"
+        with self._lookup_caches_lock:
+            cache = self._lookup_caches.get(cache_key)
+            if cache is None:
+                cache = LookupCache(self.LOOKUP_CACHE_SIZE, self.LOOKUP_CACHE_TTL)
+                self._lookup_caches[cache_key] = cache
+        return cache
+
+    @classmethod
+    def clear_lookup_cache(cls):
+        """Remove all cached lookup results of the class."""
+        cache_key = f"{cls.__module__}.{cls.__name__}"
+        with cls._lookup_caches_lock:
+            cls._lookup_caches.pop(cache_key, None)
+
+    # pylint: disable=unused-argument
+    def get_query(self, field: str) -> Optional[Dict]:
+        """Returns a query clause that limits the events enriched by a field.
+
+        Args:
+            field: Name of the field.
+
+        Returns:
+            An OpenSearch query clause or None to enrich all events.
+        """
+        if not self.timeline_id:
+            return None
+        return {"term": {"__ts_timeline_id": self.timeline_id}}
+
+    def get_distinct_values(self, field: str) -> Iterator[Tuple[str, int]]:
+        """Yields the distinct values of a field in the timeline.
+
+        Args:
+            field: Name of the field.
+
+        Yields:
+            A tuple with the value and the number of events with that value.
+        """
+        # Refresh the index to make sure all events are searchable.
+        try:
+            self.datastore.client.indices.refresh(index=self.index_name)
+        except NotFoundError:
+            logger.error("Unable to refresh index: %s, not found.", self.index_name)
+
+        yield from self.datastore.iter_distinct_values(
+            self.index_name, field, query=self.get_query(field)
+        )
+
+    def lookup_values(self, values: List[str]) -> Dict[str, Any]:
+        """Resolve a batch of values.
+
+        Args:
+            values: List of at most LOOKUP_BATCH_SIZE values.
+
+        Returns:
+            Dict with the lookup result per value. Values without a result
+            can be left out.
+        """
+        raise NotImplementedError
+
+    def resolve_values(self, values: Iterable[str]) -> Dict[str, Any]:
+        """Resolve values in batches, using the lookup cache.
+
+        Args:
+            values: The values to resolve.
+
+        Returns:
+            Dict with the lookup result per value, values without a result
+            are left out.
+        """
+        results, missing = self.lookup_cache.get_many(values)
+        for batch_start in range(0, len(missing), self.LOOKUP_BATCH_SIZE):
+            batch = missing[batch_start : batch_start + self.LOOKUP_BATCH_SIZE]
+            batch_results = self.lookup_values(batch)
+            batch_results = {value: batch_results.get(value) for value in batch}
+            self.lookup_cache.put_many(batch_results)
+            results.update(batch_results)
+
+        return {
+            value: result for value, result in results.items() if result is not None
+        }
+
+    def build_update(self, field: str, value: str, result: Any) -> Optional[Dict]:
+        """Build the update for the events that have a value in a field.
+
+        Args:
+            field: Name of the field.
+            value: The value of the field.
+            result: The lookup result of the value.
+
+        Returns:
+            Dict that can contain "attributes" (dict of attributes to set),
+            "tags" (list of tags to add) and "emojis" (list of emojis to add),
+            or None if the events should not be updated.
+        """
+        raise NotImplementedError
+
+    def apply_updates(self, field: str, updates: Dict[str, Dict]) -> Dict[str, Any]:
+        """Write updates back to all events that have the values in a field.
+
+        Args:
+            field: Name of the field.
+            updates: Dict with the update per value.
+
+        Returns:
+            Dict with the result of the update, see
+            OpenSearchDataStore.update_events_by_values.
+        """
+        created_tags = set()
+        created_attributes = set()
+        for update in updates.values():
+            created_tags.update(update.get("tags") or [])
+            created_attributes.update(update.get("attributes") or {})
+        if created_tags:
+            self.output.add_created_tags(sorted(created_tags))
+        if created_attributes:
+            self.output.add_created_attributes(sorted(created_attributes))
+
+        result = self.datastore.update_events_by_values(
+            self.index_name, field, updates, query=self.get_query(field)
+        )
+        if result.get("failures"):
+            logger.error(
+                "Unable to enrich %d events in index %s by field %s",
+                len(result["failures"]),
+                self.index_name,
+                field,
+            )
+        if result.get("version_conflicts"):
+            logger.warning(
+                "Unable to enrich %d events in index %s by field %s, the events "
+                "were changed by another update",
+                result["version_conflicts"],
+                self.index_name,
+                field,
+            )
+            conflicts = self.output.result_attributes.get("version_conflicts", 0)
+            self.output.result_attributes["version_conflicts"] = (
+                conflicts + result["version_conflicts"]
+            )
+        return result
+
+    def enrich_field(
+        self, field: str, values: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """Enrich all events of the timeline by the values of a field.
+
+        Args:
+            field: Name of the field.
+            values: Optional dict with the number of events per distinct
+                value. If not provided the values are collected with
+                get_distinct_values.
+
+        Returns:
+            Dict with the number of distinct values ("values"), the number of
+            values with an update ("matches") and the result of the update.
+        """
+        if values is None:
+            values = dict(self.get_distinct_values(field))
+
+        results = self.resolve_values(list(values))
+        updates = {}
+        for value, result in results.items():
+            update = self.build_update(field, value, result)
+            if update:
+                updates[value] = update
+
+        update_result = self.apply_updates(field, updates)
+        update_result["values"] = len(values)
+        update_result["matches"] = len(updates)
+        return update_result
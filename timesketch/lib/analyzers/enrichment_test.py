@@ -0,0 +1,124 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the distinct value enrichment analyzer base class."""
+
+import copy
+from unittest import mock
+
+from timesketch.lib.analyzers import enrichment
+from timesketch.lib.testlib import BaseTest
+from timesketch.lib.testlib import MockDataStore
+
+
+class UpperCaseEnrichment(enrichment.EnrichmentAnalyzer):
+    """Enrichment analyzer that adds the upper case version of a value."""
+
+    NAME = "upper_case_enrichment"
+    LOOKUP_BATCH_SIZE = 2
+
+    def __init__(self, index_name, sketch_id, timeline_id=None):
+        super().__init__(index_name, sketch_id, timeline_id=timeline_id)
+        self.lookups = []
+
+    def lookup_values(self, values):
+        self.lookups.append(list(values))
+        return {value: value.upper() for value in values if value != "skip"}
+
+    def build_update(self, field, value, result):
+        return {"attributes": {f"{field}_upper": result}, "tags": ["upper"]}
+
+    def run(self):
+        result = self.enrich_field("name")
+        return f"Enriched {result['updated']:d} events"
+
+
+class TestLookupCache(BaseTest):
+    """Tests for the LookupCache class."""
+
+    def test_get_and_put(self):
+        """Test that cached results are returned and the size is bounded."""
+        cache = enrichment.LookupCache(max_size=2, ttl=60)
+        cache.put_many({"a": 1, "b": None})
+        cache.put_many({"c": 3})
+
+        cached, missing = cache.get_many(["a", "b", "c"])
+        self.assertEqual(cached, {"b": None, "c": 3})
+        self.assertEqual(missing, ["a"])
+
+    def test_expired(self):
+        """Test that expired results are looked up again."""
+        cache = enrichment.LookupCache(max_size=2, ttl=0)
+        cache.put_many({"a": 1})
+        with mock.patch.object(enrichment.time, "monotonic", return_value=1e12):
+            cached, missing = cache.get_many(["a"])
+        self.assertEqual(cached, {})
+        self.assertEqual(missing, ["a"])
+
+
+class TestEnrichmentAnalyzer(BaseTest):
+    """Tests for the EnrichmentAnalyzer class."""
+
+    def setUp(self):
+        super().setUp()
+        UpperCaseEnrichment.clear_lookup_cache()
+
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    def test_enrich_field(self):
+        """Test that every distinct value is resolved once and written back."""
+        analyzer = UpperCaseEnrichment("test_index", 1, 1)
+        analyzer.datastore.client = mock.Mock()
+        for event_id, value in enumerate(["foo", "bar", "foo", "skip", "baz"]):
+            event = copy.deepcopy(MockDataStore.event_dict)
+            event["_source"]["name"] = value
+            analyzer.datastore.import_event("test_index", event["_source"], event_id)
+
+        result = analyzer.enrich_field("name")
+
+        self.assertEqual(result["values"], 4)
+        self.assertEqual(result["matches"], 3)
+        self.assertEqual(result["updated"], 4)
+        looked_up = sorted(value for batch in analyzer.lookups for value in batch)
+        self.assertEqual(looked_up, ["bar", "baz", "foo", "skip"])
+        self.assertTrue(all(len(batch) <= 2 for batch in analyzer.lookups))
+
+        event = analyzer.datastore.event_store[0]["_source"]
+        self.assertEqual(event["name_upper"], "FOO")
+        self.assertIn("upper", event["tag"])
+        self.assertNotIn("name_upper", analyzer.datastore.event_store[3]["_source"])
+
+        # A second run uses the cached lookup results.
+        analyzer.lookups = []
+        result = analyzer.enrich_field("name")
+        self.assertEqual(analyzer.lookups, [])
+        self.assertEqual(result["noops"], 4)
+
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    def test_version_conflicts_in_output(self):
+        """Test that version conflicts are added to the analyzer output."""
+        analyzer = UpperCaseEnrichment("test_index", 1, 1)
+        result = {"total": 2, "updated": 1, "version_conflicts": 1, "failures": []}
+        with mock.patch.object(
+            analyzer.datastore, "update_events_by_values", return_value=result
+        ):
+            analyzer.apply_updates("name", {"foo": {"tags": ["upper"]}})
+            analyzer.apply_updates("other", {"foo": {"tags": ["upper"]}})
+        self.assertEqual(analyzer.output.result_attributes["version_conflicts"], 2)
+
+    def test_get_query(self):
+        """Test that the events are limited to the timeline."""
+        with mock.patch(
+            "timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore
+        ):
+            analyzer = UpperCaseEnrichment("test_index", 1, 1)
+        self.assertEqual(analyzer.get_query("name"), {"term": {"__ts_timeline_id": 1}})
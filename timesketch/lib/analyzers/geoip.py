@@ -21,7 +21,6 @@ import os
 import ipaddress
 import logging
 
-from collections import defaultdict
 from typing import Tuple, Union
 
 from flask import current_app
@@ -32,7 +31,7 @@ import geoip2.webservice
 import maxminddb
 
 from timesketch.lib import emojis
-from timesketch.lib.analyzers import interface
+from timesketch.lib.analyzers import enrichment
 from timesketch.lib.analyzers import manager
 
 
@@ -194,7 +193,7 @@ class MaxMindGeoWebClient(geoip2.webservice.Client, GeoIpClientAdapter):
         return (iso_code, latitude, longitude, country_name, city)
 
 
-class BaseGeoIpAnalyzer(interface.BaseAnalyzer):
+class BaseGeoIpAnalyzer(enrichment.EnrichmentAnalyzer):
     """Sketch analyzer for geolocating IP addresses.
 
     Concrete plugin implementations should define the following attributes
@@ -236,6 +235,7 @@ class BaseGeoIpAnalyzer(interface.BaseAnalyzer):
             timeline_id: Timeline ID
         """
         self.index_name = index_name
+        self._client = None
         super().__init__(index_name, sketch_id, timeline_id=timeline_id)
 
     def _validate_ip(self, ip_address):
@@ -253,56 +253,24 @@ class BaseGeoIpAnalyzer(interface.BaseAnalyzer):
         except ValueError:
             return False
 
-    def run(self):
-        """Entry point for the analyzer.
+    def lookup_values(self, values):
+        """Geolocate a batch of IP addresses.
+
+        Args:
+            values (list): List of IP addresses.
 
         Returns:
-            String with summary of the analyzer result
+            Dict with a tuple of (iso_code, latitude, longitude, country_name,
+            city_name) per IP address that could be geolocated.
         """
-        if self.GEOIP_CLIENT is None:
-            return "GeoIP Client not configured in analyzer"
-
-        query = f'_exists_:({" OR ".join(self.IP_FIELDS)})'
-
-        return_fields = self.IP_FIELDS.copy()
-
-        events = self.event_stream(query_string=query, return_fields=return_fields)
-
-        ip_addresses = defaultdict(lambda: defaultdict(list))
-
-        for event in events:
-            for ip_address_field in self.IP_FIELDS:
-                ip_address = event.source.get(ip_address_field)
-                if ip_address is None:
-                    continue
-
-                if isinstance(ip_address, str):
-                    ip_address = [ip_address]
-
-                for ip_addr in ip_address:
-                    if not self._validate_ip(ip_addr):
-                        logger.debug(
-                            f"Value {0} in {1} not valid.".format(
-                                ip_addr, ip_address_field
-                            )
-                        )
-                        continue
-                    ip_addresses[ip_addr][ip_address_field].append(event)
-
-        try:
-            client = self.GEOIP_CLIENT()  # pylint: disable=E1102
-        except GeoIPClientError as error:
-            return f"GeoIP Client error - {error}"
-
-        for ip_address, ip_address_fields in ip_addresses.items():
-            response = client.ip2geo(ip_address)
+        results = {}
+        for ip_address in values:
+            response = self._client.ip2geo(ip_address)
 
             if not response:
                 continue
 
-            try:
-                iso_code, latitude, longitude, country_name, city_name = response
-            except ValueError:
+            if len(response) != 5:
                 logging.error(
                     "GeoIP client must return 5 fields: "
                     "<iso_code, latitude, longitude, country_name, "
@@ -311,33 +279,74 @@ class BaseGeoIpAnalyzer(interface.BaseAnalyzer):
                 )
                 continue
 
-            flag_emoji = emojis.get_emoji(f"FLAG_{iso_code}")
+            results[ip_address] = tuple(response)
+        return results
 
-            if flag_emoji is None:
-                logger.error(
-                    "Invalid ISO code {} encountered for IP {}.".format(
-                        iso_code, ip_address
-                    )
-                )
+    def build_update(self, field, value, result):
+        """Build the geolocation attributes of the events with an IP address.
+
+        Args:
+            field (str): Name of the IP address field.
+            value (str): The IP address.
+            result (tuple): The geolocation of the IP address.
+
+        Returns:
+            Dict with the attributes, tags and emojis to add to the events.
+        """
+        iso_code, latitude, longitude, country_name, city_name = result
+
+        flag_emoji = emojis.get_emoji(f"FLAG_{iso_code}")
+
+        if flag_emoji is None:
+            logger.error(
+                "Invalid ISO code {} encountered for IP {}.".format(iso_code, value)
+            )
+
+        new_attributes = {}
+        if latitude and longitude:
+            new_attributes[f"{field}_latitude"] = latitude
+            new_attributes[f"{field}_longitude"] = longitude
+        if iso_code:
+            new_attributes[f"{field}_iso_code"] = iso_code
+        if city_name:
+            new_attributes[f"{field}_city"] = city_name
+
+        update = {"attributes": new_attributes}
+        if flag_emoji:
+            update["emojis"] = [flag_emoji]
+        if country_name:
+            update["tags"] = [country_name]
+        return update
+
+    def run(self):
+        """Entry point for the analyzer.
+
+        Returns:
+            String with summary of the analyzer result
+        """
+        if self.GEOIP_CLIENT is None:
+            return "GeoIP Client not configured in analyzer"
+
+        ip_addresses_per_field = {}
+        ip_addresses = set()
+        for ip_address_field in self.IP_FIELDS:
+            valid_ip_addresses = {}
+            for ip_addr, count in self.get_distinct_values(ip_address_field):
+                if not self._validate_ip(ip_addr):
+                    logger.debug("Value %s in %s not valid.", ip_addr, ip_address_field)
+                    continue
+                valid_ip_addresses[ip_addr] = count
+            if valid_ip_addresses:
+                ip_addresses_per_field[ip_address_field] = valid_ip_addresses
+                ip_addresses.update(valid_ip_addresses)
+
+        try:
+            self._client = self.GEOIP_CLIENT()  # pylint: disable=E1102
+        except GeoIPClientError as error:
+            return f"GeoIP Client error - {error}"
 
-            for ip_address_field, events in ip_address_fields.items():
-                for event in events:
-                    new_attributes = {}
-                    if latitude and longitude:
-                        new_attributes[f"{ip_address_field}_latitude"] = latitude
-                        new_attributes[f"{ip_address_field}_longitude"] = longitude
-                    if iso_code:
-                        new_attributes[f"{ip_address_field}_iso_code"] = iso_code
-                    if city_name:
-                        new_attributes[f"{ip_address_field}_city"] = city_name
-                    event.add_attributes(new_attributes)
-
-                    if flag_emoji:
-                        event.add_emojis([flag_emoji])
-
-                    if country_name:
-                        event.add_tags([country_name])
-                    event.commit()
+        for ip_address_field, values in ip_addresses_per_field.items():
+            self.enrich_field(ip_address_field, values=values)
 
         return f"Found {len(ip_addresses)} IP address(es)."
 
@@ -4,15 +4,14 @@ import logging
 import sys
 
 from math import ceil
-from typing import Optional, Union
 from flask import current_app
 import sqlalchemy as sqla
-from timesketch.lib.analyzers import interface, manager
+from timesketch.lib.analyzers import enrichment, manager
 
 logger = logging.getLogger("timesketch.analyzers.hashR")
 
 
-class HashRLookup(interface.BaseAnalyzer):
+class HashRLookup(enrichment.EnrichmentAnalyzer):
     """Analyzer for HashRLookup."""
 
     NAME = "hashr_lookup"
@@ -31,6 +30,15 @@ class HashRLookup(interface.BaseAnalyzer):
     add_source_attribute = None
     query_batch_size = None
     DEFAULT_BATCH_SIZE = 50000
+    ZEROBYTE_FILE_HASH = (
+        "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    )
+
+    # Note: Add fieldnames that contain sha256 values in your events.
+    HASH_FIELDS = ["hash_sha256", "hash", "sha256", "sha256_hash"]
+
+    # check_against_hashr splits the hashes into batches of query_batch_size.
+    LOOKUP_BATCH_SIZE = DEFAULT_BATCH_SIZE
 
     def __init__(self, index_name, sketch_id, timeline_id=None):
         """Initialize The Sketch Analyzer.
@@ -229,38 +237,36 @@ class HashRLookup(interface.BaseAnalyzer):
         logger.debug("Closed database connection.")
         return matching_hashes
 
-    def annotate_event(
-        self,
-        hash_value: str,
-        sources: Optional[Union[list, bool]],
-        event: interface.Event,
-    ):
-        """Add tags and attributes to the given event, based on the rules for
-        the analyzer.
+    def lookup_values(self, values):
+        """Check a batch of hashes against the hashR database.
 
         Args:
-          hash_value: A string of a sha256 hash value.
-          sources: A list of sources (image names) where this hash is known from.
-          event:  The OpenSearch event object that contains this hash and needs
-                  to be tagged or to add an attribute.
+          values: A list of sha256 hash values.
+
+        Returns:
+          A dict with the set of sources per hash that is known in hashR.
         """
-        tags_container = ["known-hash"]
-        if (
-            hash_value
-            == "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
-        ):
-            tags_container.append("zerobyte-file")
-            self.zerobyte_file_counter += 1
-            # Do not add any source attribute for zerobyte files,
-            # since it exists in all sources.
-            sources = False
+        return self.check_against_hashr(list(values))
 
-        event.add_tags(tags_container)
+    def build_update(self, field, value, result):
+        """Build the tags and attributes of the events with a known hash.
 
-        if sources:
-            event.add_attributes({"hashR_sample_sources": list(sources)})
+        Args:
+          field: Name of the hash field.
+          value: A string of a sha256 hash value.
+          result: The sources (image names) where this hash is known from.
 
-        event.commit()
+        Returns:
+          Dict with the tags and attributes to add to the events.
+        """
+        update = {"tags": ["known-hash"]}
+        if value == self.ZEROBYTE_FILE_HASH:
+            update["tags"].append("zerobyte-file")
+            # Do not add any source attribute for zerobyte files,
+            # since it exists in all sources.
+        elif self.add_source_attribute and result:
+            update["attributes"] = {"hashR_sample_sources": sorted(result)}
+        return update
 
     def run(self):
         """Entry point for the analyzer.
@@ -271,53 +277,33 @@ class HashRLookup(interface.BaseAnalyzer):
         # Connect to the hashR database
         self.connect_hashr()
 
-        # Note: Add fieldnames that contain sha256 values in your events.
-        query = (
-            "_exists_:hash_sha256 OR _exists_:sha256 OR _exists_:hash OR "
-            "_exists_:sha256_hash"
-        )
-
-        # Note: Add fieldnames that contain sha256 values in your events.
-        return_fields = ["hash_sha256", "hash", "sha256", "sha256_hash"]
-
-        # Generator of events based on your query.
-        # Swap for self.event_pandas to get pandas back instead of events.
-        events = self.event_stream(query_string=query, return_fields=return_fields)
         known_hash_counter = 0
         error_hash_counter = 0
         total_event_counter = 0
-        hash_events_dict = {}
+        hashes_per_field = {}
+        unique_hashes = set()
         logger.debug("Collecting a list of unique hashes to check against hashR.")
-        for event in events:
-            total_event_counter += 1
-            hash_value = None
-            for key in return_fields:
-                if key in event.source.keys():
-                    hash_value = event.source.get(key)
-                    break
-            if not hash_value:
-                error_hash_counter += 1
-                logger.warning(
-                    "No matching field with a hash found in this event! "
-                    "-- Event Source: %s",
-                    str(event.source),
-                )
-                continue
-
-            if len(hash_value) != 64:
-                logger.warning(
-                    "The extracted hash does not match the required "
-                    "length (64) of a SHA256 hash. Skipping this "
-                    "event! Hash: %s - Length: %d",
-                    hash_value,
-                    len(hash_value),
-                )
-                error_hash_counter += 1
-                continue
-
-            hash_events_dict.setdefault(hash_value, []).append(event)
-
-        if len(hash_events_dict) <= 0:
+        for field in self.HASH_FIELDS:
+            field_hashes = {}
+            for hash_value, count in self.get_distinct_values(field):
+                total_event_counter += count
+                if len(hash_value) != 64:
+                    logger.warning(
+                        "The extracted hash does not match the required "
+                        "length (64) of a SHA256 hash. Skipping %d event(s)! "
+                        "Hash: %s - Length: %d",
+                        count,
+                        hash_value,
+                        len(hash_value),
+                    )
+                    error_hash_counter += count
+                    continue
+                field_hashes[hash_value] = count
+            if field_hashes:
+                hashes_per_field[field] = field_hashes
+                unique_hashes.update(field_hashes)
+
+        if not unique_hashes:
             self.output.result_status = "SUCCESS"
             self.output.result_priority = "NOTE"
             self.output.result_summary = (
@@ -327,32 +313,36 @@ class HashRLookup(interface.BaseAnalyzer):
 
         logger.debug(
             "Found %d unique hashes in %d events.",
-            len(hash_events_dict),
+            len(unique_hashes),
             total_event_counter,
         )
 
-        matching_hashes = self.check_against_hashr(list(hash_events_dict.keys()))
+        matching_hashes = self.resolve_values(sorted(unique_hashes))
         if self.add_source_attribute:
             logger.debug("Start adding tags and attributes to events.")
-            for sample_hash, hashr_value in matching_hashes.items():
-                for event in hash_events_dict[sample_hash]:
-                    known_hash_counter += 1
-                    self.annotate_event(sample_hash, hashr_value, event)
-            self.unique_known_hash_counter = len(matching_hashes)
         else:
             logger.debug("Start adding tags to events.")
-            for sample_hash in matching_hashes:
-                for event in hash_events_dict[sample_hash]:
-                    known_hash_counter += 1
-                    self.annotate_event(sample_hash, False, event)
-            self.unique_known_hash_counter = len(matching_hashes)
+
+        for field, field_hashes in hashes_per_field.items():
+            updates = {}
+            for sample_hash, count in field_hashes.items():
+                if sample_hash not in matching_hashes:
+                    continue
+                known_hash_counter += count
+                if sample_hash == self.ZEROBYTE_FILE_HASH:
+                    self.zerobyte_file_counter += count
+                updates[sample_hash] = self.build_update(
+                    field, sample_hash, matching_hashes[sample_hash]
+                )
+            self.apply_updates(field, updates)
+        self.unique_known_hash_counter = len(matching_hashes)
 
         self.output.result_status = "SUCCESS"
         self.output.result_priority = "NOTE"
         self.output.result_summary = (
             f"Found a total of {total_event_counter} events that contain a "
             f"sha256 hash value - {self.unique_known_hash_counter} / "
-            f"{len(hash_events_dict)} unique hashes known in hashR - "
+            f"{len(unique_hashes)} unique hashes known in hashR - "
             f"{known_hash_counter} events tagged - "
             f"{self.zerobyte_file_counter} entries were tagged as zerobyte "
             f"files - {error_hash_counter} events raised an error"
@@ -360,7 +350,7 @@ class HashRLookup(interface.BaseAnalyzer):
         self.output.result_markdown = (
             f"Found a total of {total_event_counter} events that contain a "
             f"sha256 hash value\n* {self.unique_known_hash_counter} / "
-            f"{len(hash_events_dict)} unique hashes known in hashR\n"
+            f"{len(unique_hashes)} unique hashes known in hashR\n"
             f"* {known_hash_counter} events tagged\n"
             f"* {self.zerobyte_file_counter} entries were tagged as zerobyte "
             f"files\n* {error_hash_counter} events raised an error"
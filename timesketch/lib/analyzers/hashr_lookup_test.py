@@ -23,6 +23,7 @@ class TestHashRLookup(BaseTest):
         super().setUp()
         self.analyzer = hashr_lookup.HashRLookup("test_index", 1)
         self.logger = logging.getLogger("timesketch.analyzers.hashR")
+        hashr_lookup.HashRLookup.clear_lookup_cache()
 
     @mock.patch.object(sqlalchemy, "create_engine", autospec=False)
     @mock.patch.object(sqlalchemy, "MetaData", autospec=True)
@@ -511,14 +512,14 @@ class TestHashRLookup(BaseTest):
                 "analyzer_name": "hashR lookup",
                 "result_status": "SUCCESS",
                 "result_priority": "NOTE",
-                "result_summary": "Found a total of 13 events that contain a sha256 hash value - 6 / 11 unique hashes known in hashR - 6 events tagged - 1 entries were tagged as zerobyte files - 2 events raised an error",
+                "result_summary": "Found a total of 12 events that contain a sha256 hash value - 6 / 11 unique hashes known in hashR - 6 events tagged - 1 entries were tagged as zerobyte files - 1 events raised an error",
                 "platform_meta_data": {
                     "timesketch_instance": "https://localhost",
                     "sketch_id": 1,
                     "timeline_id": 1,
                     "created_tags": ["zerobyte-file", "known-hash"],
                 },
-                "result_markdown": "Found a total of 13 events that contain a sha256 hash value\n* 6 / 11 unique hashes known in hashR\n* 6 events tagged\n* 1 entries were tagged as zerobyte files\n* 2 events raised an error",
+                "result_markdown": "Found a total of 12 events that contain a sha256 hash value\n* 6 / 11 unique hashes known in hashR\n* 6 events tagged\n* 1 entries were tagged as zerobyte files\n* 1 events raised an error",
             }
         )
 
@@ -529,14 +530,14 @@ class TestHashRLookup(BaseTest):
                 "analyzer_name": "hashR lookup",
                 "result_status": "SUCCESS",
                 "result_priority": "NOTE",
-                "result_summary": "Found a total of 13 events that contain a sha256 hash value - 6 / 11 unique hashes known in hashR - 6 events tagged - 1 entries were tagged as zerobyte files - 2 events raised an error",
+                "result_summary": "Found a total of 12 events that contain a sha256 hash value - 6 / 11 unique hashes known in hashR - 6 events tagged - 1 entries were tagged as zerobyte files - 1 events raised an error",
                 "platform_meta_data": {
                     "timesketch_instance": "https://localhost",
                     "sketch_id": 1,
                     "timeline_id": 1,
                     "created_tags": ["known-hash", "zerobyte-file"],
                 },
-                "result_markdown": "Found a total of 13 events that contain a sha256 hash value\n* 6 / 11 unique hashes known in hashR\n* 6 events tagged\n* 1 entries were tagged as zerobyte files\n* 2 events raised an error",
+                "result_markdown": "Found a total of 12 events that contain a sha256 hash value\n* 6 / 11 unique hashes known in hashR\n* 6 events tagged\n* 1 entries were tagged as zerobyte files\n* 1 events raised an error",
             }
         )
 
@@ -553,7 +554,9 @@ class TestHashRLookup(BaseTest):
             event_id += 1
 
         mock_connect.return_value = True
-        mock_check.return_value = expected_matching_hashes
+        mock_check.return_value = {
+            sample_hash: {"TagsOnly"} for sample_hash in expected_matching_hashes
+        }
         analyzer.add_source_attribute = False
         analyzer.unique_known_hash_counter = 5
         result_message = analyzer.run()
@@ -563,16 +566,11 @@ class TestHashRLookup(BaseTest):
         mock_warning.assert_any_call(
             self.logger,
             "The extracted hash does not match the required length (64) of "
-            "a SHA256 hash. Skipping this event! Hash: %s - Length: %d",
+            "a SHA256 hash. Skipping %d event(s)! Hash: %s - Length: %d",
+            1,
             "8bbd7976b2b86e1746494c98425e7830",
             32,
         )
-        self.assertTrue(
-            "No matching field with a hash found in this event! -- Event Source:"
-            in str(mock_warning.call_args_list)
-            and "5302a61849d2722551832734c5d246db90c41a7ffdad36b5558992227edc2e92"
-            in str(mock_warning.call_args_list)
-        )
         mock_debug.assert_any_call(self.logger, "Start adding tags to events.")
 
     @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
@@ -665,7 +663,7 @@ class TestHashRLookup(BaseTest):
                 "analyzer_name": "hashR lookup",
                 "result_status": "SUCCESS",
                 "result_priority": "NOTE",
-                "result_summary": "Found a total of 13 events that contain a sha256 hash value - 5 / 11 unique hashes known in hashR - 5 events tagged - 1 entries were tagged as zerobyte files - 2 events raised an error",
+                "result_summary": "Found a total of 12 events that contain a sha256 hash value - 5 / 11 unique hashes known in hashR - 5 events tagged - 1 entries were tagged as zerobyte files - 1 events raised an error",
                 "platform_meta_data": {
                     "timesketch_instance": "https://localhost",
                     "sketch_id": 1,
@@ -673,7 +671,7 @@ class TestHashRLookup(BaseTest):
                     "created_tags": ["zerobyte-file", "known-hash"],
                     "created_attributes": ["hashR_sample_sources"],
                 },
-                "result_markdown": "Found a total of 13 events that contain a sha256 hash value\n* 5 / 11 unique hashes known in hashR\n* 5 events tagged\n* 1 entries were tagged as zerobyte files\n* 2 events raised an error",
+                "result_markdown": "Found a total of 12 events that contain a sha256 hash value\n* 5 / 11 unique hashes known in hashR\n* 5 events tagged\n* 1 entries were tagged as zerobyte files\n* 1 events raised an error",
             }
         )
 
@@ -684,7 +682,7 @@ class TestHashRLookup(BaseTest):
                 "analyzer_name": "hashR lookup",
                 "result_status": "SUCCESS",
                 "result_priority": "NOTE",
-                "result_summary": "Found a total of 13 events that contain a sha256 hash value - 5 / 11 unique hashes known in hashR - 5 events tagged - 1 entries were tagged as zerobyte files - 2 events raised an error",
+                "result_summary": "Found a total of 12 events that contain a sha256 hash value - 5 / 11 unique hashes known in hashR - 5 events tagged - 1 entries were tagged as zerobyte files - 1 events raised an error",
                 "platform_meta_data": {
                     "timesketch_instance": "https://localhost",
                     "sketch_id": 1,
@@ -692,7 +690,7 @@ class TestHashRLookup(BaseTest):
                     "created_tags": ["known-hash", "zerobyte-file"],
                     "created_attributes": ["hashR_sample_sources"],
                 },
-                "result_markdown": "Found a total of 13 events that contain a sha256 hash value\n* 5 / 11 unique hashes known in hashR\n* 5 events tagged\n* 1 entries were tagged as zerobyte files\n* 2 events raised an error",
+                "result_markdown": "Found a total of 12 events that contain a sha256 hash value\n* 5 / 11 unique hashes known in hashR\n* 5 events tagged\n* 1 entries were tagged as zerobyte files\n* 1 events raised an error",
             }
         )
 
@@ -720,16 +718,11 @@ class TestHashRLookup(BaseTest):
         mock_warning.assert_any_call(
             self.logger,
             "The extracted hash does not match the required length (64) of "
-            "a SHA256 hash. Skipping this event! Hash: %s - Length: %d",
+            "a SHA256 hash. Skipping %d event(s)! Hash: %s - Length: %d",
+            1,
             "8bbd7976b2b86e1746494c98425e7830",
             32,
         )
-        self.assertTrue(
-            "No matching field with a hash found in this event! -- Event Source:"
-            in str(mock_warning.call_args_list)
-            and "5302a61849d2722551832734c5d246db90c41a7ffdad36b5558992227edc2e92"
-            in str(mock_warning.call_args_list)
-        )
         mock_debug.assert_any_call(
             self.logger, "Start adding tags and attributes to events."
         )
@@ -772,39 +765,41 @@ class TestHashRLookup(BaseTest):
         result_message = analyzer.run()
         self.assertEqual(result_message, expected_result_message)
 
-    def test_process_event(self):
-        """Test the process_event function with no special cases."""
-        event = mock.MagicMock()
-        sources = [
-            "WindowsPro:Windows10Home-10.0-19041-1288sp",
+    def test_build_update(self):
+        """Test the build_update function with no special cases."""
+        sources = {
             "WindowsPro:Windows10Pro-10.0-19041-1288sp",
-        ]
+            "WindowsPro:Windows10Home-10.0-19041-1288sp",
+        }
         hash_value = "5302a61849d2722551832734c5d246db90c41a7ffdad36b5558992227edc2e92"
 
-        self.analyzer.annotate_event(hash_value, sources, event)
-        self.assertEqual(self.analyzer.zerobyte_file_counter, 0)
-        event.add_tags.assert_called_with(["known-hash"])
-        event.add_attributes.assert_called_with(
+        self.analyzer.add_source_attribute = True
+        update = self.analyzer.build_update("sha256", hash_value, sources)
+        self.assertEqual(
+            update,
             {
-                "hashR_sample_sources": [
-                    "WindowsPro:Windows10Home-10.0-19041-1288sp",
-                    "WindowsPro:Windows10Pro-10.0-19041-1288sp",
-                ]
-            }
+                "tags": ["known-hash"],
+                "attributes": {
+                    "hashR_sample_sources": [
+                        "WindowsPro:Windows10Home-10.0-19041-1288sp",
+                        "WindowsPro:Windows10Pro-10.0-19041-1288sp",
+                    ]
+                },
+            },
         )
-        event.commit.assert_called_once()
 
-    def test_process_event_zerobytefile(self):
-        """Test the process_event function with a zyrobyte hash."""
-        event = mock.MagicMock()
-        sources = [
+        self.analyzer.add_source_attribute = False
+        update = self.analyzer.build_update("sha256", hash_value, sources)
+        self.assertEqual(update, {"tags": ["known-hash"]})
+
+    def test_build_update_zerobytefile(self):
+        """Test the build_update function with a zerobyte hash."""
+        sources = {
             "WindowsPro:Windows10Home-10.0-19041-1288sp",
             "WindowsPro:Windows10Pro-10.0-19041-1288sp",
-        ]
+        }
         hash_value = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
 
-        self.analyzer.annotate_event(hash_value, sources, event)
-        self.assertEqual(self.analyzer.zerobyte_file_counter, 1)
-        event.add_tags.assert_called_with(["known-hash", "zerobyte-file"])
-        event.add_attributes.assert_not_called()
-        event.commit.assert_called_once()
+        self.analyzer.add_source_attribute = True
+        update = self.analyzer.build_update("sha256", hash_value, sources)
+        self.assertEqual(update, {"tags": ["known-hash", "zerobyte-file"]})
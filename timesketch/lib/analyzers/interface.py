@@ -135,6 +135,8 @@ class Event:
         event_id: ID of the Event.
         index_name: The name of the OpenSearch index.
         source: Source document from OpenSearch.
+        matched_queries: Names of the named query clauses that matched the
+            event, if any.
     """
 
     def __init__(self, event, datastore, sketch=None, analyzer=None):
@@ -160,6 +162,7 @@ class Event:
             self.index_name = event["_index"]
             self.timeline_id = event.get("_source", {}).get("__ts_timeline_id")
             self.source = event.get("_source", None)
+            self.matched_queries = event.get("matched_queries", [])
         except KeyError as e:
             raise KeyError(f"Malformed event: {e!s}") from e
 
@@ -80,8 +80,11 @@ class AnalysisManager:
         cls._class_registry = {}
 
     @classmethod
-    def get_analyzers(cls, analyzer_names=None, include_dfiq=False):
-        """Retrieves the registered analyzers.
+    def get_analyzer_groups(cls, analyzer_names=None, include_dfiq=False):
+        """Retrieves the registered analyzers grouped by dependency level.
+
+        Analyzers within a group do not depend on each other and can run
+        concurrently. Every group only depends on analyzers in earlier groups.
 
         Args:
             analyzer_names (list): List of analyzer names.
@@ -89,7 +92,7 @@ class AnalysisManager:
                                  in the results. Defaults to False.
 
         Yields:
-            tuple: containing:
+            list: of tuples, each containing:
                 str: the uniquely identifying name of the analyzer
                 type: the analyzer class.
         """
@@ -99,7 +102,8 @@ class AnalysisManager:
 
         completed_analyzers = set()
         for cluster in cls._build_dependencies(analyzer_names):
-            for analyzer_name in cluster:
+            analyzer_group = []
+            for analyzer_name in sorted(cluster):
                 if analyzer_name in completed_analyzers:
                     continue
                 analyzer_class = cls.get_analyzer(analyzer_name)
@@ -111,9 +115,29 @@ class AnalysisManager:
                 ):
                     continue
 
-                yield analyzer_name, analyzer_class
+                analyzer_group.append((analyzer_name, analyzer_class))
                 completed_analyzers.add(analyzer_name)
 
+            if analyzer_group:
+                yield analyzer_group
+
+    @classmethod
+    def get_analyzers(cls, analyzer_names=None, include_dfiq=False):
+        """Retrieves the registered analyzers.
+
+        Args:
+            analyzer_names (list): List of analyzer names.
+            include_dfiq (bool): Optional. Whether to include DFIQ analyzers
+                                 in the results. Defaults to False.
+
+        Yields:
+            tuple: containing:
+                str: the uniquely identifying name of the analyzer
+                type: the analyzer class.
+        """
+        for analyzer_group in cls.get_analyzer_groups(analyzer_names, include_dfiq):
+            yield from analyzer_group
+
     @classmethod
     def get_analyzer(cls, analyzer_name):
         """Retrieves a class object of a specific analyzer.
@@ -123,6 +123,19 @@ class TestAnalysisManager(BaseTest):
             analyzers = manager.AnalysisManager.get_analyzers()
             _ = list(analyzers)
 
+    def test_get_analyzer_groups(self):
+        """Test to get analyzers grouped by dependency level."""
+        manager.AnalysisManager.register_analyzer(MockAnalyzer2)
+        manager.AnalysisManager.register_analyzer(MockAnalyzer3)
+        manager.AnalysisManager.register_analyzer(MockAnalyzer4)
+
+        analyzer_groups = list(manager.AnalysisManager.get_analyzer_groups())
+        group_names = [[name for name, _ in group] for group in analyzer_groups]
+        self.assertEqual(
+            group_names,
+            [["mockanalyzer", "mockanalyzer3"], ["mockanalyzer2"], ["mockanalyzer4"]],
+        )
+
     def test_get_analyzer(self):
         """Test to get analyzer class from registry."""
         analyzer_class = manager.AnalysisManager.get_analyzer("mockanalyzer")
@@ -1,6 +1,7 @@
 """Index analyzer plugin for sigma."""
 
 import logging
+import time
 from typing import Optional
 
 from timesketch.lib.analyzers import interface
@@ -142,4 +143,224 @@ class RulesSigmaPlugin(SigmaPlugin):
     NAME = "sigma"
 
 
+class BatchSigmaPlugin(SigmaPlugin):
+    """Sigma plugin that evaluates a batch of rules in a single pass.
+
+    Rules are counted together with a single msearch request and the
+    matching events of all rules are fetched with one query that uses a
+    named clause per rule. The rule titles, TTPs and tags of all rules that
+    match an event are merged so that every event is updated only once.
+    """
+
+    NAME = "sigma_batch"
+    DISPLAY_NAME = "Sigma (batched)"
+    DESCRIPTION = (
+        "Run pre-defined Sigma rules (only stable) in batches and tag "
+        "matching events"
+    )
+
+    # Number of rules that are evaluated by a single analyzer task.
+    RULES_PER_BATCH = 100
+
+    def __init__(self, index_name, sketch_id, timeline_id=None, **kwargs):
+        """Initialize The Batched Sigma Analyzer.
+
+        Args:
+            index_name: OpenSearch index name
+            sketch_id: Sketch ID
+            timeline_id: The ID of the timeline.
+        """
+        self._rules = kwargs.get("rules") or []
+        super().__init__(index_name, sketch_id, timeline_id=timeline_id, **kwargs)
+
+    def count_rule_matches(self, rules: list):
+        """Counts the events matching each rule with a single msearch.
+
+        Args:
+            rules: List of Sigma rule dicts.
+
+        Returns:
+            list: a tuple (count, took, error) per rule, in the same order as
+                the rules. The count is None if the rule failed to run.
+        """
+        if self.timeline_id:
+            timeline_ids = [self.timeline_id]
+        else:
+            timeline_ids = None
+
+        body = []
+        for rule in rules:
+            query_dsl = self.datastore.build_query(
+                sketch_id=self.sketch.id,
+                query_string=rule.get("search_query"),
+                query_filter={},
+                timeline_ids=timeline_ids,
+            )
+            body.append({"index": self.index_name})
+            body.append(
+                {"query": query_dsl["query"], "size": 0, "track_total_hits": True}
+            )
+
+        self.datastore.client.indices.refresh(index=self.index_name)
+        response = self.datastore.client.msearch(body=body)
+
+        results = []
+        for item in response.get("responses", []):
+            if "error" in item:
+                error = item["error"]
+                if isinstance(error, dict):
+                    error = error.get("reason", str(error))
+                results.append((None, item.get("took", 0), error))
+                continue
+
+            total = item.get("hits", {}).get("total", 0)
+            if isinstance(total, dict):
+                total = total.get("value", 0)
+            results.append((total, item.get("took", 0), None))
+        return results
+
+    def run_sigma_rules(self, rules: list):
+        """Runs a list of sigma rules and applies their tags in one pass.
+
+        Args:
+            rules: List of Sigma rule dicts that have at least one match.
+
+        Returns:
+            tuple: the total number of tagged events and a dict with the
+                number of tagged events per rule index.
+        """
+        should_clauses = []
+        for rule_index, rule in enumerate(rules):
+            rule_query = self.datastore.build_query(
+                sketch_id=self.sketch.id,
+                query_string=rule.get("search_query"),
+                query_filter={},
+            )
+            should_clauses.append(
+                {"bool": {"must": [rule_query["query"]], "_name": str(rule_index)}}
+            )
+        query_dsl = {
+            "query": {"bool": {"should": should_clauses, "minimum_should_match": 1}}
+        }
+
+        tagged_events_counter = 0
+        events_per_rule = {rule_index: 0 for rule_index in range(len(rules))}
+        events = self.event_stream(
+            query_dsl=query_dsl, return_fields=["ts_sigma_rule", "ts_ttp"]
+        )
+        for event in events:
+            ts_sigma_rules = set(event.source.get("ts_sigma_rule", []))
+            ts_ttp = set(event.source.get("ts_ttp", []))
+            tags = set()
+            for matched_query in event.matched_queries:
+                rule_index = int(matched_query)
+                rule = rules[rule_index]
+                events_per_rule[rule_index] += 1
+
+                ts_sigma_rules.add(rule.get("title", "N/A"))
+                if rule.get("id"):
+                    ts_sigma_rules.add(rule.get("id"))
+                for tag in rule.get("tags") or []:
+                    # Special handling for sigma tags that TS considers TTPs
+                    # https://car.mitre.org and https://attack.mitre.org
+                    if tag.startswith(("attack.", "car.")):
+                        ts_ttp.add(tag)
+                    else:
+                        tags.add(tag)
+
+            attributes = {"ts_sigma_rule": list(ts_sigma_rules)}
+            if ts_ttp:
+                attributes["ts_ttp"] = list(ts_ttp)
+            event.add_attributes(attributes)
+            if tags:
+                # Tags are written together with the attributes instead of
+                # through add_tags so the event gets a single update.
+                self.output.add_created_tags(list(tags))
+                event.updated_event["tag"] = list(
+                    set(event.source.get("tag", [])) | tags
+                )
+            event.commit()
+            tagged_events_counter += 1
+
+        return tagged_events_counter, events_per_rule
+
+    def run(self):
+        """Entry point for the analyzer.
+
+        Returns:
+            String with summary of the analyzer result.
+        """
+        rules = self._rules
+        if not rules:
+            logger.error("No Sigma rules given.")
+            return "Unable to run, no rules given to the analyzer"
+
+        start_time = time.time()
+        counts = self.count_rule_matches(rules)
+
+        matching_rules = []
+        matching_took = []
+        rule_summaries = []
+        for rule, (count, took, error) in zip(rules, counts):
+            rule_name = rule.get("title", "N/A")
+            if error:
+                logger.error(
+                    "Unable to run Sigma rule %s (%s): %s",
+                    rule_name,
+                    rule.get("id"),
+                    error,
+                )
+                rule_summaries.append(
+                    f"* {rule_name} ({rule.get('id')}): error [{error}]"
+                )
+                continue
+            if count:
+                matching_rules.append(rule)
+                matching_took.append(took)
+            else:
+                rule_summaries.append(
+                    f"* {rule_name} ({rule.get('id')}): 0 events, count took {took} ms"
+                )
+
+        tagged_events_counter = 0
+        if matching_rules:
+            fetch_start_time = time.time()
+            tagged_events_counter, events_per_rule = self.run_sigma_rules(
+                matching_rules
+            )
+            fetch_took = int((time.time() - fetch_start_time) * 1000)
+            for rule_index, (rule, took) in enumerate(
+                zip(matching_rules, matching_took)
+            ):
+                rule_name = rule.get("title", "N/A")
+                rule_summaries.append(
+                    f"* {rule_name} ({rule.get('id')}): "
+                    f"{events_per_rule[rule_index]} events, count took {took} ms"
+                )
+            rule_summaries.append(
+                f"Tagging {len(matching_rules)} matching rules took {fetch_took} ms"
+            )
+
+        total_took = int((time.time() - start_time) * 1000)
+        summary = (
+            f"{tagged_events_counter} events tagged by {len(matching_rules)} "
+            f"out of {len(rules)} rules in {total_took} ms"
+        )
+        return "\n".join([summary] + rule_summaries)
+
+    @classmethod
+    def get_kwargs(cls):
+        """Returns all stable rules of Timesketch split into batches.
+
+        Returns:
+            List of dicts with a batch of Sigma rules each.
+        """
+        sigma_rules = [rule["rule"] for rule in SigmaPlugin.get_kwargs()]
+        return [
+            {"rules": sigma_rules[index : index + cls.RULES_PER_BATCH]}
+            for index in range(0, len(sigma_rules), cls.RULES_PER_BATCH)
+        ]
+
+
 manager.AnalysisManager.register_analyzer(RulesSigmaPlugin)
+manager.AnalysisManager.register_analyzer(BatchSigmaPlugin)
@@ -2,6 +2,7 @@
 
 from unittest import mock
 
+from timesketch.lib.analyzers import interface
 from timesketch.lib.analyzers import sigma_tagger
 from timesketch.lib.testlib import BaseTest
 from timesketch.lib.testlib import MockDataStore
@@ -30,3 +31,82 @@ class TestSigmaPlugin(BaseTest):
         rules = analyzer_init.get_kwargs()
         self.assertIsNotNone(rules)
         self.assertGreaterEqual(len(rules), 0)
+
+
+class TestBatchSigmaPlugin(BaseTest):
+    """Tests the functionality of the batched Sigma analyzer."""
+
+    RULES = [
+        {
+            "title": "Rule one",
+            "id": "rule-1",
+            "search_query": "message:foo",
+            "tags": ["attack.t1046", "plain_tag"],
+        },
+        {
+            "title": "Rule two",
+            "id": "rule-2",
+            "search_query": "message:bar",
+            "tags": [],
+        },
+        {
+            "title": "Rule three",
+            "id": "rule-3",
+            "search_query": "message:baz",
+            "tags": ["car.2013-01-002"],
+        },
+    ]
+
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    def test_get_kwargs(self):
+        """Test that the rules are split into batches."""
+        rules = [{"rule": {"title": f"rule {i}"}} for i in range(5)]
+        with mock.patch.object(sigma_tagger.SigmaPlugin, "get_kwargs") as get_rules:
+            get_rules.return_value = rules
+            with mock.patch.object(sigma_tagger.BatchSigmaPlugin, "RULES_PER_BATCH", 2):
+                kwargs = sigma_tagger.BatchSigmaPlugin.get_kwargs()
+
+        self.assertEqual(len(kwargs), 3)
+        self.assertEqual([len(batch["rules"]) for batch in kwargs], [2, 2, 1])
+
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    def test_run(self):
+        """Test that matches of all rules are merged into one update."""
+        analyzer = sigma_tagger.BatchSigmaPlugin(
+            sketch_id=1, index_name="test_index", rules=self.RULES
+        )
+        analyzer.datastore = mock.MagicMock()
+        analyzer.datastore.build_query.return_value = {"query": {"match_all": {}}}
+        analyzer.datastore.client.msearch.return_value = {
+            "responses": [
+                {"took": 3, "hits": {"total": {"value": 1}}},
+                {"took": 2, "hits": {"total": {"value": 0}}},
+                {"took": 4, "hits": {"total": {"value": 1}}},
+            ]
+        }
+        event = interface.Event(
+            {
+                "_id": "1",
+                "_index": "test_index",
+                "_source": {"tag": ["existing"]},
+                "matched_queries": ["0", "1"],
+            },
+            analyzer.datastore,
+            analyzer=analyzer,
+        )
+
+        with mock.patch.object(analyzer, "event_stream", return_value=iter([event])):
+            result = analyzer.run()
+
+        self.assertIn("1 events tagged by 2 out of 3 rules", result)
+        self.assertIn("* Rule two (rule-2): 0 events", result)
+        analyzer.datastore.import_event.assert_called_once()
+        updated_event = analyzer.datastore.import_event.call_args[1]["event"]
+        self.assertEqual(
+            sorted(updated_event["ts_sigma_rule"]),
+            ["Rule one", "Rule three", "rule-1", "rule-3"],
+        )
+        self.assertEqual(
+            sorted(updated_event["ts_ttp"]), ["attack.t1046", "car.2013-01-002"]
+        )
+        self.assertEqual(sorted(updated_event["tag"]), ["existing", "plain_tag"])
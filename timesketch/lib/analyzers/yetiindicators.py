@@ -1,13 +1,15 @@
 """Index analyzer plugin for Yeti indicators."""
 
-import datetime
+import collections
+from concurrent import futures
 import json
 import logging
 import re
-from typing import Dict, List, Optional, Set, Tuple, Union, Any
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union, Any
 
 import yaml
 from flask import current_app
+from opensearchpy.exceptions import NotFoundError
 
 try:
     from yeti.api import YetiApi
@@ -19,7 +21,7 @@ except ImportError:
 
 
 from timesketch.lib import emojis, sigma_util
-from timesketch.lib.analyzers import interface, manager
+from timesketch.lib.analyzers import enrichment, interface, manager
 
 logger = logging.getLogger("timesketch.analyzers.yetiindicators")
 
@@ -50,6 +52,15 @@ OBSERVABLE_INTEL_MAPPING = {
     "generic": "message",
 }
 
+# Default number of indicator queries that are sent in one msearch request.
+DEFAULT_MSEARCH_BATCH_SIZE = 100
+
+# Default number of msearch requests that run at the same time.
+DEFAULT_MSEARCH_CONCURRENCY = 4
+
+# Number of indicators listed in the slowest indicators table of the output.
+SLOWEST_INDICATORS_REPORTED = 10
+
 HIGH_SEVERITY_TYPES = {
     "malware",
     "threat-actor",
@@ -466,6 +477,205 @@ class YetiGraphAnalyzer(YetiBaseAnalyzer):
             return None
         return {"query": {"query_string": {"query": parsed_sigma["search_query"]}}}
 
+    def build_query(self, indicator: Dict) -> Optional[Dict]:
+        """Builds a query DSL from a Yeti indicator or observable.
+
+        Args:
+            indicator: a dictionary representing a Yeti object.
+
+        Returns:
+            A dictionary representing a query DSL or None if the type of the
+            object is not supported.
+        """
+        if indicator["root_type"] == "observable":
+            return self.build_query_from_observable(indicator)
+        if indicator["type"] == "regex":
+            return self.build_query_from_regexp(indicator)
+        if indicator["type"] == "sigma":
+            return self.build_query_from_sigma(indicator)
+        if indicator["type"] == "query":
+            if indicator["query_type"] == "opensearch":
+                return {"query": {"query_string": {"query": indicator["pattern"]}}}
+        return None
+
+    def _get_msearch_settings(self) -> Tuple[int, int]:
+        """Returns the configured msearch batch size and concurrency."""
+        batch_size = current_app.config.get(
+            "YETI_MSEARCH_BATCH_SIZE", DEFAULT_MSEARCH_BATCH_SIZE
+        )
+        concurrency = current_app.config.get(
+            "YETI_MSEARCH_CONCURRENCY", DEFAULT_MSEARCH_CONCURRENCY
+        )
+        return max(int(batch_size), 1), max(int(concurrency), 1)
+
+    def _msearch_count(
+        self, batch: List[Tuple[str, Dict]]
+    ) -> Dict[str, Tuple[Optional[int], int, Optional[str]]]:
+        """Counts the events matching a batch of queries with one msearch.
+
+        Args:
+            batch: List of tuples with the indicator ID and its query DSL.
+
+        Returns:
+            Dict with a tuple (count, took, error) per indicator ID. The count
+            is None if the query failed.
+        """
+        body = []
+        for _, query_dsl in batch:
+            query = query_dsl["query"]
+            if self.timeline_id:
+                query = {
+                    "bool": {
+                        "must": [query],
+                        "filter": [{"term": {"__ts_timeline_id": self.timeline_id}}],
+                    }
+                }
+            body.append({"index": self.index_name})
+            body.append({"query": query, "size": 0, "track_total_hits": True})
+
+        try:
+            response = self.datastore.client.msearch(body=body)
+        except Exception as exception:  # pylint: disable=broad-except
+            return {
+                indicator_id: (None, 0, str(exception)) for indicator_id, _ in batch
+            }
+
+        results = {}
+        responses = response.get("responses", [])
+        for (indicator_id, _), item in zip(batch, responses):
+            if "error" in item:
+                error = item["error"]
+                if isinstance(error, dict):
+                    error = error.get("reason", str(error))
+                results[indicator_id] = (None, item.get("took", 0), error)
+                continue
+
+            total = item.get("hits", {}).get("total", 0)
+            if isinstance(total, dict):
+                total = total.get("value", 0)
+            results[indicator_id] = (total, item.get("took", 0), None)
+
+        for indicator_id, _ in batch[len(responses) :]:
+            results[indicator_id] = (None, 0, "Missing msearch response")
+        return results
+
+    def count_indicator_matches(
+        self, queries: Dict[str, Dict]
+    ) -> Dict[str, Tuple[Optional[int], int, Optional[str]]]:
+        """Counts the events matching each indicator query.
+
+        Queries are sent in msearch batches of YETI_MSEARCH_BATCH_SIZE, with
+        up to YETI_MSEARCH_CONCURRENCY requests running at the same time.
+
+        Args:
+            queries: Dict with the query DSL per indicator ID.
+
+        Returns:
+            Dict with a tuple (count, took, error) per indicator ID. The count
+            is None if the query failed.
+        """
+        batch_size, concurrency = self._get_msearch_settings()
+        items = list(queries.items())
+        batches = [
+            items[index : index + batch_size]
+            for index in range(0, len(items), batch_size)
+        ]
+        if not batches:
+            return {}
+
+        # Refresh the index to make sure all events are searchable.
+        try:
+            self.datastore.client.indices.refresh(index=self.index_name)
+        except NotFoundError:
+            logger.error("Unable to refresh index: %s, not found.", self.index_name)
+
+        results = {}
+        if concurrency == 1 or len(batches) == 1:
+            for batch in batches:
+                try:
+                    results.update(self._msearch_count(batch))
+                except Exception as exception:  # pylint: disable=broad-except
+                    results.update(self._batch_error(batch, exception))
+            return results
+
+        with futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            future_batches = {
+                executor.submit(self._msearch_count, batch): batch for batch in batches
+            }
+            for future in futures.as_completed(future_batches):
+                batch = future_batches[future]
+                try:
+                    results.update(future.result())
+                except Exception as exception:  # pylint: disable=broad-except
+                    results.update(self._batch_error(batch, exception))
+        return results
+
+    def _batch_error(
+        self, batch: List[Tuple[str, Dict]], exception: Exception
+    ) -> Dict[str, Tuple[Optional[int], int, Optional[str]]]:
+        """Logs a failed msearch batch and returns the error per indicator.
+
+        Args:
+            batch: List of tuples with the indicator ID and its query DSL.
+            exception: The exception raised for the batch.
+
+        Returns:
+            Dict with a tuple (None, 0, error) per indicator ID.
+        """
+        logger.error(
+            "Error counting events in sketch %s for %d indicators: %s",
+            self.sketch.id,
+            len(batch),
+            str(exception),
+        )
+        return {indicator_id: (None, 0, str(exception)) for indicator_id, _ in batch}
+
+    def fetch_indicator_matches(
+        self, queries: Dict[str, Dict], errors: Optional[Dict[str, str]] = None
+    ) -> Iterator[Tuple[interface.Event, List[str]]]:
+        """Fetches the events matching a set of indicator queries.
+
+        The queries are combined into a single query per batch with a named
+        clause per indicator, so that every event is fetched only once. A
+        batch that fails is logged and the remaining batches are fetched.
+
+        Args:
+            queries: Dict with the query DSL per indicator ID.
+            errors: Optional dict that the error per indicator ID of failed
+                batches is added to.
+
+        Yields:
+            A tuple with the event and the IDs of the matching indicators.
+        """
+        if errors is None:
+            errors = {}
+        batch_size, _ = self._get_msearch_settings()
+        items = list(queries.items())
+        for index in range(0, len(items), batch_size):
+            batch = items[index : index + batch_size]
+            should_clauses = [
+                {"bool": {"must": [query_dsl["query"]], "_name": indicator_id}}
+                for indicator_id, query_dsl in batch
+            ]
+            query_dsl = {
+                "query": {"bool": {"should": should_clauses, "minimum_should_match": 1}}
+            }
+            try:
+                events = self.event_stream(
+                    query_dsl=query_dsl, return_fields=["message"]
+                )
+                for event in events:
+                    yield event, event.matched_queries
+            except Exception as exception:  # pylint: disable=broad-except
+                logger.error(
+                    "Error fetching events in sketch %s for %d indicators: %s",
+                    self.sketch.id,
+                    len(batch),
+                    str(exception),
+                )
+                for indicator_id, _ in batch:
+                    errors[indicator_id] = str(exception)
+
     def run(self):
         """Entry point for the analyzer.
 
@@ -473,7 +683,6 @@ class YetiGraphAnalyzer(YetiBaseAnalyzer):
             String with summary of the analyzer result.
         """
         total_matches = 0
-        total_processed = 0
         total_failed = 0
         entities_found = set()
         matching_indicators = set()
@@ -486,76 +695,87 @@ class YetiGraphAnalyzer(YetiBaseAnalyzer):
                 self.get_intelligence_attribute()
             )
 
+        # Indicators can be linked to more than one entity, they are only
+        # searched for once.
+        indicators = {}
         entities = self.get_entities(type_selector=self._TYPE_SELECTOR)
         for entity in entities.values():
-            indicators = self.get_neighbors(
+            neighbors = self.get_neighbors(
                 entity,
                 max_hops=self._MAX_HOPS,
                 neighbor_types=self._TARGET_NEIGHBOR_TYPE,
             )
             logging.debug(
                 "Found %d neighbor indicators for %s",
-                len(indicators),
+                len(neighbors),
                 entity["name"],
             )
-
-            for indicator in indicators.values():
-                query_dsl = None
-                if indicator["root_type"] == "observable":
-                    query_dsl = self.build_query_from_observable(indicator)
-                elif indicator["type"] == "regex":
-                    query_dsl = self.build_query_from_regexp(indicator)
-                elif indicator["type"] == "sigma":
-                    query_dsl = self.build_query_from_sigma(indicator)
-                elif indicator["type"] == "query":
-                    if indicator["query_type"] == "opensearch":
-                        query_dsl = {
-                            "query": {"query_string": {"query": indicator["pattern"]}}
-                        }
-                if not query_dsl:
-                    logging.warning(
-                        "Unsupported indicator type, skipping: %s (%s)",
-                        indicator["type"],
-                        indicator["root_type"],
-                    )
-                    continue
-                events = self.event_stream(
-                    query_dsl=query_dsl, return_fields=["message"], scroll=False
+            for indicator in neighbors.values():
+                _, indicator_entities = indicators.setdefault(
+                    indicator["id"], (indicator, [])
                 )
-                logging.debug("Searching for %s", str(query_dsl))
-                try:
-                    indicator_match = 0
-                    start = datetime.datetime.now()
-                    for event in events:
-                        total_matches += 1
-                        self.mark_event(indicator, event, [entity])
-                        matching_indicators.add(indicator["id"])
+                indicator_entities.append(entity)
+
+        queries = {}
+        for indicator_id, (indicator, _) in indicators.items():
+            query_dsl = self.build_query(indicator)
+            if not query_dsl:
+                logging.warning(
+                    "Unsupported indicator type, skipping: %s (%s)",
+                    indicator["type"],
+                    indicator["root_type"],
+                )
+                continue
+            queries[indicator_id] = query_dsl
+        total_processed = len(queries)
+
+        counts = self.count_indicator_matches(queries)
+        matching_queries = {}
+        for indicator_id, (count, _, error) in counts.items():
+            if error:
+                logging.error(
+                    "Error counting events in sketch %s for indicator %s: %s",
+                    self.sketch.id,
+                    indicator_id,
+                    error,
+                )
+                total_failed += 1
+            elif count:
+                matching_queries[indicator_id] = queries[indicator_id]
+
+        indicator_matches = collections.Counter()
+        fetch_errors = {}
+        try:
+            for event, indicator_ids in self.fetch_indicator_matches(
+                matching_queries, errors=fetch_errors
+            ):
+                for indicator_id in indicator_ids:
+                    if indicator_id not in indicators:
+                        continue
+                    indicator, indicator_entities = indicators[indicator_id]
+                    total_matches += 1
+                    indicator_matches[indicator_id] += 1
+                    self.mark_event(indicator, event, indicator_entities)
+                    matching_indicators.add(indicator_id)
+                    for entity in indicator_entities:
                         if entity["type"] in HIGH_SEVERITY_TYPES:
                             priority = "HIGH"
                             if self._SAVE_INTELLIGENCE:
                                 self.add_intelligence_entry(indicator, event, entity)
-
                         entities_found.add(f"{entity['name']}:{entity['type']}")
-                        indicator_match += 1
-                    logging.debug(
-                        "Found %s matches for indicator %s in %s",
-                        indicator_match,
-                        indicator["id"],
-                        str(datetime.datetime.now() - start),
-                    )
-                except Exception as exception:  # pylint: disable=broad-except
-                    # No matter the exception, we don't want to stop the
-                    # analyzer. Errors are logged and reported in the UI.
-                    logging.error(
-                        "Error processing events in sketch %s for indicator %s: %s",
-                        self.sketch.id,
-                        indicator["id"],
-                        str(exception),
-                    )
-                    total_failed += 1
-
-                total_processed += 1
+        except Exception as exception:  # pylint: disable=broad-except
+            # No matter the exception, we don't want to stop the
+            # analyzer. Errors are logged and reported in the UI.
+            logging.error(
+                "Error processing events in sketch %s for indicators: %s",
+                self.sketch.id,
+                str(exception),
+            )
+            total_failed += len(set(matching_queries) - matching_indicators)
+        else:
+            total_failed += len(fetch_errors)
 
+        self.report_indicator_timings(indicators, counts, indicator_matches)
         self.output.result_status = "SUCCESS"
         self.output.result_priority = priority
 
@@ -588,6 +808,51 @@ class YetiGraphAnalyzer(YetiBaseAnalyzer):
 
         return str(self.output)
 
+    def report_indicator_timings(
+        self,
+        indicators: Dict[str, Tuple[Dict, List[Dict]]],
+        counts: Dict[str, Tuple[Optional[int], int, Optional[str]]],
+        indicator_matches: Dict[str, int],
+    ):
+        """Adds the search time of every indicator to the analyzer output.
+
+        The time per indicator is added to the result attributes and the
+        slowest indicators are listed in the result markdown.
+
+        Args:
+            indicators: Dict with the indicator and its entities per ID.
+            counts: Dict with a tuple (count, took, error) per indicator ID.
+            indicator_matches: Dict with the number of tagged events per ID.
+        """
+        timings = {}
+        for indicator_id, (count, took, error) in counts.items():
+            timings[indicator_id] = {
+                "matches": count,
+                "tagged": indicator_matches.get(indicator_id, 0),
+                "took_ms": took,
+                "error": error,
+            }
+        self.output.result_attributes["indicator_timings"] = timings
+        if not timings:
+            return
+
+        slowest = sorted(
+            timings.items(), key=lambda item: item[1]["took_ms"], reverse=True
+        )[:SLOWEST_INDICATORS_REPORTED]
+        lines = [
+            "#### Slowest indicators",
+            "",
+            "| Indicator | Matches | Time (ms) |",
+            "| --- | --- | --- |",
+        ]
+        for indicator_id, timing in slowest:
+            indicator = indicators[indicator_id][0]
+            name = indicator.get("name") or indicator.get("value") or indicator_id
+            name = name.replace("|", "\\|")
+            matches = timing["matches"] if timing["error"] is None else "error"
+            lines.append(f"| {name} | {matches} | {timing['took_ms']} |")
+        self.output.result_markdown = "\n".join(lines)
+
 
 class YetiTriageIndicators(YetiGraphAnalyzer):
     """Analyzer for Yeti triage indicators."""
@@ -684,7 +949,7 @@ class YetiKeywords(YetiGraphAnalyzer):
     _MAX_HOPS = 1
 
 
-class YetiBloomChecker(YetiBaseAnalyzer):
+class YetiBloomChecker(YetiBaseAnalyzer, enrichment.EnrichmentAnalyzer):
     """Analyzer for Yeti bloom filter checker."""
 
     NAME = "yetibloomchecker"
@@ -739,6 +1004,31 @@ class YetiBloomChecker(YetiBaseAnalyzer):
 
         return hashmap, after_key
 
+    def lookup_values(self, values):
+        """Checks a batch of hashes against Yeti's bloom filters.
+
+        Args:
+            values: List of hashes.
+
+        Returns:
+            Dict with the list of matching bloom filters per hash.
+        """
+        bloom_hits = self.api.search_bloom(list(values))
+        return {hit["value"]: hit["hits"] for hit in bloom_hits}
+
+    def build_update(self, field, value, result):
+        """Returns the tags for the events with a hash in a bloom filter.
+
+        Args:
+            field: Name of the hash field.
+            value: The hash.
+            result: List of matching bloom filters.
+
+        Returns:
+            Dict with the tags to add to the events.
+        """
+        return {"tags": [f"bloom:{tag}" for tag in result]}
+
     def run(self):
         hashmap = set()
         after = None
@@ -748,23 +1038,18 @@ class YetiBloomChecker(YetiBaseAnalyzer):
                 break
 
         try:
-            bloom_hits = self.api.search_bloom(list(hashmap))
+            hit_dict = self.resolve_values(sorted(hashmap))
         except yeti_errors.YetiApiError as e:
             return f"Error getting bloom hits from Yeti: {e}"
         except RuntimeError as exception:
             return str(exception)
-        hit_dict = {hit["value"]: hit["hits"] for hit in bloom_hits}
-
-        tagged = 0
-        for event in self.event_stream(
-            query_string="_exists_:sha256_hash", return_fields=["sha256_hash"]
-        ):
-            sha256_hash = event.source.get("sha256_hash")
-            if sha256_hash in hit_dict:
-                tagged += 1
-                tags = hit_dict[sha256_hash]
-                event.add_tags([f"bloom:{tag}" for tag in tags])
-                event.commit()
+
+        updates = {
+            sha256_hash: self.build_update("sha256_hash", sha256_hash, hits)
+            for sha256_hash, hits in hit_dict.items()
+        }
+        result = self.apply_updates("sha256_hash", updates)
+        tagged = result["total"]
 
         msg = (
             f"Bloom filter check completed. {len(hashmap)} hashes checked,"
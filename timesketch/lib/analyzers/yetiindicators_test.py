@@ -61,6 +61,11 @@ MOCK_YETI_NEIGHBORS_RESPONSE = {
 }
 
 
+MOCK_MSEARCH_MATCH = {"responses": [{"took": 7, "hits": {"total": {"value": 1}}}]}
+
+MOCK_MSEARCH_NOMATCH = {"responses": [{"took": 3, "hits": {"total": {"value": 0}}}]}
+
+
 MATCHING_PATH_MESSAGE = {
     "__ts_timeline_id": 1,
     "es_index": "",
@@ -118,6 +123,7 @@ class TestYetiIndicators(BaseTest):
 
         analyzer = YetiTestAnalyzer("test_index", 1, 123)
         analyzer.datastore.client = mock.Mock()
+        analyzer.datastore.client.msearch.return_value = MOCK_MSEARCH_NOMATCH
         analyzer.run()
 
         mock_api.search_entities.assert_any_call(
@@ -138,7 +144,9 @@ class TestYetiIndicators(BaseTest):
 
         analyzer = yetiindicators.YetiBadnessIndicators("test_index", 1, 123)
         analyzer.datastore.client = mock.Mock()
+        analyzer.datastore.client.msearch.return_value = MOCK_MSEARCH_MATCH
         analyzer.datastore.import_event("test_index", MATCHING_PATH_MESSAGE, "0")
+        analyzer.datastore.event_store["0"]["matched_queries"] = ["2152802"]
 
         message = json.loads(analyzer.run())
         self.assertEqual(
@@ -153,6 +161,11 @@ class TestYetiIndicators(BaseTest):
         self.assertEqual(
             sorted(analyzer.tagged_events["0"]["tags"]), sorted(["malware", "xmrig"])
         )
+        self.assertEqual(
+            message["result_attributes"]["indicator_timings"]["2152802"],
+            {"matches": 1, "tagged": 1, "took_ms": 7, "error": None},
+        )
+        self.assertIn("| typo'd dhcpd | 1 | 7 |", message["result_markdown"])
 
     # Mock the OpenSearch datastore and the YetiApi
     @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
@@ -165,6 +178,8 @@ class TestYetiIndicators(BaseTest):
 
         analyzer = yetiindicators.YetiBadnessIndicators("test_index", 1, 123)
         analyzer.datastore.client = mock.Mock()
+        analyzer.datastore.client.msearch.return_value = MOCK_MSEARCH_NOMATCH
+        analyzer.datastore.import_event("test_index", MATCHING_PATH_MESSAGE, "0")
 
         message = json.loads(analyzer.run())
         self.assertEqual(
@@ -174,6 +189,104 @@ class TestYetiIndicators(BaseTest):
         mock_api.search_entities.assert_called()
         mock_api.search_graph.assert_called()
 
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    @mock.patch("timesketch.lib.analyzers.yetiindicators.YetiApi")
+    def test_count_indicator_matches(self, _):
+        """Tests that indicator queries are counted in msearch batches."""
+        current_app.config["YETI_MSEARCH_BATCH_SIZE"] = 2
+        current_app.config["YETI_MSEARCH_CONCURRENCY"] = 2
+        self.addCleanup(current_app.config.pop, "YETI_MSEARCH_BATCH_SIZE")
+        self.addCleanup(current_app.config.pop, "YETI_MSEARCH_CONCURRENCY")
+
+        def _msearch(body):
+            responses = []
+            for header, search in zip(body[::2], body[1::2]):
+                self.assertEqual(header, {"index": "test_index"})
+                self.assertEqual(search["size"], 0)
+                value = search["query"]["bool"]["must"][0]["term"]["value"]
+                if value == "bad":
+                    responses.append({"took": 1, "error": {"reason": "broken"}})
+                else:
+                    responses.append({"took": 2, "hits": {"total": {"value": 3}}})
+            return {"responses": responses}
+
+        analyzer = yetiindicators.YetiBadnessIndicators("test_index", 1, 123)
+        analyzer.datastore.client = mock.Mock()
+        analyzer.datastore.client.msearch.side_effect = _msearch
+        queries = {
+            str(i): {"query": {"term": {"value": "bad" if i == 2 else "good"}}}
+            for i in range(5)
+        }
+
+        results = analyzer.count_indicator_matches(queries)
+
+        self.assertEqual(analyzer.datastore.client.msearch.call_count, 3)
+        self.assertEqual(results["0"], (3, 2, None))
+        self.assertEqual(results["2"], (None, 1, "broken"))
+        self.assertEqual(len(results), 5)
+
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    @mock.patch("timesketch.lib.analyzers.yetiindicators.YetiApi")
+    def test_count_indicator_matches_failed_batch(self, _):
+        """Tests that a failing msearch batch does not stop the others."""
+        current_app.config["YETI_MSEARCH_BATCH_SIZE"] = 2
+        current_app.config["YETI_MSEARCH_CONCURRENCY"] = 2
+        self.addCleanup(current_app.config.pop, "YETI_MSEARCH_BATCH_SIZE")
+        self.addCleanup(current_app.config.pop, "YETI_MSEARCH_CONCURRENCY")
+
+        def _msearch(body):
+            value = body[1]["query"]["term"]["value"]
+            if value == "bad":
+                # Not a valid msearch response.
+                return None
+            return {"responses": [{"took": 2, "hits": {"total": {"value": 3}}}] * 2}
+
+        analyzer = yetiindicators.YetiBadnessIndicators("test_index", 1, 123)
+        analyzer.timeline_id = None
+        analyzer.datastore.client = mock.Mock()
+        analyzer.datastore.client.msearch.side_effect = _msearch
+        queries = {
+            str(i): {"query": {"term": {"value": "bad" if i < 2 else "good"}}}
+            for i in range(4)
+        }
+
+        results = analyzer.count_indicator_matches(queries)
+
+        self.assertEqual(analyzer.datastore.client.msearch.call_count, 2)
+        self.assertIsNone(results["0"][0])
+        self.assertIsNone(results["1"][0])
+        self.assertIsNotNone(results["1"][2])
+        self.assertEqual(results["2"], (3, 2, None))
+        self.assertEqual(results["3"], (3, 2, None))
+
+    @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
+    @mock.patch("timesketch.lib.analyzers.yetiindicators.YetiApi")
+    def test_fetch_indicator_matches_failed_batch(self, _):
+        """Tests that a batch that raises does not stop the other batches."""
+        current_app.config["YETI_MSEARCH_BATCH_SIZE"] = 1
+        self.addCleanup(current_app.config.pop, "YETI_MSEARCH_BATCH_SIZE")
+
+        analyzer = yetiindicators.YetiBadnessIndicators("test_index", 1, 123)
+        event = mock.Mock(matched_queries=["2"])
+
+        def _event_stream(query_dsl, return_fields):
+            del return_fields
+            should = query_dsl["query"]["bool"]["should"]
+            if should[0]["bool"]["_name"] == "1":
+                raise ValueError("broken")
+            return iter([event])
+
+        queries = {
+            "1": {"query": {"term": {"value": "bad"}}},
+            "2": {"query": {"term": {"value": "good"}}},
+        }
+        errors = {}
+        with mock.patch.object(analyzer, "event_stream", side_effect=_event_stream):
+            matches = list(analyzer.fetch_indicator_matches(queries, errors=errors))
+
+        self.assertEqual(matches, [(event, ["2"])])
+        self.assertEqual(errors, {"1": "broken"})
+
     @mock.patch("timesketch.lib.analyzers.interface.OpenSearchDataStore", MockDataStore)
     @mock.patch("timesketch.lib.analyzers.yetiindicators.YetiApi")
     def test_slug(self, _):
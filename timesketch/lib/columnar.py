@@ -0,0 +1,209 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Columnar transfer format for search results.
+
+Clients that load large result sets into data frames can ask for events in
+batches of columns instead of a list of JSON objects. The response is a
+sequence of frames, every frame starts with a one byte frame type and the
+length of the payload as a four byte big endian integer:
+
+    M: a JSON object with the metadata of the response.
+    J: a JSON object {"columns": {name: [values]}} with a batch of events.
+    A: an Arrow IPC stream with a batch of events. Columns with values that
+       are not scalars are JSON encoded, their names are listed in the
+       "json_columns" key of the schema metadata.
+
+Arrow batches are only produced if pyarrow is installed, otherwise the JSON
+batches are used.
+"""
+
+import json
+import logging
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow
+    from pyarrow import ipc as pyarrow_ipc
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+logger = logging.getLogger("timesketch.columnar")
+
+MIMETYPE = "application/vnd.timesketch.columnar"
+
+FORMAT_ARROW = "arrow"
+FORMAT_COLUMNS = "columns"
+
+FRAME_HEADER = struct.Struct(">cI")
+FRAME_META = b"M"
+FRAME_COLUMNS = b"J"
+FRAME_ARROW = b"A"
+
+# Number of events in a single batch.
+DEFAULT_BATCH_SIZE = 10000
+
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+def get_response_format(requested_format: Optional[str]) -> Optional[str]:
+    """Returns the columnar format to use for a response.
+
+    Args:
+        requested_format: The format requested by the client.
+
+    Returns:
+        FORMAT_ARROW or FORMAT_COLUMNS, or None if the client did not ask for
+        a columnar response. Arrow is replaced with the JSON columns if
+        pyarrow is not installed.
+    """
+    if requested_format == FORMAT_ARROW:
+        return FORMAT_ARROW if PYARROW_AVAILABLE else FORMAT_COLUMNS
+    if requested_format == FORMAT_COLUMNS:
+        return FORMAT_COLUMNS
+    return None
+
+
+def hit_to_row(hit: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns a single row with the source and ID of a search hit.
+
+    Args:
+        hit: A search hit as returned by OpenSearch.
+
+    Returns:
+        A dict with the fields of the event, the "_id" and "_index".
+    """
+    row = dict(hit.get("_source", {}))
+    row["_id"] = hit.get("_id")
+    row["_index"] = hit.get("_index")
+    return row
+
+
+def rows_to_columns(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Returns a dict with a list of values per field.
+
+    Args:
+        rows: List of events.
+
+    Returns:
+        Dict with the values of each field, None where an event does not
+        have the field.
+    """
+    columns = {}
+    for row_number, row in enumerate(rows):
+        for name, value in row.items():
+            column = columns.get(name)
+            if column is None:
+                column = [None] * row_number
+                columns[name] = column
+            column.append(value)
+        for column in columns.values():
+            if len(column) <= row_number:
+                column.append(None)
+    return columns
+
+
+def _encode_frame(frame_type: bytes, payload: bytes) -> bytes:
+    """Returns a frame with a header and a payload."""
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def encode_meta(meta: Dict[str, Any]) -> bytes:
+    """Returns a frame with the metadata of a response.
+
+    Args:
+        meta: The metadata of the response.
+
+    Returns:
+        Bytes with the frame.
+    """
+    return _encode_frame(FRAME_META, json.dumps(meta, default=str).encode("utf-8"))
+
+
+def _to_arrow_array(values: List[Any]):
+    """Returns an Arrow array and whether the values were JSON encoded."""
+    if all(value is None or isinstance(value, _SCALAR_TYPES) for value in values):
+        try:
+            return pyarrow.array(values), False
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            pass
+    encoded = [None if value is None else json.dumps(value) for value in values]
+    return pyarrow.array(encoded, type=pyarrow.string()), True
+
+
+def encode_batch(rows: List[Dict[str, Any]], response_format: str) -> bytes:
+    """Returns a frame with a batch of events.
+
+    Args:
+        rows: List of events.
+        response_format: FORMAT_ARROW or FORMAT_COLUMNS.
+
+    Returns:
+        Bytes with the frame.
+    """
+    columns = rows_to_columns(rows)
+    if response_format != FORMAT_ARROW:
+        payload = json.dumps({"columns": columns}, default=str).encode("utf-8")
+        return _encode_frame(FRAME_COLUMNS, payload)
+
+    arrays = []
+    json_columns = []
+    for name, values in columns.items():
+        array, json_encoded = _to_arrow_array(values)
+        arrays.append(array)
+        if json_encoded:
+            json_columns.append(name)
+
+    table = pyarrow.Table.from_arrays(
+        arrays,
+        names=list(columns),
+        metadata={"json_columns": json.dumps(json_columns)},
+    )
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow_ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return _encode_frame(FRAME_ARROW, sink.getvalue().to_pybytes())
+
+
+def stream_frames(
+    rows: Iterable[Dict[str, Any]],
+    response_format: str,
+    meta: Optional[Dict[str, Any]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """Yields the frames of a columnar response.
+
+    Args:
+        rows: Iterable of events.
+        response_format: FORMAT_ARROW or FORMAT_COLUMNS.
+        meta: Optional metadata, sent as the first frame.
+        batch_size: Maximum number of events per batch.
+
+    Yields:
+        Bytes with a frame.
+    """
+    if meta is not None:
+        yield encode_meta(meta)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield encode_batch(batch, response_format)
+            batch = []
+    if batch:
+        yield encode_batch(batch, response_format)
@@ -0,0 +1,70 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the columnar transfer format."""
+
+import json
+
+from timesketch.lib import columnar
+from timesketch.lib.testlib import BaseTest
+
+
+def _decode_frames(data):
+    """Returns a list of frame types and JSON payloads."""
+    frames = []
+    offset = 0
+    while offset < len(data):
+        frame_type, size = columnar.FRAME_HEADER.unpack_from(data, offset)
+        offset += columnar.FRAME_HEADER.size
+        frames.append((frame_type, json.loads(data[offset : offset + size])))
+        offset += size
+    return frames
+
+
+class TestColumnar(BaseTest):
+    """Tests for the columnar transfer format."""
+
+    def test_rows_to_columns(self):
+        """Test that missing fields are filled with None."""
+        columns = columnar.rows_to_columns(
+            [{"message": "a"}, {"tag": ["x"]}, {"message": "c", "tag": []}]
+        )
+        self.assertEqual(columns["message"], ["a", None, "c"])
+        self.assertEqual(columns["tag"], [None, ["x"], []])
+
+    def test_stream_frames(self):
+        """Test that events are sent in batches after the metadata."""
+        rows = [{"message": str(number)} for number in range(5)]
+        data = b"".join(
+            columnar.stream_frames(
+                rows, columnar.FORMAT_COLUMNS, meta={"scroll_id": "foo"}, batch_size=2
+            )
+        )
+        frames = _decode_frames(data)
+
+        self.assertEqual(frames[0], (columnar.FRAME_META, {"scroll_id": "foo"}))
+        self.assertEqual(
+            [frame[1]["columns"]["message"] for frame in frames[1:]],
+            [["0", "1"], ["2", "3"], ["4"]],
+        )
+
+    def test_get_response_format(self):
+        """Test that Arrow is only used when pyarrow is installed."""
+        self.assertIsNone(columnar.get_response_format(None))
+        self.assertEqual(columnar.get_response_format("columns"), "columns")
+        expected = (
+            columnar.FORMAT_ARROW
+            if columnar.PYARROW_AVAILABLE
+            else columnar.FORMAT_COLUMNS
+        )
+        self.assertEqual(columnar.get_response_format("arrow"), expected)
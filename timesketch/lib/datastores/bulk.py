@@ -0,0 +1,441 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Concurrent bulk indexing for the OpenSearch datastore."""
+
+from concurrent import futures
+import json
+import logging
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import prometheus_client
+from opensearchpy.exceptions import ConnectionTimeout
+
+from timesketch.lib.definitions import METRICS_NAMESPACE
+
+
+logger = logging.getLogger("timesketch.opensearch.bulk")
+
+METRICS = {
+    "bulk_request_duration": prometheus_client.Histogram(
+        "opensearch_bulk_request_duration_seconds",
+        "Latency of a single bulk request sent to OpenSearch",
+        namespace=METRICS_NAMESPACE,
+    ),
+    "bulk_request_bytes": prometheus_client.Histogram(
+        "opensearch_bulk_request_bytes",
+        "Size of the body of a single bulk request sent to OpenSearch",
+        buckets=(2**16, 2**18, 2**20, 2**22, 2**23, 2**24, 2**25, 2**26),
+        namespace=METRICS_NAMESPACE,
+    ),
+    "bulk_items": prometheus_client.Counter(
+        "opensearch_bulk_items",
+        "Number of bulk items per result (ok, retried, failed)",
+        ["result"],
+        namespace=METRICS_NAMESPACE,
+    ),
+    "bulk_in_flight": prometheus_client.Gauge(
+        "opensearch_bulk_in_flight_batches",
+        "Number of bulk batches being sent or waiting to be sent",
+        namespace=METRICS_NAMESPACE,
+    ),
+}
+
+# Item status returned by OpenSearch when the write queue of a node is full.
+STATUS_TOO_MANY_REQUESTS = 429
+
+# Number of times OpenSearch retries an update that hit a version conflict.
+UPDATE_RETRY_ON_CONFLICT = 3
+
+
+def _merge_documents(document: Dict, update: Dict):
+    """Merge a partial update into a partial document, like OpenSearch does.
+
+    Objects are merged recursively, all other values are replaced.
+
+    Args:
+        document: The partial document, changed in place.
+        update: The partial update to merge into the document.
+    """
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(document.get(key), dict):
+            _merge_documents(document[key], value)
+        else:
+            document[key] = value
+
+
+class BulkBatch:
+    """A batch of bulk actions, serialized to UTF-8 NDJSON lines when added.
+
+    Partial document updates of the same document are merged into a single
+    update action, as long as no other update of the document is queued in
+    between them. Update actions are retried by OpenSearch on version
+    conflicts.
+
+    Attributes:
+        actions (list): List of tuples with the serialized action header, the
+            serialized action body and the name of the target index.
+        size (int): Size of the serialized actions in bytes.
+        merged_updates (int): Number of updates merged into a queued update.
+        has_updates (bool): Whether the batch holds update actions.
+    """
+
+    def __init__(self, serializer: Any):
+        """Initialize the batch.
+
+        Args:
+            serializer: Serializer with dumps and loads methods, the
+                OpenSearch client transport serializer.
+        """
+        self._serializer = serializer
+        # Position in actions of the last partial document update, keyed by
+        # index name and document ID.
+        self._update_positions = {}
+        self.actions = []
+        self.size = 0
+        self.merged_updates = 0
+        self.has_updates = False
+
+    def __len__(self) -> int:
+        """Returns the number of actions in the batch."""
+        return len(self.actions)
+
+    def _dumps(self, data: Dict) -> bytes:
+        """Returns the data serialized to a UTF-8 encoded JSON line."""
+        return self._serializer.dumps(data).encode("utf-8")
+
+    def _merge_update(self, position: int, body: Dict):
+        """Merge a partial document update into a queued update action.
+
+        Args:
+            position: Position of the queued update in actions.
+            body: Dict with the partial update.
+        """
+        header_line, body_line, index_name = self.actions[position]
+        queued_body = self._serializer.loads(body_line)
+        _merge_documents(queued_body["doc"], body["doc"])
+        merged_line = self._dumps(queued_body)
+        self.actions[position] = (header_line, merged_line, index_name)
+        self.size += len(merged_line) - len(body_line)
+        self.merged_updates += 1
+
+    def add(self, index_name: str, header: Dict, body: Dict) -> bool:
+        """Serialize and add a single action to the batch.
+
+        Args:
+            index_name: Name of the index the action targets.
+            header: Dict with the action metadata, e.g. {"index": {...}}.
+            body: Dict with the document or the partial update.
+
+        Returns:
+            False if the action was merged into a queued update action,
+            True otherwise.
+        """
+        update_key = None
+        if "update" in header:
+            self.has_updates = True
+            header = {
+                "update": {
+                    "retry_on_conflict": UPDATE_RETRY_ON_CONFLICT,
+                    **header["update"],
+                }
+            }
+            update_key = (index_name, header["update"].get("_id"))
+            if list(body) != ["doc"]:
+                # Scripts and other updates can not be merged, later partial
+                # updates must not be applied before them.
+                self._update_positions.pop(update_key, None)
+                update_key = None
+            elif update_key in self._update_positions:
+                self._merge_update(self._update_positions[update_key], body)
+                return False
+
+        header_line = self._dumps(header)
+        body_line = self._dumps(body)
+        if update_key:
+            self._update_positions[update_key] = len(self.actions)
+        self.actions.append((header_line, body_line, index_name))
+        # Two newline characters are added per action in the request body.
+        self.size += len(header_line) + len(body_line) + 2
+        return True
+
+
+def _build_request_body(actions: List) -> bytes:
+    """Returns a NDJSON bulk request body for a list of serialized actions."""
+    lines = []
+    for header_line, body_line, _ in actions:
+        lines.append(header_line)
+        lines.append(body_line)
+    lines.append(b"")
+    return b"\n".join(lines)
+
+
+def _timeout_item(header_line: bytes, index_name: str, reason: str) -> Dict:
+    """Returns a bulk response item for an action that timed out."""
+    item = {
+        "_index": index_name,
+        "status": 0,
+        "error": {"type": "timeout", "reason": reason},
+    }
+    # Updates target a document, the ID is kept so that callers know which
+    # documents may not have been updated.
+    document_id = next(iter(json.loads(header_line).values()), {}).get("_id")
+    if document_id:
+        item["_id"] = document_id
+    return {"index": item}
+
+
+class BulkIndexer:
+    """Sends bulk batches to OpenSearch from a pool of worker threads.
+
+    Up to `concurrency` bulk requests are in flight at the same time and up to
+    `max_queued_batches` more are waiting for a worker. Submitting a batch
+    blocks while that limit is reached, which throttles the producer to the
+    speed of the cluster. Batches with update actions are sent one at a time
+    by a single worker, in the order they were submitted, so that updates of
+    the same document are applied in order. The workers are started when the
+    first batch is submitted.
+
+    Items rejected by OpenSearch because the write queue of a node is full
+    (HTTP status 429) are retried with an exponential backoff, without
+    re-sending the items of the batch that were accepted. Requests that time
+    out are retried as a whole.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        concurrency: int = 2,
+        max_queued_batches: int = 4,
+        request_timeout: Optional[int] = None,
+        retry_limit: int = 3,
+        retry_backoff: float = 1.0,
+    ):
+        """Initialize the indexer.
+
+        Args:
+            client: An opensearchpy.OpenSearch client.
+            concurrency: Number of bulk requests to run in parallel.
+            max_queued_batches: Number of batches that may wait for a worker
+                before submitting more batches blocks.
+            request_timeout: Timeout passed to the bulk API.
+            retry_limit: Maximum number of retries for a rejected item or a
+                request that timed out.
+            retry_backoff: Seconds to wait before the first retry, doubled
+                for every following retry.
+        """
+        self._client = client
+        self._request_timeout = request_timeout
+        self._retry_limit = retry_limit
+        self._retry_backoff = retry_backoff
+        self._concurrency = max(1, concurrency)
+        self._executor = None
+        self._ordered_executor = None
+        self._slots = threading.BoundedSemaphore(
+            max(1, concurrency) + max(0, max_queued_batches)
+        )
+        self._futures = []
+
+    def _bulk(self, actions: List) -> Dict:
+        """Send a single bulk request and record the latency.
+
+        Args:
+            actions: List of serialized actions.
+
+        Returns:
+            The response of the bulk API.
+        """
+        body = _build_request_body(actions)
+        METRICS["bulk_request_bytes"].observe(len(body))
+        with METRICS["bulk_request_duration"].time():
+            # pylint: disable=unexpected-keyword-arg
+            return self._client.bulk(body=body, timeout=self._request_timeout)
+
+    def _sleep_before_retry(self, attempt: int):
+        """Wait with an exponential backoff before retrying."""
+        time.sleep(self._retry_backoff * 2 ** (attempt - 1))
+
+    def _send_batch(self, batch: BulkBatch) -> Dict:
+        """Send a batch to OpenSearch, retrying rejected items.
+
+        Args:
+            batch: The BulkBatch to send.
+
+        Returns:
+            A dict with the number of events sent and a list of the bulk
+            response items of the actions that failed.
+        """
+        pending = batch.actions
+        failed_items = []
+        attempt = 0
+
+        try:
+            while pending:
+                try:
+                    response = self._bulk(pending)
+                except (ConnectionTimeout, socket.timeout) as e:
+                    attempt += 1
+                    if attempt > self._retry_limit:
+                        logger.error(
+                            "Unable to add %d events, reached retry max.",
+                            len(pending),
+                            exc_info=True,
+                        )
+                        failed_items.extend(
+                            _timeout_item(header_line, index_name, str(e))
+                            for header_line, _, index_name in pending
+                        )
+                        METRICS["bulk_items"].labels(result="failed").inc(len(pending))
+                        break
+                    logger.warning(
+                        "Bulk request timed out (retry %d/%d)",
+                        attempt,
+                        self._retry_limit,
+                    )
+                    self._sleep_before_retry(attempt)
+                    continue
+
+                if not response.get("errors", False):
+                    METRICS["bulk_items"].labels(result="ok").inc(len(pending))
+                    break
+
+                retry_actions = []
+                for action, item in zip(pending, response.get("items", [])):
+                    result = next(iter(item.values()), {})
+                    if not result.get("error"):
+                        METRICS["bulk_items"].labels(result="ok").inc()
+                        continue
+                    if (
+                        result.get("status") == STATUS_TOO_MANY_REQUESTS
+                        and attempt < self._retry_limit
+                    ):
+                        retry_actions.append(action)
+                        continue
+                    failed_items.append(item)
+                    METRICS["bulk_items"].labels(result="failed").inc()
+
+                pending = retry_actions
+                if pending:
+                    attempt += 1
+                    METRICS["bulk_items"].labels(result="retried").inc(len(pending))
+                    logger.warning(
+                        "%d events rejected by OpenSearch, retrying (%d/%d)",
+                        len(pending),
+                        attempt,
+                        self._retry_limit,
+                    )
+                    self._sleep_before_retry(attempt)
+        finally:
+            METRICS["bulk_in_flight"].dec()
+
+        return {"number_of_events": len(batch), "failed_items": failed_items}
+
+    def _get_executor(self, batch: BulkBatch) -> futures.ThreadPoolExecutor:
+        """Returns the executor for a batch, starting it if needed.
+
+        Args:
+            batch: The BulkBatch to send.
+
+        Returns:
+            The single worker executor for batches with updates, the
+            concurrent executor otherwise.
+        """
+        if batch.has_updates:
+            if not self._ordered_executor:
+                self._ordered_executor = futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="opensearch-bulk-updates"
+                )
+            return self._ordered_executor
+        if not self._executor:
+            self._executor = futures.ThreadPoolExecutor(
+                max_workers=self._concurrency, thread_name_prefix="opensearch-bulk"
+            )
+        return self._executor
+
+    def _collect(self, wait: bool) -> List[Dict]:
+        """Returns the results of finished batches.
+
+        Args:
+            wait: If True wait for all submitted batches to finish.
+
+        Raises:
+            Exception: Any error raised while sending a batch.
+        """
+        if wait:
+            futures.wait(self._futures)
+
+        results = []
+        pending = []
+        for future in self._futures:
+            if future.done():
+                results.append(future.result())
+            else:
+                pending.append(future)
+        self._futures = pending
+        return results
+
+    def submit(self, batch: BulkBatch) -> List[Dict]:
+        """Queue a batch to be sent, blocking while the queue is full.
+
+        Args:
+            batch: The BulkBatch to send.
+
+        Returns:
+            List of results of batches that finished in the meantime.
+        """
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        METRICS["bulk_in_flight"].inc()
+        try:
+            future = self._get_executor(batch).submit(self._send_batch, batch)
+        except Exception:
+            METRICS["bulk_in_flight"].dec()
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        return self._collect(wait=False)
+
+    def send(self, batch: BulkBatch) -> Dict:
+        """Send a batch from the calling thread and wait for the result.
+
+        Must not be called while submitted batches are in flight, since the
+        batch could overtake them.
+
+        Args:
+            batch: The BulkBatch to send.
+
+        Returns:
+            A dict with the number of events sent and a list of the bulk
+            response items of the actions that failed.
+        """
+        METRICS["bulk_in_flight"].inc()
+        return self._send_batch(batch)
+
+    def has_pending(self) -> bool:
+        """Returns whether submitted batches have not been collected yet."""
+        return bool(self._futures)
+
+    def wait(self) -> List[Dict]:
+        """Wait for all submitted batches and return their results."""
+        return self._collect(wait=True)
+
+    def close(self):
+        """Wait for all workers to finish and stop them."""
+        for executor in (self._executor, self._ordered_executor):
+            if executor:
+                executor.shutdown(wait=True)
+        self._executor = None
+        self._ordered_executor = None
@@ -0,0 +1,255 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the concurrent bulk indexer."""
+
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from opensearchpy.exceptions import ConnectionTimeout
+from opensearchpy.serializer import JSONSerializer
+
+from timesketch.lib.datastores import bulk
+
+
+class FakeBulkClient:
+    """Fake OpenSearch client that records bulk requests."""
+
+    def __init__(self, rejected_ids=None, reject_times=1):
+        """Initialize the client.
+
+        Args:
+            rejected_ids: Document IDs to reject with status 429.
+            reject_times: How many times each rejected ID is rejected.
+        """
+        self.requests = []
+        self._rejections = {doc_id: reject_times for doc_id in rejected_ids or []}
+        self._lock = threading.Lock()
+
+    # pylint: disable=unused-argument
+    def bulk(self, body, timeout=None):
+        """Record the request and return a bulk response."""
+        lines = [json.loads(line) for line in body.splitlines() if line]
+        headers = lines[::2]
+        items = []
+        errors = False
+        with self._lock:
+            self.requests.append([header["index"]["_id"] for header in headers])
+            for header in headers:
+                doc_id = header["index"]["_id"]
+                if self._rejections.get(doc_id):
+                    self._rejections[doc_id] -= 1
+                    errors = True
+                    items.append(
+                        {
+                            "index": {
+                                "_id": doc_id,
+                                "status": 429,
+                                "error": {"type": "es_rejected_execution_exception"},
+                            }
+                        }
+                    )
+                else:
+                    items.append({"index": {"_id": doc_id, "status": 201}})
+        return {"errors": errors, "items": items}
+
+
+def _build_batch(doc_ids):
+    """Returns a BulkBatch with an index action for each document ID."""
+    batch = bulk.BulkBatch(JSONSerializer())
+    for doc_id in doc_ids:
+        batch.add(
+            "test_index",
+            {"index": {"_index": "test_index", "_id": doc_id}},
+            {"message": f"event {doc_id}"},
+        )
+    return batch
+
+
+class TestBulkIndexer(unittest.TestCase):
+    """Tests for the BulkIndexer."""
+
+    def test_batch_size(self):
+        """Test that the batch size is the size of the request body."""
+        batch = _build_batch(["a", "b"])
+        self.assertEqual(len(batch), 2)
+        # pylint: disable=protected-access
+        body = bulk._build_request_body(batch.actions)
+        self.assertEqual(batch.size, len(body))
+
+    def test_partial_updates_are_merged(self):
+        """Test that partial updates of the same document are merged."""
+        batch = bulk.BulkBatch(JSONSerializer())
+        header = {"update": {"_index": "test_index", "_id": "a"}}
+        self.assertTrue(
+            batch.add("test_index", header, {"doc": {"tag": ["x"], "a": {"b": 1}}})
+        )
+        self.assertFalse(
+            batch.add("test_index", header, {"doc": {"tag": ["y"], "a": {"c": 2}}})
+        )
+        batch.add(
+            "test_index",
+            {"update": {"_index": "test_index", "_id": "b"}},
+            {"doc": {"tag": ["z"]}},
+        )
+
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.merged_updates, 1)
+        self.assertEqual(
+            json.loads(batch.actions[0][1]),
+            {"doc": {"tag": ["y"], "a": {"b": 1, "c": 2}}},
+        )
+        # pylint: disable=protected-access
+        body = bulk._build_request_body(batch.actions)
+        self.assertEqual(batch.size, len(body))
+
+    def test_scripts_are_not_merged(self):
+        """Test that updates are not merged across a script update."""
+        batch = bulk.BulkBatch(JSONSerializer())
+        header = {"update": {"_index": "test_index", "_id": "a"}}
+        batch.add("test_index", header, {"doc": {"tag": ["x"]}})
+        batch.add("test_index", header, {"script": {"source": "", "lang": "painless"}})
+        batch.add("test_index", header, {"doc": {"tag": ["y"]}})
+
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(batch.merged_updates, 0)
+
+    def test_only_rejected_items_are_retried(self):
+        """Test that only items rejected with 429 are sent again."""
+        client = FakeBulkClient(rejected_ids=["b"])
+        indexer = bulk.BulkIndexer(client, concurrency=1, retry_backoff=0)
+        results = indexer.submit(_build_batch(["a", "b", "c"]))
+        results.extend(indexer.wait())
+        indexer.close()
+
+        self.assertEqual(client.requests, [["a", "b", "c"], ["b"]])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["number_of_events"], 3)
+        self.assertEqual(results[0]["failed_items"], [])
+
+    def test_rejected_items_fail_after_retry_limit(self):
+        """Test that an item is reported as failed after the retry limit."""
+        client = FakeBulkClient(rejected_ids=["b"], reject_times=10)
+        indexer = bulk.BulkIndexer(
+            client, concurrency=1, retry_limit=2, retry_backoff=0
+        )
+        results = indexer.submit(_build_batch(["a", "b"]))
+        results.extend(indexer.wait())
+        indexer.close()
+
+        self.assertEqual(client.requests, [["a", "b"], ["b"], ["b"]])
+        failed_items = results[0]["failed_items"]
+        self.assertEqual(len(failed_items), 1)
+        self.assertEqual(failed_items[0]["index"]["_id"], "b")
+
+    def test_timeout_is_retried(self):
+        """Test that a request that timed out is sent again."""
+        client = mock.MagicMock()
+        client.bulk.side_effect = [
+            ConnectionTimeout("TIMEOUT", "timed out", None),
+            {"errors": False, "items": []},
+        ]
+        indexer = bulk.BulkIndexer(client, concurrency=1, retry_backoff=0)
+        results = indexer.submit(_build_batch(["a"]))
+        results.extend(indexer.wait())
+        indexer.close()
+
+        self.assertEqual(client.bulk.call_count, 2)
+        self.assertEqual(results[0]["failed_items"], [])
+
+    def test_timed_out_updates_are_failed(self):
+        """Test that updates that timed out are failed with their ID."""
+        client = mock.MagicMock()
+        client.bulk.side_effect = ConnectionTimeout("TIMEOUT", "timed out", None)
+        indexer = bulk.BulkIndexer(client, retry_limit=0, retry_backoff=0)
+        batch = bulk.BulkBatch(JSONSerializer())
+        batch.add(
+            "test_index",
+            {"update": {"_index": "test_index", "_id": "a"}},
+            {"doc": {"tag": ["foo"]}},
+        )
+        result = indexer.send(batch)
+        indexer.close()
+
+        failed_item = result["failed_items"][0]["index"]
+        self.assertEqual(failed_item["_id"], "a")
+        self.assertEqual(failed_item["error"]["type"], "timeout")
+
+    def test_concurrent_batches(self):
+        """Test that all submitted batches are sent."""
+        client = FakeBulkClient()
+        indexer = bulk.BulkIndexer(client, concurrency=4, max_queued_batches=1)
+        results = []
+        for i in range(20):
+            results.extend(indexer.submit(_build_batch([f"{i}-a", f"{i}-b"])))
+        results.extend(indexer.wait())
+        indexer.close()
+
+        self.assertEqual(len(client.requests), 20)
+        self.assertEqual(sum(r["number_of_events"] for r in results), 40)
+
+    def test_update_batches_are_sent_in_order(self):
+        """Test that batches with updates are sent one at a time in order."""
+        client = mock.MagicMock()
+        in_flight = []
+        max_in_flight = []
+        lock = threading.Lock()
+
+        # pylint: disable=unused-argument
+        def _bulk(body, timeout=None):
+            with lock:
+                in_flight.append(body)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(body)
+            return {"errors": False, "items": []}
+
+        client.bulk.side_effect = _bulk
+        indexer = bulk.BulkIndexer(client, concurrency=4, max_queued_batches=4)
+        for i in range(8):
+            batch = bulk.BulkBatch(JSONSerializer())
+            batch.add(
+                "test_index",
+                {"update": {"_index": "test_index", "_id": "a"}},
+                {"doc": {"i": i}},
+            )
+            indexer.submit(batch)
+        indexer.wait()
+        indexer.close()
+
+        self.assertEqual(max(max_in_flight), 1)
+        sent = [
+            json.loads(call.kwargs["body"].splitlines()[1])["doc"]["i"]
+            for call in client.bulk.call_args_list
+        ]
+        self.assertEqual(sent, list(range(8)))
+        header = json.loads(client.bulk.call_args.kwargs["body"].splitlines()[0])
+        self.assertEqual(
+            header["update"]["retry_on_conflict"], bulk.UPDATE_RETRY_ON_CONFLICT
+        )
+
+    def test_send_does_not_start_workers(self):
+        """Test that a batch sent from the calling thread starts no workers."""
+        client = FakeBulkClient()
+        indexer = bulk.BulkIndexer(client, concurrency=4)
+        result = indexer.send(_build_batch(["a"]))
+        self.assertEqual(result["number_of_events"], 1)
+        self.assertFalse(indexer.has_pending())
+        # pylint: disable=protected-access
+        self.assertIsNone(indexer._executor)
+        self.assertIsNone(indexer._ordered_executor)
+        indexer.close()
@@ -0,0 +1,348 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process wide cache of the field types of indices.
+
+Aggregations need to know whether a field is a text field, since text fields
+can only be aggregated on by their keyword sub field. The mapping of every
+index is fetched once and kept per index.
+
+The type of a field can not change once it is in the mapping of an index, but
+new fields are added when events are written. Entries are refreshed when the
+generation of the index changed (see query_cache, if a Redis backed cache is
+enabled), when they are older than FIELD_TYPE_CACHE_TTL seconds, or when a
+field is looked up that is not in the mapping yet.
+"""
+
+import collections
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+import opensearchpy
+import prometheus_client
+import redis
+from flask import current_app
+
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.definitions import METRICS_NAMESPACE
+
+
+logger = logging.getLogger("timesketch.opensearch.field_types")
+
+METRICS = {
+    "field_type_cache_lookups": prometheus_client.Counter(
+        "field_type_cache_lookups",
+        "Number of index mappings looked up in the field type cache per result "
+        "(hit, miss, outdated)",
+        ["result"],
+        namespace=METRICS_NAMESPACE,
+    ),
+}
+
+# Default number of seconds the field types of an index are kept.
+DEFAULT_TTL = 300
+
+# Maximum number of indices in the cache.
+DEFAULT_MAX_INDICES = 1000
+
+# Minimum number of seconds between refreshes of an index mapping because a
+# field was not found in it.
+MISSING_FIELD_REFRESH_INTERVAL = 5
+
+
+def _flatten_properties(
+    properties: Dict, prefix: str = "", field_types: Optional[Dict] = None
+) -> Dict[str, str]:
+    """Returns the type of every field in the properties of a mapping.
+
+    Args:
+        properties: The properties of an index mapping.
+        prefix: Prefix of the field names, for the properties of objects.
+        field_types: Optional dict that the field types are added to.
+
+    Returns:
+        Dict with the type per field name, None for objects. Fields of
+        objects and sub fields, e.g. "message.keyword", are included with
+        their full name.
+    """
+    if field_types is None:
+        field_types = {}
+    for name, value in properties.items():
+        field_name = f"{prefix}{name}"
+        field_types[field_name] = value.get("type")
+        for sub_name, sub_value in value.get("fields", {}).items():
+            field_types[f"{field_name}.{sub_name}"] = sub_value.get("type")
+        if "properties" in value:
+            _flatten_properties(value["properties"], f"{field_name}.", field_types)
+    return field_types
+
+
+def _get_index_names(indices: Union[str, List[str]]) -> List[str]:
+    """Returns a list of index names."""
+    if isinstance(indices, str):
+        indices = indices.split(",")
+    return [index_name for index_name in indices or [] if index_name]
+
+
+class FieldTypeCache:
+    """A thread safe, size bounded cache of the field types per index."""
+
+    def __init__(self, max_indices: int = DEFAULT_MAX_INDICES):
+        """Initialize the cache.
+
+        Args:
+            max_indices: Maximum number of indices in the cache.
+        """
+        self.max_indices = max_indices
+        # Index name to a tuple of the fetch time, the index generation and
+        # the field types of the index.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_generations(index_names: List[str]) -> Dict[str, int]:
+        """Returns the generation of each index, if generations are kept."""
+        if not query_cache.generations_enabled():
+            return {}
+        try:
+            client = query_cache.get_redis_client()
+            if client is None:
+                return {}
+            generations = query_cache.get_index_generations(client, index_names)
+        except (ValueError, redis.exceptions.RedisError) as e:
+            logger.warning("Unable to read index generations: %s", str(e))
+            return {}
+        return dict(zip(index_names, generations))
+
+    @staticmethod
+    def _fetch(client, index_names: List[str]) -> Dict[str, Dict[str, str]]:
+        """Returns the field types of indices from the datastore.
+
+        Args:
+            client (opensearchpy.OpenSearch): The OpenSearch client.
+            index_names: List of index names.
+
+        Returns:
+            Dict with the field types per index name.
+        """
+        try:
+            mappings = client.indices.get_mapping(
+                index=index_names, ignore_unavailable=True
+            )
+        except opensearchpy.NotFoundError:
+            logger.error(
+                "Unable to get indices mapping in datastore, for indices: [%s]",
+                ",".join(index_names),
+            )
+            return {}
+
+        field_types = {}
+        for index_name, value in mappings.items():
+            # The structure is different in ES version 6.x and lower. This check
+            # makes sure we support both old and new versions.
+            properties = value.get("mappings", {}).get("properties")
+            if properties is None:
+                properties = next(iter(value.get("mappings", {}).values()), {}).get(
+                    "properties", {}
+                )
+            field_types[index_name] = _flatten_properties(properties)
+        return field_types
+
+    def get_index_field_types(
+        self,
+        client,
+        index_names: List[str],
+        refresh: bool = False,
+        max_age: Optional[float] = None,
+    ) -> Dict[str, Dict[str, str]]:
+        """Returns the field types of indices, fetching them if needed.
+
+        Args:
+            client (opensearchpy.OpenSearch): The OpenSearch client.
+            index_names: List of index names.
+            refresh: If True the mappings of all indices are fetched.
+            max_age: Optional number of seconds after which cached field types
+                are fetched again, defaults to FIELD_TYPE_CACHE_TTL.
+
+        Returns:
+            Dict with the field types per index name. Indices that do not
+            exist are left out.
+        """
+        index_names = sorted(set(index_names))
+        if max_age is None:
+            max_age = current_app.config.get("FIELD_TYPE_CACHE_TTL", DEFAULT_TTL)
+        generations = self._get_generations(index_names)
+        expired_before = time.monotonic() - max_age
+
+        result = {}
+        missing = []
+        with self._lock:
+            for index_name in index_names:
+                entry = self._entries.get(index_name)
+                if refresh or entry is None:
+                    lookup_result = "miss"
+                else:
+                    fetched_at, generation, field_types = entry
+                    if fetched_at < expired_before:
+                        lookup_result = "outdated"
+                    elif generation != generations.get(index_name):
+                        lookup_result = "outdated"
+                    else:
+                        lookup_result = "hit"
+                        self._entries.move_to_end(index_name)
+                        result[index_name] = field_types
+                if lookup_result != "hit":
+                    missing.append(index_name)
+                METRICS["field_type_cache_lookups"].labels(result=lookup_result).inc()
+
+        if not missing:
+            return result
+
+        fetched = self._fetch(client, missing)
+        now = time.monotonic()
+        with self._lock:
+            for index_name, field_types in fetched.items():
+                self._entries[index_name] = (
+                    now,
+                    generations.get(index_name),
+                    field_types,
+                )
+                self._entries.move_to_end(index_name)
+            while len(self._entries) > self.max_indices:
+                self._entries.popitem(last=False)
+        result.update(fetched)
+        return result
+
+    def get_field_types(
+        self, client, indices: Union[str, List[str]], refresh: bool = False
+    ) -> Dict[str, str]:
+        """Returns the field types of one or more indices.
+
+        Args:
+            client (opensearchpy.OpenSearch): The OpenSearch client.
+            indices: Index name, comma separated index names or list of index
+                names.
+            refresh: If True the mappings of all indices are fetched.
+
+        Returns:
+            Dict with the type per field name. If the type of a field differs
+            between indices, the type in the first index is used.
+        """
+        index_names = _get_index_names(indices)
+        index_field_types = self.get_index_field_types(
+            client, index_names, refresh=refresh
+        )
+        field_types = {}
+        for index_name in index_names:
+            for field_name, field_type in index_field_types.get(index_name, {}).items():
+                field_types.setdefault(field_name, field_type)
+        return field_types
+
+    def get_field_type(
+        self, client, indices: Union[str, List[str]], field_name: str
+    ) -> Optional[str]:
+        """Returns the type of a field.
+
+        Args:
+            client (opensearchpy.OpenSearch): The OpenSearch client.
+            indices: Index name, comma separated index names or list of index
+                names.
+            field_name: Name of the field.
+
+        Returns:
+            The type of the field or None if it is not in the mappings.
+        """
+        index_names = _get_index_names(indices)
+        index_field_types = self.get_index_field_types(client, index_names)
+        for index_name in index_names:
+            field_type = index_field_types.get(index_name, {}).get(field_name)
+            if field_type:
+                return field_type
+
+        # The field may have been added to the mappings since they were
+        # fetched.
+        index_field_types = self.get_index_field_types(
+            client, index_names, max_age=MISSING_FIELD_REFRESH_INTERVAL
+        )
+        for index_name in index_names:
+            field_type = index_field_types.get(index_name, {}).get(field_name)
+            if field_type:
+                return field_type
+        return None
+
+    def clear(self):
+        """Remove all indices from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = FieldTypeCache()
+
+
+def get_index_field_types(
+    client, index_names: List[str], refresh: bool = False
+) -> Dict[str, Dict[str, str]]:
+    """Returns the field types per index from the shared cache.
+
+    See FieldTypeCache.get_index_field_types.
+    """
+    return _cache.get_index_field_types(client, index_names, refresh=refresh)
+
+
+def get_field_types(
+    client, indices: Union[str, List[str]], refresh: bool = False
+) -> Dict[str, str]:
+    """Returns the field types of indices from the shared cache.
+
+    See FieldTypeCache.get_field_types.
+    """
+    return _cache.get_field_types(client, indices, refresh=refresh)
+
+
+def get_field_type(
+    client, indices: Union[str, List[str]], field_name: str
+) -> Optional[str]:
+    """Returns the type of a field from the shared cache.
+
+    See FieldTypeCache.get_field_type.
+    """
+    return _cache.get_field_type(client, indices, field_name)
+
+
+def format_field_by_type(
+    client, indices: Union[str, List[str]], field_name: str
+) -> str:
+    """Returns the name of a field to aggregate on.
+
+    Text fields are not available to aggregations per default, their keyword
+    sub field is used instead.
+
+    Args:
+        client: The OpenSearch client.
+        indices: Index name, comma separated index names or list of index
+            names.
+        field_name: Name of the field.
+
+    Returns:
+        Field name as string formatted after mapping type.
+    """
+    if get_field_type(client, indices, field_name) == "text":
+        return f"{field_name}.keyword"
+    return field_name
+
+
+def clear():
+    """Remove all indices from the shared cache."""
+    _cache.clear()
@@ -0,0 +1,102 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the field type cache."""
+
+from unittest import mock
+
+from timesketch.lib.datastores import field_types
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.datastores.query_cache_test import FakeRedis
+from timesketch.lib.testlib import BaseTest
+
+
+PROPERTIES = {
+    "message": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+    "port": {"type": "long"},
+    "url": {"properties": {"domain": {"type": "text"}}},
+}
+
+
+def _get_mapping(index, ignore_unavailable):
+    del ignore_unavailable
+    return {name: {"mappings": {"properties": PROPERTIES}} for name in index}
+
+
+class TestFieldTypeCache(BaseTest):
+    """Tests for the FieldTypeCache class."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = mock.Mock()
+        self.client.indices.get_mapping.side_effect = _get_mapping
+        self.cache = field_types.FieldTypeCache()
+
+    def test_get_field_type(self):
+        """Test that the mapping of an index is fetched once."""
+        self.assertEqual(
+            self.cache.get_field_type(self.client, "index_1,index_2", "message"),
+            "text",
+        )
+        self.assertEqual(
+            self.cache.get_field_type(self.client, ["index_1"], "url.domain"), "text"
+        )
+        self.assertEqual(
+            self.cache.get_field_type(self.client, ["index_2"], "message.keyword"),
+            "keyword",
+        )
+        self.client.indices.get_mapping.assert_called_once_with(
+            index=["index_1", "index_2"], ignore_unavailable=True
+        )
+
+    def test_missing_field(self):
+        """Test that the mapping is fetched again for fields not in it."""
+        self.assertEqual(
+            self.cache.get_field_type(self.client, "index_1", "port"), "long"
+        )
+        self.assertIsNone(self.cache.get_field_type(self.client, "index_1", "foo"))
+        self.assertEqual(self.client.indices.get_mapping.call_count, 1)
+
+        with mock.patch.object(field_types.time, "monotonic", return_value=1e12):
+            self.assertIsNone(self.cache.get_field_type(self.client, "index_1", "foo"))
+        self.assertEqual(self.client.indices.get_mapping.call_count, 2)
+
+    def test_writes_invalidate_field_types(self):
+        """Test that a write to an index fetches its mapping again."""
+        self.app.config["QUERY_CACHE_ENABLED"] = True
+        self.addCleanup(self.app.config.update, {"QUERY_CACHE_ENABLED": False})
+        with mock.patch.object(
+            query_cache, "get_redis_client", return_value=FakeRedis()
+        ):
+            self.cache.get_field_types(self.client, ["index_1", "index_2"])
+            query_cache.bump_index_generation(["index_2"])
+            field_type_map = self.cache.get_field_types(
+                self.client, ["index_1", "index_2"]
+            )
+
+        self.assertEqual(field_type_map["port"], "long")
+        self.client.indices.get_mapping.assert_called_with(
+            index=["index_2"], ignore_unavailable=True
+        )
+
+    def test_format_field_by_type(self):
+        """Test that the keyword sub field of text fields is used."""
+        with mock.patch.object(field_types, "_cache", self.cache):
+            self.assertEqual(
+                field_types.format_field_by_type(self.client, "index_1", "message"),
+                "message.keyword",
+            )
+            self.assertEqual(
+                field_types.format_field_by_type(self.client, "index_1", "port"),
+                "port",
+            )
@@ -18,8 +18,8 @@ import copy
 import codecs
 import json
 import logging
+import os
 import re
-import socket
 import time
 import queue
 import threading
@@ -41,6 +41,9 @@ from flask import current_app
 from flask_login import current_user
 import prometheus_client
 
+from timesketch.lib.datastores import bulk
+from timesketch.lib.datastores import field_types
+from timesketch.lib.datastores import query_cache
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.lib.definitions import METRICS_NAMESPACE
 from timesketch.lib import errors
@@ -75,6 +78,35 @@ METRICS = {
         "Number of times a single event is requested",
         namespace=METRICS_NAMESPACE,
     ),
+    "client_pool_clients": prometheus_client.Gauge(
+        "opensearch_client_pool_clients",
+        "Number of shared OpenSearch clients held by this process",
+        namespace=METRICS_NAMESPACE,
+    ),
+    "client_pool_requests": prometheus_client.Counter(
+        "opensearch_client_pool_requests",
+        "Number of datastore initializations per outcome (reused, created)",
+        ["outcome"],
+        namespace=METRICS_NAMESPACE,
+    ),
+    "client_pool_health_checks": prometheus_client.Counter(
+        "opensearch_client_pool_health_checks",
+        "Number of background health checks per result (ok, failed)",
+        ["result"],
+        namespace=METRICS_NAMESPACE,
+    ),
+    "client_pool_connections": prometheus_client.Gauge(
+        "opensearch_client_pool_connections",
+        "Number of live and dead node connections of the shared clients",
+        ["state"],
+        namespace=METRICS_NAMESPACE,
+    ),
+    "client_pool_http_connections": prometheus_client.Gauge(
+        "opensearch_client_pool_http_connections",
+        "HTTP connections opened, idle and the pool size of the shared clients",
+        ["type"],
+        namespace=METRICS_NAMESPACE,
+    ),
 }
 
 # OpenSearch scripts
@@ -101,10 +133,283 @@ if (!removedLabel) {
 }
 """
 
+ADD_TAGS_SCRIPT = """
+if (ctx._source.tag == null) {
+    ctx._source.tag = new ArrayList();
+} else if (!(ctx._source.tag instanceof List)) {
+    ctx._source.tag = [ctx._source.tag];
+}
+boolean changed = false;
+for (String tag : params.tags) {
+    if (!ctx._source.tag.contains(tag)) {
+        ctx._source.tag.add(tag);
+        changed = true;
+    }
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
+ENRICH_EVENTS_SCRIPT = """
+boolean addToList(Map source, String field, def items) {
+    if (items == null) {
+        return false;
+    }
+    def current = source[field];
+    if (current == null) {
+        current = new ArrayList();
+    } else if (!(current instanceof List)) {
+        current = [current];
+    }
+    boolean changed = false;
+    for (def item : items) {
+        if (!current.contains(item)) {
+            current.add(item);
+            changed = true;
+        }
+    }
+    source[field] = current;
+    return changed;
+}
+
+def values = ctx._source[params.field];
+if (values == null) {
+    ctx.op = 'noop';
+    return;
+}
+if (!(values instanceof List)) {
+    values = [values];
+}
+boolean changed = false;
+for (def value : values) {
+    def update = params.updates.get(String.valueOf(value));
+    if (update == null) {
+        continue;
+    }
+    def attributes = update.get('attributes');
+    if (attributes != null) {
+        for (def entry : attributes.entrySet()) {
+            if (ctx._source[entry.getKey()] != entry.getValue()) {
+                ctx._source[entry.getKey()] = entry.getValue();
+                changed = true;
+            }
+        }
+    }
+    changed = addToList(ctx._source, 'tag', update.get('tags')) || changed;
+    changed = addToList(ctx._source, '__ts_emojis', update.get('emojis')) || changed;
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
 # Default sort order for PIT exports if not specified, ensuring stable pagination.
 # _doc is generally recommended for performance with slicing.
 _DEFAULT_PIT_SORT_CRITERIA = [{"_id": "asc"}]
 
+# Default number of HTTP connections kept open per OpenSearch node.
+DEFAULT_POOL_MAXSIZE = 10
+
+# Default number of seconds between background health checks of shared clients.
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+
+class _SharedClient:
+    """A process-wide OpenSearch client shared between datastore instances.
+
+    Attributes:
+        client (opensearchpy.OpenSearch): The thread-safe OpenSearch client.
+        version (str): Cached version number of the OpenSearch cluster.
+        healthy (bool): Result of the last health check of the cluster.
+        pid (int): ID of the process that created the client.
+        last_checked (float): Timestamp of the last successful health check.
+    """
+
+    def __init__(self, client: OpenSearch):
+        """Initialize the shared client and cache the cluster version.
+
+        Args:
+            client: An OpenSearch client instance.
+        """
+        self.client = client
+        self.version = client.info().get("version").get("number")
+        self.healthy = True
+        self.pid = os.getpid()
+        self.last_checked = time.time()
+
+    def check_health(self) -> bool:
+        """Verify that the cluster still responds and refresh the version.
+
+        Returns:
+            True if the cluster responded, False otherwise.
+        """
+        try:
+            self.version = self.client.info().get("version").get("number")
+            self.healthy = True
+            self.last_checked = time.time()
+            METRICS["client_pool_health_checks"].labels(result="ok").inc()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            os_logger.warning("Health check of OpenSearch client failed: %s", str(e))
+            self.healthy = False
+            METRICS["client_pool_health_checks"].labels(result="failed").inc()
+        return self.healthy
+
+    def close(self):
+        """Close all connections held by the client."""
+        try:
+            self.client.close()
+        except Exception:  # pylint: disable=broad-exception-caught
+            os_logger.debug("Unable to close OpenSearch client.", exc_info=True)
+
+
+_shared_clients: Dict[str, _SharedClient] = {}
+_shared_clients_lock = threading.Lock()
+_health_check_thread: Optional[threading.Thread] = None
+_health_check_stop = threading.Event()
+
+
+def _update_pool_metrics():
+    """Export connection statistics of the shared clients as metrics."""
+    live = dead = http_open = http_idle = http_maxsize = 0
+    for shared_client in list(_shared_clients.values()):
+        connection_pool = shared_client.client.transport.connection_pool
+        connections = getattr(connection_pool, "connections", [])
+        live += len(connections)
+        dead_queue = getattr(connection_pool, "dead", None)
+        if dead_queue is not None:
+            dead += dead_queue.qsize()
+        for connection in connections:
+            http_pool = getattr(connection, "pool", None)
+            if http_pool is None:
+                continue
+            http_open += getattr(http_pool, "num_connections", 0)
+            idle_queue = getattr(http_pool, "pool", None)
+            if idle_queue is not None:
+                http_idle += idle_queue.qsize()
+                http_maxsize += idle_queue.maxsize
+
+    METRICS["client_pool_clients"].set(len(_shared_clients))
+    METRICS["client_pool_connections"].labels(state="live").set(live)
+    METRICS["client_pool_connections"].labels(state="dead").set(dead)
+    METRICS["client_pool_http_connections"].labels(type="opened").set(http_open)
+    METRICS["client_pool_http_connections"].labels(type="idle").set(http_idle)
+    METRICS["client_pool_http_connections"].labels(type="maxsize").set(http_maxsize)
+
+
+def _health_check_loop(interval: int):
+    """Periodically check the health of all shared clients.
+
+    Args:
+        interval: Number of seconds to wait between checks.
+    """
+    while not _health_check_stop.wait(interval):
+        for shared_client in list(_shared_clients.values()):
+            shared_client.check_health()
+        _update_pool_metrics()
+
+
+def _start_health_check_thread(interval: int):
+    """Start the background health check thread if it is not running.
+
+    Must be called while holding _shared_clients_lock.
+
+    Args:
+        interval: Number of seconds between health checks, zero disables them.
+    """
+    global _health_check_thread  # pylint: disable=global-statement
+    if not interval or interval <= 0:
+        return
+    if _health_check_thread and _health_check_thread.is_alive():
+        return
+    _health_check_stop.clear()
+    _health_check_thread = threading.Thread(
+        target=_health_check_loop,
+        args=(interval,),
+        name="opensearch-health-check",
+        daemon=True,
+    )
+    _health_check_thread.start()
+
+
+def get_shared_client(
+    hosts: List[Dict[str, Any]], parameters: Dict[str, Any], health_check_interval: int
+) -> _SharedClient:
+    """Return the process-wide client for a connection configuration.
+
+    Clients are keyed on the hosts and client parameters, created on first use
+    and reused afterwards. A client that failed its last health check, or one
+    that was inherited from a parent process, is replaced by a new one.
+
+    Args:
+        hosts: List of host dictionaries passed to the OpenSearch client.
+        parameters: Keyword arguments passed to the OpenSearch client.
+        health_check_interval: Seconds between background health checks.
+
+    Returns:
+        A _SharedClient instance.
+    """
+    key = json.dumps([hosts, parameters], sort_keys=True, default=str)
+    with _shared_clients_lock:
+        shared_client = _shared_clients.get(key)
+    if shared_client and shared_client.pid != os.getpid():
+        # Sockets inherited across a fork must not be used by the child.
+        shared_client = None
+
+    # Health checks and the version lookup of a new client block on the
+    # cluster, they run without the lock so that an unreachable cluster does
+    # not stall threads that want another client.
+    stale_client = None
+    if shared_client and not shared_client.healthy:
+        if not shared_client.check_health():
+            stale_client = shared_client
+            shared_client = None
+
+    if shared_client:
+        METRICS["client_pool_requests"].labels(outcome="reused").inc()
+        return shared_client
+
+    new_client = _SharedClient(OpenSearch(hosts, **parameters))
+    with _shared_clients_lock:
+        shared_client = _shared_clients.get(key)
+        if (
+            shared_client
+            and shared_client is not stale_client
+            and shared_client.pid == os.getpid()
+            and shared_client.healthy
+        ):
+            # Another thread published a client in the meantime.
+            new_client.close()
+            METRICS["client_pool_requests"].labels(outcome="reused").inc()
+            return shared_client
+
+        _shared_clients[key] = new_client
+        METRICS["client_pool_requests"].labels(outcome="created").inc()
+        _start_health_check_thread(health_check_interval)
+        _update_pool_metrics()
+
+    if stale_client:
+        stale_client.close()
+    return new_client
+
+
+def reset_shared_clients():
+    """Drop all shared clients, e.g. after forking a new worker process.
+
+    The connections themselves are not closed since the sockets are shared with
+    the parent process, they are released when the objects are collected.
+    """
+    global _shared_clients_lock  # pylint: disable=global-statement
+    global _health_check_thread  # pylint: disable=global-statement
+    _shared_clients_lock = threading.Lock()
+    _shared_clients.clear()
+    _health_check_thread = None
+    METRICS["client_pool_clients"].set(0)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_shared_clients)
+
 
 class OpenSearchDataStore:
     """Implements the datastore."""
@@ -116,6 +421,14 @@ class OpenSearchDataStore:
     DEFAULT_STREAM_LIMIT = 5000  # Max events to return when streaming results
 
     DEFAULT_FLUSH_RETRY_LIMIT = 3  # Max retries for flushing the queue.
+    DEFAULT_FLUSH_BYTES = 10 * 1024 * 1024  # Max size of a bulk request body.
+    DEFAULT_BULK_CONCURRENCY = 2  # Bulk requests in flight at the same time.
+    DEFAULT_BULK_QUEUE_SIZE = 4  # Bulk batches waiting to be sent.
+    DEFAULT_UPDATE_BY_QUERY_CHUNK_SIZE = 10000  # Max IDs per update_by_query.
+    DEFAULT_DISTINCT_VALUES_PAGE_SIZE = 10000  # Buckets per composite agg page.
+    DEFAULT_ENRICHMENT_CHUNK_SIZE = 1000  # Max values per enrichment update.
+    DEFAULT_CONFLICT_RETRY_LIMIT = 3  # Retries of updates with version conflicts.
+    KEYWORD_IGNORE_ABOVE = 256  # Longer strings are not in dynamic keyword fields.
     DEFAULT_EVENT_IMPORT_TIMEOUT = 180  # Timeout value in seconds for importing events.
 
     DEFAULT_INDEX_WAIT_TIMEOUT = 10  # Seconds to wait for an index to become ready
@@ -141,22 +454,37 @@ class OpenSearchDataStore:
             **kwargs: Additional keyword arguments that are passed directly to
                 the opensearchpy.OpenSearch client constructor. These can
                 override or supplement the default and application-configured
-                parameters. For example, `max_poolsize`, `timeout`, `use_ssl`,
+                parameters. For example, `pool_maxsize`, `timeout`, `use_ssl`,
                 `http_auth`, etc.
 
         Attributes:
             client (opensearchpy.OpenSearch): The underlying OpenSearch client
-                instance used for all communication with the datastore.
+                instance used for all communication with the datastore. The
+                client is shared by all datastore instances of the process that
+                use the same connection parameters, see `get_shared_client`.
+                The number of connections kept open per node is set by
+                `OPENSEARCH_POOL_MAXSIZE`.
             timeout (int): The default timeout in seconds for OpenSearch
                 requests, fetched from `current_app.config.OPENSEARCH_TIMEOUT`.
-            flush_interval (int): The number of events to queue before a bulk
-                insert is flushed to OpenSearch. Fetched from
+            flush_interval (int): The maximum number of events to queue before
+                a bulk insert is flushed to OpenSearch. Fetched from
                 `current_app.config.OPENSEARCH_FLUSH_INTERVAL` or defaults to
                 `DEFAULT_FLUSH_INTERVAL`.
+            flush_bytes (int): The maximum size in bytes of the queued events
+                before a bulk insert is flushed, from `OPENSEARCH_FLUSH_BYTES`
+                config or `DEFAULT_FLUSH_BYTES`.
+            bulk_concurrency (int): Number of bulk requests sent in parallel,
+                from `OPENSEARCH_BULK_CONCURRENCY` or `DEFAULT_BULK_CONCURRENCY`.
+            bulk_queue_size (int): Number of batches that may wait to be sent
+                before importing blocks, from `OPENSEARCH_BULK_QUEUE_SIZE` or
+                `DEFAULT_BULK_QUEUE_SIZE`.
             import_counter (collections.Counter): A counter for imported events.
-            import_events (list): A temporary store for events before bulk import.
+            import_events (bulk.BulkBatch): Serialized events queued for the
+                next bulk import. Partial updates of an event that is already
+                queued for an update are merged into that update.
             version (str): The version number of the connected OpenSearch
-                instance.
+                instance, cached by the shared client and refreshed by the
+                background health check (`OPENSEARCH_HEALTH_CHECK_INTERVAL`).
             _request_timeout (int): Timeout in seconds for importing events, from
                 `TIMEOUT_FOR_EVENT_IMPORT` config or `DEFAULT_EVENT_IMPORT_TIMEOUT`.
             index_timeout (int): Seconds to wait for an index to become ready,
@@ -268,21 +596,52 @@ class OpenSearchDataStore:
         if self.timeout:
             parameters["timeout"] = self.timeout
 
+        pool_maxsize = current_app.config.get(
+            "OPENSEARCH_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE
+        )
+        if pool_maxsize:
+            parameters["pool_maxsize"] = int(pool_maxsize)
+
         # Add and overwrite parameters provided by the initialization caller.
         parameters.update(kwargs)
 
-        self.client = OpenSearch(opensearch_connection_config, **parameters)
-        os_logger.info(
-            "Connected to OpenSearch node: %s", self.client.transport.get_connection()
+        # The underlying client is shared by all datastore instances in this
+        # process, so creating a datastore does not open new connections nor
+        # query the cluster version again.
+        shared_client = get_shared_client(
+            opensearch_connection_config,
+            parameters,
+            health_check_interval=current_app.config.get(
+                "OPENSEARCH_HEALTH_CHECK_INTERVAL", DEFAULT_HEALTH_CHECK_INTERVAL
+            ),
+        )
+        self.client = shared_client.client
+        os_logger.debug(
+            "Using OpenSearch node: %s", self.client.transport.get_connection()
         )
 
         # Number of events to queue up when bulk inserting events.
         self.flush_interval = current_app.config.get(
             "OPENSEARCH_FLUSH_INTERVAL", self.DEFAULT_FLUSH_INTERVAL
         )
+        self.flush_bytes = current_app.config.get(
+            "OPENSEARCH_FLUSH_BYTES", self.DEFAULT_FLUSH_BYTES
+        )
+        self.bulk_concurrency = current_app.config.get(
+            "OPENSEARCH_BULK_CONCURRENCY", self.DEFAULT_BULK_CONCURRENCY
+        )
+        self.bulk_queue_size = current_app.config.get(
+            "OPENSEARCH_BULK_QUEUE_SIZE", self.DEFAULT_BULK_QUEUE_SIZE
+        )
         self.import_counter = Counter()
-        self.import_events = []
-        self.version = self.client.info().get("version").get("number")
+        self.import_events = bulk.BulkBatch(self.client.transport.serializer)
+        self._bulk_indexer = None
+        self._flushed_events = 0
+        # Indices written to since the last flush, used to invalidate
+        # cached query results.
+        self._written_indices = set()
+        self._failed_events = 0
+        self.version = shared_client.version
         self._request_timeout = current_app.config.get(
             "TIMEOUT_FOR_EVENT_IMPORT", self.DEFAULT_EVENT_IMPORT_TIMEOUT
         )
@@ -1302,9 +1661,375 @@ class OpenSearchDataStore:
             self.client.update(index=searchindex_id, id=event_id, body=doc)
 
         self.client.update(index=searchindex_id, id=event_id, body=update_body)
+        query_cache.bump_index_generation([searchindex_id])
+
+        return None
+
+    def add_tags_to_events(
+        self,
+        index_name: str,
+        event_ids: List[str],
+        tags: List[str],
+        chunk_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Add tags to events in the datastore without reading them first.
+
+        The tags are appended by a painless script in an update_by_query
+        request, tags that an event already has are not added twice and
+        events that already have all the tags are not rewritten. Events that
+        were changed by another update while they were tagged cause version
+        conflicts, the request of their chunk is sent again, up to
+        DEFAULT_CONFLICT_RETRY_LIMIT times.
+
+        Args:
+            index_name: Name of the index the events are stored in.
+            event_ids: List of document IDs of the events to tag.
+            tags: List of tags to add to the events.
+            chunk_size: Optional maximum number of event IDs per request.
+                Defaults to DEFAULT_UPDATE_BY_QUERY_CHUNK_SIZE.
 
+        Returns:
+            Dict with the number of matched ("total"), updated ("updated")
+            and unchanged ("noops") events, the number of events that could
+            not be tagged because of version conflicts after all retries
+            ("version_conflicts") and a list of failures ("failures").
+        """
+        result = {
+            "total": 0,
+            "updated": 0,
+            "noops": 0,
+            "version_conflicts": 0,
+            "failures": [],
+        }
+        if not event_ids or not tags:
+            return result
+
+        chunk_size = chunk_size or self.DEFAULT_UPDATE_BY_QUERY_CHUNK_SIZE
+        for chunk_start in range(0, len(event_ids), chunk_size):
+            chunk = event_ids[chunk_start : chunk_start + chunk_size]
+            body = {
+                "query": {"ids": {"values": chunk}},
+                "script": {
+                    "lang": "painless",
+                    "source": ADD_TAGS_SCRIPT,
+                    "params": {"tags": tags},
+                },
+            }
+            self._update_by_query_with_retries(index_name, body, result)
+
+        # The index is refreshed once, after the last chunk.
+        self.client.indices.refresh(index=index_name)
+        query_cache.bump_index_generation([index_name])
+        return result
+
+    def _get_aggregatable_field(self, index_name: str, field: str) -> Optional[str]:
+        """Returns the name of the field to aggregate and filter values on.
+
+        Text fields are aggregated on their keyword sub field, all other
+        fields, e.g. keyword, ip and numeric fields, as they are.
+
+        Args:
+            index_name: Name of the index.
+            field: Name of the field.
+
+        Returns:
+            Name of the field or None if the field is a text field without a
+            keyword sub field.
+        """
+        index_field_types = field_types.get_field_types(self.client, index_name)
+        if index_field_types.get(field) != "text":
+            return field
+        keyword_field = f"{field}.keyword"
+        if keyword_field in index_field_types:
+            return keyword_field
         return None
 
+    def _iter_source_values(
+        self, index_name: str, field: str, filters: List[Dict]
+    ) -> Generator[Any, None, None]:
+        """Yield the values of a field in the source of the matching events.
+
+        Args:
+            index_name: Name of the index.
+            field: Name of the field.
+            filters: List of OpenSearch query clauses the events must match.
+
+        Yields:
+            Every value of the field, values of list fields one by one.
+        """
+        # pylint: disable=unexpected-keyword-arg
+        result = self.client.search(
+            index=index_name,
+            body={
+                "query": {"bool": {"filter": filters}},
+                "_source": [field],
+                "size": self.DEFAULT_STREAM_LIMIT,
+            },
+            scroll="5m",
+            params={"ignore_unavailable": "true"},
+        )
+        METRICS["search_requests"].labels(type="stream").inc()
+        scroll_id = result.get("_scroll_id")
+        try:
+            while True:
+                hits = result.get("hits", {}).get("hits", [])
+                if not hits:
+                    break
+                for hit in hits:
+                    source = hit.get("_source", {})
+                    values = source.get(field)
+                    if values is None:
+                        values = self._get_nested_value(source, field)
+                    if values is None:
+                        continue
+                    if not isinstance(values, list):
+                        values = [values]
+                    yield from values
+                if not scroll_id:
+                    break
+                result = self.client.scroll(scroll_id=scroll_id, scroll="5m")
+                scroll_id = result.get("_scroll_id")
+        finally:
+            if scroll_id:
+                try:
+                    self.client.clear_scroll(scroll_id=scroll_id)
+                except (NotFoundError, RequestError, TransportError) as e:
+                    os_logger.debug("Unable to clear scroll: %s", str(e))
+
+    @staticmethod
+    def _get_nested_value(source: Dict, field: str) -> Any:
+        """Returns the value of a dotted field name from an object field."""
+        value = source
+        for part in field.split("."):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(part)
+        return value
+
+    def iter_distinct_values(
+        self,
+        index_name: str,
+        field: str,
+        query: Optional[Dict] = None,
+        page_size: Optional[int] = None,
+    ) -> Generator[tuple, None, None]:
+        """Yield the distinct values of a field with their number of events.
+
+        The values are collected with a paginated composite aggregation on the
+        field, or its keyword sub field for text fields. Only one page of
+        values is held in memory at a time, regardless of the number of
+        events.
+
+        Values that are not in the aggregatable field, e.g. strings longer
+        than the ignore_above limit of a keyword field, are read from the
+        events that have them instead. The same is done for all events if a
+        text field has no keyword sub field.
+
+        Args:
+            index_name: Name of the index to aggregate.
+            field: Name of the field.
+            query: Optional OpenSearch query clause to filter the events.
+            page_size: Optional number of buckets per request. Defaults to
+                DEFAULT_DISTINCT_VALUES_PAGE_SIZE.
+
+        Yields:
+            A tuple with the value and the number of events with that value.
+        """
+        page_size = page_size or self.DEFAULT_DISTINCT_VALUES_PAGE_SIZE
+        filters = [{"exists": {"field": field}}]
+        if query:
+            filters.append(query)
+
+        aggregation_field = self._get_aggregatable_field(index_name, field)
+        if aggregation_field is None:
+            yield from Counter(
+                self._iter_source_values(index_name, field, filters)
+            ).items()
+            return
+
+        body = {
+            "size": 0,
+            "query": {"bool": {"filter": filters}},
+            "aggs": {
+                "distinct_values": {
+                    "composite": {
+                        "size": page_size,
+                        "sources": [{"value": {"terms": {"field": aggregation_field}}}],
+                    }
+                }
+            },
+        }
+
+        while True:
+            # pylint: disable=unexpected-keyword-arg
+            response = self.client.search(
+                index=index_name,
+                body=body,
+                params={"ignore_unavailable": "true"},
+            )
+            METRICS["search_requests"].labels(type="composite_aggregation").inc()
+            aggregation = response.get("aggregations", {}).get("distinct_values", {})
+            for bucket in aggregation.get("buckets", []):
+                yield bucket["key"]["value"], bucket["doc_count"]
+
+            after_key = aggregation.get("after_key")
+            if not after_key:
+                break
+            body["aggs"]["distinct_values"]["composite"]["after"] = after_key
+
+        # Values that were ignored when the events were indexed are not part
+        # of the aggregation. Ignored values of keyword fields do not match
+        # the exists query either.
+        ignored_filters = [{"term": {"_ignored": aggregation_field}}]
+        if query:
+            ignored_filters.append(query)
+        ignored_values = Counter(
+            value
+            for value in self._iter_source_values(index_name, field, ignored_filters)
+            if isinstance(value, str) and len(value) > self.KEYWORD_IGNORE_ABOVE
+        )
+        yield from ignored_values.items()
+
+    def update_events_by_values(
+        self,
+        index_name: str,
+        field: str,
+        updates: Dict[str, Dict],
+        query: Optional[Dict] = None,
+        chunk_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Enrich all events that have one of the given values in a field.
+
+        The events are updated server side by a painless script in an
+        update_by_query request that is scoped with a terms query on the
+        values, so no event has to be read by the caller. Events that already
+        carry the enrichment are not rewritten. Events that were changed by
+        another update while they were enriched cause version conflicts, the
+        update of their chunk of values is sent again, up to
+        DEFAULT_CONFLICT_RETRY_LIMIT times.
+
+        Args:
+            index_name: Name of the index the events are stored in.
+            field: Name of the field that holds the values. The terms query
+                runs on the field, or its keyword sub field for text fields.
+            updates: Dict with the update per value. An update is a dict that
+                can contain "attributes" (dict of attributes to set), "tags"
+                (list of tags to add) and "emojis" (list of emojis to add).
+            query: Optional OpenSearch query clause to filter the events.
+            chunk_size: Optional maximum number of values per request.
+                Defaults to DEFAULT_ENRICHMENT_CHUNK_SIZE.
+
+        Returns:
+            Dict with the number of matched ("total"), updated ("updated")
+            and unchanged ("noops") events, the number of events that could
+            not be updated because of version conflicts after all retries
+            ("version_conflicts") and a list of failures ("failures").
+        """
+        result = {
+            "total": 0,
+            "updated": 0,
+            "noops": 0,
+            "version_conflicts": 0,
+            "failures": [],
+        }
+        if not updates:
+            return result
+
+        values = list(updates)
+        chunk_size = chunk_size or self.DEFAULT_ENRICHMENT_CHUNK_SIZE
+        aggregation_field = self._get_aggregatable_field(index_name, field)
+        for chunk_start in range(0, len(values), chunk_size):
+            chunk = values[chunk_start : chunk_start + chunk_size]
+            filters = [self._build_values_filter(field, aggregation_field, chunk)]
+            if query:
+                filters.append(query)
+            body = {
+                "query": {"bool": {"filter": filters}},
+                "script": {
+                    "lang": "painless",
+                    "source": ENRICH_EVENTS_SCRIPT,
+                    "params": {
+                        "field": field,
+                        "updates": {value: updates[value] for value in chunk},
+                    },
+                },
+            }
+            self._update_by_query_with_retries(index_name, body, result)
+
+        # The index is refreshed once, after the last chunk.
+        self.client.indices.refresh(index=index_name)
+        query_cache.bump_index_generation([index_name])
+        return result
+
+    def _update_by_query_with_retries(
+        self, index_name: str, body: Dict, result: Dict[str, Any]
+    ):
+        """Send an update_by_query request, retrying version conflicts.
+
+        Events that were changed by another update while the request ran
+        cause version conflicts, the request is sent again up to
+        DEFAULT_CONFLICT_RETRY_LIMIT times. The script of the request has to
+        skip events that were already updated.
+
+        Args:
+            index_name: Name of the index the events are stored in.
+            body: The update_by_query request body.
+            result: Dict with the number of matched ("total"), updated
+                ("updated") and unchanged ("noops") events, version
+                conflicts ("version_conflicts") and failures ("failures").
+                The results of the request are added to it, version
+                conflicts only if they are left after all retries.
+        """
+        for retry_count in range(self.DEFAULT_CONFLICT_RETRY_LIMIT + 1):
+            if retry_count:
+                # The retry has to see the events as changed by the other
+                # update, updated events are skipped by the script.
+                self.client.indices.refresh(index=index_name)
+            # pylint: disable=unexpected-keyword-arg
+            response = self.client.update_by_query(
+                index=index_name,
+                body=body,
+                conflicts="proceed",
+                request_timeout=self._request_timeout,
+            )
+            METRICS["search_requests"].labels(type="update_by_query").inc()
+            if not retry_count:
+                result["total"] += response.get("total", 0)
+                result["noops"] += response.get("noops", 0)
+            result["updated"] += response.get("updated", 0)
+            result["failures"].extend(response.get("failures", []))
+            if not response.get("version_conflicts"):
+                break
+        result["version_conflicts"] += response.get("version_conflicts", 0)
+
+    def _build_values_filter(
+        self, field: str, aggregation_field: Optional[str], values: List
+    ) -> Dict:
+        """Returns a query clause that matches the events with any of the values.
+
+        The clause can match more events than needed, the enrichment script
+        only changes events that have one of the values.
+
+        Args:
+            field: Name of the field.
+            aggregation_field: Name of the aggregatable field, see
+                _get_aggregatable_field.
+            values: List of values.
+
+        Returns:
+            OpenSearch query clause.
+        """
+        if aggregation_field is None:
+            clauses = [{"match_phrase": {field: value}} for value in values]
+        else:
+            clauses = [{"terms": {aggregation_field: values}}]
+            if any(
+                isinstance(value, str) and len(value) > self.KEYWORD_IGNORE_ABOVE
+                for value in values
+            ):
+                clauses.append({"term": {"_ignored": aggregation_field}})
+        return {"bool": {"should": clauses, "minimum_should_match": 1}}
+
     def create_index(
         self, index_name: str = uuid4().hex, mappings: Optional[Dict] = None
     ):
@@ -1377,24 +2102,37 @@ class OpenSearchDataStore:
     ):
         """Add event to OpenSearch.
 
+        Events are serialized when they are queued and sent in bulk once the
+        queue holds `flush_interval` events or `flush_bytes` bytes. Bulk
+        requests are sent in the background, call flush_queued_events to wait
+        for all of them. Repeated partial updates of the same event are merged
+        into a single update while the event is queued.
+
         Args:
             index_name: Name of the index in OpenSearch
             event: Event dictionary
             event_id: Event OpenSearch ID
-            flush_interval: Number of events to queue up before indexing
+            flush_interval: Number of events to queue up before indexing. An
+                interval of 1 indexes the event right away and waits for
+                the result.
             timeline_id: Optional ID number of a Timeline object this event
                 belongs to. If supplied an additional field will be added to
                 the store indicating the timeline this belongs to.
         """
         if event:
-            for k, v in event.items():
+            # Make sure we have decoded strings in the event dict. Only the
+            # items that are not already strings are replaced.
+            undecoded_keys = [
+                k
+                for k, v in event.items()
+                if not isinstance(k, str) or isinstance(v, bytes)
+            ]
+            for k in undecoded_keys:
+                v = event.pop(k)
                 if not isinstance(k, str):
                     k = codecs.decode(k, "utf8")
-
-                # Make sure we have decoded strings in the event dict.
                 if isinstance(v, bytes):
                     v = codecs.decode(v, "utf8")
-
                 event[k] = v
 
             # Header needed by OpenSearch when bulk inserting.
@@ -1416,118 +2154,165 @@ class OpenSearchDataStore:
             if timeline_id:
                 event["__ts_timeline_id"] = timeline_id
 
-            self.import_events.append(header)
-            self.import_events.append(event)
+            if not self.import_events.add(index_name, header, event):
+                # Partial updates of an event that is already queued for an
+                # update are merged into the queued update.
+                self.import_counter["merged_updates"] += 1
+            self._written_indices.add(index_name)
             self.import_counter["events"] += 1
 
             if not flush_interval:
                 flush_interval = self.flush_interval
+            flush_interval = int(flush_interval)
 
-            if self.import_counter["events"] % int(flush_interval) == 0:
+            if flush_interval == 1:
                 _ = self.flush_queued_events()
-                self.import_events = []
+            elif (
+                len(self.import_events) >= flush_interval
+                or self.import_events.size >= self.flush_bytes
+            ):
+                self._submit_queued_events()
         else:
             # Import the remaining events in the queue.
-            if self.import_events:
-                _ = self.flush_queued_events()
+            _ = self.flush_queued_events()
 
         return self.import_counter["events"]
 
-    def flush_queued_events(self, retry_count=0):
-        """Flush all queued events.
+    def _submit_queued_events(self):
+        """Hand the queued events over to the bulk indexer."""
+        if not self.import_events:
+            return
+
+        batch = self.import_events
+        self.import_events = bulk.BulkBatch(self.client.transport.serializer)
+        for result in self._get_bulk_indexer().submit(batch):
+            self._process_bulk_result(result)
+        query_cache.bump_index_generation(self._written_indices)
+
+    def _get_bulk_indexer(self) -> bulk.BulkIndexer:
+        """Returns the bulk indexer of the datastore, creating it if needed."""
+        if not self._bulk_indexer:
+            self._bulk_indexer = bulk.BulkIndexer(
+                self.client,
+                concurrency=int(self.bulk_concurrency),
+                max_queued_batches=int(self.bulk_queue_size),
+                request_timeout=self._request_timeout,
+                retry_limit=self.DEFAULT_FLUSH_RETRY_LIMIT,
+            )
+        return self._bulk_indexer
+
+    def _process_bulk_result(self, result: Dict):
+        """Record the errors of a finished bulk batch in the error container.
 
-        Returns:
-            dict: A dict object that contains the number of events
-                that were sent to OpenSearch as well as information
-                on whether there were any errors, and what the
-                details of these errors if any.
-            retry_count: optional int indicating whether this is a retry.
+        Args:
+            result: Dict returned by the bulk indexer for a single batch.
         """
-        if not self.import_events:
-            return {}
+        self._flushed_events += result.get("number_of_events", 0)
+        failed_items = result.get("failed_items", [])
+        if not failed_items:
+            return
 
-        return_dict = {
-            "number_of_events": len(self.import_events) / 2,
-            "total_events": self.import_counter["events"],
-        }
+        self._failed_events += len(failed_items)
 
-        try:
-            # pylint: disable=unexpected-keyword-arg
-            results = self.client.bulk(
-                body=self.import_events, timeout=self._request_timeout
-            )
-        except (ConnectionTimeout, socket.timeout):
-            if retry_count >= self.DEFAULT_FLUSH_RETRY_LIMIT:
-                os_logger.error(
-                    "Unable to add events, reached recount max.", exc_info=True
-                )
-                return {}
+        os_logger.error("Errors while attempting to upload events.")
+        for item in failed_items:
+            # The item is keyed by the action, e.g. "index" or "update".
+            index = next(iter(item.values()), {})
+            index_name = index.get("_index", "N/A")
 
-            os_logger.error(
-                "Unable to add events (retry {:d}/{:d})".format(
-                    retry_count, self.DEFAULT_FLUSH_RETRY_LIMIT
-                )
+            _ = self._error_container.setdefault(
+                index_name,
+                {
+                    "errors": [],
+                    "types": Counter(),
+                    "details": Counter(),
+                    "document_ids": [],
+                },
             )
-            return self.flush_queued_events(retry_count + 1)
-
-        errors_in_upload = results.get("errors", False)
-        return_dict["errors_in_upload"] = errors_in_upload
 
-        if errors_in_upload:
-            items = results.get("items", [])
-            return_dict["errors"] = []
+            error_counter = self._error_container[index_name]["types"]
+            error_detail_counter = self._error_container[index_name]["details"]
+            error_list = self._error_container[index_name]["errors"]
 
-            os_logger.error("Errors while attempting to upload events.")
-            for item in items:
-                index = item.get("index", {})
-                index_name = index.get("_index", "N/A")
+            error = index.get("error", {})
+            status_code = index.get("status", 0)
+            doc_id = index.get("_id", "(unable to get doc id)")
+            caused_by = error.get("caused_by", {})
 
-                _ = self._error_container.setdefault(
-                    index_name, {"errors": [], "types": Counter(), "details": Counter()}
-                )
+            caused_reason = caused_by.get("reason", "Unknown Detailed Reason")
 
-                error_counter = self._error_container[index_name]["types"]
-                error_detail_counter = self._error_container[index_name]["details"]
-                error_list = self._error_container[index_name]["errors"]
+            error_counter[error.get("type")] += 1
+            detail_msg = "{:s}/{:s}".format(
+                caused_by.get("type", "Unknown Detailed Type"),
+                " ".join(caused_reason.split()[:5]),
+            )
+            error_detail_counter[detail_msg] += 1
 
-                error = index.get("error", {})
-                status_code = index.get("status", 0)
-                doc_id = index.get("_id", "(unable to get doc id)")
-                caused_by = error.get("caused_by", {})
+            error_msg = "<{:s}> {:s} [{:s}/{:s}]".format(
+                error.get("type", "Unknown Type"),
+                error.get("reason", "No reason given"),
+                caused_by.get("type", "Unknown Type"),
+                caused_reason,
+            )
+            error_list.append(error_msg)
+            if "_id" in index:
+                self._error_container[index_name]["document_ids"].append(index["_id"])
+            try:
+                os_logger.error(
+                    "Unable to upload document: {:s} to index {:s} - "
+                    "[{:d}] {:s}".format(doc_id, index_name, status_code, error_msg)
+                )
+            # We need to catch all exceptions here, since this is a crucial
+            # call that we do not want to break operation.
+            except Exception:  # pylint: disable=broad-except
+                os_logger.error(
+                    "Unable to upload document, and unable to log the error itself.",
+                    exc_info=True,
+                )
 
-                caused_reason = caused_by.get("reason", "Unknown Detailed Reason")
+    def flush_queued_events(self):
+        """Flush all queued events and wait for all bulk requests to finish.
 
-                error_counter[error.get("type")] += 1
-                detail_msg = "{:s}/{:s}".format(
-                    caused_by.get("type", "Unknown Detailed Type"),
-                    " ".join(caused_reason.split()[:5]),
-                )
-                error_detail_counter[detail_msg] += 1
+        Returns:
+            dict: A dict object that contains the number of events
+                that were sent to OpenSearch as well as information
+                on whether there were any errors, and what the
+                details of these errors if any.
+        """
+        if not self.import_events and not self._bulk_indexer:
+            return {}
 
-                error_msg = "<{:s}> {:s} [{:s}/{:s}]".format(
-                    error.get("type", "Unknown Type"),
-                    error.get("reason", "No reason given"),
-                    caused_by.get("type", "Unknown Type"),
-                    caused_reason,
-                )
-                error_list.append(error_msg)
-                try:
-                    os_logger.error(
-                        "Unable to upload document: {:s} to index {:s} - "
-                        "[{:d}] {:s}".format(doc_id, index_name, status_code, error_msg)
-                    )
-                # We need to catch all exceptions here, since this is a crucial
-                # call that we do not want to break operation.
-                except Exception:  # pylint: disable=broad-except
-                    os_logger.error(
-                        "Unable to upload document, and unable to log the "
-                        "error itself.",
-                        exc_info=True,
-                    )
+        indexer = self._get_bulk_indexer()
+        try:
+            if indexer.has_pending():
+                self._submit_queued_events()
+                results = indexer.wait()
+            else:
+                # Nothing is in flight, the queued events are sent from this
+                # thread without starting any workers, e.g. when single
+                # events are indexed with a flush interval of 1.
+                batch = self.import_events
+                self.import_events = bulk.BulkBatch(self.client.transport.serializer)
+                results = [indexer.send(batch)] if batch else []
+            for result in results:
+                self._process_bulk_result(result)
+        finally:
+            self._bulk_indexer.close()
+            self._bulk_indexer = None
 
-        return_dict["error_container"] = self._error_container
+        # Results cached while the last batches were in flight are stale.
+        query_cache.bump_index_generation(self._written_indices)
+        self._written_indices = set()
 
-        self.import_events = []
+        return_dict = {
+            "number_of_events": self._flushed_events,
+            "total_events": self.import_counter["events"],
+            "merged_updates": self.import_counter["merged_updates"],
+            "errors_in_upload": self._failed_events > 0,
+            "error_container": self._error_container,
+        }
+        self._flushed_events = 0
+        self._failed_events = 0
         return return_dict
 
     def _create_pit_for_slice(
@@ -1634,8 +2419,10 @@ class OpenSearchDataStore:
                 "size": page_size,
                 "sort": sort_criteria,
                 "pit": {"id": pit_id, "keep_alive": pit_keep_alive},
-                "slice": {"id": slice_id, "max": num_slices},
             }
+            # OpenSearch rejects a slice clause with a single slice.
+            if num_slices > 1:
+                query["slice"] = {"id": slice_id, "max": num_slices}
             if search_after_params:
                 query["search_after"] = search_after_params
 
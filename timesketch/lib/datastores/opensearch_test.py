@@ -0,0 +1,504 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the OpenSearch datastore."""
+
+import json
+import threading
+from unittest import mock
+
+from opensearchpy.serializer import JSONSerializer
+
+from timesketch.lib.datastores import field_types
+from timesketch.lib.datastores import opensearch
+from timesketch.lib.testlib import BaseTest
+
+
+# pylint: disable=unused-argument
+def _mock_opensearch_client(*args, **kwargs):
+    """Returns a mocked OpenSearch client."""
+    client = mock.MagicMock()
+    client.info.return_value = {"version": {"number": "2.19.0"}}
+    client.transport.connection_pool.connections = []
+    client.transport.connection_pool.dead.qsize.return_value = 0
+    client.transport.serializer = JSONSerializer()
+    client.bulk.return_value = {"errors": False, "items": []}
+    return client
+
+
+class TestSharedClient(BaseTest):
+    """Tests for the process-wide OpenSearch client."""
+
+    def setUp(self):
+        super().setUp()
+        opensearch.reset_shared_clients()
+        self.app.config["OPENSEARCH_HEALTH_CHECK_INTERVAL"] = 0
+
+    def tearDown(self):
+        opensearch.reset_shared_clients()
+        super().tearDown()
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_client_is_shared(self, mock_client_class):
+        """Test that datastores share one client and one version lookup."""
+        datastore_1 = opensearch.OpenSearchDataStore()
+        datastore_2 = opensearch.OpenSearchDataStore()
+
+        self.assertIs(datastore_1.client, datastore_2.client)
+        self.assertEqual(datastore_1.version, "2.19.0")
+        self.assertEqual(mock_client_class.call_count, 1)
+        self.assertEqual(datastore_1.client.info.call_count, 1)
+
+        # Per instance import state must not be shared.
+        self.assertIsNot(datastore_1.import_events, datastore_2.import_events)
+
+        # Different client parameters get a separate client.
+        datastore_3 = opensearch.OpenSearchDataStore(pool_maxsize=60)
+        self.assertIsNot(datastore_1.client, datastore_3.client)
+        self.assertEqual(mock_client_class.call_count, 2)
+        _, kwargs = mock_client_class.call_args
+        self.assertEqual(kwargs.get("pool_maxsize"), 60)
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_unhealthy_client_is_replaced(self, mock_client_class):
+        """Test that a client failing its health check is re-created."""
+        datastore = opensearch.OpenSearchDataStore()
+        shared_client = list(
+            opensearch._shared_clients.values()  # pylint: disable=protected-access
+        )[0]
+
+        shared_client.client.info.side_effect = ConnectionError("down")
+        self.assertFalse(shared_client.check_health())
+
+        new_datastore = opensearch.OpenSearchDataStore()
+        self.assertIsNot(datastore.client, new_datastore.client)
+        self.assertEqual(mock_client_class.call_count, 2)
+        shared_client.client.close.assert_called_once()
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_client_not_reused_after_fork(self, mock_client_class):
+        """Test that a client created by another process is not reused."""
+        datastore = opensearch.OpenSearchDataStore()
+        # pylint: disable=protected-access
+        for shared_client in opensearch._shared_clients.values():
+            shared_client.pid = -1
+
+        new_datastore = opensearch.OpenSearchDataStore()
+        self.assertIsNot(datastore.client, new_datastore.client)
+        self.assertEqual(mock_client_class.call_count, 2)
+
+    def test_slow_cluster_does_not_block_other_clients(self):
+        """Test that the version lookup runs without holding the lock."""
+        probe_started = threading.Event()
+        release_probe = threading.Event()
+
+        def _client(hosts, **kwargs):
+            client = _mock_opensearch_client()
+            if kwargs.get("pool_maxsize") == 1:
+
+                def _slow_info():
+                    probe_started.set()
+                    release_probe.wait(5)
+                    return {"version": {"number": "2.19.0"}}
+
+                client.info.side_effect = _slow_info
+            return client
+
+        with mock.patch(
+            "timesketch.lib.datastores.opensearch.OpenSearch", side_effect=_client
+        ):
+            slow_thread = threading.Thread(
+                target=opensearch.get_shared_client,
+                args=([{"host": "slow"}], {"pool_maxsize": 1}, 0),
+            )
+            slow_thread.start()
+            self.assertTrue(probe_started.wait(5))
+            fast_thread = threading.Thread(
+                target=opensearch.get_shared_client,
+                args=([{"host": "fast"}], {"pool_maxsize": 2}, 0),
+            )
+            fast_thread.start()
+            fast_thread.join(2)
+            fast_client_created = not fast_thread.is_alive()
+            release_probe.set()
+            slow_thread.join()
+            fast_thread.join()
+        self.assertTrue(fast_client_created)
+        self.assertEqual(
+            len(opensearch._shared_clients),  # pylint: disable=protected-access
+            2,
+        )
+
+
+class TestImportEvent(BaseTest):
+    """Tests for the bulk import of events."""
+
+    def setUp(self):
+        super().setUp()
+        opensearch.reset_shared_clients()
+        self.app.config["OPENSEARCH_HEALTH_CHECK_INTERVAL"] = 0
+
+    def tearDown(self):
+        opensearch.reset_shared_clients()
+        super().tearDown()
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_flush_by_bytes(self, _):
+        """Test that batches are flushed when the byte budget is reached."""
+        datastore = opensearch.OpenSearchDataStore()
+        datastore.flush_bytes = 200
+        for i in range(10):
+            datastore.import_event("test", {"message": "x" * 50, "i": i})
+
+        result = datastore.flush_queued_events()
+        self.assertGreater(datastore.client.bulk.call_count, 1)
+        self.assertEqual(result["number_of_events"], 10)
+        self.assertEqual(result["total_events"], 10)
+        self.assertFalse(result["errors_in_upload"])
+
+        sent_events = 0
+        for call in datastore.client.bulk.call_args_list:
+            body = call.kwargs["body"]
+            self.assertLessEqual(len(body), 200 + 100)
+            sent_events += len(body.splitlines()) // 2
+        self.assertEqual(sent_events, 10)
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_updates_are_merged(self, _):
+        """Test that queued partial updates of an event are merged."""
+        datastore = opensearch.OpenSearchDataStore()
+        datastore.import_event("test", {"tag": ["a"]}, event_id="1")
+        datastore.import_event("test", {b"comment": b"foo"}, event_id="1")
+        datastore.import_event("test", {"tag": ["b"]}, event_id="2")
+
+        result = datastore.flush_queued_events()
+        self.assertEqual(result["number_of_events"], 2)
+        self.assertEqual(result["total_events"], 3)
+        self.assertEqual(result["merged_updates"], 1)
+
+        body = datastore.client.bulk.call_args.kwargs["body"]
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(lines[1], {"doc": {"tag": ["a"], "comment": "foo"}})
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_errors_are_recorded(self, _):
+        """Test that failed items end up in the error container."""
+        datastore = opensearch.OpenSearchDataStore()
+        datastore.client.bulk.return_value = {
+            "errors": True,
+            "items": [
+                {"update": {"_index": "test", "_id": "1", "status": 201}},
+                {
+                    "update": {
+                        "_index": "test",
+                        "_id": "2",
+                        "status": 400,
+                        "error": {
+                            "type": "mapper_parsing_exception",
+                            "reason": "failed to parse",
+                        },
+                    }
+                },
+            ],
+        }
+        datastore.import_event("test", {"tag": ["a"]}, event_id="1")
+        datastore.import_event("test", {"tag": ["b"]}, event_id="2")
+
+        result = datastore.flush_queued_events()
+        self.assertTrue(result["errors_in_upload"])
+        container = result["error_container"]["test"]
+        self.assertEqual(len(container["errors"]), 1)
+        self.assertEqual(container["types"]["mapper_parsing_exception"], 1)
+        self.assertEqual(container["document_ids"], ["2"])
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_single_event_is_sent_without_workers(self, _):
+        """Test that a flush interval of 1 sends from the calling thread."""
+        datastore = opensearch.OpenSearchDataStore()
+        with mock.patch.object(
+            opensearch.bulk.futures, "ThreadPoolExecutor"
+        ) as mock_executor:
+            for i in range(3):
+                datastore.import_event("test", {"i": i}, flush_interval=1)
+        mock_executor.assert_not_called()
+        self.assertEqual(datastore.client.bulk.call_count, 3)
+
+
+class TestAddTagsToEvents(BaseTest):
+    """Tests for tagging events with update_by_query."""
+
+    def setUp(self):
+        super().setUp()
+        opensearch.reset_shared_clients()
+        self.app.config["OPENSEARCH_HEALTH_CHECK_INTERVAL"] = 0
+
+    def tearDown(self):
+        opensearch.reset_shared_clients()
+        super().tearDown()
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_add_tags_in_chunks(self, _):
+        """Test that event IDs are sent in chunks and results are summed."""
+        datastore = opensearch.OpenSearchDataStore()
+        datastore.client.update_by_query.return_value = {
+            "total": 2,
+            "updated": 1,
+            "noops": 1,
+            "version_conflicts": 0,
+            "failures": [],
+        }
+
+        result = datastore.add_tags_to_events(
+            "test", ["1", "2", "3", "4"], ["foo", "bar"], chunk_size=2
+        )
+        self.assertEqual(datastore.client.update_by_query.call_count, 2)
+        for call in datastore.client.update_by_query.call_args_list:
+            self.assertNotIn("refresh", call.kwargs)
+        datastore.client.indices.refresh.assert_called_once_with(index="test")
+        self.assertEqual(result["total"], 4)
+        self.assertEqual(result["updated"], 2)
+        self.assertEqual(result["noops"], 2)
+
+        body = datastore.client.update_by_query.call_args_list[0].kwargs["body"]
+        self.assertEqual(body["query"], {"ids": {"values": ["1", "2"]}})
+        self.assertEqual(body["script"]["params"], {"tags": ["foo", "bar"]})
+        self.assertEqual(body["script"]["source"], opensearch.ADD_TAGS_SCRIPT)
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_add_tags_version_conflicts_are_retried(self, _):
+        """Test that tagging with version conflicts is sent again."""
+        datastore = opensearch.OpenSearchDataStore()
+        conflict = {"total": 2, "updated": 1, "noops": 0, "version_conflicts": 1}
+        datastore.client.update_by_query.side_effect = [
+            conflict,
+            {"total": 1, "updated": 1, "noops": 0, "version_conflicts": 0},
+        ]
+
+        result = datastore.add_tags_to_events("test", ["1", "2"], ["foo"])
+        self.assertEqual(datastore.client.update_by_query.call_count, 2)
+        self.assertEqual(result["total"], 2)
+        self.assertEqual(result["updated"], 2)
+        self.assertEqual(result["version_conflicts"], 0)
+
+        datastore.client.update_by_query.reset_mock()
+        datastore.client.update_by_query.side_effect = None
+        datastore.client.update_by_query.return_value = conflict
+        result = datastore.add_tags_to_events("test", ["1", "2"], ["foo"])
+        self.assertEqual(
+            datastore.client.update_by_query.call_count,
+            datastore.DEFAULT_CONFLICT_RETRY_LIMIT + 1,
+        )
+        self.assertEqual(result["version_conflicts"], 1)
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_add_no_tags(self, _):
+        """Test that nothing is sent without tags."""
+        datastore = opensearch.OpenSearchDataStore()
+        result = datastore.add_tags_to_events("test", ["1"], [])
+        datastore.client.update_by_query.assert_not_called()
+        self.assertEqual(result["total"], 0)
+
+
+class TestDistinctValues(BaseTest):
+    """Tests for collecting and enriching the distinct values of a field."""
+
+    LONG_URL = "https://example.com/" + "a" * 300
+
+    def setUp(self):
+        super().setUp()
+        opensearch.reset_shared_clients()
+        field_types.clear()
+        self.app.config["OPENSEARCH_HEALTH_CHECK_INTERVAL"] = 0
+
+    def tearDown(self):
+        opensearch.reset_shared_clients()
+        field_types.clear()
+        super().tearDown()
+
+    @staticmethod
+    def _set_mapping(datastore, field_mapping):
+        """Set the mapping of the url field of the test index."""
+        datastore.client.indices.get_mapping.return_value = {
+            "test": {"mappings": {"properties": {"url": field_mapping}}}
+        }
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_long_values_are_streamed(self, _):
+        """Test that values above the keyword limit are not missed."""
+        datastore = opensearch.OpenSearchDataStore()
+        self._set_mapping(
+            datastore,
+            {
+                "type": "text",
+                "fields": {"keyword": {"type": "keyword", "ignore_above": 256}},
+            },
+        )
+        datastore.client.search.side_effect = [
+            {
+                "aggregations": {
+                    "distinct_values": {
+                        "buckets": [
+                            {"key": {"value": "https://example.com/"}, "doc_count": 2}
+                        ]
+                    }
+                }
+            },
+            {
+                "_scroll_id": "scroll",
+                "hits": {
+                    "hits": [
+                        {"_source": {"url": self.LONG_URL}},
+                        {"_source": {"url": self.LONG_URL}},
+                    ]
+                },
+            },
+        ]
+        datastore.client.scroll.return_value = {"_scroll_id": "scroll", "hits": {}}
+
+        values = dict(datastore.iter_distinct_values("test", "url"))
+        self.assertEqual(values, {"https://example.com/": 2, self.LONG_URL: 2})
+
+        aggregation_body = datastore.client.search.call_args_list[0].kwargs["body"]
+        sources = aggregation_body["aggs"]["distinct_values"]["composite"]["sources"]
+        self.assertEqual(sources, [{"value": {"terms": {"field": "url.keyword"}}}])
+        stream_body = datastore.client.search.call_args_list[1].kwargs["body"]
+        self.assertIn(
+            {"term": {"_ignored": "url.keyword"}},
+            stream_body["query"]["bool"]["filter"],
+        )
+        datastore.client.clear_scroll.assert_called_once_with(scroll_id="scroll")
+
+        datastore.client.update_by_query.return_value = {"total": 3, "updated": 3}
+        result = datastore.update_events_by_values(
+            "test",
+            "url",
+            {
+                "https://example.com/": {"tags": ["foo"]},
+                self.LONG_URL: {"tags": ["foo"]},
+            },
+        )
+        self.assertEqual(result["updated"], 3)
+        body = datastore.client.update_by_query.call_args.kwargs["body"]
+        clauses = body["query"]["bool"]["filter"][0]["bool"]["should"]
+        self.assertEqual(
+            clauses,
+            [
+                {"terms": {"url.keyword": ["https://example.com/", self.LONG_URL]}},
+                {"term": {"_ignored": "url.keyword"}},
+            ],
+        )
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_keyword_field_is_used_as_is(self, _):
+        """Test that keyword fields are aggregated without a sub field."""
+        datastore = opensearch.OpenSearchDataStore()
+        self._set_mapping(datastore, {"type": "keyword"})
+        datastore.client.search.side_effect = [
+            {"aggregations": {"distinct_values": {"buckets": []}}},
+            {"hits": {"hits": []}},
+        ]
+
+        self.assertEqual(list(datastore.iter_distinct_values("test", "url")), [])
+        aggregation_body = datastore.client.search.call_args_list[0].kwargs["body"]
+        sources = aggregation_body["aggs"]["distinct_values"]["composite"]["sources"]
+        self.assertEqual(sources, [{"value": {"terms": {"field": "url"}}}])
+
+        datastore.client.update_by_query.return_value = {"total": 1, "updated": 1}
+        datastore.update_events_by_values("test", "url", {"foo": {"tags": ["bar"]}})
+        body = datastore.client.update_by_query.call_args.kwargs["body"]
+        clauses = body["query"]["bool"]["filter"][0]["bool"]["should"]
+        self.assertEqual(clauses, [{"terms": {"url": ["foo"]}}])
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_version_conflicts_are_retried(self, _):
+        """Test that updates with version conflicts are sent again."""
+        datastore = opensearch.OpenSearchDataStore()
+        self._set_mapping(datastore, {"type": "keyword"})
+        conflict = {"total": 3, "updated": 1, "noops": 1, "version_conflicts": 1}
+        datastore.client.update_by_query.side_effect = [
+            conflict,
+            {"total": 2, "updated": 0, "noops": 1, "version_conflicts": 1},
+            {"total": 2, "updated": 1, "noops": 1, "version_conflicts": 0},
+        ]
+
+        result = datastore.update_events_by_values("test", "url", {"foo": {}})
+        self.assertEqual(datastore.client.update_by_query.call_count, 3)
+        self.assertEqual(result["total"], 3)
+        self.assertEqual(result["updated"], 2)
+        self.assertEqual(result["noops"], 1)
+        self.assertEqual(result["version_conflicts"], 0)
+
+        datastore.client.update_by_query.reset_mock()
+        datastore.client.update_by_query.side_effect = None
+        datastore.client.update_by_query.return_value = conflict
+        result = datastore.update_events_by_values("test", "url", {"foo": {}})
+        self.assertEqual(
+            datastore.client.update_by_query.call_count,
+            datastore.DEFAULT_CONFLICT_RETRY_LIMIT + 1,
+        )
+        self.assertEqual(result["version_conflicts"], 1)
+
+    @mock.patch(
+        "timesketch.lib.datastores.opensearch.OpenSearch",
+        side_effect=_mock_opensearch_client,
+    )
+    def test_text_field_without_keyword(self, _):
+        """Test that values of text fields without keyword are streamed."""
+        datastore = opensearch.OpenSearchDataStore()
+        self._set_mapping(datastore, {"type": "text"})
+        datastore.client.search.return_value = {
+            "hits": {"hits": [{"_source": {"url": ["foo", "bar"]}}]}
+        }
+
+        values = dict(datastore.iter_distinct_values("test", "url"))
+        self.assertEqual(values, {"foo": 1, "bar": 1})
+        datastore.client.search.assert_called_once()
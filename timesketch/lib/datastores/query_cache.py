@@ -0,0 +1,337 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Shared cache for the results of datastore queries.
+
+Results are stored in Redis so that all web workers share them. Every index
+has a generation counter that is increased whenever events in the index are
+written to. The generations of the queried indices are part of the cache key,
+which means that a write to an index makes all cached results of queries on
+that index unreachable, they expire through their TTL.
+
+Writes only become searchable after the next refresh of the index. Results
+cached between a write and that refresh miss the write, so the generation is
+increased once more when it is first read after QUERY_CACHE_REFRESH_DELAY
+seconds have passed since the last write.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Iterable, List, Optional
+
+import prometheus_client
+import redis
+from flask import current_app
+
+from timesketch.lib.definitions import METRICS_NAMESPACE
+
+
+logger = logging.getLogger("timesketch.opensearch.query_cache")
+
+METRICS = {
+    "query_cache_lookups": prometheus_client.Counter(
+        "query_cache_lookups",
+        "Number of query result cache lookups per result (hit, miss, error)",
+        ["result"],
+        namespace=METRICS_NAMESPACE,
+    ),
+    "query_cache_evictions": prometheus_client.Counter(
+        "query_cache_evictions",
+        "Number of query results evicted because the cache was full",
+        namespace=METRICS_NAMESPACE,
+    ),
+}
+
+KEY_PREFIX = "timesketch:query_cache"
+
+# Default values for the configuration of the cache.
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_ENTRY_SIZE = 5 * 1024 * 1024
+# Seconds after which writes are searchable, the default index refresh
+# interval of OpenSearch is one second.
+DEFAULT_REFRESH_DELAY = 2
+
+_redis_clients = {}
+_redis_clients_lock = threading.Lock()
+
+
+def get_redis_client() -> Optional[redis.Redis]:
+    """Returns a shared Redis client for caches or None if not configured.
+
+    Returns:
+        A Redis client or None.
+    """
+    redis_url = current_app.config.get("QUERY_CACHE_REDIS_URL")
+    if not redis_url:
+        redis_url = current_app.config.get("CELERY_BROKER_URL")
+    if not redis_url:
+        return None
+
+    with _redis_clients_lock:
+        client = _redis_clients.get(redis_url)
+        if client is None:
+            client = redis.from_url(redis_url, socket_timeout=1)
+            _redis_clients[redis_url] = client
+    return client
+
+
+def is_enabled() -> bool:
+    """Returns whether the query cache is enabled in the configuration."""
+    return bool(current_app.config.get("QUERY_CACHE_ENABLED", False))
+
+
+def generations_enabled() -> bool:
+    """Returns whether a cache that depends on index generations is enabled."""
+    return (
+        is_enabled()
+        or bool(current_app.config.get("SKETCH_SNAPSHOT_ENABLED", False))
+        or bool(current_app.config.get("AGGREGATION_RESULT_CACHE_ENABLED", False))
+    )
+
+
+def _generation_key(index_name: str) -> str:
+    """Returns the Redis key of the generation counter of an index."""
+    return f"{KEY_PREFIX}:generation:{index_name}"
+
+
+def _written_key(index_name: str) -> str:
+    """Returns the Redis key of the time of the last write to an index."""
+    return f"{KEY_PREFIX}:written:{index_name}"
+
+
+def get_index_generations(client: redis.Redis, index_names: List[str]) -> List[int]:
+    """Returns the current generation counter of each index.
+
+    The generation of an index that was written to more than the refresh
+    delay ago, and not read since, is increased first. Results cached before
+    the writes became searchable are not served anymore.
+
+    Args:
+        client: The Redis client.
+        index_names: List of index names.
+
+    Returns:
+        List of generation counters, in the same order as the indices.
+    """
+    if not index_names:
+        return []
+    refresh_delay = float(
+        current_app.config.get("QUERY_CACHE_REFRESH_DELAY", DEFAULT_REFRESH_DELAY)
+    )
+    values = client.mget(
+        [_generation_key(x) for x in index_names]
+        + [_written_key(x) for x in index_names]
+    )
+    generations = [int(value or 0) for value in values[: len(index_names)]]
+    written_times = values[len(index_names) :]
+
+    now = time.time()
+    for position, (index_name, written_at) in enumerate(
+        zip(index_names, written_times)
+    ):
+        if written_at is None or now - float(written_at) < refresh_delay:
+            continue
+        # Only the process that removes the write time increases the
+        # generation, the others read the increased generation.
+        if client.delete(_written_key(index_name)):
+            generations[position] = int(client.incr(_generation_key(index_name)))
+        else:
+            generations[position] = int(client.get(_generation_key(index_name)) or 0)
+    return generations
+
+
+def bump_index_generation(index_names: Iterable[str]):
+    """Increase the generation counter of indices that were written to.
+
+    The time of the write is recorded, so that the generation is increased
+    again once the write is searchable (see get_index_generations).
+
+    Args:
+        index_names: Names of the indices that were written to.
+    """
+    index_names = sorted(set(index_names))
+    if not index_names or not generations_enabled():
+        return
+
+    try:
+        client = get_redis_client()
+        if client is None:
+            return
+        written_at = str(time.time())
+        pipeline = client.pipeline(transaction=False)
+        for index_name in index_names:
+            pipeline.incr(_generation_key(index_name))
+            pipeline.set(_written_key(index_name), written_at)
+        pipeline.execute()
+    except redis.exceptions.RedisError as e:
+        logger.warning(
+            "Unable to invalidate cached queries for indices [%s]: %s",
+            ", ".join(index_names),
+            str(e),
+        )
+
+
+class QueryCache:
+    """Cache for the results of datastore searches."""
+
+    def __init__(self):
+        """Initialize the cache from the configuration."""
+        self.enabled = is_enabled()
+        self.ttl = int(current_app.config.get("QUERY_CACHE_TTL", DEFAULT_TTL))
+        self.max_entries = int(
+            current_app.config.get("QUERY_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)
+        )
+        self.max_entry_size = int(
+            current_app.config.get("QUERY_CACHE_MAX_ENTRY_SIZE", DEFAULT_MAX_ENTRY_SIZE)
+        )
+        self._client = None
+        if self.enabled:
+            try:
+                self._client = get_redis_client()
+            except (ValueError, redis.exceptions.RedisError) as e:
+                logger.warning("Unable to set up the query cache: %s", str(e))
+            if self._client is None:
+                self.enabled = False
+
+    def _get_generations(self, index_names: List[str]) -> List[int]:
+        """Returns the current generation counter of each index.
+
+        Args:
+            index_names: List of index names.
+
+        Returns:
+            List of generation counters, in the same order as the indices.
+        """
+        return get_index_generations(self._client, index_names)
+
+    def build_key(self, indices: List[str], **query_parameters) -> Optional[str]:
+        """Build the cache key of a query.
+
+        Args:
+            indices: List of index names the query runs on.
+            **query_parameters: All other parameters that determine the result
+                of the query, e.g. query string, filter, DSL and timeline IDs.
+
+        Returns:
+            The cache key or None if the cache is disabled or unavailable.
+        """
+        if not self.enabled:
+            return None
+
+        indices = sorted(set(indices or []))
+        try:
+            generations = self._get_generations(indices)
+        except redis.exceptions.RedisError as e:
+            logger.warning("Unable to read index generations: %s", str(e))
+            METRICS["query_cache_lookups"].labels(result="error").inc()
+            return None
+
+        key_data = {
+            "indices": dict(zip(indices, generations)),
+            "query": query_parameters,
+        }
+        try:
+            key_string = json.dumps(key_data, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+        digest = hashlib.sha256(key_string.encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}:result:{digest}"
+
+    def get(self, key: Optional[str]) -> Optional[Any]:
+        """Returns a cached query result.
+
+        Args:
+            key: The cache key as returned by build_key.
+
+        Returns:
+            The cached result or None if there is no cached result.
+        """
+        if not key:
+            return None
+
+        try:
+            value = self._client.get(key)
+        except redis.exceptions.RedisError as e:
+            logger.warning("Unable to read from the query cache: %s", str(e))
+            METRICS["query_cache_lookups"].labels(result="error").inc()
+            return None
+
+        if value is None:
+            METRICS["query_cache_lookups"].labels(result="miss").inc()
+            return None
+
+        METRICS["query_cache_lookups"].labels(result="hit").inc()
+        return json.loads(value)
+
+    def set(self, key: Optional[str], result: Any):
+        """Store a query result in the cache.
+
+        Results larger than QUERY_CACHE_MAX_ENTRY_SIZE are not stored. When
+        the cache holds more than QUERY_CACHE_MAX_ENTRIES results, the oldest
+        results are evicted.
+
+        Args:
+            key: The cache key as returned by build_key.
+            result: The JSON serializable query result.
+        """
+        if not key:
+            return
+
+        value = json.dumps(result)
+        if len(value) > self.max_entry_size:
+            return
+
+        entries_key = f"{KEY_PREFIX}:entries"
+        now = time.time()
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            pipeline.set(key, value, ex=self.ttl)
+            pipeline.zadd(entries_key, {key: now})
+            # Entries older than the TTL have expired already.
+            pipeline.zremrangebyscore(entries_key, "-inf", now - self.ttl)
+            pipeline.zcard(entries_key)
+            entry_count = pipeline.execute()[-1]
+
+            excess = entry_count - self.max_entries
+            if excess > 0:
+                evicted = self._client.zpopmin(entries_key, excess)
+                evicted_keys = [evicted_key for evicted_key, _ in evicted]
+                if evicted_keys:
+                    self._client.delete(*evicted_keys)
+                METRICS["query_cache_evictions"].inc(len(evicted_keys))
+        except redis.exceptions.RedisError as e:
+            logger.warning("Unable to write to the query cache: %s", str(e))
+
+    def get_or_search(self, key: Optional[str], search_function, *args, **kwargs):
+        """Returns a cached result or runs the search and caches its result.
+
+        Args:
+            key: The cache key as returned by build_key.
+            search_function: Function that runs the query.
+            *args: Arguments to the search function.
+            **kwargs: Keyword arguments to the search function.
+
+        Returns:
+            The result of the query.
+        """
+        result = self.get(key)
+        if result is not None:
+            return result
+
+        result = search_function(*args, **kwargs)
+        self.set(key, result)
+        return result
@@ -0,0 +1,185 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the query result cache."""
+
+from unittest import mock
+
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.testlib import BaseTest
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the Redis commands used by the cache."""
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.hashes = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        self.values[key] = value.encode("utf-8")
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def delete(self, *keys):
+        deleted = [self.values.pop(key, None) for key in keys]
+        return len([value for value in deleted if value is not None])
+
+    def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    def hset(self, key, mapping):
+        values = {field: value.encode("utf-8") for field, value in mapping.items()}
+        self.hashes.setdefault(key, {}).update(values)
+
+    def expire(self, key, seconds):  # pylint: disable=unused-argument
+        return key in self.hashes
+
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    def zremrangebyscore(self, key, minimum, maximum):
+        del minimum
+        entries = self.sorted_sets.get(key, {})
+        for member, score in list(entries.items()):
+            if score <= maximum:
+                del entries[member]
+
+    def zcard(self, key):
+        return len(self.sorted_sets.get(key, {}))
+
+    def zpopmin(self, key, count):
+        entries = self.sorted_sets.get(key, {})
+        popped = sorted(entries.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del entries[member]
+        return popped
+
+    def pipeline(self, transaction=True):  # pylint: disable=unused-argument
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Pipeline that runs the commands directly against the fake client."""
+
+    def __init__(self, client):
+        self._client = client
+        self._results = []
+
+    def __getattr__(self, name):
+        def _command(*args, **kwargs):
+            self._results.append(getattr(self._client, name)(*args, **kwargs))
+
+        return _command
+
+    def execute(self):
+        results, self._results = self._results, []
+        return results
+
+
+class TestQueryCache(BaseTest):
+    """Tests for the query result cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.app.config["QUERY_CACHE_ENABLED"] = True
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(
+            query_cache, "get_redis_client", return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.app.config["QUERY_CACHE_ENABLED"] = False
+        super().tearDown()
+
+    def test_get_or_search(self):
+        """Test that identical queries are answered from the cache."""
+        cache = query_cache.QueryCache()
+        search = mock.Mock(return_value={"hits": {"hits": []}})
+
+        for _ in range(2):
+            key = cache.build_key(["index_1"], query_string="foo", query_filter={})
+            result = cache.get_or_search(key, search, query_string="foo")
+
+        self.assertEqual(result, {"hits": {"hits": []}})
+        search.assert_called_once_with(query_string="foo")
+
+    def test_key_is_normalized(self):
+        """Test that the key does not depend on the order of the input."""
+        cache = query_cache.QueryCache()
+        key_1 = cache.build_key(
+            ["index_1", "index_2"], query_filter={"size": 40, "order": "asc"}
+        )
+        key_2 = cache.build_key(
+            ["index_2", "index_1"], query_filter={"order": "asc", "size": 40}
+        )
+        self.assertEqual(key_1, key_2)
+
+    def test_writes_invalidate_results(self):
+        """Test that a write to an index changes the cache key."""
+        cache = query_cache.QueryCache()
+        key = cache.build_key(["index_1", "index_2"], query_string="foo")
+        cache.set(key, {"count": 1})
+
+        query_cache.bump_index_generation(["index_2"])
+        new_key = cache.build_key(["index_1", "index_2"], query_string="foo")
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(cache.get(new_key))
+
+        other_key = cache.build_key(["index_1"], query_string="foo")
+        query_cache.bump_index_generation(["index_2"])
+        self.assertEqual(other_key, cache.build_key(["index_1"], query_string="foo"))
+
+    def test_results_before_refresh_are_invalidated(self):
+        """Test that results cached before a write is searchable expire."""
+        cache = query_cache.QueryCache()
+        with mock.patch.object(query_cache.time, "time", return_value=100.0):
+            query_cache.bump_index_generation(["index_1"])
+            key = cache.build_key(["index_1"], query_string="foo")
+            cache.set(key, {"count": 0})
+            self.assertEqual(cache.build_key(["index_1"], query_string="foo"), key)
+
+        with mock.patch.object(query_cache.time, "time", return_value=103.0):
+            new_key = cache.build_key(["index_1"], query_string="foo")
+            self.assertNotEqual(new_key, key)
+            self.assertEqual(cache.build_key(["index_1"], query_string="foo"), new_key)
+
+    def test_size_bound(self):
+        """Test that the oldest entries are evicted."""
+        self.app.config["QUERY_CACHE_MAX_ENTRIES"] = 2
+        cache = query_cache.QueryCache()
+        keys = []
+        for number in range(3):
+            key = cache.build_key(["index_1"], query_string=str(number))
+            cache.set(key, number)
+            keys.append(key)
+
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertEqual(cache.get(keys[2]), 2)
+
+    def test_disabled(self):
+        """Test that no key is built when the cache is disabled."""
+        self.app.config["QUERY_CACHE_ENABLED"] = False
+        cache = query_cache.QueryCache()
+        self.assertIsNone(cache.build_key(["index_1"], query_string="foo"))
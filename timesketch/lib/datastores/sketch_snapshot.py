@@ -0,0 +1,391 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Materialized snapshot of the datastore metadata of a sketch.
+
+Loading a sketch needs the mappings, the number of events per timeline and
+the labels of all indices in the sketch. The snapshot keeps this metadata per
+index in a Redis hash per sketch, so that all web workers share it.
+
+Every entry records the generation of its index (see query_cache). Imports,
+tagging and labelling increase the generation of the indices they write to,
+which makes only the entries of those indices outdated. Outdated, missing and
+expired entries are rebuilt with a single mapping and a single aggregation
+request for all of them.
+"""
+
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+import opensearchpy
+import prometheus_client
+import redis
+from flask import current_app
+
+from timesketch.lib.datastores import field_types
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.definitions import METRICS_NAMESPACE
+
+
+logger = logging.getLogger("timesketch.opensearch.sketch_snapshot")
+
+METRICS = {
+    "sketch_snapshot_lookups": prometheus_client.Counter(
+        "sketch_snapshot_lookups",
+        "Number of index entries looked up in sketch metadata snapshots per "
+        "result (hit, miss, outdated, expired, fresh, error)",
+        ["result"],
+        namespace=METRICS_NAMESPACE,
+    ),
+    "sketch_snapshot_age": prometheus_client.Histogram(
+        "sketch_snapshot_age_seconds",
+        "Age of the index entries served from sketch metadata snapshots",
+        buckets=(1, 10, 60, 300, 900, 1800, 3600, 21600, 86400),
+        namespace=METRICS_NAMESPACE,
+    ),
+}
+
+KEY_PREFIX = "timesketch:sketch_snapshot"
+
+# Default number of seconds an entry of the snapshot is served.
+DEFAULT_TTL = 3600
+
+# This is a workaround to return all labels by setting the max buckets to
+# something big, same as OpenSearchDataStore.get_filter_labels.
+MAX_LABELS = 10000
+
+
+def is_enabled() -> bool:
+    """Returns whether the sketch snapshot is enabled in the configuration."""
+    return bool(current_app.config.get("SKETCH_SNAPSHOT_ENABLED", False))
+
+
+def _is_child_field(field: str, index_field_types: Dict[str, Any]) -> bool:
+    """Returns whether a field is a sub field or a field of an object.
+
+    The field types of an index are flattened, e.g. the keyword sub field of
+    "message" is "message.keyword". A field with a dot in its name is a top
+    level field of the mapping if none of its prefixes is a field.
+
+    Args:
+        field: The flattened name of the field.
+        index_field_types: Dict with the type per flattened field name.
+
+    Returns:
+        True if the field is not a top level field of the mapping.
+    """
+    parts = field.split(".")
+    return any(
+        ".".join(parts[:length]) in index_field_types for length in range(1, len(parts))
+    )
+
+
+class SketchSnapshot:
+    """Snapshot of the mappings, event counts and labels of a sketch."""
+
+    def __init__(self, datastore, sketch_id: int):
+        """Initialize the snapshot.
+
+        Args:
+            datastore: Instance of OpenSearchDataStore, can be None if none
+                of the timelines of the sketch are ready.
+            sketch_id: The ID of the sketch.
+        """
+        self.datastore = datastore
+        self.sketch_id = sketch_id
+        self.key = f"{KEY_PREFIX}:{sketch_id}"
+        self.ttl = int(current_app.config.get("SKETCH_SNAPSHOT_TTL", DEFAULT_TTL))
+        self._client = None
+        if is_enabled():
+            try:
+                self._client = query_cache.get_redis_client()
+            except (ValueError, redis.exceptions.RedisError) as e:
+                logger.warning("Unable to set up the sketch snapshot: %s", str(e))
+
+    def _get_index_stats(
+        self, index_names: List[str], timeline_ids: List[int]
+    ) -> Dict[str, Dict]:
+        """Returns the event counts and labels of each index.
+
+        Args:
+            index_names: List of index names.
+            timeline_ids: List of IDs of the timelines in the sketch.
+
+        Returns:
+            Dict per index name with the number of events ("doc_count"), the
+            number of events per timeline ("timeline_counts") and the number
+            of events per label ("labels").
+        """
+        # pylint: disable=line-too-long
+        aggregation = {
+            "size": 0,
+            "aggs": {
+                "per_index": {
+                    "terms": {"field": "_index", "size": len(index_names)},
+                    "aggs": {
+                        "per_timeline": {
+                            "terms": {
+                                "field": "__ts_timeline_id",
+                                "include": timeline_ids,
+                                "size": max(len(timeline_ids), 1),
+                            }
+                        },
+                        "nested": {
+                            "nested": {"path": "timesketch_label"},
+                            "aggs": {
+                                "inner": {
+                                    "filter": {
+                                        "term": {
+                                            "timesketch_label.sketch_id": self.sketch_id
+                                        }
+                                    },
+                                    "aggs": {
+                                        "labels": {
+                                            "terms": {
+                                                "field": "timesketch_label.name.keyword",
+                                                "size": MAX_LABELS,
+                                            }
+                                        }
+                                    },
+                                }
+                            },
+                        },
+                    },
+                }
+            },
+        }
+        # pylint: enable=line-too-long
+        try:
+            result = self.datastore.client.search(index=index_names, body=aggregation)
+        except opensearchpy.NotFoundError:
+            logger.error("Unable to find the index/indices: %s", ",".join(index_names))
+            return {}
+
+        stats = {}
+        buckets = result.get("aggregations", {}).get("per_index", {}).get("buckets", [])
+        for bucket in buckets:
+            timeline_buckets = bucket.get("per_timeline", {}).get("buckets", [])
+            label_buckets = (
+                bucket.get("nested", {})
+                .get("inner", {})
+                .get("labels", {})
+                .get("buckets", [])
+            )
+            stats[bucket["key"]] = {
+                "doc_count": bucket["doc_count"],
+                "timeline_counts": {
+                    str(x["key"]): x["doc_count"] for x in timeline_buckets
+                },
+                "labels": {x["key"]: x["doc_count"] for x in label_buckets},
+            }
+        return stats
+
+    def _build_entries(
+        self,
+        index_names: List[str],
+        timeline_ids: List[int],
+        generations: Dict[str, int],
+        refresh: bool = False,
+    ) -> Dict[str, Dict]:
+        """Build the snapshot entries of indices from the datastore.
+
+        Args:
+            index_names: List of index names.
+            timeline_ids: List of IDs of the timelines in the sketch.
+            generations: Dict with the generation of each index.
+            refresh: If True the mappings are not read from the field type
+                cache.
+
+        Returns:
+            Dict with the snapshot entry per index name.
+        """
+        types_per_index = field_types.get_index_field_types(
+            self.datastore.client, index_names, refresh=refresh
+        )
+        stats = self._get_index_stats(index_names, timeline_ids)
+        now = time.time()
+
+        entries = {}
+        for index_name in index_names:
+            entry = {
+                "generation": generations.get(index_name, 0),
+                "timeline_ids": timeline_ids,
+                "updated_at": now,
+                "fields": [],
+                "doc_count": 0,
+                "timeline_counts": {},
+                "labels": {},
+            }
+            index_field_types = types_per_index.get(index_name)
+            if index_field_types is not None:
+                # Determine if index is from the time before multiple timelines
+                # per index. This is used in the UI to support both modes.
+                entry["is_legacy"] = bool("__ts_timeline_id" not in index_field_types)
+                for field, field_type in index_field_types.items():
+                    # Exclude internal fields, sub fields and fields of objects.
+                    if field.startswith("__") or field == "timesketch_label":
+                        continue
+                    if _is_child_field(field, index_field_types):
+                        continue
+                    entry["fields"].append(
+                        {"field": field, "type": field_type or "n/a"}
+                    )
+            entry.update(stats.get(index_name, {}))
+            entries[index_name] = entry
+        return entries
+
+    def _get_entries(
+        self, index_names: List[str], timeline_ids: List[int], fresh: bool
+    ) -> Dict[str, Dict]:
+        """Returns the snapshot entries of indices, rebuilding them if needed.
+
+        Args:
+            index_names: Sorted list of index names.
+            timeline_ids: Sorted list of IDs of the timelines in the sketch.
+            fresh: If True all entries are rebuilt from the datastore.
+
+        Returns:
+            Dict with the snapshot entry per index name.
+        """
+        if self._client is None:
+            return self._build_entries(index_names, timeline_ids, {}, refresh=True)
+
+        try:
+            generations = dict(
+                zip(
+                    index_names,
+                    query_cache.get_index_generations(self._client, index_names),
+                )
+            )
+            values = [] if fresh else self._client.hmget(self.key, index_names)
+        except redis.exceptions.RedisError as e:
+            logger.warning("Unable to read the sketch snapshot: %s", str(e))
+            METRICS["sketch_snapshot_lookups"].labels(result="error").inc(
+                len(index_names)
+            )
+            return self._build_entries(index_names, timeline_ids, {}, refresh=True)
+
+        entries = {}
+        now = time.time()
+        for index_name, value in zip(index_names, values):
+            if value is None:
+                result = "miss"
+            else:
+                entry = json.loads(value)
+                age = now - entry.get("updated_at", 0)
+                if entry.get("generation") != generations[index_name]:
+                    result = "outdated"
+                elif entry.get("timeline_ids") != timeline_ids:
+                    result = "outdated"
+                elif age > self.ttl:
+                    result = "expired"
+                else:
+                    result = "hit"
+                    entries[index_name] = entry
+                    METRICS["sketch_snapshot_age"].observe(max(age, 0))
+            METRICS["sketch_snapshot_lookups"].labels(result=result).inc()
+
+        if fresh:
+            METRICS["sketch_snapshot_lookups"].labels(result="fresh").inc(
+                len(index_names)
+            )
+
+        missing = [x for x in index_names if x not in entries]
+        if not missing:
+            return entries
+
+        new_entries = self._build_entries(
+            missing, timeline_ids, generations, refresh=fresh
+        )
+        entries.update(new_entries)
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            pipeline.hset(
+                self.key,
+                mapping={
+                    index_name: json.dumps(entry)
+                    for index_name, entry in new_entries.items()
+                },
+            )
+            pipeline.expire(self.key, self.ttl)
+            pipeline.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning("Unable to write the sketch snapshot: %s", str(e))
+        return entries
+
+    def get(self, timelines: List[Any], fresh: bool = False) -> Dict[str, Any]:
+        """Returns the datastore metadata of the active timelines of a sketch.
+
+        Args:
+            timelines: List of active timelines of the sketch (instances of
+                timesketch.models.sketch.Timeline).
+            fresh: If True the metadata is read from the datastore instead of
+                the snapshot, and the snapshot is updated.
+
+        Returns:
+            Dict with the "mappings", "indices_metadata", "stats_per_timeline"
+            and "filter_labels" of the sketch, in the format of the sketch
+            API.
+        """
+        indices_metadata = {}
+        stats_per_timeline = {}
+        ready_indices = set()
+        for timeline in timelines:
+            index_name = timeline.searchindex.index_name
+            indices_metadata[index_name] = {}
+            stats_per_timeline[timeline.id] = {"count": 0}
+            if timeline.searchindex.get_status.status == "ready":
+                ready_indices.add(index_name)
+
+        snapshot = {
+            "mappings": [],
+            "indices_metadata": indices_metadata,
+            "stats_per_timeline": stats_per_timeline,
+            "filter_labels": [],
+        }
+        if not ready_indices:
+            return snapshot
+
+        index_names = sorted(ready_indices)
+        timeline_ids = sorted(timeline.id for timeline in timelines)
+        entries = self._get_entries(index_names, timeline_ids, fresh=fresh)
+
+        mappings = {}
+        labels = {}
+        for index_name in index_names:
+            entry = entries.get(index_name, {})
+            if "is_legacy" in entry:
+                indices_metadata[index_name]["is_legacy"] = entry["is_legacy"]
+            for mapping in entry.get("fields", []):
+                mappings[mapping["field"]] = mapping
+            for label, count in entry.get("labels", {}).items():
+                labels[label] = labels.get(label, 0) + count
+
+        for timeline in timelines:
+            entry = entries.get(timeline.searchindex.index_name)
+            if not entry:
+                continue
+            if entry.get("is_legacy", False):
+                count = entry.get("doc_count", 0)
+            else:
+                count = entry.get("timeline_counts", {}).get(str(timeline.id), 0)
+            stats_per_timeline[timeline.id] = {"count": count}
+
+        snapshot["mappings"] = list(mappings.values())
+        snapshot["filter_labels"] = [
+            {"label": label, "count": count}
+            for label, count in sorted(labels.items(), key=lambda x: (-x[1], x[0]))
+        ]
+        return snapshot
@@ -0,0 +1,187 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the sketch metadata snapshot."""
+
+from unittest import mock
+
+from timesketch.lib.datastores import field_types
+from timesketch.lib.datastores import query_cache
+from timesketch.lib.datastores import sketch_snapshot
+from timesketch.lib.datastores.query_cache_test import FakeRedis
+from timesketch.lib.testlib import BaseTest
+
+
+MAPPINGS = {
+    "index_1": {
+        "mappings": {
+            "properties": {
+                "__ts_timeline_id": {"type": "long"},
+                "message": {"type": "text"},
+                "timesketch_label": {"type": "nested"},
+            }
+        }
+    },
+    "index_2": {"mappings": {"properties": {"domain": {"type": "keyword"}}}},
+}
+
+STATS = {
+    "index_1": {
+        "key": "index_1",
+        "doc_count": 10,
+        "per_timeline": {
+            "buckets": [{"key": 1, "doc_count": 6}, {"key": 2, "doc_count": 4}]
+        },
+        "nested": {
+            "inner": {"labels": {"buckets": [{"key": "__ts_star", "doc_count": 2}]}}
+        },
+    },
+    "index_2": {
+        "key": "index_2",
+        "doc_count": 7,
+        "per_timeline": {"buckets": []},
+        "nested": {
+            "inner": {"labels": {"buckets": [{"key": "__ts_star", "doc_count": 1}]}}
+        },
+    },
+}
+
+
+def _get_mapping(index, ignore_unavailable):
+    del ignore_unavailable
+    return {index_name: MAPPINGS[index_name] for index_name in index}
+
+
+def _search(index, body):  # pylint: disable=unused-argument
+    buckets = [STATS[index_name] for index_name in index]
+    return {"aggregations": {"per_index": {"buckets": buckets}}}
+
+
+def _timeline(timeline_id, index_name, status="ready"):
+    searchindex = mock.Mock(index_name=index_name)
+    searchindex.get_status.status = status
+    return mock.Mock(id=timeline_id, searchindex=searchindex)
+
+
+class TestSketchSnapshot(BaseTest):
+    """Tests for the sketch metadata snapshot."""
+
+    def setUp(self):
+        super().setUp()
+        self.app.config["SKETCH_SNAPSHOT_ENABLED"] = True
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(
+            query_cache, "get_redis_client", return_value=self.redis
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        field_types.clear()
+
+        self.datastore = mock.Mock()
+        self.datastore.client.indices.get_mapping.side_effect = _get_mapping
+        self.datastore.client.search.side_effect = _search
+        self.timelines = [
+            _timeline(1, "index_1"),
+            _timeline(2, "index_1"),
+            _timeline(3, "index_2"),
+            _timeline(4, "index_3", status="processing"),
+        ]
+
+    def tearDown(self):
+        self.app.config["SKETCH_SNAPSHOT_ENABLED"] = False
+        super().tearDown()
+
+    def test_get(self):
+        """Test that the metadata of all indices is combined."""
+        snapshot = sketch_snapshot.SketchSnapshot(self.datastore, 1)
+        metadata = snapshot.get(self.timelines)
+
+        self.assertEqual(
+            metadata["indices_metadata"],
+            {
+                "index_1": {"is_legacy": False},
+                "index_2": {"is_legacy": True},
+                "index_3": {},
+            },
+        )
+        self.assertEqual(
+            metadata["stats_per_timeline"],
+            {1: {"count": 6}, 2: {"count": 4}, 3: {"count": 7}, 4: {"count": 0}},
+        )
+        self.assertEqual(
+            sorted(x["field"] for x in metadata["mappings"]), ["domain", "message"]
+        )
+        self.assertEqual(
+            metadata["filter_labels"], [{"label": "__ts_star", "count": 3}]
+        )
+
+    def test_mappings_are_top_level_fields(self):
+        """Test that objects and dotted field names are kept in the mappings."""
+        properties = {
+            "__ts_timeline_id": {"type": "long"},
+            "message": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "user": {"properties": {"name": {"type": "keyword"}}},
+            "event.code": {"type": "keyword"},
+            "timesketch_label": {
+                "type": "nested",
+                "properties": {"name": {"type": "text"}},
+            },
+        }
+        self.datastore.client.indices.get_mapping.side_effect = None
+        self.datastore.client.indices.get_mapping.return_value = {
+            "index_4": {"mappings": {"properties": properties}}
+        }
+        self.datastore.client.search.side_effect = None
+        self.datastore.client.search.return_value = {}
+
+        snapshot = sketch_snapshot.SketchSnapshot(self.datastore, 1)
+        metadata = snapshot.get([_timeline(5, "index_4")])
+        self.assertEqual(
+            sorted(metadata["mappings"], key=lambda x: x["field"]),
+            [
+                {"field": "event.code", "type": "keyword"},
+                {"field": "message", "type": "text"},
+                {"field": "user", "type": "n/a"},
+            ],
+        )
+
+    def test_only_outdated_indices_are_rebuilt(self):
+        """Test that writes to an index only rebuild the entry of that index."""
+        snapshot = sketch_snapshot.SketchSnapshot(self.datastore, 1)
+        metadata = snapshot.get(self.timelines)
+        self.datastore.client.indices.get_mapping.reset_mock()
+
+        self.assertEqual(snapshot.get(self.timelines), metadata)
+        self.datastore.client.indices.get_mapping.assert_not_called()
+
+        query_cache.bump_index_generation(["index_2"])
+        self.assertEqual(snapshot.get(self.timelines), metadata)
+        self.datastore.client.indices.get_mapping.assert_called_once_with(
+            index=["index_2"], ignore_unavailable=True
+        )
+
+        self.datastore.client.indices.get_mapping.reset_mock()
+        snapshot.get(self.timelines, fresh=True)
+        self.datastore.client.indices.get_mapping.assert_called_once_with(
+            index=["index_1", "index_2"], ignore_unavailable=True
+        )
+
+    def test_disabled(self):
+        """Test that the metadata is read from the datastore when disabled."""
+        self.app.config["SKETCH_SNAPSHOT_ENABLED"] = False
+        snapshot = sketch_snapshot.SketchSnapshot(self.datastore, 1)
+        snapshot.get(self.timelines)
+        snapshot.get(self.timelines)
+        self.assertEqual(self.datastore.client.indices.get_mapping.call_count, 2)
+        self.assertEqual(self.datastore.client.search.call_count, 2)
+        self.assertEqual(self.redis.hashes, {})
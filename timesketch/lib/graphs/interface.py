@@ -18,6 +18,7 @@ import hashlib
 from typing import Dict, List, Optional
 import networkx as nx
 
+from timesketch.lib.datastores import field_types
 from timesketch.lib.datastores.opensearch import OpenSearchDataStore
 
 
@@ -85,32 +86,105 @@ class Graph:
             event: (dict): OpenSearch event.
             attributes: (dict) Attributes to add to node.
         """
+        self.add_aggregated_edge(
+            source,
+            target,
+            label,
+            {event.get("_index"): [event.get("_id")]},
+            1,
+            attributes=attributes,
+        )
+
+    def add_aggregated_edge(
+        self,
+        source: "Node",
+        target: "Node",
+        label: str,
+        events: Dict[str, List[str]],
+        event_count: int,
+        attributes: Optional[Dict] = None,
+    ):
+        """Add edge that represents a number of events to graph.
+
+        Args:
+            source: (Node) Node to use as source.
+            target: (Node) Node to use as target.
+            label: (str) Label for the node.
+            events: (dict) Lists of document IDs of a sample of the events,
+                keyed by index name.
+            event_count: (int) Total number of events of the edge.
+            attributes: (dict) Attributes to add to node.
+        """
         if not attributes:
             attributes = {}
 
         attributes["id"] = "".join([source.id, target.id, label]).lower()
 
         edge = Edge(source, target, label, attributes)
-
-        if edge.node_counter < MAX_EVENTS_PER_EDGE:
-            index = event.get("_index")
-            doc_id = event.get("_id")
-            events = edge.attributes.get("events", {})
-            doc_ids = events.get(index, [])
-            doc_ids.append(doc_id)
-            edge.node_counter += 1
-            events[index] = doc_ids
-            edge.set_attribute("events", events)
+        # Events of the same edge are added to the existing edge.
+        edge = self._edges.get(edge.id, edge)
+        edge.add_events(events, event_count=event_count)
 
         self._edges[edge.id] = edge
 
+    def to_partial(self):
+        """Output the nodes and edges in a format that can be merged.
+
+        Returns:
+            Dict with a list of nodes and a list of edges.
+        """
+        nodes = [
+            {"id": node_id, "label": node.label, "attributes": node.attributes}
+            for node_id, node in self._nodes.items()
+        ]
+        edges = [
+            {
+                "id": edge_id,
+                "source": edge.source.id,
+                "target": edge.target.id,
+                "label": edge.label,
+                "attributes": edge.attributes,
+                "event_count": edge.event_count,
+            }
+            for edge_id, edge in self._edges.items()
+        ]
+        return {"nodes": nodes, "edges": edges}
+
+    def add_partial(self, partial):
+        """Merge the nodes and edges of a partial graph into the graph.
+
+        Args:
+            partial (dict): Partial graph as returned by to_partial.
+        """
+        for node_dict in partial.get("nodes", []):
+            if node_dict["id"] in self._nodes:
+                continue
+            node = Node(node_dict["label"], dict(node_dict["attributes"]))
+            node.id = node_dict["id"]
+            self._nodes[node.id] = node
+
+        for edge_dict in partial.get("edges", []):
+            edge = self._edges.get(edge_dict["id"])
+            attributes = dict(edge_dict["attributes"])
+            events = attributes.pop("events", {})
+            if not edge:
+                edge = Edge(
+                    self._nodes[edge_dict["source"]],
+                    self._nodes[edge_dict["target"]],
+                    edge_dict["label"],
+                    attributes,
+                )
+                edge.id = edge_dict["id"]
+                self._edges[edge.id] = edge
+            edge.add_events(events, event_count=edge_dict.get("event_count"))
+
     def commit(self):
         """Commit all nodes and edges to the networkx graph object."""
         for node_id, node in self._nodes.items():
             self.nx_instance.add_node(node_id, label=node.label, **node.attributes)
 
         for _, edge in self._edges.items():
-            label = edge.label + f" ({edge.node_counter})"
+            label = edge.label + f" ({edge.event_count})"
             self.nx_instance.add_edge(
                 edge.source.id, edge.target.id, label=label, **edge.attributes
             )
@@ -177,6 +251,7 @@ class Edge(BaseGraphElement):
         source (Node): Node to add as source node.
         target (Node): Node to add as target node.
         node_counter (int): Counter for number of nodes referenced for the edge.
+        event_count (int): Total number of events of the edge.
     """
 
     def __init__(self, source, target, label="", attributes=None):
@@ -189,8 +264,30 @@ class Edge(BaseGraphElement):
         self.source = source
         self.target = target
         self.node_counter = 0
+        self.event_count = 0
         super().__init__(label, attributes)
 
+    def add_events(self, events, event_count=None):
+        """Reference events from the edge, up to MAX_EVENTS_PER_EDGE events.
+
+        Args:
+            events (dict): Lists of document IDs keyed by index name.
+            event_count (int): Optional total number of events that are added
+                to the edge, defaults to the number of document IDs.
+        """
+        edge_events = self.attributes.get("events", {})
+        for index, doc_ids in events.items():
+            if event_count is None:
+                self.event_count += len(doc_ids)
+            for doc_id in doc_ids:
+                if self.node_counter >= MAX_EVENTS_PER_EDGE:
+                    break
+                edge_events.setdefault(index, []).append(doc_id)
+                self.node_counter += 1
+        if event_count is not None:
+            self.event_count += event_count
+        self.set_attribute("events", edge_events)
+
 
 class BaseGraphPlugin:
     """Base class for a graph.
@@ -217,6 +314,24 @@ class BaseGraphPlugin:
     # https://networkx.org/documentation/stable/reference/classes/index.html
     GRAPH_TYPE = "MultiDiGraph"
 
+    # Edges of the graph as aggregations, used by generate_from_aggregations.
+    # Every edge definition is a dict with the keys:
+    #   query_string: Query string that selects the events of the edges.
+    #   source: Dict with the "field" and optional node "attributes" of the
+    #       source nodes, and an optional "missing" node label for events
+    #       without the field (empty by default).
+    #   target: Dict with the same keys for the target nodes.
+    #   label_field: Field that holds the edge label, or
+    #   label: Static edge label, also used for events without label_field.
+    EDGE_AGGREGATIONS = []
+
+    # Number of edges per composite aggregation request.
+    AGGREGATION_PAGE_SIZE = 500
+
+    # Number of event IDs sampled per edge. The top_hits aggregation is
+    # limited by the index.max_inner_result_window setting (100 by default).
+    EDGE_EVENT_SAMPLE_SIZE = 100
+
     def __init__(self, sketch=None, timeline_ids=None):
         """Initialize the graph object.
 
@@ -309,6 +424,185 @@ class BaseGraphPlugin:
         )
         return event_generator
 
+    def _format_field_by_type(self, field_name, indices):
+        """Format field name based on mapping type.
+
+        Text fields are not available to aggregations per default, their
+        keyword sub field is used instead.
+
+        Args:
+            field_name: Name of the field.
+            indices: List of index names.
+
+        Returns:
+            Field name as string formatted after mapping type.
+        """
+        return field_types.format_field_by_type(
+            self.datastore.client, indices, field_name
+        )
+
+    def aggregate_edges(self, edge_definition):
+        """Aggregate the edges of an edge definition.
+
+        The edges are collected with a paginated composite aggregation, with
+        a top_hits aggregation that samples the events of every edge. Only
+        the edges are returned by the cluster, not the events.
+
+        Args:
+            edge_definition (dict): Dict with the edge definition, see
+                EDGE_AGGREGATIONS.
+
+        Yields:
+            A tuple with a dict of the source, target and label values, the
+            number of events of the edge and a dict with sampled document IDs
+            keyed by index name.
+        """
+        indices = self._get_sketch_indices()
+        if not indices:
+            return
+
+        fields = {
+            "source": edge_definition["source"]["field"],
+            "target": edge_definition["target"]["field"],
+        }
+        if edge_definition.get("label_field"):
+            fields["label"] = edge_definition["label_field"]
+
+        # Events without one of the fields are kept in a bucket with a None
+        # key, instead of being left out of the graph.
+        sources = [
+            {
+                name: {
+                    "terms": {
+                        "field": self._format_field_by_type(field, indices),
+                        "missing_bucket": True,
+                    }
+                }
+            }
+            for name, field in fields.items()
+        ]
+        aggregations = {
+            "edges": {
+                "composite": {"size": self.AGGREGATION_PAGE_SIZE, "sources": sources},
+                "aggregations": {
+                    "events": {
+                        "top_hits": {
+                            "size": min(
+                                self.EDGE_EVENT_SAMPLE_SIZE, MAX_EVENTS_PER_EDGE
+                            ),
+                            "_source": False,
+                        }
+                    }
+                },
+            }
+        }
+        query_dsl = self.datastore.build_query(
+            sketch_id=self.sketch.id,
+            query_string=edge_definition["query_string"],
+            query_filter={},
+            aggregations=aggregations,
+            timeline_ids=self.timeline_ids,
+        )
+        query_dsl.pop("sort", None)
+
+        while True:
+            # pylint: disable=unexpected-keyword-arg
+            response = self.datastore.client.search(
+                index=indices, body=query_dsl, size=0
+            )
+            edges = response.get("aggregations", {}).get("edges", {})
+            for bucket in edges.get("buckets", []):
+                events = {}
+                for hit in bucket.get("events", {}).get("hits", {}).get("hits", []):
+                    events.setdefault(hit["_index"], []).append(hit["_id"])
+                yield bucket["key"], bucket["doc_count"], events
+
+            after_key = edges.get("after_key")
+            if not after_key:
+                break
+            query_dsl["aggregations"]["edges"]["composite"]["after"] = after_key
+
+    @staticmethod
+    def _key_to_label(value, missing=None):
+        """Returns the label of a node or edge from an aggregation key.
+
+        Args:
+            value: Value of the aggregation key, None for missing values.
+            missing: Optional label for missing values, defaults to an empty
+                string.
+
+        Returns:
+            The label as string.
+        """
+        if value is None:
+            return missing or ""
+        return str(value)
+
+    def generate_from_aggregations(self):
+        """Generate the graph from the edge aggregations.
+
+        Returns:
+            Graph object instance.
+        """
+        for edge_definition in self.EDGE_AGGREGATIONS:
+            source_definition = edge_definition["source"]
+            target_definition = edge_definition["target"]
+            for key, event_count, events in self.aggregate_edges(edge_definition):
+                source = self.graph.add_node(
+                    self._key_to_label(key["source"], source_definition.get("missing")),
+                    dict(source_definition.get("attributes", {})),
+                )
+                target = self.graph.add_node(
+                    self._key_to_label(key["target"], target_definition.get("missing")),
+                    dict(target_definition.get("attributes", {})),
+                )
+                label = self._key_to_label(
+                    key.get("label"), edge_definition.get("label")
+                )
+                self.graph.add_aggregated_edge(
+                    source, target, label, events, event_count
+                )
+
+        self.graph.commit()
+        return self.graph
+
     def generate(self):
-        """Entry point for the graph."""
+        """Entry point for the graph.
+
+        Plugins either implement this method or define EDGE_AGGREGATIONS.
+
+        Returns:
+            Graph object instance.
+        """
+        if self.EDGE_AGGREGATIONS:
+            return self.generate_from_aggregations()
         raise NotImplementedError
+
+    def generate_partial(self):
+        """Generate the graph as a partial graph.
+
+        The graph of a sketch is the merge of the partial graphs of its
+        timelines, see merge_partial_graphs. Plugins are instantiated with the
+        ID of a single timeline to generate the partial graph of the timeline.
+
+        Returns:
+            Dict with a list of nodes and a list of edges.
+        """
+        return self.generate().to_partial()
+
+
+def merge_partial_graphs(graph_type, partials):
+    """Merge partial graphs into a single graph.
+
+    Args:
+        graph_type: (str) Name of graph type.
+        partials: (list) Partial graphs as returned by Graph.to_partial.
+
+    Returns:
+        Graph object instance.
+    """
+    graph = Graph(graph_type)
+    for partial in partials:
+        graph.add_partial(partial)
+    graph.commit()
+    return graph
@@ -0,0 +1,216 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the graph interface."""
+
+import json
+from unittest import mock
+
+from timesketch.lib.datastores import field_types
+from timesketch.lib.graphs import interface
+from timesketch.lib.testlib import BaseTest
+
+
+def _build_graph(events):
+    """Build a graph with an edge from user to computer per event."""
+    graph = interface.Graph("MultiDiGraph")
+    for event in events:
+        user = graph.add_node(event["_source"]["username"], {"type": "user"})
+        computer = graph.add_node(event["_source"]["computer"], {"type": "computer"})
+        graph.add_edge(user, computer, "logon", event)
+    return graph
+
+
+def _event(index, doc_id, username="alice", computer="host1"):
+    """Returns an event dict."""
+    return {
+        "_index": index,
+        "_id": doc_id,
+        "_source": {"username": username, "computer": computer},
+    }
+
+
+class TestGraph(BaseTest):
+    """Tests for the Graph class."""
+
+    def test_add_edge(self):
+        """Test that events of the same edge are added to one edge."""
+        graph = _build_graph([_event("index_1", "1"), _event("index_1", "2")])
+        graph.commit()
+
+        edges = list(graph.nx_instance.edges(data=True))
+        self.assertEqual(len(edges), 1)
+        self.assertEqual(edges[0][2]["label"], "logon (2)")
+        self.assertEqual(edges[0][2]["events"], {"index_1": ["1", "2"]})
+
+    def test_max_events_per_edge(self):
+        """Test that the number of events per edge is bounded."""
+        with mock.patch.object(interface, "MAX_EVENTS_PER_EDGE", 2):
+            graph = _build_graph([_event("index_1", str(i)) for i in range(3)])
+        graph.commit()
+
+        edges = list(graph.nx_instance.edges(data=True))
+        self.assertEqual(edges[0][2]["events"], {"index_1": ["0", "1"]})
+
+    def test_merge_partial_graphs(self):
+        """Test that partial graphs merge into the graph of all events."""
+        events_1 = [_event("index_1", "1"), _event("index_1", "2", username="bob")]
+        events_2 = [_event("index_2", "3"), _event("index_2", "4", computer="host2")]
+        partials = [
+            # Partial graphs are stored as JSON.
+            json.loads(json.dumps(_build_graph(events).to_partial()))
+            for events in (events_1, events_2)
+        ]
+
+        merged = interface.merge_partial_graphs("MultiDiGraph", partials)
+        expected = _build_graph(events_1 + events_2)
+        expected.commit()
+
+        self.assertEqual(merged.to_cytoscape(), expected.to_cytoscape())
+        self.assertEqual(merged.nx_instance.number_of_nodes(), 4)
+        self.assertEqual(merged.nx_instance.number_of_edges(), 3)
+
+
+class LoginGraph(interface.BaseGraphPlugin):
+    """Aggregation based graph plugin."""
+
+    NAME = "LoginGraph"
+
+    EDGE_AGGREGATIONS = [
+        {
+            "query_string": "tag:logon-event",
+            "source": {"field": "username", "attributes": {"type": "user"}},
+            "target": {"field": "computer_name", "attributes": {"type": "computer"}},
+            "label_field": "logon_type",
+        }
+    ]
+
+
+def _mapping(index, ignore_unavailable):
+    """Returns a mapping with text fields, except for logon_type."""
+    del ignore_unavailable
+    properties = {
+        "username": {"type": "text"},
+        "computer_name": {"type": "text"},
+        "logon_type": {"type": "long"},
+    }
+    return {name: {"mappings": {"properties": properties}} for name in index}
+
+
+def _bucket(username, computer_name, logon_type, doc_count, doc_ids):
+    """Returns a composite aggregation bucket."""
+    return {
+        "key": {
+            "source": username,
+            "target": computer_name,
+            "label": logon_type,
+        },
+        "doc_count": doc_count,
+        "events": {
+            "hits": {"hits": [{"_index": "index_1", "_id": x} for x in doc_ids]}
+        },
+    }
+
+
+class TestBaseGraphPlugin(BaseTest):
+    """Tests for the BaseGraphPlugin class."""
+
+    @mock.patch("timesketch.lib.graphs.interface.OpenSearchDataStore")
+    def test_generate_from_aggregations(self, mock_datastore_class):
+        """Test that the edges are built from composite aggregation pages."""
+        datastore = mock_datastore_class.return_value
+        datastore.build_query.side_effect = lambda **kwargs: {
+            "query": {"match_all": {}},
+            "aggregations": kwargs["aggregations"],
+            "sort": {"datetime": "asc"},
+        }
+        datastore.client.indices.get_mapping.side_effect = _mapping
+        field_types.clear()
+        responses = [
+            {
+                "aggregations": {
+                    "edges": {
+                        "after_key": {"source": "alice"},
+                        "buckets": [
+                            _bucket("alice", "host1", 2, 1000, ["1", "2"]),
+                            _bucket("alice", "host1", 10, 1, ["3"]),
+                        ],
+                    }
+                }
+            },
+            {
+                "aggregations": {
+                    "edges": {
+                        "buckets": [
+                            _bucket("bob", "host1", 2, 5, ["4"]),
+                            _bucket("bob", None, None, 3, ["5"]),
+                        ]
+                    }
+                }
+            },
+        ]
+        # The request body is changed between pages, keep a copy of it.
+        bodies = []
+
+        def _search(index, body, size):
+            del index, size
+            bodies.append(json.loads(json.dumps(body)))
+            return responses[len(bodies) - 1]
+
+        datastore.client.search.side_effect = _search
+        timeline = mock.Mock(id=1)
+        timeline.searchindex.index_name = "index_1"
+        sketch = mock.Mock(id=1, active_timelines=[timeline])
+
+        graph = LoginGraph(sketch=sketch).generate()
+
+        sources = bodies[0]["aggregations"]["edges"]["composite"]["sources"]
+        self.assertEqual(
+            sources,
+            [
+                {
+                    "source": {
+                        "terms": {"field": "username.keyword", "missing_bucket": True}
+                    }
+                },
+                {
+                    "target": {
+                        "terms": {
+                            "field": "computer_name.keyword",
+                            "missing_bucket": True,
+                        }
+                    }
+                },
+                {"label": {"terms": {"field": "logon_type", "missing_bucket": True}}},
+            ],
+        )
+        self.assertNotIn("sort", bodies[0])
+        self.assertEqual(
+            bodies[1]["aggregations"]["edges"]["composite"]["after"],
+            {"source": "alice"},
+        )
+        edges = sorted(
+            (data["label"], data["events"])
+            for _, _, data in graph.nx_instance.edges(data=True)
+        )
+        self.assertEqual(
+            edges,
+            [
+                (" (3)", {"index_1": ["5"]}),
+                ("10 (1)", {"index_1": ["3"]}),
+                ("2 (1000)", {"index_1": ["1", "2"]}),
+                ("2 (5)", {"index_1": ["4"]}),
+            ],
+        )
+        labels = sorted(data["label"] for _, data in graph.nx_instance.nodes(data=True))
+        self.assertEqual(labels, ["", "alice", "bob", "host1"])
@@ -21,7 +21,9 @@ import pandas as pd
 
 from timesketch.lib.stories import interface
 
+from timesketch.lib.aggregators import interface as aggregator_interface
 from timesketch.lib.aggregators import manager as aggregator_manager
+from timesketch.lib.aggregators import result_cache as aggregation_result_cache
 from timesketch.lib.datastores.opensearch import OpenSearchDataStore
 from timesketch.models.sketch import Aggregation
 from timesketch.models.sketch import AggregationGroup
@@ -36,6 +38,48 @@ class ApiDataFetcher(interface.DataFetcher):
         """Initialize the data fetcher."""
         super().__init__()
         self._datastore = OpenSearchDataStore()
+        # Results of prefetched aggregations, keyed by aggregation ID.
+        self._aggregation_results = {}
+
+    def _get_saved_aggregation(self, agg_dict):
+        """Returns the stored aggregation of an aggregation dict.
+
+        Args:
+            agg_dict (dict): a dictionary containing information
+                about the stored aggregation.
+
+        Returns:
+            The stored aggregation (instance of Aggregation) or None if the
+            aggregation is not found.
+        """
+        aggregation_id = agg_dict.get("id")
+        if not aggregation_id:
+            return None
+
+        aggregation = Aggregation.get_by_id(aggregation_id)
+        if not aggregation or aggregation.sketch_id != self._sketch_id:
+            return None
+        return aggregation
+
+    def prefetch_aggregations(self, agg_dicts):
+        """Get the results of the aggregations of a story.
+
+        Results are read from the aggregation result cache if possible, the
+        remaining aggregations are run in a single msearch.
+
+        Args:
+            agg_dicts (list): list of dictionaries containing information
+                about the stored aggregations.
+        """
+        aggregations = []
+        for agg_dict in agg_dicts:
+            aggregation = self._get_saved_aggregation(agg_dict)
+            if aggregation:
+                aggregations.append(aggregation)
+
+        self._aggregation_results.update(
+            aggregation_result_cache.get_results(aggregations)
+        )
 
     def get_aggregation(self, agg_dict):
         """Returns an aggregation object from an aggregation dict.
@@ -49,38 +93,25 @@ class ApiDataFetcher(interface.DataFetcher):
             object (instance of AggregationResult) from a saved aggregation
             or an empty dict if not found.
         """
-        aggregation_id = agg_dict.get("id")
-        if not aggregation_id:
-            return {}
-
-        aggregation = Aggregation.get_by_id(aggregation_id)
+        aggregation = self._get_saved_aggregation(agg_dict)
         if not aggregation:
             return {}
 
-        try:
-            agg_class = aggregator_manager.AggregatorManager.get_aggregator(
-                aggregation.agg_type
-            )
-        except KeyError:
+        result = self._aggregation_results.pop(aggregation.id, None)
+        if result is None:
+            result = aggregation_result_cache.get_result(aggregation)
+        result_obj, _ = result
+        if result_obj is None:
             return {}
 
-        if not agg_class:
-            return pd.DataFrame()
-
-        parameter_string = aggregation.parameters
-        parameters = json.loads(parameter_string)
-        parameter_index = parameters.pop("index", None)
-        indices, timeline_ids = self.get_indices_and_timelines(parameter_index)
-        aggregator = agg_class(
-            sketch_id=self._sketch_id, indices=indices, timeline_ids=timeline_ids
-        )
-
+        parameters = json.loads(aggregation.parameters)
+        _ = parameters.pop("index", None)
         _ = parameters.pop("supported_charts", None)
         chart_color = parameters.pop("chart_color", "N/A")
         chart_title = parameters.pop("chart_title", "N/A")
 
         data = {
-            "aggregation": aggregator.run(**parameters),
+            "aggregation": result_obj,
             "name": aggregation.name,
             "description": aggregation.description,
             "agg_type": aggregation.agg_type,
@@ -115,6 +146,8 @@ class ApiDataFetcher(interface.DataFetcher):
         orientation = group.orientation
 
         result_chart = None
+        runs = []
+        run_options = []
         for aggregator in group.aggregations:
             if aggregator.parameters:
                 aggregator_parameters = json.loads(aggregator.parameters)
@@ -135,8 +168,15 @@ class ApiDataFetcher(interface.DataFetcher):
             chart_type = aggregator_parameters.pop("supported_charts", None)
             color = aggregator_parameters.pop("chart_color", "")
             chart_title = aggregator_parameters.pop("chart_title", None)
-            result_obj = aggregator_obj.run(**aggregator_parameters)
+            runs.append((aggregator_obj, aggregator_parameters))
+            run_options.append((chart_type, color, chart_title))
+
+        # The aggregations of all aggregators are sent in a single request.
+        result_objs = aggregator_interface.run_aggregators(runs)
 
+        for (aggregator_obj, _), (chart_type, color, chart_title), result_obj in zip(
+            runs, run_options, result_objs
+        ):
             title = chart_title or aggregator_obj.chart_title
 
             chart = result_obj.to_chart(
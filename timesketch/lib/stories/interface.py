@@ -56,6 +56,15 @@ class StoryExporter:
         if not isinstance(blocks, (list, tuple)):
             return
 
+        if self._data_fetcher:
+            self._data_fetcher.prefetch_aggregations(
+                [
+                    block.get("componentProps", {}).get("aggregation") or {}
+                    for block in blocks
+                    if block.get("componentName") == "TsAggregationCompact"
+                ]
+            )
+
         for block in blocks:
             self.from_block_dict(block)
 
@@ -196,6 +205,17 @@ class DataFetcher:
         """
         raise NotImplementedError
 
+    def prefetch_aggregations(self, agg_dicts):
+        """Run the aggregations of a story before they are requested.
+
+        Data fetchers can override this to run all aggregations at once,
+        the default is to run them when they are requested.
+
+        Args:
+            agg_dicts (list): list of dictionaries containing information
+                about the stored aggregations.
+        """
+
     def get_view(self, view_dict):
         """Returns a data frame from a view dict.
 
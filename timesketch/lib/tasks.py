@@ -15,6 +15,8 @@
 
 
 import codecs
+from collections import Counter
+import contextlib
 from hashlib import sha1
 import io
 import json
@@ -28,8 +30,10 @@ from typing import Optional
 from urllib.parse import urlparse
 import yaml
 import prometheus_client
+import redis
 
 from celery import chain
+from celery import chord
 from celery import group
 from celery import signals
 from flask import current_app
@@ -40,16 +44,24 @@ from timesketch.app import configure_logger
 from timesketch.app import create_celery_app
 from timesketch.lib import datafinder
 from timesketch.lib import errors
+from timesketch.lib.aggregators import result_cache as aggregation_result_cache
 from timesketch.lib.analyzers import manager
 from timesketch.lib.analyzers.dfiq_plugins.manager import DFIQAnalyzerManager
+from timesketch.lib.datastores import query_cache
 from timesketch.lib.datastores.opensearch import OpenSearchDataStore
+from timesketch.lib.graphs import manager as graph_manager
+from timesketch.lib.datastores.opensearch import reset_shared_clients
 from timesketch.lib.definitions import METRICS_NAMESPACE
-from timesketch.lib.utils import read_and_validate_csv
-from timesketch.lib.utils import read_and_validate_jsonl
+from timesketch.lib.utils import iter_file_range_lines
+from timesketch.lib.utils import read_and_validate_csv_batches
+from timesketch.lib.utils import read_and_validate_jsonl_batches
 from timesketch.lib.utils import send_email
+from timesketch.lib.utils import split_file_by_lines
 from timesketch.models import db_session
+from timesketch.models.sketch import Aggregation
 from timesketch.models.sketch import Analysis
 from timesketch.models.sketch import AnalysisSession
+from timesketch.models.sketch import GraphCache
 from timesketch.models.sketch import SearchIndex
 from timesketch.models.sketch import Sketch
 from timesketch.models.sketch import Timeline
@@ -123,6 +135,18 @@ celery = create_celery_app()
 
 PLASO_MINIMUM_VERSION = 20201228
 
+# Default size in bytes of the ranges a file is split into for parallel
+# ingestion.
+DEFAULT_PARALLEL_INGESTION_RANGE_SIZE = 256 * 1024 * 1024
+
+# Maximum number of error messages a range task returns, the number of errors
+# is always returned.
+MAX_RANGE_ERROR_MESSAGES = 100
+
+# Default maximum number of analyzer tasks of a single analysis pipeline that
+# run at the same time.
+DEFAULT_ANALYZERS_MAX_CONCURRENCY = 8
+
 
 # pylint: disable=unused-argument
 @signals.after_setup_logger.connect
@@ -131,13 +155,20 @@ def setup_loggers(*args, **kwargs):
     configure_logger()
 
 
-def get_import_errors(error_container: dict, index_name: str, total_count: int):
+def get_import_errors(
+    error_container: dict,
+    index_name: str,
+    total_count: int,
+    error_count: Optional[int] = None,
+):
     """Returns a string with error message or an empty string if no errors.
 
     Args:
       error_container: dict with error messages for each index.
       index_name: string with the search index name.
       total_count: integer with the total amount of events indexed.
+      error_count: optional integer with the number of errors, for error
+          containers that only hold a sample of the error messages.
     """
     if index_name not in error_container:
         return ""
@@ -148,7 +179,8 @@ def get_import_errors(error_container: dict, index_name: str, total_count: int):
     if not error_list:
         return ""
 
-    error_count = len(error_list)
+    if error_count is None:
+        error_count = len(error_list)
 
     error_types = index_dict.get("types")
     error_details = index_dict.get("details")
@@ -195,11 +227,13 @@ class SqlAlchemyTask(celery.Task):
 # pylint: disable=unused-argument
 @signals.worker_process_init.connect
 def init_worker(**kwargs):
-    """Create new database engine per worker process."""
+    """Create new database engine and OpenSearch clients per worker process."""
     url = celery.conf.get("SQLALCHEMY_DATABASE_URI")
     engine_options = celery.conf.get("SQLALCHEMY_ENGINE_OPTIONS", {})
     engine = create_engine(url, future=True, **engine_options)
     db_session.configure(bind=engine)
+    # Connections inherited from the parent process must not be reused.
+    reset_shared_clients()
 
 
 def _close_index(index_name, data_store, timeline_id):
@@ -328,6 +362,174 @@ def _set_datasource_total_events(timeline_id, file_path, total_file_events):
     raise KeyError(f"No datasource find in the timeline with file_path: {file_path}")
 
 
+def _get_generic_mappings():
+    """Returns the document mappings from GENERIC_MAPPING_FILE, if any.
+
+    Raises:
+        RuntimeError: If the mappings in the file are not a dict.
+    """
+    mappings = None
+    mappings_file_path = current_app.config.get("GENERIC_MAPPING_FILE", "")
+    if os.path.isfile(mappings_file_path):
+        try:
+            with open(mappings_file_path, "r", encoding="utf-8") as mfh:
+                mappings = json.load(mfh)
+
+                if not isinstance(mappings, dict):
+                    raise RuntimeError(
+                        "Unable to create mappings, the mappings are not a "
+                        "dict, please look at the file: {:s}".format(mappings_file_path)
+                    )
+        except (json.JSONDecodeError, OSError):
+            logger.error("Unable to read in mapping", exc_info=True)
+    return mappings
+
+
+class _MappingLimit:
+    """Keeps the total fields limit of an index above the fields being indexed.
+
+    Each unique key is counted twice due to the "keyword" type plus a
+    percentage buffer (OPENSEARCH_MAPPING_BUFFER, default 10%). To prevent
+    mapping explosions the limit is checked against an upper mapping limit
+    (OPENSEARCH_MAPPING_UPPER_LIMIT, default: 1000).
+
+    Attributes:
+        unique_keys (set): Fields of the index and of the indexed events.
+        current_limit (int): The total fields limit of the index.
+        upper_limit (int): The highest limit the index may be raised to.
+    """
+
+    LOCK_KEY_PREFIX = "timesketch:mapping_limit"
+    # Seconds a task holds or waits for the lock of an index.
+    LOCK_TIMEOUT = 30
+
+    def __init__(self, opensearch, index_name: str, timeline_id: int):
+        """Initialize with the fields and the limit of the index.
+
+        Args:
+            opensearch: Instance of opensearch.OpenSearchDataStore.
+            index_name: Name of the datastore index.
+            timeline_id: ID of the timeline that is being indexed.
+        """
+        self._opensearch = opensearch
+        self._index_name = index_name
+        self._timeline_id = timeline_id
+        self._buffer_percentage = float(
+            current_app.config.get("OPENSEARCH_MAPPING_BUFFER", 0.1)
+        )
+        self.upper_limit = int(
+            current_app.config.get("OPENSEARCH_MAPPING_UPPER_LIMIT", 1000)
+        )
+        current_index_mapping_properties = (
+            opensearch.client.indices.get_mapping(index=index_name)
+            .get(index_name, {})
+            .get("mappings", {})
+            .get("properties", {})
+        )
+        self.unique_keys = set(current_index_mapping_properties)
+        self.current_limit = self._get_index_limit()
+
+    def _get_index_limit(self) -> int:
+        """Returns the total fields limit set on the index."""
+        try:
+            return int(
+                self._opensearch.client.indices.get_settings(index=self._index_name)[
+                    self._index_name
+                ]["settings"]["index"]["mapping"]["total_fields"]["limit"]
+            )
+        except KeyError:
+            return 1000
+
+    def update(self, events: list) -> int:
+        """Add the fields of events and raise the limit of the index if needed.
+
+        Args:
+            events: List of event dicts about to be indexed.
+
+        Returns:
+            The limit required for the fields seen so far. If it is above the
+            upper limit the limit of the index is left unchanged.
+        """
+        for event in events:
+            self.unique_keys.update(event.keys())
+        new_limit = int((len(self.unique_keys) * 2) * (1 + self._buffer_percentage))
+        if new_limit > self.upper_limit:
+            return new_limit
+
+        if new_limit > self.current_limit and self.current_limit < self.upper_limit:
+            # Tasks indexing into the same index read and raise the limit one
+            # at a time, so that no task lowers a limit another task raised.
+            try:
+                with self._get_lock():
+                    self._raise_limit(new_limit)
+            except redis.exceptions.RedisError as e:
+                logger.warning(
+                    "Unable to lock the mapping limit of index [%s]: %s",
+                    self._index_name,
+                    str(e),
+                )
+                self._raise_limit(new_limit)
+        return new_limit
+
+    def _get_lock(self):
+        """Returns a lock shared by all tasks that index into the index.
+
+        Returns:
+            A Redis lock, or a context manager that does nothing if Redis is
+            not configured.
+        """
+        client = query_cache.get_redis_client()
+        if client is None:
+            return contextlib.nullcontext()
+        return client.lock(
+            f"{self.LOCK_KEY_PREFIX}:{self._index_name}",
+            timeout=self.LOCK_TIMEOUT,
+            blocking_timeout=self.LOCK_TIMEOUT,
+        )
+
+    def _raise_limit(self, new_limit: int):
+        """Raise the limit of the index, unless it is already high enough.
+
+        Args:
+            new_limit: The limit required for the fields seen so far.
+        """
+        # Other tasks indexing into the same index may have raised the limit
+        # in the meantime, the limit must never be lowered.
+        self.current_limit = max(self.current_limit, self._get_index_limit())
+        if new_limit <= self.current_limit:
+            return
+        self._opensearch.client.indices.put_settings(
+            index=self._index_name,
+            body={"index.mapping.total_fields.limit": new_limit},
+        )
+        METRICS["worker_mapping_increase"].labels(
+            index_name=self._index_name, timeline_id=self._timeline_id
+        ).set(new_limit)
+        logger.info(
+            "OpenSearch index [%s] mapping limit increased to: %d",
+            self._index_name,
+            new_limit,
+        )
+        self.current_limit = new_limit
+
+
+def _get_mapping_limit_error(
+    timeline_name: str, index_name: str, upper_limit: int, new_limit: int
+) -> str:
+    """Returns and logs the error for exceeding the upper mapping limit."""
+    METRICS["worker_mapping_increase_limit_exceeded"].labels(
+        index_name=index_name
+    ).inc()
+    error_msg = (
+        f"Error: Indexing timeline [{timeline_name}] into [{index_name}] "
+        f"exceeds the upper field mapping limit of {upper_limit}. "
+        f"New calculated mapping limit: {new_limit}. Review your "
+        "import data or adjust OPENSEARCH_MAPPING_UPPER_LIMIT."
+    )
+    logger.error(error_msg)
+    return error_msg
+
+
 def _get_index_task_class(file_extension):
     """Get correct index task function for the supplied file type.
 
@@ -349,7 +551,25 @@ def _get_index_task_class(file_extension):
     return index_class
 
 
-def build_index_pipeline(
+def _use_parallel_ingestion(file_path: str, file_extension: str) -> bool:
+    """Returns whether a file is large enough to be indexed in parallel.
+
+    Only JSONL files are split, lines of a CSV file may span multiple lines
+    in quoted fields and cannot be split safely at a newline.
+
+    Args:
+        file_path: Path to the file on disk.
+        file_extension: The file extension of the file.
+    """
+    min_file_size = int(current_app.config.get("PARALLEL_INGESTION_MIN_FILE_SIZE", 0))
+    if not min_file_size or file_extension not in ("jsonl", "json"):
+        return False
+    if not file_path or not os.path.isfile(file_path):
+        return False
+    return os.path.getsize(file_path) >= min_file_size
+
+
+def build_index_pipeline(  # pylint: disable=too-many-arguments
     file_path: str = "",
     events: str = "",
     timeline_name: str = "",
@@ -360,6 +580,7 @@ def build_index_pipeline(
     timeline_id: Optional[int] = None,
     headers_mapping: Optional[dict] = None,
     delimiter: str = ",",
+    upload_state_path: str = "",
 ):
     """Build a pipeline for index and analysis.
 
@@ -382,6 +603,9 @@ def build_index_pipeline(
                          (ii) source header we want to insert [key=source], and
                          (iii) def. value if we add a new column [key=default_value]
         delimiter: Delimiter to use. Default uses ","
+        upload_state_path: Optional path of the state files of a chunked
+            upload, the files are removed once the indexing task is done or
+            failed.
 
     Returns:
         Celery chain with indexing task (or single indexing task) and analyzer
@@ -390,6 +614,8 @@ def build_index_pipeline(
     if not (file_path or events):
         raise RuntimeError("Unable to upload data, missing either a file or events.")
     index_task_class = _get_index_task_class(file_extension)
+    if _use_parallel_ingestion(file_path, file_extension):
+        index_task_class = run_csv_jsonl_parallel
     sketch_analyzer_chain = None
     searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
 
@@ -410,6 +636,11 @@ def build_index_pipeline(
             file_path, events, timeline_name, index_name, file_extension, timeline_id
         )
 
+    if upload_state_path:
+        cleanup_task = run_upload_cleanup.si(upload_state_path)
+        index_task.link(cleanup_task)
+        index_task.link_error(cleanup_task)
+
     # TODO: Check if a scenario is set or an investigative question
     # is in the sketch, and then enable data finder on the newly
     # indexed data.
@@ -485,6 +716,7 @@ def build_sketch_analysis_pipeline(
     timeline_id=None,
     include_dfiq=False,
     approach_id=None,
+    max_concurrency=None,
 ):
     """Build a pipeline for sketch analysis.
 
@@ -504,12 +736,33 @@ def build_sketch_analysis_pipeline(
         timeline_id (int): Optional int of the timeline to run the analyzer on.
         include_dfiq (bool): If trie then include dfiq analyzers in the task.
         approach_id (int): Optional ID of the approach triggering the analyzer.
+        max_concurrency (int): Optional maximum number of analyzer tasks of
+            this pipeline that run at the same time. Defaults to
+            ANALYZERS_MAX_CONCURRENCY from the configuration.
 
     Returns:
-        A tuple with a Celery group with analysis tasks or None if no analyzers
-        are enabled and an analyzer session ID.
+        A tuple with a Celery chain with analysis tasks or None if no analyzers
+        are enabled and an analyzer session ID. Analyzers that don't depend
+        on each other run concurrently, analyzers with dependencies run after
+        the analyzers they depend on.
+
+    Raises:
+        ValueError: If max_concurrency is not a positive integer.
     """
-    tasks = []
+    if max_concurrency is None:
+        max_concurrency = current_app.config.get(
+            "ANALYZERS_MAX_CONCURRENCY", DEFAULT_ANALYZERS_MAX_CONCURRENCY
+        )
+    # A bool is an int, but not a number of tasks.
+    if (
+        isinstance(max_concurrency, bool)
+        or not isinstance(max_concurrency, int)
+        or max_concurrency < 1
+    ):
+        raise ValueError(
+            f"Max concurrency needs to be a positive integer, not {max_concurrency!r}"
+        )
+
     if not analyzer_names:
         analyzer_names = current_app.config.get("AUTO_SKETCH_ANALYZERS", [])
         if not analyzer_kwargs:
@@ -531,88 +784,106 @@ def build_sketch_analysis_pipeline(
     analysis_session = AnalysisSession(user=user, sketch=sketch)
     db_session.add(analysis_session)
 
-    analyzers = manager.AnalysisManager.get_analyzers(analyzer_names, include_dfiq)
-    for analyzer_name, analyzer_class in analyzers:
-        base_kwargs = analyzer_kwargs.get(analyzer_name, {})
-        searchindex = SearchIndex.get_by_id(searchindex_id)
-
-        timeline = None
-        if timeline_id:
-            timeline = Timeline.get_by_id(timeline_id)
-
-        if not timeline:
-            timeline = Timeline.query.filter_by(
-                sketch=sketch, searchindex=searchindex
-            ).first()
-
-        additional_kwargs = analyzer_class.get_kwargs()
-        if isinstance(additional_kwargs, dict):
-            additional_kwargs = [additional_kwargs]
-
-        kwargs_list = []
-        for _kwargs in additional_kwargs:
-            combined_kwargs = {**base_kwargs, **_kwargs}
-            kwargs_list.append(combined_kwargs)
-
-        if not kwargs_list:
-            kwargs_list = [base_kwargs]
-
-        # Create a hash of the analyzer arguments to compare with later analyzer
-        # executions if the analyzer arguments / config changed.
-        kwargs_list_hash = sha1(
-            json.dumps(kwargs_list, sort_keys=True).encode("utf-8")
-        ).hexdigest()
-
-        if not analyzer_force_run:
-            skip_analysis = False
-            for past_analysis in timeline.analysis:
-                if (
-                    (past_analysis.analyzer_name == analyzer_name)
-                    and (past_analysis.get_status.status == "DONE")
-                    and (past_analysis.created_at > timeline.updated_at)
-                ):
-                    for attribute in past_analysis.get_attributes:
-                        if attribute.value == kwargs_list_hash:
-                            skip_analysis = True
+    analyzer_groups = manager.AnalysisManager.get_analyzer_groups(
+        analyzer_names, include_dfiq
+    )
+    stages = []
+    for analyzer_group in analyzer_groups:
+        stage_tasks = []
+        for analyzer_name, analyzer_class in analyzer_group:
+            base_kwargs = analyzer_kwargs.get(analyzer_name, {})
+            searchindex = SearchIndex.get_by_id(searchindex_id)
+
+            timeline = None
+            if timeline_id:
+                timeline = Timeline.get_by_id(timeline_id)
+
+            if not timeline:
+                timeline = Timeline.query.filter_by(
+                    sketch=sketch, searchindex=searchindex
+                ).first()
+
+            additional_kwargs = analyzer_class.get_kwargs()
+            if isinstance(additional_kwargs, dict):
+                additional_kwargs = [additional_kwargs]
+
+            kwargs_list = []
+            for _kwargs in additional_kwargs:
+                combined_kwargs = {**base_kwargs, **_kwargs}
+                kwargs_list.append(combined_kwargs)
+
+            if not kwargs_list:
+                kwargs_list = [base_kwargs]
+
+            # Create a hash of the analyzer arguments to compare with later analyzer
+            # executions if the analyzer arguments / config changed.
+            kwargs_list_hash = sha1(
+                json.dumps(kwargs_list, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+
+            if not analyzer_force_run:
+                skip_analysis = False
+                for past_analysis in timeline.analysis:
+                    if (
+                        (past_analysis.analyzer_name == analyzer_name)
+                        and (past_analysis.get_status.status == "DONE")
+                        and (past_analysis.created_at > timeline.updated_at)
+                    ):
+                        for attribute in past_analysis.get_attributes:
+                            if attribute.value == kwargs_list_hash:
+                                skip_analysis = True
+                                break
+                        if skip_analysis:
                             break
-                    if skip_analysis:
-                        break
-
-            if skip_analysis:
-                continue
 
-        for kwargs in kwargs_list:
-            analysis = Analysis(
-                name=analyzer_name,
-                description=analyzer_name,
-                analyzer_name=analyzer_name,
-                parameters=json.dumps(kwargs),
-                user=user,
-                sketch=sketch,
-                timeline=timeline,
-                approach_id=approach_id,
-            )
-            analysis.add_attribute(name="kwargs_hash", value=kwargs_list_hash)
-            analysis.set_status("PENDING")
-            db_session.add(analysis)
-            analysis_session.analyses.append(analysis)
-            db_session.commit()
-
-            tasks.append(
-                run_sketch_analyzer.s(
-                    sketch_id,
-                    analysis.id,
-                    analyzer_name,
-                    timeline_id=timeline_id,
-                    **kwargs,
+                if skip_analysis:
+                    continue
+
+            for kwargs in kwargs_list:
+                analysis = Analysis(
+                    name=analyzer_name,
+                    description=analyzer_name,
+                    analyzer_name=analyzer_name,
+                    parameters=json.dumps(kwargs),
+                    user=user,
+                    sketch=sketch,
+                    timeline=timeline,
+                    approach_id=approach_id,
                 )
-            )
+                analysis.add_attribute(name="kwargs_hash", value=kwargs_list_hash)
+                analysis.set_status("PENDING")
+                db_session.add(analysis)
+                analysis_session.analyses.append(analysis)
+                db_session.commit()
+
+                stage_tasks.append(
+                    run_sketch_analyzer.s(
+                        sketch_id,
+                        analysis.id,
+                        analyzer_name,
+                        timeline_id=timeline_id,
+                        **kwargs,
+                    )
+                )
+        if stage_tasks:
+            stages.append(stage_tasks)
+
     # Commit the analysis session to the database.
     if len(analysis_session.analyses) > 0:
         db_session.add(analysis_session)
         db_session.commit()
 
+    tasks = []
+    for stage_tasks in stages:
+        if tasks:
+            # A group returns a list of index names, collapse it back into
+            # the single index name the next analyzers expect.
+            tasks.append(run_sketch_init.s())
+        tasks.append(_build_analyzer_stage(stage_tasks, max_concurrency))
+
     if current_app.config.get("ENABLE_EMAIL_NOTIFICATIONS"):
+        if tasks:
+            tasks.append(run_sketch_init.s())
         tasks.append(run_email_result_task.s(sketch_id))
 
     if not tasks:
@@ -621,6 +892,27 @@ def build_sketch_analysis_pipeline(
     return chain(tasks), analysis_session
 
 
+def _build_analyzer_stage(stage_tasks, max_concurrency):
+    """Build the Celery signature for analyzers that can run concurrently.
+
+    Args:
+        stage_tasks (list): analyzer task signatures without dependencies
+            between each other.
+        max_concurrency (int): maximum number of the analyzer tasks that run
+            at the same time. The tasks are spread over this many chains.
+
+    Returns:
+        A Celery signature, a group if more than one task runs concurrently.
+    """
+    lanes = [
+        stage_tasks[lane_index::max_concurrency]
+        for lane_index in range(min(max_concurrency, len(stage_tasks)))
+    ]
+    if len(lanes) == 1:
+        return chain(lanes[0])
+    return group(chain(lane) for lane in lanes)
+
+
 @celery.task(track_started=True)
 def run_sketch_init(index_name_list):
     """Create sketch init Celery task.
@@ -1052,9 +1344,9 @@ def run_csv_jsonl(
         METRICS["worker_files_parsed"].labels(source_type=source_type).inc()
 
     validators = {
-        "csv": read_and_validate_csv,
-        "jsonl": read_and_validate_jsonl,
-        "json": read_and_validate_jsonl,
+        "csv": read_and_validate_csv_batches,
+        "jsonl": read_and_validate_jsonl_batches,
+        "json": read_and_validate_jsonl_batches,
     }
     read_and_validate = validators.get(source_type)
 
@@ -1080,21 +1372,7 @@ def run_csv_jsonl(
         )
     )
 
-    mappings = None
-    mappings_file_path = current_app.config.get("GENERIC_MAPPING_FILE", "")
-    if os.path.isfile(mappings_file_path):
-        try:
-            with open(mappings_file_path, "r", encoding="utf-8") as mfh:
-                mappings = json.load(mfh)
-
-                if not isinstance(mappings, dict):
-                    raise RuntimeError(
-                        "Unable to create mappings, the mappings are not a "
-                        "dict, please look at the file: {:s}".format(mappings_file_path)
-                    )
-        except (json.JSONDecodeError, OSError):
-            logger.error("Unable to read in mapping", exc_info=True)
-
+    mappings = _get_generic_mappings()
     opensearch = OpenSearchDataStore()
 
     # Reason for the broad exception catch is that we want to capture
@@ -1102,13 +1380,6 @@ def run_csv_jsonl(
     final_counter = 0
     error_msg = ""
     error_count = 0
-    unique_keys = set()
-    limit_buffer_percentage = float(
-        current_app.config.get("OPENSEARCH_MAPPING_BUFFER", 0.1)
-    )
-    upper_mapping_limit = int(
-        current_app.config.get("OPENSEARCH_MAPPING_UPPER_LIMIT", 1000)
-    )
 
     searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
 
@@ -1120,68 +1391,26 @@ def run_csv_jsonl(
             searchindex.set_status("ready")
             db_session.add(searchindex)
             db_session.commit()
-        current_index_mapping_properties = (
-            opensearch.client.indices.get_mapping(index=index_name)
-            .get(index_name, {})
-            .get("mappings", {})
-            .get("properties", {})
-        )
-        unique_keys = set(current_index_mapping_properties)
+        mapping_limit = _MappingLimit(opensearch, index_name, timeline_id)
 
-        try:
-            current_limit = int(
-                opensearch.client.indices.get_settings(index=index_name)[index_name][
-                    "settings"
-                ]["index"]["mapping"]["total_fields"]["limit"]
-            )
-        except KeyError:
-            current_limit = 1000
-
-        for event in read_and_validate(
+        for event_batch in read_and_validate(
             file_handle=file_handle,
             headers_mapping=headers_mapping,
             delimiter=delimiter,
         ):
-            unique_keys.update(event.keys())
-            # Calculating the new limit. Each unique key is counted twice due to
-            # the "keyword" type plus a percentage buffer (default 10%).
-            new_limit = int((len(unique_keys) * 2) * (1 + limit_buffer_percentage))
-            # To prevent mapping explosions we still check against an upper
-            # mapping limit set in timesketch.conf (default: 1000).
-            if new_limit > upper_mapping_limit:
-                METRICS["worker_mapping_increase_limit_exceeded"].labels(
-                    index_name=index_name
-                ).inc()
-                error_msg = (
-                    f"Error: Indexing timeline [{timeline_name}] into [{index_name}] "
-                    f"exceeds the upper field mapping limit of {upper_mapping_limit}. "
-                    f"New calculated mapping limit: {new_limit}. Review your "
-                    "import data or adjust OPENSEARCH_MAPPING_UPPER_LIMIT."
+            new_limit = mapping_limit.update(event_batch)
+            if new_limit > mapping_limit.upper_limit:
+                error_msg = _get_mapping_limit_error(
+                    timeline_name, index_name, mapping_limit.upper_limit, new_limit
                 )
-                logger.error(error_msg)
                 _set_datasource_status(
                     timeline_id, file_path, "fail", error_message=str(error_msg)
                 )
                 return None
 
-            if new_limit > current_limit and current_limit < upper_mapping_limit:
-                new_limit = min(new_limit, upper_mapping_limit)
-                opensearch.client.indices.put_settings(
-                    index=index_name,
-                    body={"index.mapping.total_fields.limit": new_limit},
-                )
-                METRICS["worker_mapping_increase"].labels(
-                    index_name=index_name, timeline_id=timeline_id
-                ).set(new_limit)
-                logger.info(
-                    "OpenSearch index [%s] mapping limit increased to: %d",
-                    index_name,
-                    new_limit,
-                )
-                current_limit = new_limit
-
-            opensearch.import_event(index_name, event, timeline_id=timeline_id)
-            final_counter += 1
+            for event in event_batch:
+                opensearch.import_event(index_name, event, timeline_id=timeline_id)
+            final_counter += len(event_batch)
 
         # Import the remaining events
         results = opensearch.flush_queued_events()
@@ -1254,6 +1483,439 @@ def run_csv_jsonl(
     return index_name
 
 
+@celery.task(bind=True, track_started=True, base=SqlAlchemyTask)
+def run_csv_jsonl_parallel(
+    self,
+    file_path: str,
+    events: str,
+    timeline_name: str,
+    index_name: str,
+    source_type: str,
+    timeline_id: int,
+    headers_mapping: Optional[dict] = None,
+    delimiter: str = ",",
+):
+    """Create a Celery task that indexes a large JSONL file in parallel.
+
+    The file is split into byte ranges that end at a newline and the task is
+    replaced by a chord of one run_csv_jsonl_range task per range, followed
+    by run_csv_jsonl_merge that sets the status of the data source. The
+    number of events of the file is counted while splitting it.
+
+    Args:
+        file_path: Path to the JSONL file.
+        events: Not used, parallel ingestion is only done for files.
+        timeline_name: Name of the Timesketch timeline.
+        index_name: Name of the datastore index.
+        source_type: Type of file, jsonl or json.
+        timeline_id: ID of the timeline object this data belongs to.
+        headers_mapping: list of dicts containing:
+                         (i) target header we want to insert [key=target],
+                         (ii) sources header we want to rename/combine [key=source],
+                         (iii) def. value if we add a new column [key=default_value]
+        delimiter: Not used for JSONL files.
+
+    Returns:
+        Name (str) of the index, once the chord is done.
+    """
+    METRICS["worker_csv_jsonl_runs"].inc()
+    METRICS["worker_files_parsed"].labels(source_type=source_type).inc()
+    time_start = time.time()
+
+    range_size = int(
+        current_app.config.get(
+            "PARALLEL_INGESTION_RANGE_SIZE", DEFAULT_PARALLEL_INGESTION_RANGE_SIZE
+        )
+    )
+    ranges = split_file_by_lines(file_path, range_size)
+    _set_datasource_total_events(
+        timeline_id, file_path, sum(lines for _, _, lines in ranges)
+    )
+    _set_datasource_status(timeline_id, file_path, "processing")
+    logger.info(
+        "Index timeline [%s] to index [%s] (source: %s) in %d parallel tasks",
+        timeline_name,
+        index_name,
+        source_type,
+        len(ranges),
+    )
+
+    searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
+    try:
+        # The index is created once, before the range tasks run.
+        opensearch = OpenSearchDataStore()
+        os_index_name = opensearch.create_index(
+            index_name=index_name, mappings=_get_generic_mappings()
+        )
+        if searchindex and os_index_name:
+            searchindex.set_status("ready")
+            db_session.add(searchindex)
+            db_session.commit()
+    except errors.IndexNotReadyError as e:
+        METRICS["worker_index_not_ready_errors"].labels(
+            index_name=index_name, timeline_id=timeline_id, source_type=source_type
+        ).inc()
+        logger.error("Unable to create index [%s]: %s", index_name, str(e))
+        _set_datasource_status(timeline_id, file_path, "fail", error_message=str(e))
+        searchindex.set_status("fail")
+        raise
+    except (RuntimeError, RequestError, errors.DatastoreConnectionError) as e:
+        _set_datasource_status(timeline_id, file_path, "fail", error_message=str(e))
+        raise
+
+    range_tasks = []
+    line_offset = 0
+    for start, end, lines in ranges:
+        range_tasks.append(
+            run_csv_jsonl_range.s(
+                file_path,
+                start,
+                end,
+                line_offset,
+                timeline_name,
+                index_name,
+                timeline_id,
+                headers_mapping,
+            )
+        )
+        line_offset += lines
+
+    merge_task = run_csv_jsonl_merge.s(
+        file_path, timeline_name, index_name, source_type, timeline_id, time_start
+    )
+    if not range_tasks:
+        return merge_task([])
+    return self.replace(chord(group(range_tasks), merge_task))
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_csv_jsonl_range(
+    file_path: str,
+    start: int,
+    end: int,
+    line_offset: int,
+    timeline_name: str,
+    index_name: str,
+    timeline_id: int,
+    headers_mapping: Optional[dict] = None,
+):
+    """Create a Celery task for indexing a byte range of a JSONL file.
+
+    Errors are returned instead of raised, so that the merge task of the
+    chord runs and sets the status of the data source.
+
+    Args:
+        file_path: Path to the JSONL file.
+        start: Offset of the first byte of the range.
+        end: Offset of the end of the range (exclusive).
+        line_offset: Number of lines in the file before the range.
+        timeline_name: Name of the Timesketch timeline.
+        index_name: Name of the datastore index.
+        timeline_id: ID of the timeline object this data belongs to.
+        headers_mapping: list of dicts, see run_csv_jsonl.
+
+    Returns:
+        A dict with the number of events, the import errors, the fields of
+        the events and a failure message if the range could not be indexed.
+    """
+    result = {
+        "events": 0,
+        "error_count": 0,
+        "errors": [],
+        "error_types": {},
+        "error_details": {},
+        "unique_keys": [],
+        "failure": "",
+    }
+
+    try:
+        opensearch = OpenSearchDataStore()
+        mapping_limit = _MappingLimit(opensearch, index_name, timeline_id)
+
+        for event_batch in read_and_validate_jsonl_batches(
+            iter_file_range_lines(file_path, start, end),
+            headers_mapping=headers_mapping,
+            line_offset=line_offset,
+        ):
+            new_limit = mapping_limit.update(event_batch)
+            if new_limit > mapping_limit.upper_limit:
+                result["failure"] = _get_mapping_limit_error(
+                    timeline_name, index_name, mapping_limit.upper_limit, new_limit
+                )
+                return result
+
+            for event in event_batch:
+                opensearch.import_event(index_name, event, timeline_id=timeline_id)
+            result["events"] += len(event_batch)
+
+        results = opensearch.flush_queued_events()
+    except (errors.DataIngestionError, RuntimeError, RequestError) as e:
+        result["failure"] = str(e)
+        return result
+    except Exception as e:  # pylint: disable=broad-except
+        result["failure"] = traceback.format_exc()
+        logger.error("Error: %s\n%s", str(e), result["failure"])
+        return result
+
+    index_errors = results.get("error_container", {}).get(index_name, {})
+    error_list = index_errors.get("errors", [])
+    result["error_count"] = len(error_list)
+    result["errors"] = error_list[:MAX_RANGE_ERROR_MESSAGES]
+    result["error_types"] = dict(index_errors.get("types", {}))
+    result["error_details"] = dict(index_errors.get("details", {}))
+    result["unique_keys"] = sorted(mapping_limit.unique_keys)
+    return result
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_csv_jsonl_merge(
+    range_results: list,
+    file_path: str,
+    timeline_name: str,
+    index_name: str,
+    source_type: str,
+    timeline_id: int,
+    time_start: float,
+):
+    """Create a Celery task that merges the results of the range tasks.
+
+    Args:
+        range_results: List of results of run_csv_jsonl_range.
+        file_path: Path to the JSONL file.
+        timeline_name: Name of the Timesketch timeline.
+        index_name: Name of the datastore index.
+        source_type: Type of file, jsonl or json.
+        timeline_id: ID of the timeline object this data belongs to.
+        time_start: Time the parallel ingestion started, in seconds since epoch.
+
+    Returns:
+        Name (str) of the index, or None if any of the ranges failed.
+    """
+    final_counter = 0
+    error_count = 0
+    index_errors = {"errors": [], "types": Counter(), "details": Counter()}
+    unique_keys = set()
+    failures = []
+
+    for range_result in range_results:
+        final_counter += range_result.get("events", 0)
+        error_count += range_result.get("error_count", 0)
+        index_errors["errors"].extend(range_result.get("errors", []))
+        index_errors["types"].update(range_result.get("error_types", {}))
+        index_errors["details"].update(range_result.get("error_details", {}))
+        unique_keys.update(range_result.get("unique_keys", []))
+        if range_result.get("failure"):
+            failures.append(range_result["failure"])
+
+    if not failures:
+        # Each range only saw the fields of its own events, check the
+        # fields of the whole file.
+        try:
+            mapping_limit = _MappingLimit(
+                OpenSearchDataStore(), index_name, timeline_id
+            )
+            mapping_limit.unique_keys.update(unique_keys)
+            new_limit = mapping_limit.update([])
+            if new_limit > mapping_limit.upper_limit:
+                failures.append(
+                    _get_mapping_limit_error(
+                        timeline_name, index_name, mapping_limit.upper_limit, new_limit
+                    )
+                )
+        except (NotFoundError, RequestError) as e:
+            failures.append(str(e))
+
+    if failures:
+        _set_datasource_status(
+            timeline_id, file_path, "fail", error_message="\n".join(failures)
+        )
+        return None
+
+    error_msg = get_import_errors(
+        error_container={index_name: index_errors},
+        index_name=index_name,
+        total_count=final_counter,
+        error_count=error_count,
+    )
+
+    METRICS["worker_events_added"].labels(
+        index_name=index_name, timeline_id=timeline_id, source_type=source_type
+    ).set(final_counter)
+    logger.info(
+        "Index timeline (ID: %d) to index [%s] - %d out of %d events imported "
+        "in %d parallel tasks.",
+        timeline_id,
+        index_name,
+        final_counter - error_count,
+        final_counter,
+        len(range_results),
+    )
+
+    # Set status to ready when done
+    _set_datasource_status(timeline_id, file_path, "ready", error_message=error_msg)
+
+    METRICS["worker_run_time"].labels(
+        index_name=index_name, timeline_id=timeline_id, source_type=source_type
+    ).observe(time.time() - time_start)
+    return index_name
+
+
+@celery.task(track_started=True)
+def run_upload_cleanup(upload_state_path: str):
+    """Create a Celery task that removes the state files of a chunked upload.
+
+    The completion marker and the chunk manifest are only needed while the
+    upload is indexed. Once they are removed, the same file can be uploaded
+    again.
+
+    Args:
+        upload_state_path: The path that the state files of the upload use.
+    """
+    for suffix in (".done", ".chunks"):
+        try:
+            os.remove(f"{upload_state_path}{suffix}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(
+                "Unable to remove the upload state %s%s: %s",
+                upload_state_path,
+                suffix,
+                str(e),
+            )
+
+
+@celery.task(track_started=True)
+def run_tag_events(event_ids_per_index: dict, tags: list):
+    """Create a Celery task that adds tags to events.
+
+    Args:
+        event_ids_per_index: Dict with index names as keys and lists of
+            document IDs of the events to tag in that index as values.
+        tags: List of tags to add to the events.
+
+    Returns:
+        Dict with the number of matched, updated and unchanged events, the
+        number of events that were not tagged because of version conflicts
+        and any errors.
+    """
+    datastore = OpenSearchDataStore()
+    results = {
+        "total": 0,
+        "updated": 0,
+        "noops": 0,
+        "version_conflicts": 0,
+        "errors": [],
+    }
+    for index_name, event_ids in event_ids_per_index.items():
+        try:
+            result = datastore.add_tags_to_events(index_name, event_ids, tags)
+        except (NotFoundError, RequestError) as e:
+            logger.error("Unable to tag events in index %s", index_name, exc_info=True)
+            results["errors"].append(f"Unable to tag events in {index_name}: {e!s}")
+            continue
+
+        for key in ("total", "updated", "noops", "version_conflicts"):
+            results[key] += result[key]
+        results["errors"].extend(str(failure) for failure in result["failures"])
+        if result["version_conflicts"]:
+            results["errors"].append(
+                f"Unable to tag {result['version_conflicts']:d} events in "
+                f"{index_name:s}, they were changed by another update."
+            )
+
+    logger.info(
+        "Tagged %d out of %d events with [%s]",
+        results["updated"],
+        results["total"],
+        ", ".join(tags),
+    )
+    return results
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_graph_generation(graphcache_id: int):
+    """Create a Celery task that generates the pending partial graphs.
+
+    Every timeline of a graph cache has its own partial graph, only the
+    partial graphs with the pending status are generated.
+
+    Args:
+        graphcache_id: The ID of the graph cache.
+
+    Returns:
+        The number of partial graphs that were generated.
+    """
+    graph_cache = GraphCache.get_by_id(graphcache_id)
+    if not graph_cache:
+        logger.error("Unable to generate graph, no graph cache %d", graphcache_id)
+        return 0
+
+    try:
+        graph_class = graph_manager.GraphManager.get_graph(graph_cache.graph_plugin)
+    except KeyError:
+        logger.error("Unable to generate graph, no plugin %s", graph_cache.graph_plugin)
+        for partial_graph in graph_cache.partial_graphs:
+            if partial_graph.get_status.status == "pending":
+                partial_graph.set_status("fail")
+        return 0
+
+    generated = 0
+    for partial_graph in graph_cache.partial_graphs:
+        if partial_graph.get_status.status != "pending":
+            continue
+
+        partial_graph.set_status("processing")
+        try:
+            graph = graph_class(
+                sketch=graph_cache.sketch, timeline_ids=[partial_graph.timeline_id]
+            )
+            graph_elements = graph.generate_partial()
+        except Exception:  # pylint: disable=broad-except
+            logger.error(
+                "Unable to generate graph %s for timeline %d",
+                graph_cache.graph_plugin,
+                partial_graph.timeline_id,
+                exc_info=True,
+            )
+            partial_graph.set_status("fail")
+            continue
+
+        partial_graph.graph_elements = json.dumps(graph_elements)
+        partial_graph.num_nodes = len(graph_elements["nodes"])
+        partial_graph.num_edges = len(graph_elements["edges"])
+        partial_graph.set_status("ready")
+        generated += 1
+
+    return generated
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_aggregation_result_refresh(aggregation_id: int):
+    """Create a Celery task that refreshes the cached result of an aggregation.
+
+    Args:
+        aggregation_id: The ID of the saved aggregation.
+
+    Returns:
+        True if the result was refreshed, False otherwise.
+    """
+    aggregation = Aggregation.get_by_id(aggregation_id)
+    if not aggregation:
+        logger.error("Unable to refresh result, no aggregation %d", aggregation_id)
+        return False
+
+    try:
+        return aggregation_result_cache.refresh(aggregation)
+    except Exception:  # pylint: disable=broad-except
+        logger.error(
+            "Unable to refresh the result of aggregation %d",
+            aggregation_id,
+            exc_info=True,
+        )
+        return False
+
+
 @celery.task(track_started=True)
 def find_data_task(
     rule_name, sketch_id, start_date, end_date, timeline_ids=None, parameters=None
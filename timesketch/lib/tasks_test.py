@@ -0,0 +1,219 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Celery tasks."""
+
+from unittest import mock
+
+from celery import Celery
+from celery import group
+from celery import signature
+from celery.canvas import _chain  # pylint: disable=protected-access
+from celery.canvas import chord
+from opensearchpy.exceptions import NotFoundError
+
+from timesketch import app as timesketch_app
+from timesketch.lib.testlib import BaseTest
+
+# Importing the tasks module creates the Celery app from the configuration
+# file of the server, the tests use a Celery app without configuration.
+with mock.patch.object(
+    timesketch_app, "create_celery_app", return_value=Celery("timesketch_test")
+):
+    # pylint: disable=wrong-import-position
+    from timesketch.lib import tasks
+
+
+def _get_task_names(canvas):
+    """Returns the names of the tasks of a Celery canvas in execution order.
+
+    Analyzer tasks are named by their analyzer. Tasks that run concurrently
+    are returned as a list with the task names of every lane.
+    """
+    if isinstance(canvas, chord):
+        return _get_task_names(group(canvas.tasks)) + _get_task_names(canvas.body)
+    if isinstance(canvas, group):
+        return [[_get_task_names(lane) for lane in canvas.tasks]]
+    if isinstance(canvas, _chain):
+        names = []
+        for task in canvas.tasks:
+            names.extend(_get_task_names(task))
+        return names
+    if canvas.task == tasks.run_sketch_analyzer.name:
+        return [canvas.args[2]]
+    return [canvas.task.rsplit(".", 1)[-1]]
+
+
+# pylint: disable=protected-access
+class TestAnalysisPipeline(BaseTest):
+    """Tests for building the sketch analysis pipeline."""
+
+    def _build_pipeline(self, analyzer_groups, max_concurrency):
+        """Build a pipeline for analyzers grouped by dependency level."""
+        analyzer_class = mock.Mock()
+        analyzer_class.get_kwargs.return_value = {}
+        with mock.patch.object(
+            tasks.manager.AnalysisManager,
+            "get_analyzer_groups",
+            return_value=[
+                [(name, analyzer_class) for name in analyzer_group]
+                for analyzer_group in analyzer_groups
+            ],
+        ):
+            return tasks.build_sketch_analysis_pipeline(
+                self.sketch1.id,
+                self.searchindex.id,
+                user_id=None,
+                analyzer_names=[name for names in analyzer_groups for name in names],
+                max_concurrency=max_concurrency,
+            )
+
+    def test_lanes(self):
+        """Test that analyzers of a stage are spread over the lanes."""
+        stage_tasks = [signature(f"analyzer_{index:d}") for index in range(5)]
+        self.assertEqual(
+            _get_task_names(tasks._build_analyzer_stage(stage_tasks, 2)),
+            [
+                [
+                    ["analyzer_0", "analyzer_2", "analyzer_4"],
+                    ["analyzer_1", "analyzer_3"],
+                ]
+            ],
+        )
+
+    def test_concurrency_cap(self):
+        """Test that at most max_concurrency analyzers run at the same time."""
+        stage_tasks = [signature(f"analyzer_{index:d}") for index in range(3)]
+        self.assertEqual(
+            _get_task_names(tasks._build_analyzer_stage(stage_tasks, 1)),
+            ["analyzer_0", "analyzer_1", "analyzer_2"],
+        )
+        self.assertEqual(
+            _get_task_names(tasks._build_analyzer_stage(stage_tasks, 10)),
+            [[["analyzer_0"], ["analyzer_1"], ["analyzer_2"]]],
+        )
+
+    def test_stages_are_joined_by_sketch_init(self):
+        """Test that dependent analyzers run after run_sketch_init."""
+        pipeline, analysis_session = self._build_pipeline(
+            [["domain", "hashr", "geoip"], ["feature_extraction"]], 2
+        )
+        self.assertEqual(len(analysis_session.analyses), 4)
+        self.assertEqual(
+            _get_task_names(pipeline),
+            [
+                [["domain", "geoip"], ["hashr"]],
+                "run_sketch_init",
+                "feature_extraction",
+            ],
+        )
+
+    def test_invalid_max_concurrency(self):
+        """Test that max_concurrency has to be a positive integer."""
+        for max_concurrency in (True, False, 0, -1, 1.5, "2"):
+            with self.assertRaises(ValueError):
+                self._build_pipeline([["domain"]], max_concurrency)
+
+        pipeline, _ = self._build_pipeline([["domain"]], 1)
+        self.assertEqual(_get_task_names(pipeline), ["domain"])
+
+
+class TestRunTagEvents(BaseTest):
+    """Tests for the run_tag_events task."""
+
+    @mock.patch.object(tasks, "OpenSearchDataStore")
+    def test_run_tag_events(self, mock_datastore):
+        """Test that the results of all indices are summed up."""
+        datastore = mock_datastore.return_value
+        datastore.add_tags_to_events.side_effect = [
+            {
+                "total": 3,
+                "updated": 2,
+                "noops": 1,
+                "version_conflicts": 1,
+                "failures": ["failed"],
+            },
+            NotFoundError(404, "index_not_found_exception", {}),
+        ]
+
+        results = tasks.run_tag_events({"foo": ["1", "2", "3"], "bar": ["4"]}, ["tag"])
+
+        datastore.add_tags_to_events.assert_any_call("foo", ["1", "2", "3"], ["tag"])
+        datastore.add_tags_to_events.assert_any_call("bar", ["4"], ["tag"])
+        self.assertEqual(results["total"], 3)
+        self.assertEqual(results["updated"], 2)
+        self.assertEqual(results["noops"], 1)
+        self.assertEqual(results["version_conflicts"], 1)
+        self.assertEqual(len(results["errors"]), 3)
+        self.assertEqual(results["errors"][0], "failed")
+        self.assertIn("Unable to tag 1 events in foo", results["errors"][1])
+        self.assertIn("Unable to tag events in bar", results["errors"][2])
+
+
+def _index_settings(limit):
+    """Returns the settings of an index with a total fields limit."""
+    return {
+        "test": {"settings": {"index": {"mapping": {"total_fields": {"limit": limit}}}}}
+    }
+
+
+# pylint: disable=protected-access
+class TestMappingLimit(BaseTest):
+    """Tests for raising the total fields limit of an index."""
+
+    def _get_mapping_limit(self, index_limits):
+        """Returns a mapping limit for an index with one field.
+
+        Args:
+            index_limits (list): the limits that are read from the index.
+        """
+        opensearch = mock.Mock()
+        opensearch.client.indices.get_mapping.return_value = {
+            "test": {"mappings": {"properties": {"message": {"type": "text"}}}}
+        }
+        opensearch.client.indices.get_settings.side_effect = [
+            _index_settings(limit) for limit in index_limits
+        ]
+        return tasks._MappingLimit(opensearch, "test", 1)
+
+    def test_limit_is_raised_under_lock(self):
+        """Test that the limit is read and raised while holding the lock."""
+        redis_client = mock.MagicMock()
+        mapping_limit = self._get_mapping_limit(["2", "2"])
+        events = [{f"field_{index:d}": index for index in range(10)}]
+        with mock.patch.object(
+            tasks.query_cache, "get_redis_client", return_value=redis_client
+        ):
+            new_limit = mapping_limit.update(events)
+
+        self.assertEqual(new_limit, 24)
+        redis_client.lock.assert_called_once_with(
+            "timesketch:mapping_limit:test", timeout=30, blocking_timeout=30
+        )
+        redis_client.lock.return_value.__enter__.assert_called_once()
+        mapping_limit._opensearch.client.indices.put_settings.assert_called_once_with(
+            index="test", body={"index.mapping.total_fields.limit": 24}
+        )
+        self.assertEqual(mapping_limit.current_limit, 24)
+
+    def test_limit_is_not_lowered(self):
+        """Test that a limit raised by another task is kept."""
+        mapping_limit = self._get_mapping_limit(["2", "100"])
+        events = [{f"field_{index:d}": index for index in range(10)}]
+        with mock.patch.object(
+            tasks.query_cache, "get_redis_client", return_value=None
+        ):
+            self.assertEqual(mapping_limit.update(events), 24)
+
+        mapping_limit._opensearch.client.indices.put_settings.assert_not_called()
+        self.assertEqual(mapping_limit.current_limit, 100)
@@ -15,6 +15,8 @@
 
 
 import codecs
+import collections
+import copy
 import json
 
 from typing import Optional, Dict
@@ -328,6 +330,85 @@ class MockDataStore:
         }
         self.event_store[event_id] = new_event
 
+    # pylint: disable=unused-argument
+    def iter_distinct_values(self, index_name, field, query=None, page_size=None):
+        """Mock yielding the distinct values of a field in the event_store.
+
+        Args:
+            index_name: Name of the index (ignored).
+            field: Name of the field.
+            query: Query to filter the events (ignored).
+            page_size: Number of buckets per request (ignored).
+
+        Yields:
+            A tuple with the value and the number of events with that value.
+        """
+        counter = collections.Counter()
+        for event in self.event_store.values():
+            values = event["_source"].get(field)
+            if values is None:
+                continue
+            if not isinstance(values, list):
+                values = [values]
+            counter.update(str(value) for value in values)
+        yield from counter.items()
+
+    # pylint: disable=unused-argument
+    def update_events_by_values(
+        self, index_name, field, updates, query=None, chunk_size=None
+    ):
+        """Mock enriching the events in the event_store by field value.
+
+        Args:
+            index_name (str): Name of the index (ignored).
+            field (str): Name of the field that holds the values.
+            updates (dict): Dict with the update per value.
+            query (dict): Query to filter the events (ignored).
+            chunk_size (int): Maximum number of values per request (ignored).
+
+        Returns:
+            Dict with the number of matched and updated events.
+        """
+        result = {
+            "total": 0,
+            "updated": 0,
+            "noops": 0,
+            "version_conflicts": 0,
+            "failures": [],
+        }
+        for event in self.event_store.values():
+            source = event["_source"]
+            values = source.get(field)
+            if values is None:
+                continue
+            if not isinstance(values, list):
+                values = [values]
+            matching_updates = [
+                updates[str(value)] for value in values if str(value) in updates
+            ]
+            if not matching_updates:
+                continue
+
+            result["total"] += 1
+            original_source = copy.deepcopy(source)
+            for update in matching_updates:
+                source.update(update.get("attributes") or {})
+                for source_field, key in (("tag", "tags"), ("__ts_emojis", "emojis")):
+                    items = update.get(key)
+                    if not items:
+                        continue
+                    current = source.get(source_field) or []
+                    if not isinstance(current, list):
+                        current = [current]
+                    source[source_field] = current + [
+                        item for item in items if item not in current
+                    ]
+            if source == original_source:
+                result["noops"] += 1
+            else:
+                result["updated"] += 1
+        return result
+
     @property
     def version(self):
         """Get MockOpenSearch version.
@@ -18,27 +18,36 @@ import colorsys
 import csv
 import datetime
 import email
+import itertools
 import json
 import logging
 import random
+import re
 import smtplib
 import time
 import codecs
 from typing import List, Optional
+import numpy
 import pandas
 
 from dateutil import parser
 from flask import current_app
-from pandas import Timestamp
 
 from timesketch.lib import errors
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger("timesketch.utils")
 
 # Fields to scrub from timelines.
 FIELDS_TO_REMOVE = ["_id", "_type", "_index", "_source", "__ts_timeline_id"]
 
-# Number of rows processed at once when ingesting a CSV file.
+# Number of rows or lines processed at once when ingesting a CSV or JSONL file.
 DEFAULT_CHUNK_SIZE = 10000
 
 # Columns that must be present in ingested timesketch files.
@@ -47,6 +56,12 @@ TIMESKETCH_FIELDS = frozenset({"message", "datetime", "timestamp_desc"})
 # Columns that must be present in ingested redline files.
 REDLINE_FIELDS = frozenset({"Alert", "Tag", "Timestamp", "Field", "Summary"})
 
+# Size of the blocks read when splitting a file into byte ranges.
+SPLIT_BLOCK_SIZE = 1024 * 1024
+
+# Runs of digits long enough to be an integer that does not fit in 64 bits.
+LONG_INTEGER_RE = re.compile(r"\d{19}")
+
 
 def random_color():
     """Generates a random color.
@@ -89,6 +104,125 @@ def _scrub_special_tags(dict_obj):
             _ = dict_obj.pop(field)
 
 
+def _parse_tag_column(column: pandas.Series) -> pandas.Series:
+    """Parse a column of tag fields into lists of strings.
+
+    This gives the same result as applying _parse_tag_field to every value
+    but uses the vectorized string methods of pandas for columns read from a
+    CSV file, i.e. columns holding strings, numbers or missing values.
+
+    Args:
+        column: A pandas Series with the raw tag field values.
+
+    Returns:
+        A pandas Series with a list of tags per row.
+    """
+    if pandas.api.types.infer_dtype(column, skipna=True) not in (
+        "empty",
+        "string",
+        "integer",
+        "floating",
+        "mixed-integer-float",
+        "boolean",
+    ):
+        return column.apply(_parse_tag_field)
+
+    # Missing values are detected before the conversion to strings, since
+    # how astype(str) converts them depends on the pandas version.
+    is_missing = column.isna()
+    text = column[~is_missing].astype(str)
+    tags = text.str.split(",").astype(object)
+
+    is_empty = text == "-"
+    if is_empty.any():
+        tags[is_empty] = pandas.Series(
+            [[] for _ in range(is_empty.sum())], index=tags.index[is_empty]
+        )
+
+    is_json = text.str.startswith("[") & text.str.endswith("]")
+    if is_json.any():
+        tags[is_json] = text[is_json].map(json.loads)
+
+    if is_missing.any():
+        # Missing values are parsed one by one, like any other value.
+        missing_tags = column[is_missing].map(_parse_tag_field).astype(object)
+        tags = pandas.concat([tags, missing_tags]).reindex(column.index)
+
+    return tags
+
+
+def _normalize_datetime_column(column: pandas.Series):
+    """Convert a column of UTC datetimes to ISO 8601 strings and timestamps.
+
+    The strings are identical to Timestamp.isoformat(), that is the fraction
+    of a second is only included when it is not zero, with microsecond or
+    nanosecond precision.
+
+    Args:
+        column: A pandas Series with timezone aware UTC datetimes.
+
+    Returns:
+        Tuple of two items:
+          pandas Series with the datetimes in ISO 8601 format.
+          numpy array with the timestamps in microseconds since epoch.
+    """
+    nanoseconds = column.dt.tz_convert(None).dt.as_unit("ns").to_numpy()
+    values = nanoseconds.view("int64")
+
+    isoformat = numpy.empty(len(values), dtype=object)
+    whole_seconds = values % 1_000_000_000 == 0
+    whole_microseconds = ~whole_seconds & (values % 1000 == 0)
+    other = ~(whole_seconds | whole_microseconds)
+    for mask, unit in (
+        (whole_seconds, "s"),
+        (whole_microseconds, "us"),
+        (other, "ns"),
+    ):
+        if mask.any():
+            isoformat[mask] = numpy.char.add(
+                numpy.datetime_as_string(nanoseconds[mask], unit=unit), "+00:00"
+            ).tolist()
+
+    # Same result as int(Timestamp.value / 1000). Python rounds the quotient
+    # of two integers correctly, so the float is built from the exact integer
+    # quotient and remainder instead of dividing a rounded float. Quotients
+    # too large to be exact as a float are computed one by one.
+    quotient, remainder = numpy.divmod(values, 1000)
+    timestamps = (quotient.astype("float64") + remainder / 1000).astype("int64")
+    inexact = numpy.abs(quotient) >= 2**53
+    if inexact.any():
+        timestamps[inexact] = [int(value / 1000) for value in values[inexact].tolist()]
+    return pandas.Series(isoformat, index=column.index), timestamps
+
+
+def _chunk_to_events(chunk: pandas.DataFrame) -> List[dict]:
+    """Convert a normalized chunk of a CSV file to event dictionaries.
+
+    OpenSearch specific fields are removed and missing values are left out
+    of the event, column by column instead of row by row.
+
+    Args:
+        chunk: A pandas DataFrame with the normalized events.
+
+    Returns:
+        A list of dicts, one per row in the chunk.
+    """
+    chunk = chunk.drop(
+        columns=[field for field in FIELDS_TO_REMOVE if field in chunk.columns]
+    )
+    events = chunk.to_dict("records")
+
+    missing = chunk.isna()
+    columns_with_missing = missing.columns[missing.any()]
+    if columns_with_missing.empty:
+        return events
+
+    rows, columns = numpy.nonzero(missing[columns_with_missing].to_numpy())
+    for row, column in zip(rows.tolist(), columns.tolist()):
+        del events[row][columns_with_missing[column]]
+    return events
+
+
 def _convert_timestamp_to_datetime(timestamp: int) -> pandas.Timestamp:
     """Convert numeric timestamp to datetime based on magnitude.
 
@@ -284,6 +418,42 @@ def read_and_validate_csv(
 ):
     """Generator for reading and validating a CSV file, yielding event dictionaries.
 
+    See read_and_validate_csv_batches for the validation and normalization
+    steps.
+
+    Args:
+        file_handle (object): A file-like object containing the CSV content.
+        delimiter (str): The character used as a field separator. Defaults to ','.
+        mandatory_fields (list[str], optional): A list of fields that must be
+            present in the CSV header. Defaults to TIMESKETCH_FIELDS.
+        headers_mapping (list[dict], optional): A list of dictionaries for
+            header mapping.
+
+    Yields:
+        dict: A dictionary representing a single event, ready for ingestion.
+
+    Raises:
+        RuntimeError: If there are missing mandatory fields or errors in the
+            header mapping.
+        DataIngestionError: If the file is empty or cannot be parsed by pandas.
+    """
+    for events in read_and_validate_csv_batches(
+        file_handle,
+        delimiter=delimiter,
+        mandatory_fields=mandatory_fields,
+        headers_mapping=headers_mapping,
+    ):
+        yield from events
+
+
+def read_and_validate_csv_batches(
+    file_handle: object,
+    delimiter: str = ",",
+    mandatory_fields: Optional[List[str]] = None,
+    headers_mapping: Optional[List[dict]] = None,
+):
+    """Generator for reading and validating a CSV file, yielding batches of events.
+
     This function reads a CSV file in chunks using pandas, which is memory
     efficient for large files. It performs several validation and normalization
     steps:
@@ -313,7 +483,7 @@ def read_and_validate_csv(
               a source.
 
     Yields:
-        dict: A dictionary representing a single event, ready for ingestion.
+        list[dict]: The events of a chunk of the file, ready for ingestion.
 
     Raises:
         RuntimeError: If there are missing mandatory fields or errors in the
@@ -396,9 +566,13 @@ def read_and_validate_csv(
                         )
                     )
 
-                chunk["datetime"] = (
-                    chunk["datetime"].apply(Timestamp.isoformat).astype(str)
+                # Ensure the timestamp is consistent with the datetime object,
+                # in microsecond epoch format. This overwrites any existing
+                # timestamp to prevent inconsistencies.
+                chunk["datetime"], timestamps = _normalize_datetime_column(
+                    chunk["datetime"]
                 )
+                chunk["timestamp"] = timestamps
             except ValueError:
                 logger.warning(
                     "Rows {} to {} skipped due to malformed "
@@ -409,19 +583,11 @@ def read_and_validate_csv(
                 continue
 
             if "tag" in chunk:
-                chunk["tag"] = chunk["tag"].apply(_parse_tag_field)
+                chunk["tag"] = _parse_tag_column(chunk["tag"])
 
-            for _, row in chunk.iterrows():
-                _scrub_special_tags(row)
-
-                # Remove all NAN values from the pandas.Series.
-                row.dropna(inplace=True)
-
-                # Ensure the timestamp is consistent with the datetime object,
-                # in microsecond epoch format. This overwrites any existing
-                # timestamp to prevent inconsistencies.
-                row["timestamp"] = int(pandas.Timestamp(row["datetime"]).value / 1000)
-                yield row.to_dict()
+            events = _chunk_to_events(chunk)
+            if events:
+                yield events
     except (pandas.errors.EmptyDataError, pandas.errors.ParserError) as e:
         error_string = f"Unable to read file, with error: {e!s}"
         logger.error(error_string)
@@ -469,29 +635,24 @@ def read_and_validate_redline(file_handle: object):
         yield row_to_yield
 
 
-def rename_jsonl_headers(linedict: dict, headers_mapping: List, lineno: int):
-    """Rename the headers of the dictionary
+def _sort_headers_mapping(headers_mapping: List):
+    """Sort a headers mapping in place, combined headers first."""
+    headers_mapping.sort(
+        key=lambda x: len(x["source"]) if x["source"] else 0, reverse=True
+    )
+
+
+def _apply_jsonl_headers_mapping(linedict: dict, headers_mapping: List, lineno: int):
+    """Rename the headers of the dictionary with a sorted and checked mapping.
 
     Args:
         linedict: dictionary to be modified
-        headers_mapping: list of dicts containing:
-                         (i) target header we want to insert [key=target],
-                         (ii) sources header we want to rename/combine [key=source],
-                         (iii) def. value if we add a new column [key=default_value]
+        headers_mapping: sorted list of dicts, see rename_jsonl_headers.
         lineno: line of the JSONL file
 
     Returns: the dictionary with renamed headers
-
-
     """
-    headers_mapping.sort(
-        key=lambda x: len(x["source"]) if x["source"] else 0, reverse=True
-    )
     ld_keys = linedict.keys()
-
-    # sanity check of the headers_mapping
-    check_mapping_errors(ld_keys, headers_mapping)
-
     for mapping in headers_mapping:
         if mapping["target"] not in ld_keys:
             if mapping["source"]:
@@ -525,6 +686,150 @@ def rename_jsonl_headers(linedict: dict, headers_mapping: List, lineno: int):
     return linedict
 
 
+def rename_jsonl_headers(linedict: dict, headers_mapping: List, lineno: int):
+    """Rename the headers of the dictionary
+
+    Args:
+        linedict: dictionary to be modified
+        headers_mapping: list of dicts containing:
+                         (i) target header we want to insert [key=target],
+                         (ii) sources header we want to rename/combine [key=source],
+                         (iii) def. value if we add a new column [key=default_value]
+        lineno: line of the JSONL file
+
+    Returns: the dictionary with renamed headers
+
+
+    """
+    _sort_headers_mapping(headers_mapping)
+
+    # sanity check of the headers_mapping
+    check_mapping_errors(linedict.keys(), headers_mapping)
+
+    return _apply_jsonl_headers_mapping(linedict, headers_mapping, lineno)
+
+
+class _JsonlHeadersMapper:
+    """Renames the headers of JSONL lines with a mapping compiled once.
+
+    The mapping is sorted once per file and the keys of a line are only
+    checked against the mapping the first time a line with the same keys is
+    seen, since the lines of a file usually share the same keys.
+    """
+
+    # Upper bound of the number of distinct sets of keys that are remembered.
+    MAX_CHECKED_KEYS = 1000
+
+    def __init__(self, headers_mapping: List):
+        """Initialize the mapper.
+
+        Args:
+            headers_mapping: list of dicts, see rename_jsonl_headers.
+        """
+        self._headers_mapping = list(headers_mapping)
+        _sort_headers_mapping(self._headers_mapping)
+        self._checked_keys = set()
+
+    def rename(self, linedict: dict, lineno: int) -> dict:
+        """Rename the headers of the dictionary.
+
+        Args:
+            linedict: dictionary to be modified
+            lineno: line of the JSONL file
+
+        Returns: the dictionary with renamed headers
+
+        Raises:
+            RuntimeError: if there are errors in the headers mapping.
+        """
+        keys = tuple(linedict)
+        if keys not in self._checked_keys:
+            check_mapping_errors(linedict.keys(), self._headers_mapping)
+            if len(self._checked_keys) < self.MAX_CHECKED_KEYS:
+                self._checked_keys.add(keys)
+        return _apply_jsonl_headers_mapping(linedict, self._headers_mapping, lineno)
+
+
+def _decode_json_line(line: str, lineno: int) -> dict:
+    """Decode a single line of a JSONL file.
+
+    The optional fast JSON backend is tried first. Lines it rejects, e.g.
+    lines with NaN values, are decoded again with the standard library so
+    that both accept the same input. Lines with integers that may not fit in
+    64 bits, which the fast backend turns into floats, are only decoded with
+    the standard library.
+
+    Args:
+        line: the line to decode.
+        lineno: line of the JSONL file
+
+    Returns:
+        The decoded JSON object.
+
+    Raises:
+        DataIngestionError: if the line is not a JSON object.
+    """
+    linedict = None
+    if _json_loads is not json.loads and not LONG_INTEGER_RE.search(line):
+        try:
+            linedict = _json_loads(line)
+        except ValueError:
+            pass
+
+    if linedict is None:
+        try:
+            linedict = json.loads(line)
+        except ValueError as e:
+            raise errors.DataIngestionError(
+                f"Error parsing JSON at line {lineno:n}: {str(e):s}"
+            ) from e
+
+    if not isinstance(linedict, dict):
+        raise errors.DataIngestionError(
+            f"Error parsing JSON at line {lineno:n}: not a JSON object"
+        )
+    return linedict
+
+
+def _timestamps_from_datetimes(values: List) -> List[Optional[int]]:
+    """Convert datetime strings of a block of JSONL lines to timestamps.
+
+    The strings are parsed together by pandas. Values pandas cannot parse are
+    parsed one by one by dateutil, which accepts more formats.
+
+    Args:
+        values: list of datetime strings.
+
+    Returns:
+        List with the timestamp in microseconds since epoch for each value,
+        or None if the value could not be parsed.
+    """
+    # Only strings are parsed, pandas would read numbers as nanoseconds.
+    strings = [value if isinstance(value, str) else None for value in values]
+    datetimes = pandas.to_datetime(
+        pandas.Series(strings, dtype=object),
+        format="mixed",
+        errors="coerce",
+        utc=True,
+    )
+    is_missing = datetimes.isna().to_numpy()
+    microseconds = (
+        datetimes.dt.tz_convert(None).dt.as_unit("ns").to_numpy().view("int64") // 1000
+    )
+    timestamps = microseconds.tolist()
+
+    for index in numpy.nonzero(is_missing)[0].tolist():
+        try:
+            parsed = parser.parse(values[index])
+            if parsed.tzinfo is None:
+                # Naive datetimes are in UTC, the same as in pandas.
+                parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+            timestamps[index] = int(parsed.timestamp() * 1000000)
+        except (TypeError, ValueError, OverflowError):
+            timestamps[index] = None
+    return timestamps
+
+
 def read_and_validate_jsonl(
     file_handle: object, delimiter: str = "", headers_mapping: Optional[List] = None
 ):  # pylint: disable=unused-argument
@@ -545,45 +850,107 @@ def read_and_validate_jsonl(
     Yields:
         A dict that's ready to add to the datastore.
     """
+    for events in read_and_validate_jsonl_batches(
+        file_handle, headers_mapping=headers_mapping
+    ):
+        yield from events
+
+
+def read_and_validate_jsonl_batches(
+    file_handle: object,
+    delimiter: str = "",
+    headers_mapping: Optional[List] = None,
+    batch_size: int = DEFAULT_CHUNK_SIZE,
+    line_offset: int = 0,
+):  # pylint: disable=unused-argument
+    """Generator for reading a JSONL (json lines) file in batches.
+
+    Lines are read and decoded in blocks of batch_size lines. A missing
+    datetime or timestamp is computed for the whole block at once.
+
+    Args:
+        file_handle: a file-like object or an iterator of lines containing
+            the JSONL content.
+        delimiter: not used in this function
+        headers_mapping: list of dicts containing:
+                         (i) target header we want to insert [key=target],
+                         (ii) sources header we want to rename/combine [key=source],
+                         (iii) def. value if we add a new column [key=default_value]
+        batch_size: number of lines read at once.
+        line_offset: number of lines of the file before the first line of
+            file_handle, used for the line numbers in error messages.
+
+    Raises:
+        RuntimeError: if there are missing fields.
+        DataIngestionError: If the ingestion fails.
+
+    Yields:
+        A list of dicts that are ready to add to the datastore.
+    """
     # Fields that must be present in each entry of the JSONL file.
     mandatory_fields = ["message", "datetime", "timestamp_desc"]
-    lineno = 0
-    for line in file_handle:
-        lineno += 1
-        try:
-            linedict = json.loads(line)
-            ld_keys = linedict.keys()
-            if headers_mapping:
-                linedict = rename_jsonl_headers(linedict, headers_mapping, lineno)
-            if "datetime" not in ld_keys and "timestamp" in ld_keys:
-                epoch = int(str(linedict["timestamp"])[:10])
-                dt = datetime.datetime.fromtimestamp(epoch)
-                linedict["datetime"] = dt.isoformat()
-            if "timestamp" not in ld_keys and "datetime" in ld_keys:
+    mapper = _JsonlHeadersMapper(headers_mapping) if headers_mapping else None
+    lineno = line_offset
+
+    while True:
+        lines = list(itertools.islice(file_handle, batch_size))
+        if not lines:
+            break
+
+        linedicts = []
+        linenos = []
+        missing_datetime = []
+        missing_timestamp = []
+        for line in lines:
+            lineno += 1
+            linedict = _decode_json_line(line, lineno)
+            if mapper:
+                linedict = mapper.rename(linedict, lineno)
+            if "datetime" not in linedict and "timestamp" in linedict:
                 try:
-                    linedict["timestamp"] = int(
-                        parser.parse(linedict["datetime"]).timestamp() * 1000000
-                    )
-                # TODO: REcord this somewhere else and make available to the user.
-                except TypeError:
-                    logger.error(
-                        "Unable to parse timestamp, skipping line "
-                        "{:d}".format(lineno),
-                        exc_info=True,
-                    )
-                    continue
-                except parser.ParserError:
+                    epoch = int(str(linedict["timestamp"])[:10])
+                except ValueError as e:
+                    raise errors.DataIngestionError(
+                        f"Error parsing JSON at line {lineno:n}: {str(e):s}"
+                    ) from e
+                missing_datetime.append((len(linedicts), epoch))
+            elif "timestamp" not in linedict and "datetime" in linedict:
+                missing_timestamp.append(len(linedicts))
+            linedicts.append(linedict)
+            linenos.append(lineno)
+
+        if missing_datetime:
+            epochs = numpy.array([epoch for _, epoch in missing_datetime])
+            datetimes = numpy.datetime_as_string(epochs.astype("datetime64[s]"))
+            for (index, _), dt in zip(missing_datetime, datetimes.tolist()):
+                linedicts[index]["datetime"] = dt
+
+        skipped = set()
+        if missing_timestamp:
+            timestamps = _timestamps_from_datetimes(
+                [linedicts[index]["datetime"] for index in missing_timestamp]
+            )
+            for index, timestamp in zip(missing_timestamp, timestamps):
+                if timestamp is None:
+                    # TODO: REcord this somewhere else and make available to the user.
                     logger.error(
                         "Unable to parse timestamp, skipping line "
-                        "{:d}".format(lineno),
-                        exc_info=True,
+                        "{:d}".format(linenos[index])
                     )
+                    skipped.add(index)
                     continue
+                linedicts[index]["timestamp"] = timestamp
+
+        events = []
+        for index, linedict in enumerate(linedicts):
+            if index in skipped:
+                continue
 
             missing_fields = [x for x in mandatory_fields if x not in linedict]
             if missing_fields:
                 raise RuntimeError(
-                    f"Missing field(s) at line {lineno}: {','.join(missing_fields)}\n"
+                    f"Missing field(s) at line {linenos[index]}: "
+                    f"{','.join(missing_fields)}\n"
                     f"Line: {linedict}\n"
                     f"Mapping: {headers_mapping}"
                 )
@@ -591,12 +958,84 @@ def read_and_validate_jsonl(
             if "tag" in linedict:
                 linedict["tag"] = [x for x in _parse_tag_field(linedict["tag"]) if x]
             _scrub_special_tags(linedict)
-            yield linedict
+            events.append(linedict)
 
-        except ValueError as e:
-            raise errors.DataIngestionError(
-                f"Error parsing JSON at line {lineno:n}: {str(e):s}"
-            )
+        if events:
+            yield events
+
+
+def split_file_by_lines(file_path: str, range_size: int) -> List[tuple]:
+    """Split a file into byte ranges of about range_size bytes.
+
+    Every range ends at the end of a line. The lines of each range are
+    counted while splitting, which gives the total number of lines of the
+    file without a separate pass.
+
+    Args:
+        file_path: path to the file.
+        range_size: minimum size of a range in bytes. The last range may be
+            smaller.
+
+    Returns:
+        List of tuples with the start offset, the end offset (exclusive)
+        and the number of lines of each range.
+    """
+    ranges = []
+    range_start = 0
+    range_lines = 0
+    block_start = 0
+    last_byte = b""
+
+    with open(file_path, "rb") as file_object:
+        while True:
+            block = file_object.read(SPLIT_BLOCK_SIZE)
+            if not block:
+                break
+
+            position = 0
+            while position < len(block):
+                boundary = max(position, range_start + range_size - block_start - 1)
+                newline = block.find(b"\n", boundary)
+                if newline == -1:
+                    range_lines += block.count(b"\n", position)
+                    break
+                range_lines += block.count(b"\n", position, newline + 1)
+                ranges.append((range_start, block_start + newline + 1, range_lines))
+                range_start = block_start + newline + 1
+                range_lines = 0
+                position = newline + 1
+
+            last_byte = block[-1:]
+            block_start += len(block)
+
+    if block_start > range_start:
+        # A last line without a newline at the end is still a line.
+        if last_byte != b"\n":
+            range_lines += 1
+        ranges.append((range_start, block_start, range_lines))
+    return ranges
+
+
+def iter_file_range_lines(file_path: str, start: int, end: int):
+    """Generator for the lines of a byte range of a file.
+
+    Args:
+        file_path: path to the file.
+        start: offset of the first byte of the range, the start of a line.
+        end: offset of the end of the range (exclusive), the end of a line.
+
+    Yields:
+        The lines of the range as strings, decoded as UTF-8.
+    """
+    with open(file_path, "rb") as file_object:
+        file_object.seek(start)
+        position = start
+        while position < end:
+            line = file_object.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode("utf-8", errors="replace")
 
 
 def get_validated_indices(
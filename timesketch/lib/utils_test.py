@@ -15,15 +15,27 @@
 
 
 import io
+import os
 import re
+import tempfile
+import time
+import numpy as np
 import pandas as pd
 
+from timesketch.lib.errors import DataIngestionError
 from timesketch.lib.testlib import BaseTest
 from timesketch.lib.utils import get_validated_indices
+from timesketch.lib.utils import iter_file_range_lines
 from timesketch.lib.utils import random_color
 from timesketch.lib.utils import read_and_validate_csv
+from timesketch.lib.utils import read_and_validate_jsonl
+from timesketch.lib.utils import read_and_validate_jsonl_batches
 from timesketch.lib.utils import check_mapping_errors
+from timesketch.lib.utils import split_file_by_lines
 from timesketch.lib.utils import _convert_timestamp_to_datetime
+from timesketch.lib.utils import _parse_tag_column
+from timesketch.lib.utils import _parse_tag_field
+from timesketch.lib.utils import _timestamps_from_datetimes
 from timesketch.lib.utils import _validate_csv_fields
 from timesketch.lib.utils import rename_jsonl_headers
 
@@ -438,6 +450,79 @@ class TestUtils(BaseTest):
         self.assertDictEqual(results[1], expected_output_2)
         self.assertDictEqual(results[2], expected_output_3)
 
+    def test_csv_tags_missing_values_and_special_fields(self):
+        """Test tags, missing values and OpenSearch fields in a CSV file."""
+        csv_data = (
+            "message,datetime,timestamp_desc,tag,_index,extra,timestamp\n"
+            'first,2021-07-30T18:32:26.5+00:00,test,"a,b",idx,1.5,\n'
+            'second,2021-07-30T18:32:27+00:00,test,"[""x"", ""y""]",idx,,123\n'
+            "third,2021-07-30T18:32:28.123456789+00:00,test,-,idx,2,\n"
+            "fourth,2021-07-30T18:32:29+00:00,test,,idx,,\n"
+        )
+        results = list(read_and_validate_csv(io.StringIO(csv_data)))
+
+        self.assertEqual(
+            results,
+            [
+                {
+                    "message": "first",
+                    "datetime": "2021-07-30T18:32:26.500000+00:00",
+                    "timestamp_desc": "test",
+                    "tag": ["a", "b"],
+                    "extra": 1.5,
+                    "timestamp": 1627669946500000,
+                },
+                {
+                    "message": "second",
+                    "datetime": "2021-07-30T18:32:27+00:00",
+                    "timestamp_desc": "test",
+                    "tag": ["x", "y"],
+                    "timestamp": 1627669947000000,
+                },
+                {
+                    "message": "third",
+                    "datetime": "2021-07-30T18:32:28.123456789+00:00",
+                    "timestamp_desc": "test",
+                    "tag": [],
+                    "extra": 2.0,
+                    "timestamp": 1627669948123456,
+                },
+                {
+                    "message": "fourth",
+                    "datetime": "2021-07-30T18:32:29+00:00",
+                    "timestamp_desc": "test",
+                    "tag": ["nan"],
+                    "timestamp": 1627669949000000,
+                },
+            ],
+        )
+        for result in results:
+            self.assertIsInstance(result["timestamp"], int)
+            self.assertIsInstance(result["datetime"], str)
+
+    def test_parse_tag_column(self):
+        """Test that tag columns are parsed like single tag fields."""
+        column = pd.Series(["a,b", "-", '["x"]', "c", None, 1.0])
+        self.assertEqual(
+            list(_parse_tag_column(column)),
+            [_parse_tag_field(value) for value in column],
+        )
+
+        column = pd.Series([["a"], "b,c"])
+        self.assertEqual(list(_parse_tag_column(column)), [["a"], ["b", "c"]])
+
+    def test_parse_tag_column_missing_values(self):
+        """Test that missing tags are detected before string conversion."""
+        for column in (
+            pd.Series(["a,b", np.nan, "", "-"]),
+            pd.Series(["a,b", None, pd.NA, "-"], dtype="string[python]"),
+            pd.Series([np.nan, np.nan]),
+        ):
+            self.assertEqual(
+                list(_parse_tag_column(column)),
+                [_parse_tag_field(value) for value in column],
+            )
+
     def test_invalid_JSONL_file(self):
         """Test for JSONL with missing keys in the dictionary wrt headers mapping"""
         linedict = {"DT": "2011-11-11", "MSG": "this is a test"}
@@ -532,3 +617,109 @@ class TestUtils(BaseTest):
         # Test NaN
         dt_nan = _convert_timestamp_to_datetime(float("nan"))
         self.assertTrue(pd.isna(dt_nan))
+
+    def test_read_jsonl_in_batches(self):
+        """Test reading a JSONL file in batches."""
+        lines = [
+            '{"message": "first", "datetime": "2021-07-30T18:32:26.975Z", '
+            '"timestamp_desc": "test", "tag": "a,b", "_index": "x"}',
+            '{"message": "second", "timestamp": 1658689261123456, '
+            '"timestamp_desc": "test"}',
+            '{"message": "third", "datetime": "not a date", "timestamp_desc": "test"}',
+            '{"message": "fourth", "datetime": "2021-07-30T18:32:26+00:00", '
+            '"timestamp_desc": "test", "id": 123456789012345678901234567890}',
+        ]
+        file_handle = io.StringIO("\n".join(lines) + "\n")
+        batches = list(read_and_validate_jsonl_batches(file_handle, batch_size=2))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        first, second, fourth = [event for batch in batches for event in batch]
+        self.assertDictEqual(
+            first,
+            {
+                "message": "first",
+                "datetime": "2021-07-30T18:32:26.975Z",
+                "timestamp_desc": "test",
+                "tag": ["a", "b"],
+                "timestamp": 1627669946975000,
+            },
+        )
+        self.assertEqual(second["datetime"], "2022-07-24T19:01:01")
+        self.assertEqual(fourth["timestamp"], 1627669946000000)
+        self.assertEqual(fourth["id"], 123456789012345678901234567890)
+
+    def test_naive_datetimes_are_utc(self):
+        """Test that naive datetimes parsed by dateutil are in UTC."""
+        original_timezone = os.environ.get("TZ")
+
+        def _restore_timezone():
+            if original_timezone is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = original_timezone
+            time.tzset()
+
+        self.addCleanup(_restore_timezone)
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+
+        # Dates outside of the range of pandas are parsed by dateutil.
+        self.assertEqual(
+            _timestamps_from_datetimes(
+                ["2021-07-30T18:32:26", "1500-01-01T00:00:00", "1500-01-01T00:00:00Z"]
+            ),
+            [1627669946000000, -14831769600000000, -14831769600000000],
+        )
+
+    def test_read_jsonl_with_headers_mapping(self):
+        """Test reading a JSONL file with a headers mapping."""
+        headers_mapping = [
+            {"target": "datetime", "source": ["DT"], "default_value": None},
+            {"target": "timestamp_desc", "source": None, "default_value": "test"},
+            {"target": "message", "source": ["a", "b"], "default_value": None},
+        ]
+        line = '{"DT": "2011-11-11T11:11:11Z", "a": 1, "b": "x"}\n'
+        events = list(
+            read_and_validate_jsonl(
+                io.StringIO(line * 3), headers_mapping=headers_mapping
+            )
+        )
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[0]["message"], "a : 1 |b : x |")
+        self.assertEqual(events[0]["timestamp_desc"], "test")
+        self.assertEqual(events[0]["timestamp"], 1321009871000000)
+
+        with self.assertRaises(RuntimeError):
+            list(
+                read_and_validate_jsonl(
+                    io.StringIO(line + '{"DT": "2011-11-11T11:11:11Z", "a": 1}\n'),
+                    headers_mapping=headers_mapping,
+                )
+            )
+
+    def test_read_invalid_jsonl(self):
+        """Test that a line that is not a JSON object fails the ingestion."""
+        with self.assertRaises(DataIngestionError):
+            list(read_and_validate_jsonl(io.StringIO('{"message": "a"}\nnope\n')))
+
+    def test_split_file_by_lines(self):
+        """Test splitting a file into byte ranges that end at a newline."""
+        lines = [f'{{"message": "event {i}"}}\n' for i in range(100)]
+        content = "".join(lines) + '{"message": "no newline"}'
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as file_object:
+            file_object.write(content)
+            file_object.flush()
+
+            ranges = split_file_by_lines(file_object.name, 300)
+            self.assertGreater(len(ranges), 1)
+            self.assertEqual(sum(lines for _, _, lines in ranges), 101)
+
+            read_lines = []
+            previous_end = 0
+            for start, end, number_of_lines in ranges:
+                self.assertEqual(start, previous_end)
+                range_lines = list(iter_file_range_lines(file_object.name, start, end))
+                self.assertEqual(len(range_lines), number_of_lines)
+                read_lines.extend(range_lines)
+                previous_end = end
+            self.assertEqual("".join(read_lines), content)
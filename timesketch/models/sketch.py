@@ -14,6 +14,7 @@
 """This module implements the models for the Timesketch core system."""
 
 
+import datetime
 import json
 import logging
 from typing import Optional, Union
@@ -25,6 +26,7 @@ from flask import url_for
 from sqlalchemy import Table
 from sqlalchemy import BigInteger
 from sqlalchemy import Column
+from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import Unicode
@@ -281,6 +283,12 @@ class Timeline(LabelMixin, StatusMixin, CommentMixin, BaseModel):
     datasources = relationship(
         "DataSource", backref="timeline", lazy="select", cascade="all, delete-orphan"
     )
+    partial_graphs = relationship(
+        "GraphCacheTimeline",
+        backref="timeline",
+        lazy="select",
+        cascade="all, delete-orphan",
+    )
 
 
 class SearchIndex(AccessControlMixin, LabelMixin, StatusMixin, CommentMixin, BaseModel):
@@ -401,6 +409,25 @@ class Aggregation(AccessControlMixin, LabelMixin, StatusMixin, CommentMixin, Bas
     sketch_id = Column(Integer, ForeignKey("sketch.id"))
     view_id = Column(Integer, ForeignKey("view.id"))
     aggregationgroup_id = Column(Integer, ForeignKey("aggregationgroup.id"))
+    result_cache = relationship(
+        "AggregationResultCache",
+        backref="aggregation",
+        lazy="select",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+
+
+class AggregationResultCache(BaseModel):
+    """Implements the cached result of a saved aggregation."""
+
+    aggregation_id = Column(Integer, ForeignKey("aggregation.id"))
+    definition = Column(Unicode(64))
+    stamp = Column(Unicode(64))
+    result = Column(UnicodeText())
+    meta = Column(UnicodeText())
+    computed_at = Column(DateTime())
+    refresh_queued_at = Column(DateTime())
 
 
 class AggregationGroup(
@@ -489,6 +516,45 @@ class GraphCache(BaseModel):
     graph_elements = Column(UnicodeText())
     num_nodes = Column(Integer)
     num_edges = Column(Integer)
+    partial_graphs = relationship(
+        "GraphCacheTimeline",
+        backref="graphcache",
+        lazy="select",
+        cascade="all, delete-orphan",
+    )
+
+
+class GraphCacheTimeline(StatusMixin, BaseModel):
+    """Implements the partial graph of a timeline in a graph cache."""
+
+    graphcache_id = Column(Integer, ForeignKey("graphcache.id"))
+    timeline_id = Column(Integer, ForeignKey("timeline.id"))
+    graph_elements = Column(UnicodeText())
+    num_nodes = Column(Integer)
+    num_edges = Column(Integer)
+
+    def is_generating(self, timeout: int) -> bool:
+        """Returns whether the partial graph is waiting for or in generation.
+
+        A partial graph stays pending or processing if the worker that
+        generates it is stopped. Once its status is older than the timeout
+        it is not considered to be in generation anymore.
+
+        Args:
+            timeout: Number of seconds a partial graph can be pending or
+                processing.
+
+        Returns:
+            True if the partial graph is pending or processing since less
+            than timeout seconds.
+        """
+        status = self.get_status
+        if status.status not in ("pending", "processing"):
+            return False
+        if status.created_at is None:
+            return True
+        age = datetime.datetime.now() - status.created_at
+        return age.total_seconds() < timeout
 
 
 class DataSource(LabelMixin, StatusMixin, CommentMixin, BaseModel):
@@ -14,8 +14,11 @@
 """Tests for the sketch models."""
 
 
+import datetime
 import json
 
+from timesketch.models.sketch import GraphCache
+from timesketch.models.sketch import GraphCacheTimeline
 from timesketch.models.sketch import Sketch
 from timesketch.models.sketch import Timeline
 from timesketch.models.sketch import SearchIndex
@@ -73,6 +76,43 @@ class SketchModelTest(ModelBaseTest):
         )
         self._test_db_object(expected_result=expected_result, model_cls=Timeline)
 
+    def test_partial_graph_is_generating(self):
+        """Test that partial graphs left processing are generated again."""
+        partial_graph = GraphCacheTimeline(timeline_id=self.timeline.id)
+        self.assertFalse(partial_graph.is_generating(timeout=60))
+
+        partial_graph.set_status("processing")
+        partial_graph.get_status.created_at = datetime.datetime.now()
+        self.assertTrue(partial_graph.is_generating(timeout=60))
+
+        partial_graph.get_status.created_at -= datetime.timedelta(minutes=2)
+        self.assertFalse(partial_graph.is_generating(timeout=60))
+
+        partial_graph.set_status("ready")
+        self.assertFalse(partial_graph.is_generating(timeout=60))
+
+    def test_partial_graphs_are_deleted_with_timeline(self):
+        """Test that the partial graphs of a timeline are deleted with it."""
+        timeline = Timeline(
+            name="Graph Timeline",
+            user=self.user1,
+            sketch=self.sketch1,
+            searchindex=self.searchindex,
+        )
+        cache = GraphCache(sketch=self.sketch1, graph_plugin="test")
+        partial_graph = GraphCacheTimeline(timeline=timeline)
+        cache.partial_graphs.append(partial_graph)
+        self.db_session.add_all([timeline, cache])
+        self.db_session.commit()
+        partial_graph.set_status("ready")
+        partial_graph_id = partial_graph.id
+
+        self.db_session.delete(timeline)
+        self.db_session.commit()
+
+        self.assertIsNone(self.db_session.get(GraphCacheTimeline, partial_graph_id))
+        self.assertEqual(cache.partial_graphs, [])
+
     def test_view_model(self):
         """
         Test that the test view has the expected data stored in the database.
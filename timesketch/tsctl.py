@@ -49,7 +49,6 @@ from celery.result import AsyncResult
 from timesketch.api.v1 import export as api_export
 from timesketch.api.v1.resources import ResourceMixin
 from timesketch.api.v1 import utils as api_utils
-from timesketch.lib import utils as lib_utils
 from timesketch.lib.datastores.opensearch import OpenSearchDataStore
 
 from timesketch.lib.definitions import DEFAULT_SOURCE_FIELDS
@@ -69,9 +68,11 @@ from timesketch.models.sketch import (
     Event,
     Story,
     Aggregation,
+    AggregationResultCache,
     Attribute,
     Graph,
     GraphCache,
+    GraphCacheTimeline,
     AggregationGroup,
     AnalysisSession,
     SearchHistory,
@@ -91,6 +92,11 @@ from timesketch.models.user import Group, User
 # Default filenames for sketch export
 DEFAULT_EXPORT_METADATA_FILENAME = "metadata.json"
 DEFAULT_EXPORT_EVENTS_FILENAME_TEMPLATE = "events.{output_format}"
+# Number of exported events between progress messages.
+EXPORT_PROGRESS_INTERVAL = 100000
+# Exported events are in chronological order, _id breaks ties between events
+# with the same timestamp.
+EXPORT_SORT_CRITERIA = [{"datetime": "asc"}, {"_id": "asc"}]
 DEFAULT_EXPORT_ARCHIVE_FILENAME_TEMPLATE = (
     "sketch_{sketch_id}_{output_format}_export.zip"
 )
@@ -2697,309 +2703,151 @@ def _get_sketch_metadata(sketch: Sketch) -> dict:
     return metadata
 
 
-# Helper function to fetch and prepare event data
-def _fetch_and_prepare_event_data(
-    sketch: Sketch, datastore: OpenSearchDataStore, return_fields: list
-) -> tuple[str, bool]:
-    """Fetches all event data for a sketch and determines its format.
-    This function queries the datastore for all events associated with the
-    active timelines of the given sketch. It requests the data ideally in
-    JSONL format using the `api_export.query_to_filehandle` utility.
-    After fetching, it reads the entire content, ensures it's a string (decoding
-    from UTF-8 if necessary), and attempts to detect if the content is
-    JSONL by checking if it starts with '{' and if the first line can be
-    successfully parsed as JSON. This detection helps downstream functions
-    handle potential format discrepancies (e.g., if the API returned CSV
-    instead of the requested JSONL).
+def _get_sketch_export_query(
+    sketch: Sketch, datastore: OpenSearchDataStore, return_fields: Optional[list]
+) -> tuple[list, dict]:
+    """Returns the indices and the query to export all events of a sketch.
+
+    The query is limited to the active timelines of the sketch, so that
+    events of other sketches that share an index are not exported.
+
     Args:
-        sketch: The timesketch.models.sketch.Sketch object whose events
-                are to be fetched.
-        datastore: An initialized
-                    timesketch.lib.datastores.opensearch.OpenSearchDataStore
-                    instance used for querying.
-        return_fields: A list of field names to include in the fetched events.
+        sketch: The sketch whose events are exported.
+        datastore: The datastore the events are exported from.
+        return_fields: Optional list of fields to export, None for all fields.
+
     Returns:
-        A tuple containing:
-            - input_content (str): The fetched event data as a single string,
-                                   stripped of leading/trailing whitespace.
-                                   Will be an empty string if fetching fails or
-                                   no data is returned.
-            - is_likely_jsonl (bool): True if the fetched content starts with '{'
-                                      and the first line parses as JSON,
-                                      False otherwise.
+        A tuple with the list of index names and the base query body for
+        OpenSearchDataStore.export_events_with_slicing.
+
     Raises:
-        ValueError: If no active timelines or valid indices are found for the
-                    sketch, preventing event fetching.
-        # Note: Other exceptions from the datastore interaction or file reading
-        # are caught and logged, resulting in an empty string return value.
+        ValueError: If the sketch has no active timelines.
     """
-    query_string = "*"
-    query_filter = {
-        "indices": "_all",
-        "size": 10000,  # Use default size, export handles scrolling
-    }
-    query_dsl = None
-
-    indices, _ = lib_utils.get_validated_indices("_all", sketch)
+    timelines = list(sketch.active_timelines)
+    indices = sorted({t.searchindex.index_name for t in timelines})
     if not indices:
-        indices = [t.searchindex.index_name for t in sketch.active_timelines]
-        if not indices:
-            raise ValueError(
-                "ERROR: No active timelines (and thus no indices) found"
-                "for this sketch."
-            )
-
-    active_indices = list({t.searchindex.index_name for t in sketch.active_timelines})
-    if not active_indices:
         raise ValueError(
             "ERROR: No active timelines (and thus no indices) found for this sketch."
         )
 
-    print("Get number of events for this sketch...")
-    try:
-        total_event_count, _ = datastore.count(active_indices)
-        print(f"  Total events in active timelines: {total_event_count:,}")
-    except Exception as count_error:  # pylint: disable=broad-except
-        total_event_count = 0
-        print(f"  WARNING: Could not get total event count: {count_error}")
-
-    print("  Requesting event data (preferring JSONL)...")
-    # TODO: Use PIT, search_after and slicing to improve performance
-    event_file_handle = api_export.query_to_filehandle(
-        query_string=query_string,
-        query_filter=query_filter,
-        query_dsl=query_dsl,
-        indices=indices,
-        sketch=sketch,
-        datastore=datastore,
-        return_fields=return_fields,
+    query_dsl = datastore.build_query(
+        sketch.id, "*", {}, None, None, [t.id for t in timelines]
     )
-    event_file_handle.seek(0)
+    base_query_body = {"query": query_dsl.get("query", {})}
+    post_filter = query_dsl.get("post_filter")
+    if post_filter:
+        base_query_body["post_filter"] = post_filter
+    if return_fields:
+        base_query_body["_source"] = list(return_fields)
+    return indices, base_query_body
 
-    try:
-        # TODO(jaegeral): A streaming approach (reading, converting, and writing
-        #  to the zip archive line-by-line or in chunks) would be more
-        # memory-efficient but also significantly more complex to implement
-        content_str = event_file_handle.read()
-        if not isinstance(content_str, str):
-            content_str = content_str.decode("utf-8", errors="replace")
-    except Exception as read_err:  # pylint: disable=broad-except
-        print(f"  ERROR reading event data stream: {read_err}")
-        content_str = ""
-
-    input_content = content_str.strip()
-    is_likely_jsonl = False
-    if input_content and input_content.startswith("{"):
-        try:
-            first_line = input_content.split("\n", 1)[0]
-            json.loads(first_line)
-            is_likely_jsonl = True
-            print("  Detected JSONL format in response.")
-        except Exception:  # pylint: disable=broad-except
-            is_likely_jsonl = False
-            print("  Detected non-JSONL format in response (assuming CSV).")
-    elif input_content:
-        print("  Detected non-JSONL format in response (assuming CSV).")
-    else:
-        print("  WARNING: Received empty content from export function.")
 
-    return input_content, is_likely_jsonl
+def _event_to_csv_row(event: dict, sketch_id: int, columns: list) -> dict:
+    """Returns a CSV row for an exported event.
 
+    List values are represented as `[value1, value2]` (e.g. `[foo, bar]`),
+    empty lists as `[]` and missing values as empty strings.
 
-# Helper function to convert event data
-def _convert_event_data(
-    input_content: str,
-    is_likely_jsonl: bool,
-    output_format: str,
-    return_fields: list,
-) -> bytes:
-    """Converts fetched event data between JSONL and CSV formats.
-    This function takes the raw event data string, determines the necessary
-    conversion based on the detected input format (`is_likely_jsonl`) and the
-    desired `output_format`, and performs the conversion.
-    - If the input is JSONL and the output is CSV, it parses each JSON line,
-      extracts relevant fields, and writes to a CSV structure. List values are
-      represented as `[value1, value2]` (e.g., `["foo", "bar"]`) and empty lists
-      (e.g., an empty "tag" field) as `[]`.
-    - If the input is CSV and the output is JSONL, it reads the CSV, attempts
-      basic type inference (int, float, bool) for values, and writes each row
-      as a JSON line. It also attempts to sniff the CSV dialect.
-    - If the input and output formats match, it returns the input content
-      encoded directly.
-    Warnings are printed for skipped lines or conversion issues. Errors during
-    critical conversion steps (like parsing the first line for CSV headers or
-    major CSV/JSONL conversion failures) will raise exceptions.
     Args:
-        input_content: The fetched event data as a single string, stripped of
-                       leading/trailing whitespace.
-        is_likely_jsonl: Boolean flag indicating if the `input_content` is
-                         detected as JSONL format.
-        output_format: The target format for the event data ('csv' or 'jsonl').
-        return_fields: A list of field names expected in the output. Primarily
-                       used to determine headers when converting JSONL to CSV
-                       if the `return_fields` option was specified for the export.
+        event: An event as yielded by export_events_with_slicing.
+        sketch_id: The sketch ID, used to select the labels of the event.
+        columns: The CSV columns.
+
     Returns:
-        A bytes object containing the event data in the specified `output_format`,
-        encoded in UTF-8. Returns empty bytes if `input_content` is empty.
-    Raises:
-        ValueError: If no valid JSON lines are found when converting JSONL to CSV.
-        json.JSONDecodeError: If parsing the first JSON line for CSV headers fails.
-        Exception: Propagates exceptions from underlying CSV/JSON processing or
-                   other unexpected errors during conversion.
+        A dict with the CSV value per column.
     """
-    event_data_bytes = b""
-
-    if not input_content:
-        print(f"  WARNING: No event data returned to format as {output_format}.")
-        return event_data_bytes
+    csv_row = {}
+    for column in columns:
+        if column == "label":
+            value = [
+                label.get("name")
+                for label in event.get("timesketch_label", [])
+                if label.get("sketch_id") == sketch_id
+            ]
+        else:
+            value = event.get(column)
 
-    if output_format == "csv":
-        if is_likely_jsonl:
-            print("  Input is JSONL, converting to CSV...")
-            jsonl_data = input_content.split("\n")
-            output_csv = io.StringIO()
-            try:
-                first_valid_line_index = -1
-                for i, line in enumerate(jsonl_data):
-                    if line.strip():
-                        first_valid_line_index = i
-                        break
+        if isinstance(value, list):
+            csv_row[column] = f"[{', '.join(map(str, value))}]"
+        elif value is None:
+            csv_row[column] = ""
+        else:
+            csv_row[column] = str(value)
+    return csv_row
 
-                if first_valid_line_index == -1:
-                    raise ValueError("No valid JSON lines found for CSV conversion.")
 
-                first_event = json.loads(jsonl_data[first_valid_line_index])
+def _write_event_data(
+    fh: io.TextIOBase,
+    events,
+    output_format: str,
+    sketch_id: int,
+    columns: list,
+    total_event_count: int,
+) -> int:
+    """Writes exported events to a file, one event at a time.
 
-                if return_fields:
-                    fieldnames = [f for f in return_fields if f in first_event]
-                    if not fieldnames:
-                        print(
-                            "  WARNING: return_fields did not match event keys,"
-                            " using all keys."
-                        )
-                        fieldnames = sorted(first_event.keys())
-                else:
-                    fieldnames = sorted(first_event.keys())
+    Args:
+        fh: Text file object the events are written to.
+        events (Iterable[dict]): Events as yielded by
+            export_events_with_slicing.
+        output_format: Format of the events ('csv' or 'jsonl').
+        sketch_id: The ID of the exported sketch.
+        columns: The CSV columns, only used for the CSV format.
+        total_event_count: Expected number of events, used to report the
+            progress of the export.
 
-                writer = csv.DictWriter(
-                    output_csv, fieldnames=fieldnames, extrasaction="ignore"
-                )
-                writer.writeheader()
-
-                for line in jsonl_data:
-                    line = line.strip()
-                    if line:
-                        try:
-                            event_dict = json.loads(line)
-                            csv_row = {}
-                            for key in fieldnames:
-                                value = event_dict.get(key)
-                                if isinstance(value, list):
-                                    csv_row[key] = f"[{', '.join(map(str, value))}]"
-                                elif value is None:
-                                    csv_row[key] = ""
-                                else:
-                                    csv_row[key] = str(value)
-                            writer.writerow(csv_row)
-                        except json.JSONDecodeError:
-                            print(
-                                "  WARNING: Skipping invalid JSON line: "
-                                f"{line[:100]}..."
-                            )
-                        except Exception as row_err:  # pylint: disable=broad-except
-                            print(
-                                f"  WARNING: Error processing row: {row_err} "
-                                f"- Line: {line[:100]}..."
-                            )
+    Returns:
+        The number of written events.
+    """
+    csv_writer = None
+    if output_format == "csv":
+        csv_writer = csv.DictWriter(fh, fieldnames=columns, extrasaction="ignore")
+        csv_writer.writeheader()
 
-                event_data_bytes = output_csv.getvalue().encode("utf-8")
+    event_count = 0
+    for event in events:
+        if csv_writer:
+            csv_writer.writerow(_event_to_csv_row(event, sketch_id, columns))
+        else:
+            fh.write(json.dumps(event, ensure_ascii=False) + "\n")
+        event_count += 1
 
-            except json.JSONDecodeError as first_line_error:
+        if event_count % EXPORT_PROGRESS_INTERVAL == 0:
+            if total_event_count:
+                percentage = min(100.0, event_count * 100 / total_event_count)
                 print(
-                    "  ERROR parsing first JSON line for CSV headers: "
-                    f"{first_line_error}"
-                )
-                message = (
-                    f"  Content of first line:"
-                    f"{jsonl_data[first_valid_line_index][:200]}..."
+                    f"  Exported {event_count:,}/{total_event_count:,} events "
+                    f"({percentage:.1f}%)"
                 )
-                print(message)
-                print(traceback.format_exc())
-                raise  # Re-raise to stop execution
-            except Exception as conversion_error:  # pylint: disable=broad-except
-                message = f"  ERROR converting JSONL to CSV: {conversion_error}"
-                print(message)
-                print(traceback.format_exc())
-                raise  # Re-raise to stop execution
-        else:
-            print("  Input is not JSONL, using as CSV...")
-            event_data_bytes = input_content.encode("utf-8")
-
-    elif output_format == "jsonl":
-        if is_likely_jsonl:
-            print("  Input is JSONL, using as is...")
-            event_data_bytes = input_content.encode("utf-8")
-        else:
-            print("  Input is not JSONL, converting CSV to JSONL...")
-            try:
-                csv_input = io.StringIO(input_content)
-                try:
-                    dialect = csv.Sniffer().sniff(csv_input.read(1024))
-                    csv_input.seek(0)
-                    reader = csv.DictReader(csv_input, dialect=dialect)
-                    message = (
-                        f"    Detected CSV dialect: delimiter='{dialect.delimiter}'"
-                    )
-                    print(message)
-                except csv.Error:
-                    print("    Could not detect CSV dialect, assuming comma delimiter.")
-                    csv_input.seek(0)
-                    reader = csv.DictReader(csv_input)
-
-                output_jsonl = io.StringIO()
-                count = 0
-                for row in reader:
-                    processed_row = {}
-                    for key, value in row.items():
-                        try:
-                            processed_row[key] = int(value)
-                            continue
-                        except (ValueError, TypeError):
-                            pass
-                        try:
-                            processed_row[key] = float(value)
-                            continue
-                        except (ValueError, TypeError):
-                            pass
-                        if isinstance(value, str):
-                            if value.lower() == "true":
-                                processed_row[key] = True
-                                continue
-                            if value.lower() == "false":
-                                processed_row[key] = False
-                                continue
-                        processed_row[key] = value
+            else:
+                print(f"  Exported {event_count:,} events")
 
-                    output_jsonl.write(json.dumps(processed_row) + "\n")
-                    count += 1
+    return event_count
 
-                event_data_bytes = output_jsonl.getvalue().encode("utf-8")
-                print(f"    Successfully converted {count} CSV rows to JSONL.")
 
-            except Exception as conversion_error:  # pylint: disable=broad-except
-                print(f"  ERROR converting CSV to JSONL: {conversion_error}")
-                print(traceback.format_exc())
-                raise  # Re-raise to stop execution
+def _create_export_archive(
+    filename: str,
+    metadata: dict,
+    event_filename: str,
+    write_events,
+):
+    """Creates the zip archive with metadata and event data.
 
-    return event_data_bytes
+    The events are streamed into a deflated archive member, so the whole
+    export never has to be held in memory.
 
+    Args:
+        filename: Path of the zip archive.
+        metadata: The sketch metadata, stored as DEFAULT_EXPORT_METADATA_FILENAME.
+        event_filename: Name of the archive member for the events.
+        write_events (Callable): Function that is called with a text file
+            object of the archive member and writes the events to it. It
+            returns the number of written events.
 
-# Helper function to create the zip archive
-# TODO(jaegeral): https://github.com/google/timesketch/issues/3415
-def _create_export_archive(
-    filename: str, metadata: dict, event_data_bytes: bytes, event_filename: str
-):
-    """Creates the zip archive with metadata and event data."""
+    Raises:
+        Exception: Errors while writing the archive are re-raised after the
+            incomplete archive has been removed.
+    """
     print("Creating zip archive...")
     try:
         with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as zipf:
@@ -3008,16 +2856,19 @@ def _create_export_archive(
             )
             zipf.writestr(DEFAULT_EXPORT_METADATA_FILENAME, metadata_bytes)
 
-            if event_data_bytes:
-                zipf.writestr(event_filename, event_data_bytes)
-            else:
-                print("  WARNING: No event data was generated to include in the zip.")
-
-        print(f"Sketch exported successfully to {filename}")
+            with zipf.open(event_filename, mode="w", force_zip64=True) as fw:
+                text_fh = io.TextIOWrapper(fw, encoding="utf-8", newline="")
+                event_count = write_events(text_fh)
+                text_fh.flush()
+                text_fh.detach()
+    except Exception:
+        if os.path.exists(filename):
+            os.remove(filename)
+        raise
 
-    except Exception as zip_error:  # pylint: disable=broad-except
-        print(f"ERROR creating zip file: {zip_error}")
-        print(traceback.format_exc())
+    if not event_count:
+        print("  WARNING: No event data was generated to include in the zip.")
+    print(f"Sketch exported successfully to {filename} ({event_count:,} events)")
 
 
 # --- Main CLI command using the helper functions ---
@@ -3052,9 +2903,9 @@ def export_sketch(
     """Exports a Timesketch sketch to a zip archive.
 
     The archive includes sketch metadata (as 'metadata.json') and all associated
-    events, formatted as specified (CSV or JSONL). By default, only a predefined
-    set of common fields are exported. Use the --default-fields flag to export
-    only the default set of fields.
+    events in chronological order, formatted as specified (CSV or JSONL). By
+    default, only a predefined set of common fields are exported. Use the
+    --default-fields flag to export only the default set of fields.
     Progress messages are printed to the console
     during the export process.
 
@@ -3098,8 +2949,7 @@ def export_sketch(
         # 1. Gather Metadata
         metadata = _get_sketch_metadata(sketch)
 
-        # 2. Fetch and Prepare Event Data
-        # Get datastore instance
+        # 2. Build the query for all events of the sketch
         datastore = OpenSearchDataStore()
 
         if default_fields:
@@ -3111,20 +2961,43 @@ def export_sketch(
             print("  Exporting all event fields.")
             return_fields_to_fetch = None  # Pass None to get all fields
 
-        input_content, is_likely_jsonl = _fetch_and_prepare_event_data(
+        indices, base_query_body = _get_sketch_export_query(
             sketch, datastore, return_fields_to_fetch
         )
 
-        # 3. Convert Event Data
-        event_data_bytes = _convert_event_data(
-            input_content, is_likely_jsonl, output_format, return_fields_to_fetch
-        )
+        print("Get number of events for this sketch...")
+        try:
+            total_event_count, _ = datastore.count(indices)
+            print(f"  Total events in active timelines: {total_event_count:,}")
+        except Exception as count_error:  # pylint: disable=broad-except
+            total_event_count = 0
+            print(f"  WARNING: Could not get total event count: {count_error}")
+
+        columns = []
+        if output_format == "csv":
+            columns = api_export.get_export_columns(
+                datastore, indices, return_fields_to_fetch
+            )
         event_filename = DEFAULT_EXPORT_EVENTS_FILENAME_TEMPLATE.format(
             output_format=output_format
         )
 
-        # 4. Create Zip Archive
-        _create_export_archive(filename, metadata, event_data_bytes, event_filename)
+        # 3. Stream the events into the zip archive. Parallel slices would
+        # interleave their results, a single slice keeps the events sorted.
+        events = datastore.export_events_with_slicing(
+            indices_for_pit=indices,
+            base_query_body=base_query_body,
+            sort_criteria=EXPORT_SORT_CRITERIA,
+            num_slices=1,
+        )
+        _create_export_archive(
+            filename,
+            metadata,
+            event_filename,
+            lambda fh: _write_event_data(
+                fh, events, output_format, sketch.id, columns, total_event_count
+            ),
+        )
 
     except ValueError as ve:  # Catch specific errors raised by helpers
         print(f"ERROR: {ve}")
@@ -3357,6 +3230,18 @@ def check_db_orphaned_data(verbose_checks: bool):
             "Analyses (question conclusion link)",
         ),
         (AttributeValue, "attribute_id", Attribute, "AttributeValues (attribute link)"),
+        (
+            GraphCacheTimeline,
+            "graphcache_id",
+            GraphCache,
+            "GraphCacheTimelines (graph cache link)",
+        ),
+        (
+            GraphCacheTimeline,
+            "timeline_id",
+            Timeline,
+            "GraphCacheTimelines (timeline link)",
+        ),
         (Aggregation, "view_id", View, "Aggregations (view link)"),
         (
             Aggregation,
@@ -3364,6 +3249,12 @@ def check_db_orphaned_data(verbose_checks: bool):
             AggregationGroup,
             "Aggregations (group link)",
         ),
+        (
+            AggregationResultCache,
+            "aggregation_id",
+            Aggregation,
+            "AggregationResultCaches (aggregation link)",
+        ),
         (AggregationGroup, "view_id", View, "AggregationGroups (view link)"),
         (FacetTimeFrame, "facet_id", Facet, "FacetTimeFrames (facet link)"),
         (FacetConclusion, "facet_id", Facet, "FacetConclusions (facet link)"),
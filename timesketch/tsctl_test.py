@@ -0,0 +1,290 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the CLI management tool."""
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from unittest import mock
+
+from timesketch import tsctl
+from timesketch.lib.testlib import BaseTest
+from timesketch.models.sketch import AggregationResultCache
+
+
+class PagedExportDataStore:
+    """Datastore that streams exported events in pages.
+
+    Attributes:
+        pages (list): the pages of events, one list of events per page.
+        pages_served (int): the number of pages that have been streamed.
+        export_kwargs (dict): the arguments of the last export call.
+    """
+
+    # pylint: disable=unused-argument
+
+    def __init__(self, pages):
+        """Initialize the datastore.
+
+        Args:
+            pages (list): the pages of events that are exported.
+        """
+        self.pages = pages
+        self.pages_served = 0
+        self.export_kwargs = None
+
+    def build_query(self, sketch_id, query_string, query_filter, query_dsl, *args):
+        """Returns a query limited to the given timelines."""
+        timeline_ids = args[-1]
+        return {
+            "query": {"query_string": {"query": query_string}},
+            "post_filter": {"terms": {"__ts_timeline_id": timeline_ids}},
+        }
+
+    def count(self, indices):
+        """Returns the number of events and the size of the indices."""
+        return sum(len(page) for page in self.pages), 0
+
+    def export_events_with_slicing(self, **kwargs):
+        """Yields the events one page at a time."""
+        self.export_kwargs = kwargs
+        for page in self.pages:
+            self.pages_served += 1
+            yield from page
+
+
+class TestSketchExport(BaseTest):
+    """Tests for exporting a sketch to a zip archive."""
+
+    # pylint: disable=protected-access
+
+    COLUMNS = ["datetime", "message", "_id", "_index", "label"]
+
+    def setUp(self):
+        """Setup a temporary directory for the archives."""
+        super().setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.filename = os.path.join(temp_dir, "export.zip")
+
+    def _make_event(self, number, index_name):
+        """Returns an exported event."""
+        return {
+            "_id": f"id_{number}",
+            "_index": index_name,
+            "datetime": f"2026-01-01T00:00:{number:02d}",
+            "message": f"event {number}",
+            "timesketch_label": [
+                {"name": "__ts_star", "sketch_id": self.sketch1.id},
+                {"name": "other", "sketch_id": self.sketch2.id},
+            ],
+        }
+
+    def _read_archive(self, output_format="csv"):
+        """Returns the metadata and events of the exported archive."""
+        with zipfile.ZipFile(self.filename) as zipf:
+            members = zipf.namelist()
+            metadata = json.loads(zipf.read(tsctl.DEFAULT_EXPORT_METADATA_FILENAME))
+            event_filename = tsctl.DEFAULT_EXPORT_EVENTS_FILENAME_TEMPLATE.format(
+                output_format=output_format
+            )
+            event_data = zipf.read(event_filename).decode("utf-8")
+        return members, metadata, event_data
+
+    def test_get_sketch_export_query(self):
+        """Test the query only selects the active timelines of the sketch."""
+        datastore = PagedExportDataStore([])
+        indices, query_body = tsctl._get_sketch_export_query(
+            self.sketch1, datastore, ["datetime", "message"]
+        )
+        self.assertEqual(indices, [self.searchindex.index_name])
+        self.assertEqual(
+            query_body,
+            {
+                "query": {"query_string": {"query": "*"}},
+                "post_filter": {"terms": {"__ts_timeline_id": [self.timeline.id]}},
+                "_source": ["datetime", "message"],
+            },
+        )
+
+        indices, query_body = tsctl._get_sketch_export_query(
+            self.sketch1, datastore, None
+        )
+        self.assertNotIn("_source", query_body)
+
+    def test_get_sketch_export_query_without_timelines(self):
+        """Test a sketch without active timelines can't be exported."""
+        with self.assertRaises(ValueError):
+            tsctl._get_sketch_export_query(self.sketch2, PagedExportDataStore([]), None)
+
+    def test_event_to_csv_row(self):
+        """Test nested, list and missing values in a CSV row."""
+        event = self._make_event(1, "index_1")
+        event["tag"] = ["foo", "bar"]
+        event["empty"] = []
+        event["nested"] = {"key": "value"}
+        event["none"] = None
+
+        columns = ["message", "tag", "empty", "nested", "none", "missing", "label"]
+        row = tsctl._event_to_csv_row(event, self.sketch1.id, columns)
+        self.assertEqual(
+            row,
+            {
+                "message": "event 1",
+                "tag": "[foo, bar]",
+                "empty": "[]",
+                "nested": "{'key': 'value'}",
+                "none": "",
+                "missing": "",
+                "label": "[__ts_star]",
+            },
+        )
+
+    def test_write_event_data_csv(self):
+        """Test events are written as CSV rows with a header."""
+        events = [self._make_event(i, "index_1") for i in range(3)]
+        fh = io.StringIO()
+        event_count = tsctl._write_event_data(
+            fh, iter(events), "csv", self.sketch1.id, self.COLUMNS, len(events)
+        )
+        self.assertEqual(event_count, 3)
+
+        fh.seek(0)
+        reader = csv.reader(fh)
+        self.assertEqual(next(reader), self.COLUMNS)
+        rows = list(reader)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            rows[0],
+            ["2026-01-01T00:00:00", "event 0", "id_0", "index_1", "[__ts_star]"],
+        )
+
+    def test_write_event_data_jsonl(self):
+        """Test events are written as one JSON document per line."""
+        events = [self._make_event(i, "index_1") for i in range(3)]
+        fh = io.StringIO()
+        event_count = tsctl._write_event_data(
+            fh, iter(events), "jsonl", self.sketch1.id, [], len(events)
+        )
+        self.assertEqual(event_count, 3)
+        lines = fh.getvalue().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], events)
+
+    def test_create_export_archive(self):
+        """Test the archive contains the metadata and all events."""
+        events = [self._make_event(i, "index_1") for i in range(5)]
+        tsctl._create_export_archive(
+            self.filename,
+            {"sketch": {"id": self.sketch1.id}},
+            "events.csv",
+            lambda fh: tsctl._write_event_data(
+                fh, iter(events), "csv", self.sketch1.id, self.COLUMNS, 5
+            ),
+        )
+
+        members, metadata, event_data = self._read_archive()
+        self.assertEqual(
+            sorted(members),
+            sorted([tsctl.DEFAULT_EXPORT_METADATA_FILENAME, "events.csv"]),
+        )
+        self.assertEqual(metadata, {"sketch": {"id": self.sketch1.id}})
+        rows = list(csv.reader(io.StringIO(event_data)))
+        self.assertEqual(rows[0], self.COLUMNS)
+        self.assertEqual(len(rows) - 1, 5)
+
+    def test_create_export_archive_error(self):
+        """Test an incomplete archive is removed."""
+
+        def _write_events(fh):
+            fh.write("partial")
+            raise RuntimeError("Export failed")
+
+        with self.assertRaises(RuntimeError):
+            tsctl._create_export_archive(self.filename, {}, "events.csv", _write_events)
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_export_sketch_multiple_timelines(self):
+        """Test exporting a sketch with events of two timelines in pages."""
+        timeline2 = self._create_timeline(
+            name="Timeline 2",
+            sketch=self.sketch1,
+            searchindex=self.searchindex2,
+            user=self.user1,
+        )
+        index_names = [self.searchindex.index_name, self.searchindex2.index_name]
+        pages = [
+            [self._make_event(i, index_names[0]) for i in range(0, 3)],
+            [self._make_event(i, index_names[0]) for i in range(3, 5)],
+            [self._make_event(i, index_names[1]) for i in range(5, 8)],
+        ]
+        datastore = PagedExportDataStore(pages)
+
+        with mock.patch.object(
+            tsctl, "OpenSearchDataStore", return_value=datastore
+        ), mock.patch.object(
+            tsctl.api_export, "get_export_columns", return_value=self.COLUMNS
+        ), mock.patch.object(
+            tsctl, "_get_sketch_metadata", return_value={"id": self.sketch1.id}
+        ):
+            result = self.app.test_cli_runner().invoke(
+                tsctl.export_sketch,
+                [str(self.sketch1.id), "--filename", self.filename],
+            )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(datastore.pages_served, 3)
+        self.assertEqual(
+            datastore.export_kwargs["indices_for_pit"], sorted(index_names)
+        )
+        self.assertEqual(
+            datastore.export_kwargs["base_query_body"]["post_filter"],
+            {"terms": {"__ts_timeline_id": [self.timeline.id, timeline2.id]}},
+        )
+        self.assertEqual(
+            datastore.export_kwargs["sort_criteria"],
+            [{"datetime": "asc"}, {"_id": "asc"}],
+        )
+        self.assertEqual(datastore.export_kwargs["num_slices"], 1)
+
+        members, metadata, event_data = self._read_archive()
+        self.assertIn("events.csv", members)
+        self.assertEqual(metadata, {"id": self.sketch1.id})
+        rows = list(csv.DictReader(io.StringIO(event_data)))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual([row["_id"] for row in rows], [f"id_{i}" for i in range(8)])
+        self.assertEqual({row["_index"] for row in rows}, set(index_names))
+        self.assertTrue(all(row["label"] == "[__ts_star]" for row in rows))
+
+
+class TestCheckDbOrphanedData(BaseTest):
+    """Tests for the orphaned data check."""
+
+    def test_orphaned_aggregation_result_cache(self):
+        """Test cached results of deleted aggregations are reported."""
+        result_cache = AggregationResultCache(
+            aggregation_id=9999, definition="definition", stamp="stamp"
+        )
+        self._commit_to_database(result_cache)
+
+        result = self.app.test_cli_runner().invoke(tsctl.check_db_orphaned_data, [])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn(
+            f"ORPHANED AggregationResultCache: ID={result_cache.id}, linked to "
+            "non-existent Aggregation ID=9999 via aggregation_id",
+            result.output,
+        )
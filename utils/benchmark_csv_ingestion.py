@@ -0,0 +1,169 @@
+# Copyright 2026 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark of the CSV normalization in read_and_validate_csv.
+
+Measures read_and_validate_csv on a synthetic CSV file, together with the
+timesketch/lib/utils.py of a reference git revision, and checks that both
+produce the same events. By default the reference is the last revision that
+still converts the rows with DataFrame.iterrows.
+
+Usage:
+    python utils/benchmark_csv_ingestion.py --rows 1000000
+    python utils/benchmark_csv_ingestion.py --reference-revision <rev>
+"""
+
+import argparse
+import datetime
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+import types
+
+from timesketch.lib import utils
+
+UTILS_PATH = "timesketch/lib/utils.py"
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate_csv(rows: int) -> str:
+    """Generates a synthetic Timesketch CSV file.
+
+    Args:
+        rows: Number of events in the file.
+
+    Returns:
+        The content of the CSV file as a string.
+    """
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    tags = ["", "malware", "malware,lateral", '["a", "b"]', "-"]
+    lines = ["message,datetime,timestamp_desc,tag,hostname,_index,pid"]
+    for i in range(rows):
+        event_time = start + datetime.timedelta(
+            seconds=random.randint(0, 31536000),
+            microseconds=random.choice([0, random.randint(0, 999999)]),
+        )
+        tag = random.choice(tags)
+        if "," in tag:
+            tag = '"{}"'.format(tag.replace('"', '""'))
+        pid = random.choice(["", str(random.randint(1, 65535))])
+        lines.append(
+            f"event {i},{event_time.isoformat()},Event Time,{tag},"
+            f"host{i % 100},index,{pid}"
+        )
+    lines.append("")
+    return "\n".join(lines)
+
+
+def get_default_reference() -> str:
+    """Returns the last revision that converts the CSV rows with iterrows.
+
+    Returns:
+        The git revision, or an empty string if it cannot be found, e.g. in a
+        shallow clone or outside of a git repository.
+    """
+    try:
+        revision = subprocess.check_output(
+            ["git", "log", "-1", "--format=%h", "-Giterrows", "--", UTILS_PATH],
+            cwd=REPOSITORY_PATH,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    if not revision:
+        return ""
+    # The last change of iterrows is the commit that removed it.
+    return f"{revision}^"
+
+
+def load_reference_utils(revision: str) -> types.ModuleType:
+    """Loads timesketch/lib/utils.py from a git revision.
+
+    Args:
+        revision: A git revision of the Timesketch repository.
+
+    Returns:
+        The utils module of the revision.
+    """
+    source = subprocess.check_output(
+        ["git", "show", f"{revision}:{UTILS_PATH}"], cwd=REPOSITORY_PATH, text=True
+    )
+    module = types.ModuleType("reference_utils")
+    module.__file__ = os.path.join(REPOSITORY_PATH, UTILS_PATH)
+    code = compile(source, UTILS_PATH, "exec")
+    exec(code, module.__dict__)  # pylint: disable=exec-used
+    return module
+
+
+def read_csv(module: types.ModuleType, content: str) -> list:
+    """Reads the CSV content with the read_and_validate_csv of a module."""
+    return list(module.read_and_validate_csv(io.StringIO(content)))
+
+
+def main(args: list) -> int:
+    """Runs the benchmark."""
+    argument_parser = argparse.ArgumentParser(
+        description=__doc__.split("\n", maxsplit=1)[0]
+    )
+    argument_parser.add_argument(
+        "--rows", type=int, default=1000000, help="Number of rows in the CSV file."
+    )
+    argument_parser.add_argument(
+        "--seed", type=int, default=42, help="Seed for the synthetic data."
+    )
+    argument_parser.add_argument(
+        "--reference-revision",
+        help=(
+            "Git revision of read_and_validate_csv to compare with. Defaults "
+            "to the last revision that converts the rows with iterrows."
+        ),
+    )
+    options = argument_parser.parse_args(args)
+
+    reference = options.reference_revision or get_default_reference()
+    if not reference:
+        argument_parser.error(
+            "unable to find the revision that converts the rows with "
+            "iterrows, use --reference-revision to set the reference"
+        )
+
+    random.seed(options.seed)
+    print(f"Generating CSV file with {options.rows:d} rows")
+    content = generate_csv(options.rows)
+
+    print(f"Reference revision: {reference}")
+    modules = [(reference, load_reference_utils(reference)), ("current", utils)]
+
+    timings = {}
+    results = {}
+    for name, module in modules:
+        start_time = time.perf_counter()
+        results[name] = read_csv(module, content)
+        timings[name] = time.perf_counter() - start_time
+        rate = options.rows / timings[name]
+        print(f"{name:>10s}: {timings[name]:8.2f}s ({rate:,.0f} rows/s)")
+
+    print(f"   speedup: {timings[reference] / timings['current']:.1f}x")
+    if results[reference] != results["current"]:
+        print(f"ERROR: the events differ from the events of {reference}")
+        return 1
+    print(f"Events are identical ({len(results['current']):d} events)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))